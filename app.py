@@ -1,6 +1,5 @@
 import os
 import json  # Importar el módulo json
-import time
 import tempfile
 from hashlib import blake2b
 from tempfile import NamedTemporaryFile
@@ -12,6 +11,10 @@ from streamlit_pdf_viewer import pdf_viewer
 import google.generativeai as genai
 from PyPDF2 import PdfReader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from extraction_engine import extract_document
+from model_router import document_features
+from runtime import get_runtime
+from webhook_outbox import WEBHOOK_OUTBOX
 import pandas as pd
 import datetime
 
@@ -125,14 +128,6 @@ def load_json(file_path):
     with open(file_path, 'r') as file:
         return json.load(file)
 
-def text_to_json(text_data):
-    try:
-        json_data = json.loads(text_data)
-        return json_data
-    except json.JSONDecodeError as e:
-        st.error(f"Error al convertir texto a JSON: {str(e)}")
-        return None
-
 # Función para aplanar y limpiar datos JSON
 def flatten_json_data(json_data):
     flat_json = flatten(json_data)
@@ -272,36 +267,19 @@ def tabular_validation_form(json_data, tab):
     
     
 
-def upload_to_gemini(path, mime_type=None):
-    file = genai.upload_file(path, mime_type=mime_type)
-    print(f"Uploaded file '{file.display_name}' as: {file.uri}")
-    return file
-
-def wait_for_files_active(files):
-    print("Waiting for file processing...")
-    for name in (file.name for file in files):
-        file = genai.get_file(name)
-        while file.state.name == "PROCESSING":
-            print(".", end="", flush=True)
-            time.sleep(10)
-            file = genai.get_file(name)
-        if file.state.name != "ACTIVE":
-            raise Exception(f"File {file.name} failed to process")
-    print("...all files ready")
-    print()
-
-def crete_prompt(file_content, selected_llm, prompt=None, system_instructions=None):
+def crete_prompt(file_content, selected_llm, prompt=None, system_instructions=None, document=None):
     """
-    Crea una interacción con el modelo de IA usando un archivo PDF y devuelve la respuesta.
+    Crea una interacción con el modelo de IA usando un archivo PDF y devuelve los datos extraídos.
     
     Args:
         file_content (str): Ruta al archivo PDF
-        selected_llm (str): Nombre del modelo LLM a utilizar
+        selected_llm (str): Nombre del modelo LLM a utilizar ('auto' para el router)
         prompt (str, opcional): Instrucción específica para el modelo
         system_instructions (str, opcional): Instrucciones del sistema para guiar al modelo
+        document (str, opcional): Nombre del documento para el registro de consumo
         
     Returns:
-        Respuesta del modelo generativo
+        dict: Datos extraídos según el schema
     """
     # Prompt por defecto si no se proporciona uno
     if prompt is None:
@@ -389,60 +367,41 @@ def crete_prompt(file_content, selected_llm, prompt=None, system_instructions=No
     ]
     }
     
-    generation_config = {
-        "temperature": 1,
-        "top_p": 0.95,
-        "top_k": 40,
-        "max_output_tokens": 8192,
-        "response_mime_type": "application/json",
-        "response_schema": schema,
-    }
-    
-    model = genai.GenerativeModel(
-        model_name=selected_llm,       
-        generation_config=generation_config,
-    )
-    
-    files = genai.upload_file(file_content, mime_type="application/pdf")
-    print(f"Uploaded file '{files.display_name}' as: {files.uri}")
+    with open(file_content, 'rb') as pdf_file:
+        pdf_bytes = pdf_file.read()
+    usage_context = {'document': document, 'tenant': 'app/'}
     
-    # Crear la historia del chat
-    history = []
-    
-    # Añadir instrucciones del sistema si se proporcionan
-    if system_instructions:
-        history.append({
-            "role": "system",
-            "parts": [system_instructions]
-        })
-    
-    # Añadir mensaje del usuario con archivo y prompt
-    history.append({
-        "role": "user",
-        "parts": [
-            files,
-            prompt,
-        ],
-    })
-    
-    # Iniciar la sesión de chat
-    chat_session = model.start_chat(history=history)
+    # 'auto': el router elige flash o pro según la complejidad del documento
+    if selected_llm == 'auto':
+        return get_runtime().get_router().extract(
+            pdf_bytes, prompt, system_instructions, features=document_features(pdf_bytes=pdf_bytes, key=document),
+            schema=schema, display_name=document, usage_context=usage_context
+        )
     
-    # Enviar mensaje para obtener respuesta
-    response = chat_session.send_message("Analiza el documento según las instrucciones proporcionadas")
+    # Gemini con el modelo elegido en la barra lateral (el backend adapta el schema)
+    backend = get_runtime().get_backend('gemini', selected_llm)
     
-    return response
+    # Registra tokens y costo estimado de la interpretación
+    return extract_document(
+        pdf_bytes, prompt, system_instructions, schema=schema, backend=backend, display_name=document,
+        usage_context=usage_context
+    )
 
 def send_webhook(webhook_url, json_data):
     """
     Envía datos JSON a un webhook especificado.
+
+    Con WEBHOOK_OUTBOX la entrega pasa por el outbox de webhooks: se guarda
+    primero y se envía con la sesión compartida, con reintentos y backoff; si
+    los agota queda en el dead-letter para reenviarla. Sin outbox se envía en
+    línea, en un solo intento.
     
     Args:
         webhook_url (str): La URL del webhook al que enviar los datos
         json_data (dict): Los datos en formato diccionario para enviar como JSON
         
     Returns:
-        requests.Response: El objeto de respuesta de la petición HTTP
+        dict: status ('delivered' o 'dead'), attempts, status_code, response y last_error
     """
     # Configura los headers para especificar que estamos enviando JSON
     headers = {
@@ -450,26 +409,26 @@ def send_webhook(webhook_url, json_data):
         'User-Agent': 'Legal-Workflow-Agent/1.0'
     }
     print(f"posting to {webhook_url}")
-    try:
-        # Realiza la petición POST con los datos JSON
-        response = requests.post(
-            webhook_url, 
-            data=json.dumps(json_data),
-            headers=headers
-        )
-        
-        # Verifica si la petición fue exitosa
-        response.raise_for_status()
-        
+    if WEBHOOK_OUTBOX:
+        entry = get_runtime().get_webhook_outbox().send(webhook_url, json_data, headers=headers)
+    else:
+        entry = {'status': 'dead', 'attempts': 1, 'status_code': None, 'response': None, 'last_error': None}
+        try:
+            # Realiza la petición POST con los datos JSON
+            response = get_runtime().post(webhook_url, data=json.dumps(json_data), headers=headers)
+            entry.update(status_code=response.status_code, response=response.text)
+            # Verifica si la petición fue exitosa
+            response.raise_for_status()
+            entry['status'] = 'delivered'
+        except requests.exceptions.RequestException as e:
+            entry['last_error'] = str(e)
+    if entry['status'] == 'delivered':
         # Imprime información sobre la respuesta
-        print(f"Webhook enviado con éxito. Código de estado: {response.status_code}")
-        print(f"Respuesta: {response.text}")
-        
-        return response
-        
-    except requests.exceptions.RequestException as e:
-        print(f"Error al enviar el webhook: {e}")
-        return None
+        print(f"Webhook enviado con éxito. Código de estado: {entry['status_code']}")
+        print(f"Respuesta: {entry['response']}")
+    else:
+        print(f"Error al enviar el webhook ({entry['attempts']} intentos): {entry['last_error']}")
+    return entry
 
 
 # Configuración de la barra lateral
@@ -492,7 +451,7 @@ with st.sidebar:
         genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
     
     # Selección de modelo
-    options = ["gemini-1.5-flash-002", "gemini-1.0-pro", "gemini-1.5-pro", "gemini-2.0-flash-exp", "gemini-2.0-pro-exp","gemini-2.5-pro-preview-03-25", "gemini-2.5-flash-preview-04-17"]
+    options = ["auto", "gemini-1.5-flash-002", "gemini-1.0-pro", "gemini-1.5-pro", "gemini-2.0-flash-exp", "gemini-2.0-pro-exp","gemini-2.5-pro-preview-03-25", "gemini-2.5-flash-preview-04-17"]
     selected_llm = st.selectbox("Selecciona el modelo LLM:", options, index=options.index(st.session_state['selected_model']))
     st.session_state['selected_model'] = selected_llm
     
@@ -640,8 +599,11 @@ if uploaded_file:
                 with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
                     tmp_file.write(uploaded_file.getvalue())
                     file_path = tmp_file.name
-                response_llm = crete_prompt(file_path, st.session_state['selected_model'])
-                json_data = text_to_json(response_llm.text)
+                try:
+                    json_data = crete_prompt(file_path, st.session_state['selected_model'], document=uploaded_file.name)
+                except Exception as e:
+                    st.error(f"Error al interpretar el documento: {str(e)}")
+                    json_data = None
                 
                 # Guardar datos en el state para uso posterior
                 st.session_state['datos_interpretacion'] = json_data
@@ -663,7 +625,7 @@ if uploaded_file:
             print("Enviando datos al webhook...")
             response = send_webhook("https://magia.app.n8n.cloud/webhook-test/a4a9b9f0-5ed7-4c80-bebe-09a9d955ae2f", 
                                    st.session_state['data_to_send'])
-            if response and response.status_code == 200:
+            if response['status'] == 'delivered':
                 tab2.success("✅ Cita de conciliación agendada correctamente.")
                 st.session_state['fase_proceso'] = 'agendado'
             else:
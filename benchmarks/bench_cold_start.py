@@ -0,0 +1,166 @@
+"""
+Benchmark de arranque en frío de la lambda de extracción.
+
+1. Costo de importación por módulo: cada módulo se importa en un intérprete
+   nuevo con -X importtime y se reporta el tiempo acumulado.
+2. Primera invocación: en un intérprete nuevo se importa el handler y se
+   ejecutan tres invocaciones con red simulada (S3 local, Gemini y webhook
+   falsos): primera invocación (incluye las importaciones diferidas), segunda
+   invocación caliente con otro documento y una tercera que acierta en caché.
+
+Con --max-import-ms / --max-first-ms el proceso termina con código 1 si se
+superan los umbrales, para detectar regresiones.
+
+Uso:
+    python benchmarks/bench_cold_start.py --runs 3
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(os.path.dirname(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+HANDLER_MODULE = 'extradata_conciliacion_improved'
+MODULES = [HANDLER_MODULE, 'boto3', 'google.generativeai', 'PyPDF2', 'requests']
+
+FAKE_RESPONSE = {
+    "expediente": "CA-3020",
+    "ciudad": "Cali",
+    "convocantes": [{"rol": "CONDUCTOR", "nombre": "FELIPE PARDO", "email": "felipe@example.com"}],
+    "convocados": [{"rol": "CONDUCTOR", "nombre": "CARLOS SAENZ", "mail": "carlos@example.com"}],
+    "fecha_conciliacion": "2025-06-01",
+    "hora_conciliacion": "9:00",
+    "jornada": "AM",
+}
+
+
+def import_cost_ms(module):
+    """Tiempo acumulado de importación de un módulo en un intérprete nuevo"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    for line in reversed(result.stderr.splitlines()):
+        parts = [p.strip() for p in line.replace('import time:', '').split('|')]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1000
+    return None
+
+
+def run_worker():
+    """Se ejecuta en un intérprete nuevo: importa el handler e invoca con red simulada"""
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, BENCH_DIR)
+    from unittest import mock
+
+    from fakes import LocalS3Client
+    from synthetic_pdfs import build_pdf
+
+    s3 = LocalS3Client()
+    for i in range(2):
+        s3.put_object(Bucket='bench', Key=f'uploads/doc_{i}.pdf', Body=build_pdf(4, image_size=(300, 400), seed=i))
+
+    class FakeModel:
+        def __init__(self, **kwargs):
+            pass
+
+        def generate_content(self, parts, **kwargs):
+            response = mock.Mock()
+            response.text = json.dumps(FAKE_RESPONSE)
+            # Sin usage_metadata el registro de consumo cuenta 0 tokens
+            response.usage_metadata = None
+            return response
+
+    class FakeHttpResponse:
+        status_code = 200
+        text = 'ok'
+
+        def raise_for_status(self):
+            pass
+
+    def event(i):
+        return {'Records': [{'s3': {'bucket': {'name': 'bench'}, 'object': {'key': f'uploads/doc_{i}.pdf'}}}]}
+
+    timings = {}
+    start = time.perf_counter()
+    handler = __import__(HANDLER_MODULE)
+    timings['import_ms'] = (time.perf_counter() - start) * 1000
+
+    devnull = open(os.devnull, 'w')
+    real_stdout = sys.stdout
+    patches = [
+        mock.patch('boto3.client', return_value=s3),
+        mock.patch('google.generativeai.GenerativeModel', FakeModel),
+        mock.patch('requests.Session.post', return_value=FakeHttpResponse()),
+    ]
+    for label, doc in (('first_invocation_ms', 0), ('warm_invocation_ms', 1), ('warm_cache_hit_ms', 0)):
+        sys.stdout = devnull
+        start = time.perf_counter()
+        if label == 'first_invocation_ms':
+            # Las importaciones diferidas ocurren aquí, igual que en una invocación real
+            for p in patches:
+                p.start()
+        handler.lambda_handler(event(doc), None)
+        timings[label] = (time.perf_counter() - start) * 1000
+        sys.stdout = real_stdout
+    for p in patches:
+        p.stop()
+    print(json.dumps(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3, help='Intérpretes nuevos por medición (se reporta la mediana)')
+    parser.add_argument('--json', action='store_true', help='Imprimir el resultado en JSON')
+    parser.add_argument('--max-import-ms', type=float, help=f'Umbral para la importación de {HANDLER_MODULE}')
+    parser.add_argument('--max-first-ms', type=float, help='Umbral para la primera invocación')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker()
+        return
+
+    modules = {m: statistics.median(import_cost_ms(m) for _ in range(args.runs)) for m in MODULES}
+
+    invocations = []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            env = dict(os.environ, CACHE_DIR=cache_dir, AWS_DEFAULT_REGION='us-east-1',
+                       CHECKPOINT_PATH=os.path.join(cache_dir, 'checkpoints.db'),
+                       IDEMPOTENCY_PATH=os.path.join(cache_dir, 'idempotency.db'),
+                       WEBHOOK_OUTBOX_PATH=os.path.join(cache_dir, 'webhook_outbox.db'),
+                       MODEL_NAME='gemini-bench', WEBHOOK_URL='http://127.0.0.1:9/webhook',
+                       TEXT_FAST_PATH='0')
+            out = subprocess.run([sys.executable, __file__, '--worker'], cwd=ROOT, env=env,
+                                 capture_output=True, text=True, check=True)
+            invocations.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    invocation = {k: statistics.median(r[k] for r in invocations) for k in invocations[0]}
+
+    if args.json:
+        print(json.dumps({'import_ms': modules, 'invocation_ms': invocation}, indent=2))
+    else:
+        print(f"Costo de importación (mediana de {args.runs} intérpretes nuevos)")
+        for module, ms in sorted(modules.items(), key=lambda kv: -(kv[1] or 0)):
+            print(f"  {module:<36}{ms:>9.1f} ms")
+        print("\nInvocaciones con red simulada")
+        for label, ms in invocation.items():
+            print(f"  {label:<36}{ms:>9.1f} ms")
+
+    failed = False
+    if args.max_import_ms is not None and modules[HANDLER_MODULE] > args.max_import_ms:
+        print(f"❌ Importación del handler {modules[HANDLER_MODULE]:.1f} ms > {args.max_import_ms} ms")
+        failed = True
+    if args.max_first_ms is not None and invocation['first_invocation_ms'] > args.max_first_ms:
+        print(f"❌ Primera invocación {invocation['first_invocation_ms']:.1f} ms > {args.max_first_ms} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Latencia de envío inline vs File API contra Gemini.
+
+Para cada modo mide el tiempo de preparación del documento (subida + espera de
+ACTIVE en la ruta 'file'), el de generate_content y el total. El modo
+'file-reuse' usa el registro por hash, como la lambda en contenedor caliente.
+
+Requiere GOOGLE_API_KEY. Si no se indica --pdf se usa un formulario sintético
+de 2 páginas.
+
+Uso:
+    GOOGLE_API_KEY=... python benchmarks/bench_inline_vs_file.py --runs 5 --pdf solicitud.pdf
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+PROMPT = "Extrae expediente, ciudad y convocantes del documento en formato JSON"
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pdf', help='PDF a enviar (por defecto uno sintético de 2 páginas)')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--model', default=os.environ.get('MODEL_NAME', 'gemini-1.5-flash-002'))
+    parser.add_argument('--modes', default='inline,file,file-reuse')
+    args = parser.parse_args()
+
+    if not os.environ.get('GOOGLE_API_KEY'):
+        print("Se requiere GOOGLE_API_KEY para medir la latencia real de Gemini")
+        sys.exit(2)
+
+    import google.generativeai as genai
+    from gemini_files import GeminiFileRegistry, build_document_part
+
+    genai.configure(api_key=os.environ['GOOGLE_API_KEY'])
+    if args.pdf:
+        with open(args.pdf, 'rb') as f:
+            data = f.read()
+    else:
+        from synthetic_pdfs import build_pdf
+        data = build_pdf(2)
+
+    model = genai.GenerativeModel(
+        model_name=args.model,
+        generation_config={"temperature": 0.1, "response_mime_type": "application/json"},
+    )
+    registry = GeminiFileRegistry()
+    print(f"Documento: {len(data) / 1024:.0f} KB, modelo {args.model}, {args.runs} ejecuciones por modo\n")
+    header = f"{'modo':<12}{'prep p50':>10}{'gen p50':>10}{'total p50':>11}{'total p95':>11}{'total media':>13}"
+    print(header)
+    print('-' * len(header))
+
+    for mode in args.modes.split(','):
+        prep, gen, total = [], [], []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            part, path = build_document_part(
+                data,
+                mode='inline' if mode == 'inline' else 'file',
+                registry=registry if mode == 'file-reuse' else None,
+                display_name='bench.pdf',
+            )
+            prepared = time.perf_counter()
+            model.generate_content([part, PROMPT])
+            done = time.perf_counter()
+            prep.append((prepared - start) * 1000)
+            gen.append((done - prepared) * 1000)
+            total.append((done - start) * 1000)
+            if mode == 'file':
+                genai.delete_file(part.name)
+        print(f"{mode:<12}{statistics.median(prep):>10.0f}{statistics.median(gen):>10.0f}"
+              f"{statistics.median(total):>11.0f}{_percentile(total, 95):>11.0f}{statistics.mean(total):>13.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Benchmark de la ruta S3 → recorte → buffer de subida.
+
+Compara la ruta anterior (get_object ignorado + download_file a un
+NamedTemporaryFile + recorte a un segundo archivo temporal) con la ruta actual
+(un único GET en streaming a un buffer acotado y recorte en memoria).
+
+Cada modo corre en un proceso nuevo para que el pico de RSS sea comparable.
+
+Uso:
+    python benchmarks/bench_pdf_io.py --pages 40 --docs 20
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import LocalS3Client  # noqa: E402
+from synthetic_pdfs import build_pdf  # noqa: E402
+
+BUCKET = 'citas-conciliacion'
+
+
+def _legacy_path(s3_client, key):
+    """Reproduce la ruta original del handler (dos lecturas y dos temporales)"""
+    import PyPDF2
+
+    s3_client.get_object(Bucket=BUCKET, Key=key)
+    with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
+        s3_client.download_file(BUCKET, key, tmp_file.name)
+        file_path = tmp_file.name
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        pdf_writer = PyPDF2.PdfWriter()
+        for page_num in range(min(len(pdf_reader.pages), 2)):
+            pdf_writer.add_page(pdf_reader.pages[page_num])
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_trimmed:
+            trimmed_file_path = tmp_trimmed.name
+        with open(trimmed_file_path, 'wb') as output_file:
+            pdf_writer.write(output_file)
+    # La subida leía el archivo recortado desde disco
+    with open(trimmed_file_path, 'rb') as f:
+        payload = f.read()
+    return len(payload), [file_path, trimmed_file_path]
+
+
+def _streamed_path(s3_client, key):
+    from pdf_utils import fetch_s3_object, trim_pdf
+
+    buffer, _ = fetch_s3_object(s3_client, BUCKET, key)
+    try:
+        payload = io.BytesIO(trim_pdf(buffer, max_pages=2))
+    finally:
+        buffer.close()
+    return len(payload.getvalue()), []
+
+
+def run_worker(mode, pages, docs):
+    s3_client = LocalS3Client()
+    pdf = build_pdf(pages)
+    for i in range(docs):
+        s3_client.put_object(Bucket=BUCKET, Key=f"uploads/doc_{i}.pdf", Body=pdf)
+    del pdf
+    baseline_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    path_fn = _legacy_path if mode == 'legacy' else _streamed_path
+    leftover = []
+    peaks = []
+    start = time.perf_counter()
+    for i in range(docs):
+        tracemalloc.start()
+        _, tmp_files = path_fn(s3_client, f"uploads/doc_{i}.pdf")
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        leftover.extend(tmp_files)
+    elapsed = time.perf_counter() - start
+
+    tmp_bytes = sum(os.path.getsize(p) for p in leftover if os.path.exists(p))
+    for p in leftover:
+        if os.path.exists(p):
+            os.unlink(p)
+
+    print(json.dumps({
+        'mode': mode,
+        'docs': docs,
+        's3_requests_per_doc': s3_client.requests / docs,
+        'bytes_read_per_doc': s3_client.bytes_served / docs,
+        'peak_alloc_mb_per_doc': max(peaks) / 1e6,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'rss_growth_mb': (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_rss_kb) / 1024,
+        'ms_per_doc': elapsed * 1000 / docs,
+        'tmp_files_left': len(leftover),
+        'tmp_mb_left': tmp_bytes / 1e6,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=40)
+    parser.add_argument('--docs', type=int, default=20)
+    parser.add_argument('--worker', choices=['legacy', 'streamed'])
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.pages, args.docs)
+        return
+
+    print(f"PDF sintético de {args.pages} páginas, {args.docs} documentos por modo\n")
+    header = f"{'modo':<10}{'GET/doc':>8}{'MB leídos/doc':>15}{'pico MB/doc':>13}{'RSS MB':>9}{'ms/doc':>9}{'tmp restantes':>15}"
+    print(header)
+    print('-' * len(header))
+    for mode in ('legacy', 'streamed'):
+        out = subprocess.run(
+            [sys.executable, __file__, '--worker', mode, '--pages', str(args.pages), '--docs', str(args.docs)],
+            check=True, capture_output=True, text=True
+        ).stdout.strip().splitlines()[-1]
+        r = json.loads(out)
+        print(f"{r['mode']:<10}{r['s3_requests_per_doc']:>8.0f}{r['bytes_read_per_doc'] / 1e6:>15.2f}"
+              f"{r['peak_alloc_mb_per_doc']:>13.2f}{r['peak_rss_mb']:>9.1f}{r['ms_per_doc']:>9.1f}"
+              f"{r['tmp_files_left']:>8} ({r['tmp_mb_left']:.1f} MB)")
+
+
+if __name__ == '__main__':
+    main()
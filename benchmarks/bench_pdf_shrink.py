@@ -0,0 +1,129 @@
+"""
+Benchmark de la etapa de optimización del PDF recortado (pdf_shrink).
+
+Para cada caso sintético reporta el tamaño antes y después, el tiempo y tres
+controles de calidad:
+
+    texto   la extracción determinista (text_extractor) da los mismos campos
+    PSNR    fidelidad de la imagen de la primera página frente al original
+            reducido a la misma resolución (>30 dB es visualmente igual)
+    gemini  con --gemini y GOOGLE_API_KEY, porcentaje de campos que el modelo
+            extrae igual en ambas versiones
+
+Uso:
+    python benchmarks/bench_pdf_shrink.py --dpi 150 --quality 70
+    GOOGLE_API_KEY=... python benchmarks/bench_pdf_shrink.py --gemini
+"""
+import argparse
+import io
+import json
+import math
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+FIELDS = ('expediente', 'ciudad', 'cuantia', 'fecha_conciliacion', 'hora_conciliacion', 'jornada')
+
+
+def _cases():
+    from synthetic_pdfs import build_pdf
+
+    return {
+        'texto+anexos': build_pdf(10, image_size=(850, 1100)),
+        'recursos heredados': build_pdf(60, image_size=(850, 1100), shared_resources=True),
+        'escaneo 300 dpi': build_pdf(6, scanned_form_dpi=300, image_size=(850, 1100)),
+        'escaneo 200 dpi': build_pdf(6, scanned_form_dpi=200, image_size=(850, 1100)),
+    }
+
+
+def _first_image(pdf_bytes):
+    import PyPDF2
+    from PIL import Image
+
+    page = PyPDF2.PdfReader(io.BytesIO(pdf_bytes)).pages[0]
+    xobjects = page.get('/Resources', {}).get('/XObject', {})
+    for ref in xobjects.values():
+        obj = ref.get_object()
+        if obj.get('/Subtype') != '/Image':
+            continue
+        if obj.get('/Filter') == '/DCTDecode':
+            return Image.open(io.BytesIO(obj._data)).convert('L')
+        mode = 'L' if obj.get('/ColorSpace') == '/DeviceGray' else 'RGB'
+        return Image.frombytes(mode, (obj['/Width'], obj['/Height']), obj.get_data()).convert('L')
+    return None
+
+
+def psnr(original, shrunk):
+    """PSNR (dB) de la primera imagen; el original se reduce al tamaño optimizado"""
+    from PIL import Image, ImageChops, ImageStat
+
+    a, b = _first_image(original), _first_image(shrunk)
+    if a is None or b is None:
+        return None
+    a = a.resize(b.size, Image.LANCZOS)
+    mse = sum(v ** 2 for v in ImageStat.Stat(ImageChops.difference(a, b)).rms)
+    return float('inf') if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+
+def _gemini_fields(pdf_bytes, model):
+    response = model.generate_content([
+        {'mime_type': 'application/pdf', 'data': pdf_bytes},
+        "Extrae " + ", ".join(FIELDS) + " del formulario en JSON",
+    ])
+    data = json.loads(response.text)
+    return {field: str(data.get(field, '')).strip().lower() for field in FIELDS}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dpi', type=int, default=150)
+    parser.add_argument('--quality', type=int, default=70)
+    parser.add_argument('--color', action='store_true', help='No convertir a escala de grises')
+    parser.add_argument('--gemini', action='store_true', help='Comparar la extracción de Gemini (requiere GOOGLE_API_KEY)')
+    parser.add_argument('--model', default=os.environ.get('MODEL_NAME', 'gemini-1.5-flash-002'))
+    args = parser.parse_args()
+
+    from pdf_shrink import shrink_pdf
+    from pdf_utils import trim_pdf
+    from text_extractor import extract_fields
+
+    model = None
+    if args.gemini:
+        if not os.environ.get('GOOGLE_API_KEY'):
+            print("Se requiere GOOGLE_API_KEY para --gemini")
+            sys.exit(2)
+        import google.generativeai as genai
+
+        genai.configure(api_key=os.environ['GOOGLE_API_KEY'])
+        model = genai.GenerativeModel(args.model, generation_config={'response_mime_type': 'application/json'})
+
+    header = f"{'caso':<20}{'KB antes':>10}{'KB después':>12}{'ahorro':>8}{'ms':>7}{'texto':>7}{'PSNR dB':>9}{'gemini':>8}"
+    print(header)
+    print('-' * len(header))
+    real_stdout = sys.stdout
+    for name, pdf in _cases().items():
+        sys.stdout = open(os.devnull, 'w')
+        # Formulario + primer anexo, como cuando la selección incluye una página escaneada
+        trimmed = trim_pdf(io.BytesIO(pdf), max_pages=3)
+        start = time.perf_counter()
+        shrunk, stats = shrink_pdf(trimmed, target_dpi=args.dpi, quality=args.quality, grayscale=not args.color)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        text_ok = extract_fields(trimmed)['data'] == extract_fields(shrunk)['data']
+        sys.stdout = real_stdout
+
+        quality = psnr(trimmed, shrunk)
+        agreement = ''
+        if model is not None:
+            before, after = _gemini_fields(trimmed, model), _gemini_fields(shrunk, model)
+            agreement = f"{100 * sum(before[f] == after[f] for f in FIELDS) / len(FIELDS):.0f}%"
+        saving = 100 * (1 - stats['shrunk_bytes'] / stats['original_bytes'])
+        print(f"{name:<20}{len(trimmed) / 1024:>10.0f}{len(shrunk) / 1024:>12.0f}{saving:>7.0f}%{elapsed_ms:>7.0f}"
+              f"{'sí' if text_ok else 'NO':>7}{'-' if quality is None else f'{quality:.1f}':>9}{agreement:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Benchmark de PDFs con muchas páginas de anexos: tiempo, pico de RSS y bytes
+leídos de S3 para recortar el formulario.
+
+Modos:
+    legacy    download_file a /tmp + PdfReader.pages (ruta original)
+    buffered  un GET completo a un buffer acotado (fetch_s3_object) + recorte
+    ranged    open_s3_document: lectura por rangos de xref y páginas elegidas
+
+Los PDFs sintéticos se escriben en disco y el S3 local los sirve desde ahí,
+para que el tamaño del documento no cuente en el RSS del proceso medido. Cada
+combinación corre en un intérprete nuevo.
+
+Uso:
+    python benchmarks/bench_pdf_stream.py --pages 50,200,1000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+BUCKET = 'citas-conciliacion'
+MODES = ('legacy', 'buffered', 'ranged')
+
+
+def _legacy(s3_client, key):
+    import PyPDF2
+
+    with tempfile.NamedTemporaryFile(suffix='.pdf') as tmp_file:
+        s3_client.download_file(BUCKET, key, tmp_file.name)
+        with open(tmp_file.name, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            pdf_writer = PyPDF2.PdfWriter()
+            for page_num in range(min(len(pdf_reader.pages), 2)):
+                pdf_writer.add_page(pdf_reader.pages[page_num])
+            with tempfile.TemporaryFile() as output:
+                pdf_writer.write(output)
+                return output.tell()
+
+
+def _buffered(s3_client, key):
+    from pdf_utils import fetch_s3_object, trim_pdf
+
+    buffer, _ = fetch_s3_object(s3_client, BUCKET, key)
+    try:
+        return len(trim_pdf(buffer, max_pages=2))
+    finally:
+        buffer.close()
+
+
+def _ranged(s3_client, key):
+    from page_selection import select_pages
+    from pdf_utils import open_s3_document, trim_pdf
+
+    stream, _ = open_s3_document(s3_client, BUCKET, key)
+    try:
+        return len(trim_pdf(stream, pages=select_pages(stream)['pages']))
+    finally:
+        stream.close()
+
+
+def run_worker(mode, path):
+    from fakes import LocalS3Client
+    from pdf_utils import DocumentTooLargeError
+
+    import PyPDF2  # noqa: F401  (la importación no cuenta en la medición)
+
+    s3_client = LocalS3Client(root_dir=os.path.dirname(path))
+    s3_client.objects[(BUCKET, 'doc.pdf')] = (path, 'application/pdf')
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    fn = {'legacy': _legacy, 'buffered': _buffered, 'ranged': _ranged}[mode]
+
+    # Silenciar los prints de las funciones medidas
+    real_stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    start = time.perf_counter()
+    try:
+        output_bytes, status = fn(s3_client, 'doc.pdf'), 'ok'
+    except DocumentTooLargeError:
+        output_bytes, status = 0, 'rechazado'
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    sys.stdout = real_stdout
+
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        'mode': mode,
+        'status': status,
+        'ms': elapsed_ms,
+        'peak_rss_mb': peak_kb / 1024,
+        'rss_growth_mb': (peak_kb - baseline_kb) / 1024,
+        's3_requests': s3_client.requests,
+        's3_mb_read': s3_client.bytes_served / 1e6,
+        'output_kb': output_bytes / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', default='50,200,1000', help='Páginas totales por documento, separadas por coma')
+    parser.add_argument('--image-size', default='400x500', help='Resolución de cada anexo escaneado')
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--worker', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    parser.add_argument('--generate', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.path)
+        return
+    if args.generate:
+        from synthetic_pdfs import build_pdf
+
+        width, height = (int(v) for v in args.image_size.split('x'))
+        with open(args.path, 'wb') as f:
+            f.write(build_pdf(args.generate, image_size=(width, height)))
+        return
+
+    header = (f"{'páginas':>8}{'MB':>8}  {'modo':<10}{'estado':<11}{'ms':>9}{'RSS MB':>9}"
+              f"{'Δ RSS MB':>10}{'GET':>6}{'MB leídos':>11}")
+    print(header)
+    print('-' * len(header))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for pages in (int(p) for p in args.pages.split(',')):
+            path = os.path.join(tmp_dir, f'doc_{pages}.pdf')
+            # Se genera en otro proceso: el pico de RSS del padre se heredaría en los workers
+            subprocess.run([sys.executable, __file__, '--generate', str(pages), '--path', path,
+                            '--image-size', args.image_size], check=True)
+            size_mb = os.path.getsize(path) / 1e6
+            for mode in args.modes.split(','):
+                out = subprocess.run(
+                    [sys.executable, __file__, '--worker', mode, '--path', path],
+                    cwd=ROOT, check=True, capture_output=True, text=True
+                ).stdout.strip().splitlines()[-1]
+                r = json.loads(out)
+                print(f"{pages:>8}{size_mb:>8.1f}  {r['mode']:<10}{r['status']:<11}{r['ms']:>9.0f}"
+                      f"{r['peak_rss_mb']:>9.1f}{r['rss_growth_mb']:>10.1f}{r['s3_requests']:>6}"
+                      f"{r['s3_mb_read']:>11.1f}")
+            os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+"""
+Benchmark de throughput de extremo a extremo, sin red.
+
+Genera un lote de PDFs sintéticos en un S3 local, crea un evento SQS (con la
+notificación S3 dentro) por cada grupo de --batch-size documentos e invoca
+lambda_handler con --concurrency contenedores simultáneos. Gemini se reemplaza
+por un sustituto con latencia y tasa de errores configurables y los webhooks
+llegan a un servidor HTTP local.
+
+Cada contenedor es un proceso (como en Lambda, con su propio arranque en frío);
+con --threads son hilos de un único proceso. Reporta documentos por segundo,
+p50/p95/p99 por etapa (de las trazas de tracing.py), estados, origen de cada
+extracción y el pico de memoria por contenedor.
+
+Tipos de documento para --mix:
+    text    formulario digital (ruta rápida, sin modelo)
+    scan    formulario escaneado + anexos (pasa por el modelo)
+    annex   formulario digital con 200 páginas de anexos (lectura por rangos)
+
+Uso:
+    python benchmarks/bench_throughput.py --docs 200 --concurrency 8
+    python benchmarks/bench_throughput.py --mix scan:1 --model-latency-ms 2500 --model-error-rate 0.05
+    python benchmarks/bench_throughput.py --env PDF_SHRINK=0 --json > sin_shrink.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from multiprocessing.pool import ThreadPool
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+BUCKET = 'bench'
+TENANTS = ('uploads', 'cncvirtual5')
+FAKE_RESPONSE = {
+    "expediente": "CA-3020",
+    "ciudad": "Cali",
+    "convocantes": [{"rol": "CONDUCTOR", "nombre": "FELIPE PARDO", "email": "felipe@example.com"}],
+    "convocados": [{"rol": "CONDUCTOR", "nombre": "CARLOS SAENZ", "mail": "carlos@example.com"}],
+    "fecha_conciliacion": "2025-06-01",
+    "hora_conciliacion": "9:00",
+    "jornada": "AM",
+}
+
+# Estado de cada contenedor (proceso o, con --threads, el proceso único)
+_worker = {}
+_worker_lock = threading.Lock()
+
+
+def _build(kind, seed):
+    from synthetic_pdfs import build_pdf
+
+    if kind == 'text':
+        return build_pdf(4, image_size=(600, 800), seed=seed)
+    if kind == 'scan':
+        return build_pdf(4, form_pages=0, image_size=(850, 1100), seed=seed)
+    if kind == 'annex':
+        return build_pdf(200, image_size=(400, 500), seed=seed)
+    raise ValueError(f"Tipo de documento desconocido: {kind}")
+
+
+def generate_documents(root_dir, docs, unique, mix, seed):
+    """
+    Escribe los documentos únicos en root_dir y devuelve la secuencia de claves.
+
+    Con unique < docs las claves se repiten (y aciertan en la caché), como
+    cuando se carga varias veces la misma solicitud.
+    """
+    rng = random.Random(seed)
+    kinds, weights = zip(*mix.items())
+    objects = {}
+    for i in range(unique):
+        kind = rng.choices(kinds, weights)[0]
+        key = f"{TENANTS[i % len(TENANTS)]}/bench/{kind}_{i:04d}.pdf"
+        path = os.path.join(root_dir, f"{BUCKET}__{key.replace('/', '__')}")
+        with open(path, 'wb') as f:
+            f.write(_build(kind, seed * 100000 + i))
+        objects[key] = path
+    keys = list(objects)
+    sequence = keys + [rng.choice(keys) for _ in range(docs - unique)]
+    rng.shuffle(sequence)
+    return {'objects': objects, 'sequence': sequence}
+
+
+def build_events(sequence, batch_size):
+    """Un mensaje SQS por documento, agrupados en eventos de batch_size registros"""
+    events = []
+    for start in range(0, len(sequence), batch_size):
+        records = []
+        for offset, key in enumerate(sequence[start:start + batch_size]):
+            notification = {'Records': [{'s3': {'bucket': {'name': BUCKET}, 'object': {'key': key}}}]}
+            records.append({'messageId': f"msg-{start + offset}", 'body': json.dumps(notification)})
+        events.append({'Records': records, 'correlation_id': f"bench-{len(events)}"})
+    return events
+
+
+def _peak_memory_mb():
+    # VmHWM se reinicia en cada fork; ru_maxrss se hereda del padre
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _setup_worker(objects, fake_config):
+    """Prepara el contenedor: S3 local, Gemini falso y captura de trazas (una vez por proceso)"""
+    with _worker_lock:
+        if _worker.get('pid') == os.getpid():
+            return
+        from unittest import mock
+
+        from fakes import FakeGemini, LocalS3Client
+
+        sys.stdout = open(os.devnull, 'w')
+        s3 = LocalS3Client(root_dir=os.path.dirname(next(iter(objects.values()))))
+        for key, path in objects.items():
+            s3.objects[(BUCKET, key)] = (path, 'application/pdf')
+        gemini = FakeGemini(FAKE_RESPONSE, seed=os.getpid(), **fake_config)
+        for target, value in (('GenerativeModel', gemini.model_class()), ('upload_file', gemini.upload_file),
+                              ('get_file', gemini.get_file), ('configure', lambda **kwargs: None)):
+            mock.patch(f'google.generativeai.{target}', value).start()
+
+        import tracing
+        from runtime import get_runtime
+
+        traces = {}
+        # La traza se guarda en memoria en lugar de imprimirse
+        tracing.InvocationTrace.emit = lambda self, slow_ms=None: traces.setdefault(self.correlation_id, self.to_dict())
+        start = time.perf_counter()
+        import extradata_conciliacion_improved as handler
+
+        _worker.update(pid=os.getpid(), handler=handler, traces=traces, gemini=gemini,
+                       import_ms=(time.perf_counter() - start) * 1000)
+        get_runtime().s3_client = s3
+
+
+def _invoke(event):
+    from fakes import FakeLambdaContext
+
+    start = time.perf_counter()
+    try:
+        response = _worker['handler'].lambda_handler(event, FakeLambdaContext())
+        status = response['statusCode']
+    except Exception as e:
+        # Un registro S3 directo fallido relanza para que Lambda reintente
+        status = type(e).__name__
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return {
+        'pid': os.getpid(),
+        'status': status,
+        'ms': elapsed_ms,
+        'trace': _worker['traces'].pop(event['correlation_id'], None),
+        'peak_mb': _peak_memory_mb(),
+        'model_calls': _worker['gemini'].calls,
+        'import_ms': _worker['import_ms'],
+    }
+
+
+def _init(objects, fake_config):
+    _setup_worker(objects, fake_config)
+
+
+def _percentiles(values):
+    from trace_report import _percentile
+
+    if not values:
+        return None
+    return {f"p{p}": round(_percentile(values, p), 1) for p in (50, 95, 99)}
+
+
+def summarize_run(results, wall_s, sink):
+    from trace_report import summarize
+
+    traces = [r['trace'] for r in results if r['trace']]
+    records, stages = summarize(traces)
+    per_worker = {}
+    for r in results:
+        per_worker[r['pid']] = r
+    return {
+        'documents': len(records),
+        'invocations': len(results),
+        'wall_s': round(wall_s, 2),
+        'docs_per_s': round(len(records) / wall_s, 2) if wall_s else None,
+        'statuses': dict(Counter(r['status'] for r in records)),
+        'sources': dict(Counter(r['attrs'].get('source', '-') for r in records if r['status'] == 'ok')),
+        'invocation_ms': _percentiles([r['ms'] for r in results]),
+        'record_ms': _percentiles([r['duration_ms'] for r in records]),
+        'stages_ms': {name: dict(_percentiles(values), n=len(values))
+                      for name, values in sorted(stages.items(), key=lambda item: -sum(item[1]))},
+        'containers': len(per_worker),
+        'import_ms': round(max(r['import_ms'] for r in per_worker.values()), 1),
+        'peak_memory_mb': round(max(r['peak_mb'] for r in per_worker.values()), 1),
+        'model_calls': sum(r['model_calls'] for r in per_worker.values()),
+        'webhooks': {'received': sink.received, 'failed': sink.failed, 'requests': sink.requests,
+                     'bytes': sink.bytes_received},
+        'cold_starts': sum(1 for t in traces if t['cold_start']),
+    }
+
+
+def print_report(report, args):
+    print(f"{report['documents']} documentos en {report['invocations']} invocaciones, "
+          f"{report['containers']} contenedores ({'hilos' if args.threads else 'procesos'}), {report['wall_s']} s")
+    print(f"Throughput: {report['docs_per_s']} documentos/s")
+    print(f"Estados: {report['statuses']}  Origen: {report['sources']}")
+    print(f"Llamadas al modelo: {report['model_calls']}  Webhooks: {report['webhooks']}  "
+          f"Arranques en frío: {report['cold_starts']} (importación ≤ {report['import_ms']} ms)")
+    print(f"Pico de memoria por contenedor: {report['peak_memory_mb']} MB\n")
+    header = f"{'etapa':<16}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print('-' * len(header))
+    rows = [('invocación', dict(report['invocation_ms'], n=report['invocations'])),
+            ('documento', dict(report['record_ms'] or {}, n=report['documents']))]
+    for name, p in rows + list(report['stages_ms'].items()):
+        if 'p50' in p:
+            print(f"{name:<16}{p['n']:>6}{p['p50']:>10.1f}{p['p95']:>10.1f}{p['p99']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=100, help='Documentos a procesar')
+    parser.add_argument('--unique', type=int, help='Documentos distintos (por defecto todos)')
+    parser.add_argument('--mix', default='text:0.4,scan:0.6', help='Proporción de tipos, p. ej. text:0.3,scan:0.6,annex:0.1')
+    parser.add_argument('--concurrency', type=int, default=4, help='Contenedores simultáneos')
+    parser.add_argument('--batch-size', type=int, default=1, help='Registros SQS por invocación')
+    parser.add_argument('--threads', action='store_true', help='Contenedores como hilos de un solo proceso')
+    parser.add_argument('--model-latency-ms', type=float, default=1500, help='Mediana de latencia de generate_content')
+    parser.add_argument('--model-jitter', type=float, default=0.35, help='Desviación log-normal de la latencia')
+    parser.add_argument('--model-error-rate', type=float, default=0.0)
+    parser.add_argument('--upload-latency-ms', type=float, default=800, help='Latencia de la File API')
+    parser.add_argument('--webhook-latency-ms', type=float, default=30)
+    parser.add_argument('--webhook-error-rate', type=float, default=0.0)
+    parser.add_argument('--env', action='append', default=[], help='Variable de la lambda, KEY=VALUE (repetible)')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', action='store_true', help='Imprimir el resultado en JSON')
+    parser.add_argument('--generate', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    mix = {kind: float(weight) for kind, weight in (item.split(':') for item in args.mix.split(','))}
+    unique = min(args.unique or args.docs, args.docs)
+    if args.generate:
+        print(json.dumps(generate_documents(args.generate, args.docs, unique, mix, args.seed)))
+        return
+
+    from fakes import WebhookSink
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        docs_dir = os.path.join(tmp_dir, 'docs')
+        os.makedirs(docs_dir)
+        # Los PDFs se generan en otro proceso para no inflar la memoria heredada por los contenedores
+        generated = json.loads(subprocess.run(
+            [sys.executable, __file__, '--generate', docs_dir, '--docs', str(args.docs), '--unique', str(unique),
+             '--mix', args.mix, '--seed', str(args.seed)],
+            check=True, capture_output=True, text=True
+        ).stdout)
+
+        sink = WebhookSink(latency_ms=args.webhook_latency_ms, error_rate=args.webhook_error_rate,
+                           seed=args.seed).start()
+        os.environ.update({
+            'CACHE_DIR': os.path.join(tmp_dir, 'cache'),
+            'USAGE_LEDGER_PATH': os.path.join(tmp_dir, 'usage.jsonl'),
+            'FILE_REGISTRY_PATH': os.path.join(tmp_dir, 'files.db'),
+            'CHECKPOINT_PATH': os.path.join(tmp_dir, 'checkpoints.db'),
+            'IDEMPOTENCY_PATH': os.path.join(tmp_dir, 'idempotency.db'),
+            'WEBHOOK_OUTBOX_PATH': os.path.join(tmp_dir, 'webhook_outbox.db'),
+            # Los documentos repetidos miden la caché; --env IDEMPOTENCY_BACKEND=sqlite los reconoce como duplicados
+            'IDEMPOTENCY_BACKEND': '',
+            'WEBHOOK_URL': sink.url,
+            'MODEL_NAME': os.environ.get('MODEL_NAME', 'gemini-1.5-flash-002'),
+            'GOOGLE_API_KEY': 'fake',
+            'AWS_DEFAULT_REGION': 'us-east-1',
+            'TRACE_SAMPLE_RATE': '1',
+            'FAIL_ON_RECORD_ERROR': '0',
+        })
+        os.environ.update(dict(item.split('=', 1) for item in args.env))
+
+        events = build_events(generated['sequence'], args.batch_size)
+        fake_config = {'latency_ms': args.model_latency_ms, 'jitter': args.model_jitter,
+                       'error_rate': args.model_error_rate, 'upload_latency_ms': args.upload_latency_ms}
+        real_stdout = sys.stdout
+        if args.threads:
+            _setup_worker(generated['objects'], fake_config)
+            pool = ThreadPool(args.concurrency)
+        else:
+            pool = multiprocessing.get_context('fork').Pool(
+                args.concurrency, initializer=_init, initargs=(generated['objects'], fake_config)
+            )
+        start = time.perf_counter()
+        with pool:
+            results = list(pool.imap_unordered(_invoke, events))
+        wall_s = time.perf_counter() - start
+        sys.stdout = real_stdout
+        sink.stop()
+
+    report = summarize_run(results, wall_s, sink)
+    report['config'] = {'docs': args.docs, 'unique': unique, 'mix': mix, 'concurrency': args.concurrency,
+                        'batch_size': args.batch_size, 'threads': args.threads, **fake_config,
+                        'webhook_latency_ms': args.webhook_latency_ms, 'env': args.env}
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print_report(report, args)
+
+
+if __name__ == '__main__':
+    main()
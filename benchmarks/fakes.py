@@ -0,0 +1,349 @@
+"""
+Sustitutos locales de servicios externos para los benchmarks.
+
+LocalS3Client implementa el subconjunto de la API de boto3 que usan las
+lambdas y la app de carga (get_object con Range, head_object, download_file,
+put_object, upload_fileobj) sobre un dict en memoria, o sobre archivos en
+disco si se indica root_dir para que los documentos grandes no cuenten en el
+RSS del proceso, y cuenta peticiones y bytes servidos.
+
+FakeGemini reemplaza GenerativeModel y la File API con latencia y tasa de
+errores configurables; WebhookSink es un servidor HTTP local que recibe los
+webhooks (también en lote, con confirmación por elemento); FakeLambdaContext imita el contexto de Lambda.
+"""
+import gzip
+import json
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+
+class _NoSuchKey(Exception):
+    pass
+
+
+class _ClientError(Exception):
+    pass
+
+
+class _Exceptions:
+    NoSuchKey = _NoSuchKey
+    ClientError = _ClientError
+
+
+class _StreamingBody:
+    """Imita botocore.response.StreamingBody sobre bytes en memoria"""
+
+    def __init__(self, data, counter):
+        self._data = data
+        self._pos = 0
+        self._counter = counter
+
+    def read(self, amt=None):
+        end = len(self._data) if amt is None else min(len(self._data), self._pos + amt)
+        chunk = self._data[self._pos:end]
+        self._pos = end
+        self._counter(len(chunk))
+        return chunk
+
+    def iter_chunks(self, chunk_size=1024):
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        pass
+
+
+class _FileStreamingBody(_StreamingBody):
+    """StreamingBody que lee un rango de un archivo en disco bajo demanda"""
+
+    def __init__(self, path, start, end, counter):
+        self._file = open(path, 'rb')
+        self._file.seek(start)
+        self._remaining = end - start
+        self._counter = counter
+
+    def read(self, amt=None):
+        amt = self._remaining if amt is None else min(amt, self._remaining)
+        chunk = self._file.read(amt)
+        self._remaining -= len(chunk)
+        self._counter(len(chunk))
+        return chunk
+
+    def close(self):
+        self._file.close()
+
+
+class LocalS3Client:
+    """Almacén de objetos en memoria con la forma del cliente S3 de boto3"""
+
+    exceptions = _Exceptions
+
+    def __init__(self, objects=None, root_dir=None):
+        # {(bucket, key): (bytes, content_type)}; con root_dir, bytes es la ruta del archivo
+        self.objects = dict(objects or {})
+        self.root_dir = root_dir
+        self.requests = 0
+        self.bytes_served = 0
+        self._lock = threading.Lock()
+
+    def _count(self, n):
+        with self._lock:
+            self.bytes_served += n
+
+    def _lookup(self, bucket, key):
+        with self._lock:
+            self.requests += 1
+        try:
+            return self.objects[(bucket, key)]
+        except KeyError:
+            raise _NoSuchKey(f"{bucket}/{key}")
+
+    def put_object(self, Bucket, Key, Body, ContentType='application/pdf'):
+        if self.root_dir:
+            path = os.path.join(self.root_dir, f"{Bucket}__{Key.replace('/', '__')}")
+            with open(path, 'wb') as f:
+                f.write(Body)
+            self.objects[(Bucket, Key)] = (path, ContentType)
+        else:
+            self.objects[(Bucket, Key)] = (bytes(Body), ContentType)
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None):
+        content_type = (ExtraArgs or {}).get('ContentType', 'application/octet-stream')
+        self.put_object(Bucket, Key, Fileobj.read(), ContentType=content_type)
+
+    def _size(self, data):
+        return os.path.getsize(data) if self.root_dir else len(data)
+
+    def _body(self, data, start=0, end=None):
+        end = self._size(data) if end is None else end
+        if self.root_dir:
+            return _FileStreamingBody(data, start, end, self._count)
+        return _StreamingBody(data[start:end], self._count)
+
+    @staticmethod
+    def _etag(data, size):
+        return f'"{hash((data, size)) & 0xffffffff:08x}"'
+
+    def head_object(self, Bucket, Key):
+        data, content_type = self._lookup(Bucket, Key)
+        size = self._size(data)
+        return {'ContentLength': size, 'ContentType': content_type, 'ETag': self._etag(data, size)}
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None):
+        data, content_type = self._lookup(Bucket, Key)
+        size = self._size(data)
+        etag = self._etag(data, size)
+        if IfMatch and IfMatch != etag:
+            raise _ClientError("PreconditionFailed")
+        response = {'ContentType': content_type, 'ETag': etag}
+        start, end = 0, size
+        if Range:
+            first, _, last = Range.replace('bytes=', '').partition('-')
+            if first == '':
+                start = max(0, size - int(last))
+            else:
+                start, end = int(first), min(size, int(last) + 1) if last else size
+            response['ContentRange'] = f"bytes {start}-{end - 1}/{size}"
+        response['Body'] = self._body(data, start, end)
+        response['ContentLength'] = end - start
+        return response
+
+    def download_file(self, Bucket, Key, Filename):
+        data, _ = self._lookup(Bucket, Key)
+        body = self._body(data)
+        with open(Filename, 'wb') as f:
+            for chunk in body.iter_chunks(1024 * 1024):
+                f.write(chunk)
+        body.close()
+
+
+class FakeGemini:
+    """
+    Sustituto de google.generativeai para generate_content, count_tokens y la File API.
+
+    La latencia de cada llamada sigue una log-normal con mediana latency_ms
+    (jitter es su desviación en escala logarítmica); con probabilidad
+    error_rate la llamada falla como un 503 del servicio.
+    """
+
+    def __init__(self, response, latency_ms=0, jitter=0.0, error_rate=0.0, upload_latency_ms=0, seed=None):
+        self.response = response
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.upload_latency_ms = upload_latency_ms
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.errors = 0
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def reseed(self, seed):
+        """Cada proceso del benchmark necesita su propia secuencia aleatoria"""
+        self.rng = random.Random(seed)
+
+    def _sleep(self, median_ms):
+        if median_ms:
+            with self._lock:
+                factor = math.exp(self.rng.gauss(0, self.jitter)) if self.jitter else 1.0
+            time.sleep(median_ms * factor / 1000)
+
+    @staticmethod
+    def _pages(parts):
+        for part in parts:
+            data = part.get('data') if isinstance(part, dict) else getattr(part, 'data', None)
+            if data:
+                return max(1, data.count(b'/Type /Page') - data.count(b'/Type /Pages'))
+        return 1
+
+    def generate(self, parts):
+        self._sleep(self.latency_ms)
+        with self._lock:
+            self.calls += 1
+            failed = self.rng.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if failed:
+            try:
+                from google.api_core.exceptions import ServiceUnavailable
+            except ImportError:
+                ServiceUnavailable = Exception
+            raise ServiceUnavailable("503 The model is overloaded (simulado)")
+        prompt_tokens = 258 * self._pages(parts) + 400
+        text = json.dumps(self.response)
+        usage = SimpleNamespace(prompt_token_count=prompt_tokens, candidates_token_count=len(text) // 4,
+                                cached_content_token_count=0, total_token_count=prompt_tokens + len(text) // 4)
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    def model_class(self):
+        """Clase con la firma de GenerativeModel ligada a este sustituto"""
+        fake = self
+
+        class FakeGenerativeModel:
+            def __init__(self, model_name=None, **kwargs):
+                self.model_name = model_name
+
+            def generate_content(self, contents, **kwargs):
+                return fake.generate(contents)
+
+            def count_tokens(self, contents):
+                return SimpleNamespace(total_tokens=258 * fake._pages(contents))
+
+        return FakeGenerativeModel
+
+    def upload_file(self, stream, mime_type=None, display_name=None):
+        self._sleep(self.upload_latency_ms)
+        name = f"files/{uuid.uuid4().hex[:12]}"
+        file = SimpleNamespace(name=name, uri=f"https://fake/{name}", display_name=display_name,
+                               state=SimpleNamespace(name='ACTIVE'), expiration_time=time.time() + 48 * 3600,
+                               mime_type=mime_type)
+        self._files[name] = file
+        return file
+
+    def get_file(self, name):
+        return self._files[name]
+
+
+class WebhookSink:
+    """
+    Servidor HTTP local que recibe los webhooks, con latencia y errores configurables.
+
+    Un lote (cabecera X-Webhook-Batch, cuerpo gzip/zstd según Content-Encoding)
+    se responde con el estado de cada elemento, y los errores se sortean por
+    elemento. received y failed cuentan documentos; requests, peticiones;
+    batches guarda la codificación y los elementos ya descomprimidos de cada lote.
+    """
+
+    def __init__(self, latency_ms=0, error_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.received = 0
+        self.failed = 0
+        self.bytes_received = 0
+        self.requests = 0
+        self.batches = []
+        self._lock = threading.Lock()
+        self._server = None
+
+    def start(self):
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if sink.latency_ms:
+                    time.sleep(sink.latency_ms / 1000)
+                if self.headers.get('X-Webhook-Batch'):
+                    self._batch(body)
+                    return
+                with sink._lock:
+                    failed = sink.rng.random() < sink.error_rate
+                    sink.received += 1
+                    sink.requests += 1
+                    sink.failed += failed
+                    sink.bytes_received += len(body)
+                self._reply(500 if failed else 200, b'ok')
+
+            def _batch(self, body):
+                encoding = self.headers.get('Content-Encoding')
+                data = body
+                if encoding == 'gzip':
+                    data = gzip.decompress(body)
+                elif encoding == 'zstd':
+                    import zstandard
+
+                    data = zstandard.ZstdDecompressor().decompressobj().decompress(body)
+                items = json.loads(data)
+                with sink._lock:
+                    acks = [{'id': item['id'], 'status': 500 if sink.rng.random() < sink.error_rate else 200}
+                            for item in items]
+                    sink.received += len(items)
+                    sink.requests += 1
+                    sink.failed += sum(1 for ack in acks if ack['status'] >= 400)
+                    sink.bytes_received += len(body)
+                    sink.batches.append({'encoding': encoding, 'items': items})
+                self._reply(200, json.dumps(acks).encode('utf-8'))
+
+            def _reply(self, status, payload):
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/webhook"
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+class FakeLambdaContext:
+    """Contexto mínimo de Lambda: request id y tiempo restante"""
+
+    def __init__(self, timeout_ms=900000):
+        self.aws_request_id = uuid.uuid4().hex
+        self._deadline = time.monotonic() + timeout_ms / 1000
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self._deadline - time.monotonic()) * 1000))
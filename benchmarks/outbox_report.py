@@ -0,0 +1,85 @@
+"""
+Estado del outbox de webhooks (webhook_outbox.py).
+
+Muestra cuántas entregas hay por estado (pending, sending, delivered, dead)
+y el dead-letter: entregas que agotaron los intentos o que n8n rechazó, con
+el documento, los intentos y el último error. Con --redrive las devuelve a
+la cola y las reenvía (requiere red hacia el webhook).
+
+Uso:
+    python benchmarks/outbox_report.py --path /mnt/efs/webhook_outbox.db
+    python benchmarks/outbox_report.py --id 3f2a...            # estado de una entrega
+    python benchmarks/outbox_report.py --redrive all
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def main():
+    from webhook_outbox import WEBHOOK_OUTBOX_PATH, OutboxStore
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--path', default=WEBHOOK_OUTBOX_PATH or None, help='Archivo SQLite del outbox '
+                        '(por defecto WEBHOOK_OUTBOX_PATH)')
+    parser.add_argument('--id', help='Mostrar el estado de una entrega')
+    parser.add_argument('--top', type=int, default=20, help='Entregas del dead-letter a listar')
+    parser.add_argument('--redrive', help="Reenviar una entrega del dead-letter por id, o 'all'")
+    args = parser.parse_args()
+
+    if not args.path:
+        parser.error('indique --path o WEBHOOK_OUTBOX_PATH')
+    if not os.path.exists(args.path):
+        print(f"Sin outbox en {args.path}")
+        return 0
+    store = OutboxStore(args.path)
+
+    if args.id:
+        entry = store.get(args.id)
+        if entry is None:
+            print(f"No existe la entrega {args.id}")
+            return 1
+        entry.pop('body')
+        print(json.dumps(entry, ensure_ascii=False, indent=2))
+        return 0
+
+    if args.redrive:
+        from runtime import get_runtime
+        from webhook_outbox import WebhookOutbox
+
+        outbox = WebhookOutbox(store, get_runtime().post)
+        ids = [e['id'] for e in store.list('dead', limit=10 ** 6)] if args.redrive == 'all' else [args.redrive]
+        for delivery_id in ids:
+            outbox.redrive(delivery_id)
+        outbox.drain()
+        results = [store.get(i) for i in ids]
+        delivered = sum(1 for e in results if e and e['status'] == 'delivered')
+        print(f"Reenviadas: {len(ids)}, entregadas: {delivered}, siguen en dead-letter: {len(ids) - delivered}")
+        return 0 if delivered == len(ids) else 1
+
+    counts = store.counts()
+    print('Entregas por estado: ' + ', '.join(f"{status}={counts.get(status, 0)}"
+                                                for status in ('pending', 'sending', 'delivered', 'dead')))
+    dead = store.list('dead', limit=args.top)
+    if not dead:
+        return 0
+    print(f"\nDead-letter ({counts['dead']}):")
+    header = f"{'id':<34}{'documento':<40}{'intentos':>9}{'HTTP':>6}  {'hace':>8}  último error"
+    print(header)
+    print('-' * len(header))
+    for entry in dead:
+        document = entry['document'] or '-'
+        label = document if len(document) <= 38 else '…' + document[-37:]
+        age = f"{(time.time() - entry['updated_at']) / 60:.0f} min"
+        print(f"{entry['id']:<34}{label:<40}{entry['attempts']:>9}{entry['status_code'] or '-':>6}  {age:>8}  "
+              f"{(entry['last_error'] or '')[:80]}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+Regresión del post-proceso sobre respuestas grabadas del modelo (model_cassettes.py).
+
+Cada casete guarda la respuesta cruda de una llamada. Este script vuelve a
+pasarlas por el mismo camino que la lambda (parseo, normalización,
+validación y fechas) sin red ni costo, y compara el resultado con una línea
+base guardada: sirve para cambiar process_datetime_fields y compañía y ver
+de inmediato qué documentos históricos cambian.
+
+Los casetes se graban una vez, pagando las llamadas, ejecutando la lambda con
+LLM_CASSETTE_MODE=record (o 'auto') y LLM_CASSETTE_DIR en un directorio
+persistente (p. ej. un montaje EFS). Con LLM_CASSETTE_MODE=replay la lambda
+completa también corre sin red sobre los mismos documentos.
+
+Uso:
+    python benchmarks/replay_cassettes.py --dir casetes/ --baseline base.json --update
+    python benchmarks/replay_cassettes.py --dir casetes/ --baseline base.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def replay(cassette):
+    """Post-proceso completo de la respuesta grabada (los prints de la lambda se descartan)"""
+    from extraction_engine import postprocess_extraction
+    from extraction_schema import normalize_response
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            return postprocess_extraction(normalize_response(json.loads(cassette['text'])))
+        except Exception as e:
+            return {'__error__': f"{type(e).__name__}: {e}"}
+
+
+def diff_fields(old, new):
+    """Campos de primer nivel que cambian entre dos resultados"""
+    keys = sorted(set(old) | set(new))
+    return [(k, old.get(k), new.get(k)) for k in keys if old.get(k) != new.get(k)]
+
+
+def main():
+    from model_cassettes import LLM_CASSETTE_DIR, CassetteStore
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dir', default=LLM_CASSETTE_DIR, help='Directorio de casetes')
+    parser.add_argument('--baseline', help='JSON con los resultados de referencia')
+    parser.add_argument('--update', action='store_true', help='Reescribir la línea base con los resultados actuales')
+    parser.add_argument('--show', type=int, default=10, help='Documentos con cambios a detallar')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = {}
+    names = {}
+    for cassette in CassetteStore(args.dir).entries():
+        results[cassette['fingerprint']] = replay(cassette)
+        names[cassette['fingerprint']] = cassette.get('display_name') or cassette['document_hash'][:16]
+    elapsed = time.perf_counter() - start
+    if not results:
+        print(f"Sin casetes en {args.dir}")
+        return 0
+    errors = sum('__error__' in r for r in results.values())
+    print(f"{len(results)} casetes reproducidos en {elapsed * 1000:.0f} ms ({errors} con error)")
+
+    if not args.baseline:
+        return 1 if errors else 0
+    if args.update or not os.path.exists(args.baseline):
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=1, sort_keys=True)
+        print(f"Línea base escrita en {args.baseline}")
+        return 0
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    changed = [fp for fp in results if fp in baseline and results[fp] != baseline[fp]]
+    new = [fp for fp in results if fp not in baseline]
+    missing = [fp for fp in baseline if fp not in results]
+    print(f"Sin cambios: {len(results) - len(changed) - len(new)}, cambiados: {len(changed)}, "
+          f"nuevos: {len(new)}, ausentes: {len(missing)}")
+    for fp in changed[:args.show]:
+        print(f"\n  {names[fp]} ({fp})")
+        for field, old, value in diff_fields(baseline[fp], results[fp]):
+            print(f"    {field}: {json.dumps(old, ensure_ascii=False)} → {json.dumps(value, ensure_ascii=False)}")
+    return 1 if changed or errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""
+Generador de PDFs sintéticos para los benchmarks.
+
+Escribe el PDF directamente (sin librerías) para poder crear documentos de
+cientos de páginas en milisegundos. Las primeras páginas simulan el formulario
+de solicitud de conciliación con capa de texto; el resto simula anexos
+escaneados (una imagen por página, sin texto). Con scanned_form_dpi el
+formulario también es un escaneo (texto dibujado con Pillow sobre una imagen).
+"""
+import random
+import zlib
+
+FORM_PAGE_LINES = [
+    [
+        "SOLICITUD DE AUDIENCIA DE CONCILIACION",
+        "Expediente: CA-3020",
+        "Ciudad: Bogota [ ] Cali [X] Medellin [ ] Barranquilla [ ]",
+        "CONVOCANTE",
+        "Conductor: FELIPE PARDO  E-mail: felipe.pardo@example.com  Telefono: 3001234567",
+        "Propietario: PABLO MARMOL  E-mail: impacta.inc@example.com  Telefono: 3210000000",
+        "CONVOCADO",
+        "Conductor: CARLOS SAENZ  E-mail: carlos.saenz@example.com  Telefono: 676767",
+        "Propietario: CHECO PEREZ  E-mail: agente@example.com  Telefono: 787878",
+        "Cuantia: $ 5.450.000",
+        "Fecha de la audiencia: 2025-06-01  Hora: 9:00  AM [X] PM [ ]",
+    ],
+    [
+        "HECHOS: El dia 10 de mayo de 2025 en la calle 5 se presento un choque.",
+        "PETICIONES: Valor del siniestro.",
+        "FIRMA DEL SOLICITANTE",
+    ],
+]
+
+# Tabla para llevar el ruido a tonos claros (200-255)
+_LIGHT_GRAY = bytes(200 + b % 56 for b in range(256))
+# Ruido alrededor del blanco del papel para los formularios escaneados
+_NOISE = bytes(225 + b % 31 for b in range(256))
+
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _text_stream(lines):
+    parts = ["BT /F1 10 Tf 50 780 Td 14 TL"]
+    for line in lines:
+        parts.append(f"({_escape(line)}) Tj T*")
+    parts.append("ET")
+    return "\n".join(parts).encode('latin-1')
+
+
+def scanned_form_pixels(lines, dpi, seed=7):
+    """Dibuja las líneas del formulario sobre una hoja A4 en escala de grises (requiere Pillow)"""
+    from PIL import Image, ImageDraw, ImageFont
+
+    width, height = round(8.27 * dpi), round(11.69 * dpi)
+    image = Image.new('L', (width, height), 250)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=max(10, dpi // 7))
+    margin, step = dpi // 2, dpi // 4
+    for i, line in enumerate(lines):
+        draw.text((margin, margin + i * step), line, fill=20, font=font)
+    # Ruido de escáner leve
+    noise = Image.frombytes('L', (width, height), random.Random(seed).randbytes(width * height).translate(_NOISE))
+    image = Image.composite(noise, image, Image.new('L', (width, height), 24))
+    return image.width, image.height, image.tobytes()
+
+
+def build_pdf(total_pages, form_pages=2, image_size=(850, 1100), unique_images=True, seed=7, form_fields=None,
+              scanned_form_dpi=None, shared_resources=False):
+    """
+    Construye un PDF sintético en memoria.
+
+    Args:
+        total_pages: Número total de páginas
+        form_pages: Páginas iniciales con texto de formulario
+        image_size: Resolución (ancho, alto) de la imagen de cada anexo; None para no incluir imágenes
+        unique_images: Si es False, todos los anexos comparten la misma imagen
+        seed: Semilla para el ruido de las imágenes
+        form_fields: dict nombre -> valor para agregar campos AcroForm en la
+            primera página (str para texto, bool para casillas de chequeo)
+        scanned_form_dpi: Si se indica, las páginas del formulario son imágenes
+            a esa resolución, sin capa de texto
+        shared_resources: Las imágenes de los anexos se declaran en el nodo
+            /Pages y todas las páginas las heredan, como hacen algunos escáneres
+
+    Returns:
+        bytes: Documento PDF
+    """
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog_id = add(None)
+    pages_id = add(None)
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    def add_image(page_seed, pixels=None, size=None):
+        width, height = size or image_size
+        # Ruido claro determinista: se comprime mal, como un escaneo real
+        if pixels is None:
+            pixels = random.Random(page_seed).randbytes(width * height).translate(_LIGHT_GRAY)
+        data = zlib.compress(pixels, 1)
+        return add(
+            f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+            f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode "
+            f"/Length {len(data)} >>\nstream\n".encode('latin-1') + data + b"\nendstream"
+        )
+
+    shared_image_id = add_image(seed) if image_size and not unique_images else None
+
+    page_ids = []
+    field_ids = []
+    inherited_images = {}
+    for page_num in range(total_pages):
+        if page_num < form_pages:
+            lines = FORM_PAGE_LINES[min(page_num, len(FORM_PAGE_LINES) - 1)]
+            if scanned_form_dpi:
+                width, height, pixels = scanned_form_pixels(lines + [f"Radicado: {seed}"], scanned_form_dpi, seed)
+                image_id = add_image(None, pixels=pixels, size=(width, height))
+                content = b"q 595 0 0 842 0 0 cm /Im1 Do Q"
+                resources = f"<< /XObject << /Im1 {image_id} 0 R >> >>"
+            else:
+                content = _text_stream(lines + [f"Radicado: {seed}"])
+                resources = f"<< /Font << /F1 {font_id} 0 R >> >>"
+        elif image_size and shared_resources:
+            name = f"Im{page_num}"
+            inherited_images[name] = shared_image_id or add_image(seed + page_num)
+            content = f"q 595 0 0 842 0 0 cm /{name} Do Q".encode('latin-1')
+            resources = None
+        elif image_size:
+            image_id = shared_image_id or add_image(seed + page_num)
+            content = b"q 595 0 0 842 0 0 cm /Im1 Do Q"
+            resources = f"<< /XObject << /Im1 {image_id} 0 R >> >>"
+        else:
+            content = _text_stream([f"ANEXO {page_num + 1}"])
+            resources = f"<< /Font << /F1 {font_id} 0 R >> >>"
+        content_id = add(
+            f"<< /Length {len(content)} >>\nstream\n".encode('latin-1') + content + b"\nendstream"
+        )
+        annots = ""
+        if form_fields and page_num == 0:
+            page_id = len(objects) + len(form_fields) + 1
+            for i, (name, value) in enumerate(form_fields.items()):
+                if isinstance(value, bool):
+                    state = "/Yes" if value else "/Off"
+                    field = f"/FT /Btn /V {state} /AS {state}"
+                else:
+                    field = f"/FT /Tx /V ({_escape(value)})"
+                field_ids.append(add(
+                    f"<< /Type /Annot /Subtype /Widget /T ({_escape(name)}) {field} "
+                    f"/Rect [50 {700 - 14 * i} 250 {712 - 14 * i}] /P {page_id} 0 R >>".encode('latin-1')
+                ))
+            annots = " /Annots [" + " ".join(f"{fid} 0 R" for fid in field_ids) + "]"
+        resources = f"/Resources {resources} " if resources else ""
+        page_ids.append(add(
+            f"<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 595 842] "
+            f"{resources}/Contents {content_id} 0 R{annots} >>".encode('latin-1')
+        ))
+
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    inherited = ""
+    if inherited_images:
+        xobjects = " ".join(f"/{name} {image_id} 0 R" for name, image_id in inherited_images.items())
+        inherited = f" /Resources << /XObject << {xobjects} >> >>"
+    objects[pages_id - 1] = (
+        f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)}{inherited} >>".encode('latin-1')
+    )
+    acroform = ""
+    if field_ids:
+        acroform = " /AcroForm << /Fields [" + " ".join(f"{fid} 0 R" for fid in field_ids) + "] >>"
+    objects[catalog_id - 1] = f"<< /Type /Catalog /Pages {pages_id} 0 R{acroform} >>".encode('latin-1')
+
+    output = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n".encode('latin-1') + body + b"\nendobj\n"
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('latin-1')
+    for offset in offsets:
+        output += f"{offset:010d} 00000 n \n".encode('latin-1')
+    output += (
+        f"trailer\n<< /Size {len(objects) + 1} /Root {catalog_id} 0 R >>\n"
+        f"startxref\n{xref_offset}\n%%EOF\n"
+    ).encode('latin-1')
+    return bytes(output)
@@ -0,0 +1,105 @@
+"""
+Resumen de latencia por etapa a partir de las trazas de la lambda (tracing.py).
+
+Lee líneas de log (exportadas de CloudWatch o de una corrida local), toma las
+que son trazas JSON y muestra p50/p95/p99 de cada etapa, además de qué etapas
+dominan en los registros más lentos (los del p99 de duración).
+
+Uso:
+    aws logs tail /aws/lambda/extradata --since 1d > trazas.log
+    python benchmarks/trace_report.py trazas.log
+    python benchmarks/trace_report.py < trazas.log
+"""
+import argparse
+import json
+import sys
+from collections import defaultdict
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def iter_traces(lines):
+    """Trazas contenidas en las líneas de log (ignora el resto de prints)"""
+    for line in lines:
+        start = line.find('{"type": "trace"')
+        if start < 0:
+            continue
+        try:
+            yield json.loads(line[start:])
+        except ValueError:
+            continue
+
+
+def summarize(traces):
+    """
+    Agrupa los tiempos por etapa de todos los registros.
+
+    Returns:
+        tuple: (lista de registros, dict etapa -> lista de ms)
+    """
+    records = [r for t in traces for r in t['records']]
+    stages = defaultdict(list)
+    for record in records:
+        for name, ms in record['stages'].items():
+            stages[name].append(ms)
+    return records, stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('log', nargs='?', help='Archivo de log (por defecto stdin)')
+    args = parser.parse_args()
+
+    lines = open(args.log, encoding='utf-8') if args.log else sys.stdin
+    traces = list(iter_traces(lines))
+    records, stages = summarize(traces)
+    if not records:
+        print("No se encontraron trazas")
+        return
+
+    durations = [r['duration_ms'] for r in records]
+    statuses = defaultdict(int)
+    for record in records:
+        statuses[record['status']] += 1
+    print(f"{len(traces)} invocaciones, {len(records)} registros "
+          f"({', '.join(f'{k}={v}' for k, v in sorted(statuses.items()))}), "
+          f"{sum(t['cold_start'] for t in traces)} arranques en frío")
+
+    header = f"{'etapa':<14}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'máx ms':>10}"
+    print(header)
+    print('-' * len(header))
+    rows = [('total', durations)] + sorted(stages.items(), key=lambda item: -sum(item[1]))
+    for name, values in rows:
+        print(f"{name:<14}{len(values):>6}{_percentile(values, 50):>10.0f}{_percentile(values, 95):>10.0f}"
+              f"{_percentile(values, 99):>10.0f}{max(values):>10.0f}")
+
+    # ¿En qué se va el p99? Participación de cada etapa en los registros más lentos
+    threshold = _percentile(durations, 99)
+    slow = [r for r in records if r['duration_ms'] >= threshold]
+    share = defaultdict(float)
+    for record in slow:
+        for name, ms in record['stages'].items():
+            share[name] += ms
+    total = sum(r['duration_ms'] for r in slow) or 1
+    print(f"\nRegistros ≥ p99 ({threshold:.0f} ms): {len(slow)}")
+    for name, ms in sorted(share.items(), key=lambda item: -item[1]):
+        print(f"  {name:<14}{100 * ms / total:>6.1f}%")
+    for record in slow[:5]:
+        print(f"  {record['correlation_id']}  {record['key']}  {record['duration_ms']:.0f} ms  "
+              f"{record['attrs'].get('source', '')}")
+
+    # Cobertura de llamadas (HEDGE_REQUESTS=1): cuántas veces se dispara y cuántas gana
+    hedged = [r for r in records if 'hedge' in r['attrs']]
+    if hedged:
+        fired = [r for r in hedged if r['attrs'].get('hedge_fired')]
+        won = [r for r in fired if r['attrs']['hedge'] == 'hedge']
+        print(f"\nCobertura: {len(fired)} de {len(hedged)} llamadas al modelo ({100 * len(fired) / len(hedged):.1f}%), "
+              f"ganó la cobertura en {len(won)} ({100 * len(won) / max(len(fired), 1):.1f}% de las disparadas)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Resumen del registro de consumo de Gemini (usage_ledger.py).
+
+Muestra tokens y costo estimado agrupados por documento, por prefijo de
+carga (tenant: 'uploads/' o 'cncvirtual5/') y por modelo, para ver qué
+documentos y modelos concentran el gasto.
+
+Uso:
+    python benchmarks/usage_report.py --path /tmp/gemini_usage.jsonl
+    python benchmarks/usage_report.py --backend sqlite --path consumo.db --by tenant,model
+    python benchmarks/usage_report.py --by document --top 20 --since-hours 24
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def _print_group(title, groups, top):
+    header = f"{title:<48}{'llamadas':>9}{'págs':>6}{'entrada':>10}{'caché':>8}{'salida':>9}{'USD':>11}{'USD/llam.':>11}"
+    print(header)
+    print('-' * len(header))
+    rows = sorted(groups.items(), key=lambda item: (-item[1]['cost_usd'], -item[1]['prompt_tokens']))
+    for name, g in rows[:top]:
+        label = name if len(name) <= 46 else '…' + name[-45:]
+        unpriced = f" (+{g['unpriced']} sin precio)" if g['unpriced'] else ''
+        print(f"{label:<48}{g['calls']:>9}{g['pages']:>6}{g['prompt_tokens']:>10}{g['cached_tokens']:>8}"
+              f"{g['candidates_tokens'] + g['thoughts_tokens']:>9}{g['cost_usd']:>11.4f}"
+              f"{g['cost_usd'] / g['calls']:>11.5f}{unpriced}")
+    if len(rows) > top:
+        rest = rows[top:]
+        print(f"{f'... {len(rest)} más':<48}{sum(g['calls'] for _, g in rest):>9}{'':>6}{'':>10}{'':>8}{'':>9}"
+              f"{sum(g['cost_usd'] for _, g in rest):>11.4f}")
+    print()
+
+
+def main():
+    from usage_ledger import USAGE_LEDGER_BACKEND, USAGE_LEDGER_PATH, create_ledger_store, summarize
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', default=USAGE_LEDGER_BACKEND or 'jsonl', help="'jsonl' o 'sqlite'")
+    parser.add_argument('--path', default=USAGE_LEDGER_PATH)
+    parser.add_argument('--by', default='document,tenant,model', help='Agrupaciones separadas por coma')
+    parser.add_argument('--top', type=int, default=15, help='Filas por agrupación')
+    parser.add_argument('--since-hours', type=float, help='Solo llamadas de las últimas N horas')
+    args = parser.parse_args()
+
+    entries = list(create_ledger_store(args.backend, args.path).entries())
+    if args.since_hours:
+        cutoff = time.time() - args.since_hours * 3600
+        entries = [e for e in entries if e.get('ts', 0) >= cutoff]
+    if not entries:
+        print(f"Sin llamadas registradas en {args.path}")
+        return
+
+    total = summarize(entries, by=None)['total']
+    print(f"{total['calls']} llamadas, {total['prompt_tokens']} tokens de entrada "
+          f"({total['cached_tokens']} en caché), {total['candidates_tokens'] + total['thoughts_tokens']} de salida, "
+          f"USD {total['cost_usd']:.4f}\n")
+    titles = {'document': 'documento', 'tenant': 'prefijo', 'model': 'modelo', 'backend': 'backend',
+              'prompt_version': 'versión del prompt', 'hedge': 'cobertura (primary/hedge/loser)'}
+    for by in args.by.split(','):
+        by = by.strip()
+        _print_group(titles.get(by, by), summarize(entries, by=by), args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 import streamlit as st
 import boto3
 from datetime import datetime
+from image_ingest import upload_files
 import time
 import os
 import uuid
@@ -247,35 +248,6 @@ if 'reset_time' not in st.session_state:
 if 'uploader_key' not in st.session_state:
     st.session_state['uploader_key'] = str(uuid.uuid4())
 
-# Función para subir archivos a S3
-def upload_to_s3(file, bucket_name):
-    try:
-        # Configurar cliente AWS S3 (asumiendo credenciales configuradas)
-        s3_client = boto3.client('s3')
-        
-        # Generar ruta en S3
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        s3_path = f"uploads/{current_date}/{file.name}"
-        print(f"Subiendo archivo a S3: {s3_path}")
-        # Subir archivo
-        s3_client.upload_fileobj(file, bucket_name, s3_path)
-        
-        # Generar URL
-        url = f"https://{bucket_name}.s3.amazonaws.com/{s3_path}"
-        
-        return {
-            "success": True,
-            "name": file.name,
-            "url": url,
-            "path": s3_path
-        }
-    except Exception as e:
-        return {
-            "success": False,
-            "name": file.name,
-            "error": str(e)
-        }
-
 # Función para resetear completamente el estado
 def reset_state():
     st.session_state['upload_complete'] = False
@@ -360,20 +332,15 @@ def process_uploaded_files(uploaded_files):
     
     # Procesar cada archivo
     progress = st.progress(0)
-    results = []
     
-    for i, file in enumerate(uploaded_files):
-        # Actualizar progreso
-        progress_value = (i + 1) / len(uploaded_files)
-        progress.progress(progress_value)
-        
-        # Subir a S3
-        result = upload_to_s3(file, bucket_name)
-        results.append(result)
-        
-        # Pausa breve para mostrar el progreso
+    def on_progress(done, total):
+        # Actualizar progreso, con una pausa breve para mostrarlo
+        progress.progress(done / total)
         time.sleep(0.10)
     
+    # Las fotos se reducen y, si son varias, se agrupan con un manifiesto (image_ingest)
+    results = upload_files(boto3.client('s3'), bucket_name, 'uploads', uploaded_files, on_progress=on_progress)
+    
     # Guardar resultados y cambiar estado
     st.session_state['uploaded_files'] = results
     st.session_state['upload_complete'] = True
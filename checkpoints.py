@@ -0,0 +1,148 @@
+import base64
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from extraction_cache import content_hash, create_shared_store
+
+# Estado por documento entre intentos: 'sqlite' (sustituto local de un almacén
+# remoto), 'fs' (p. ej. un montaje EFS) o vacío (sin checkpoints)
+CHECKPOINT_BACKEND = os.environ.get('CHECKPOINT_BACKEND', 'sqlite')
+CHECKPOINT_PATH = os.environ.get('CHECKPOINT_PATH', '/tmp/document_checkpoints.db')
+# Vigencia del estado: pasado este tiempo el documento se procesa desde cero
+CHECKPOINT_TTL_SECONDS = int(os.environ.get('CHECKPOINT_TTL_SECONDS', str(24 * 3600)))
+# PDFs recortados más grandes no se guardan; el reintento vuelve a descargar y recortar
+CHECKPOINT_MAX_ARTIFACT_BYTES = int(os.environ.get('CHECKPOINT_MAX_ARTIFACT_BYTES', str(5 * 1024 * 1024)))
+
+# Etapas en orden: cada una implica las anteriores
+STAGES = ('fetched', 'trimmed', 'uploaded', 'extracted', 'delivered')
+# Artefactos que dejan de hacer falta al alcanzar una etapa: tras la extracción el reintento no usa el PDF
+STAGE_DROPS = {'extracted': ('pdf_bytes',)}
+
+_current = threading.local()
+
+
+def _encode(value):
+    if isinstance(value, (bytes, bytearray)):
+        return {'base64': base64.b64encode(bytes(value)).decode('ascii')}
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict) and set(value) == {'base64'}:
+        return base64.b64decode(value['base64'])
+    return value
+
+
+class DocumentCheckpoint:
+    """
+    Estado de un documento (bucket/key/etag) a lo largo de sus etapas.
+
+    Cada etapa completada se guarda con sus artefactos (PDF recortado, clave
+    de caché, datos extraídos, respuesta del webhook), de modo que un
+    reintento retoma en la primera etapa incompleta. Sin almacén, o sin etag
+    que identifique la versión del objeto, el estado vive solo en memoria.
+    """
+
+    def __init__(self, store, bucket, key, etag=None, state=None):
+        self.store = store if etag else None
+        self.bucket = bucket
+        self.key = key
+        self.etag = etag
+        self.id = content_hash(f"{bucket}/{key}@{etag or ''}".encode('utf-8'))
+        self.state = state or {'stage': None, 'artifacts': {}}
+
+    @property
+    def stage(self):
+        """Última etapa completada (None si el documento no tiene estado)"""
+        return self.state['stage']
+
+    def reached(self, stage):
+        return self.stage is not None and STAGES.index(self.stage) >= STAGES.index(stage)
+
+    def get(self, name, default=None):
+        return _decode(self.state['artifacts'].get(name, default))
+
+    def mark(self, stage, drop=(), **artifacts):
+        """
+        Registra una etapa completada y sus artefactos.
+
+        Args:
+            stage: Etapa de STAGES (no retrocede si ya se alcanzó una posterior)
+            drop: Artefactos que ya no hacen falta, además de los de STAGE_DROPS
+            **artifacts: Valores JSON o bytes
+        """
+        if not self.reached(stage):
+            self.state['stage'] = stage
+        drop = list(drop)
+        for reached, names in STAGE_DROPS.items():
+            if self.reached(reached):
+                drop.extend(names)
+        for name in drop:
+            self.state['artifacts'].pop(name, None)
+        self.state['artifacts'].update({name: _encode(value) for name, value in artifacts.items()})
+        self.state['updated_at'] = time.time()
+        if self.store is None:
+            return
+        try:
+            self.store.put(self.id, self.state)
+        except Exception as e:
+            # Sin checkpoint el reintento solo repite trabajo; el registro sigue
+            print(f"⚠️ No se pudo guardar el checkpoint '{stage}' de {self.key}: {e}")
+
+    @contextmanager
+    def activate(self):
+        """Hace visible el checkpoint en el hilo actual (p. ej. para la subida a la File API)"""
+        previous = getattr(_current, 'checkpoint', None)
+        _current.checkpoint = self
+        try:
+            yield self
+        finally:
+            _current.checkpoint = previous
+
+
+class CheckpointStore:
+    """Abre el estado de cada documento sobre un almacén compartido (mismo formato que la caché)"""
+
+    def __init__(self, store=None):
+        self.store = store
+
+    @classmethod
+    def from_env(cls):
+        try:
+            store = create_shared_store(CHECKPOINT_BACKEND, CHECKPOINT_PATH, table='document_checkpoints',
+                                        ttl_seconds=CHECKPOINT_TTL_SECONDS)
+        except Exception as e:
+            print(f"⚠️ No se pudo inicializar el almacén de checkpoints: {e}")
+            store = None
+        return cls(store=store)
+
+    def open(self, bucket, key, etag=None):
+        """
+        Returns:
+            DocumentCheckpoint: Con el estado de un intento anterior, si existe
+        """
+        checkpoint = DocumentCheckpoint(self.store, bucket, key, etag)
+        if checkpoint.store is None:
+            return checkpoint
+        try:
+            state = self.store.get(checkpoint.id)
+        except Exception as e:
+            print(f"⚠️ Error leyendo el checkpoint de {key}: {e}")
+            state = None
+        if state:
+            checkpoint.state = state
+        return checkpoint
+
+
+def current_checkpoint():
+    """Checkpoint del documento que se procesa en este hilo (None fuera de un registro)"""
+    return getattr(_current, 'checkpoint', None)
+
+
+def mark(stage, **artifacts):
+    """Registra una etapa en el checkpoint del hilo actual; sin checkpoint no hace nada"""
+    checkpoint = current_checkpoint()
+    if checkpoint is not None:
+        checkpoint.mark(stage, **artifacts)
@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Margen (ms) que se reserva al final de la invocación para responder el lote y emitir la traza
+DEADLINE_RESERVE_MS = float(os.environ.get('DEADLINE_RESERVE_MS', '3000'))
+# Tiempo mínimo (ms) que debe quedar para empezar cada etapa; con menos, el registro se abandona
+DEADLINE_RECORD_MS = float(os.environ.get('DEADLINE_RECORD_MS', '5000'))
+DEADLINE_MODEL_MS = float(os.environ.get('DEADLINE_MODEL_MS', '10000'))
+DEADLINE_WEBHOOK_MS = float(os.environ.get('DEADLINE_WEBHOOK_MS', '2000'))
+# Tope (segundos) de una llamada al modelo, aunque quede más tiempo de la invocación
+MODEL_TIMEOUT_SECONDS = float(os.environ.get('MODEL_TIMEOUT_SECONDS', '120'))
+
+STAGE_MIN_MS = {
+    'record': DEADLINE_RECORD_MS,
+    'model': DEADLINE_MODEL_MS,
+    'webhook': DEADLINE_WEBHOOK_MS,
+}
+
+_current = threading.local()
+
+
+class DeadlineExceeded(Exception):
+    """No queda tiempo de la invocación para la etapa; el registro se reintenta"""
+
+    def __init__(self, stage, remaining_ms):
+        self.stage = stage
+        self.remaining_ms = remaining_ms
+        super().__init__(f"Quedan {remaining_ms:.0f} ms de la invocación, insuficientes para '{stage}'")
+
+
+class Deadline:
+    """
+    Tiempo disponible de una invocación de Lambda.
+
+    Se calcula una vez con context.get_remaining_time_in_millis(), menos
+    DEADLINE_RESERVE_MS para cerrar el lote. Cada etapa pide su presupuesto
+    con timeout() (el menor entre su tope y lo que queda) y, antes de empezar,
+    require() verifica que quede el mínimo de STAGE_MIN_MS. Sin contexto
+    (scripts, app) no hay límite.
+    """
+
+    def __init__(self, remaining_ms=None, reserve_ms=DEADLINE_RESERVE_MS):
+        self._end = None
+        if remaining_ms is not None:
+            self._end = time.monotonic() + (remaining_ms - reserve_ms) / 1000
+
+    @classmethod
+    def from_context(cls, context):
+        get_remaining = getattr(context, 'get_remaining_time_in_millis', None)
+        return cls(get_remaining() if get_remaining else None)
+
+    def remaining_ms(self):
+        """Milisegundos disponibles (None sin límite)"""
+        if self._end is None:
+            return None
+        return max(0.0, (self._end - time.monotonic()) * 1000)
+
+    def require(self, stage, min_ms=None):
+        """Lanza DeadlineExceeded si no queda el mínimo de la etapa"""
+        remaining = self.remaining_ms()
+        min_ms = STAGE_MIN_MS.get(stage, 0) if min_ms is None else min_ms
+        if remaining is not None and remaining < min_ms:
+            raise DeadlineExceeded(stage, remaining)
+
+    def timeout(self, cap_seconds):
+        """Timeout (segundos) para una llamada: su tope, acotado por el tiempo restante"""
+        remaining = self.remaining_ms()
+        if remaining is None:
+            return cap_seconds
+        return max(0.1, min(cap_seconds, remaining / 1000))
+
+    @contextmanager
+    def activate(self):
+        """Hace visible el plazo en el hilo actual (cada registro corre en su hilo del pool)"""
+        previous = getattr(_current, 'deadline', None)
+        _current.deadline = self
+        try:
+            yield self
+        finally:
+            _current.deadline = previous
+
+
+def current_deadline():
+    """Plazo de la invocación en este hilo (None fuera del handler)"""
+    return getattr(_current, 'deadline', None)
+
+
+def require(stage, min_ms=None):
+    """Verifica el tiempo restante antes de una etapa; sin plazo activo no hace nada"""
+    deadline = current_deadline()
+    if deadline is not None:
+        deadline.require(stage, min_ms)
+
+
+def stage_timeout(cap_seconds):
+    """Timeout de una llamada de la etapa actual; sin plazo activo es el tope"""
+    deadline = current_deadline()
+    return cap_seconds if deadline is None else deadline.timeout(cap_seconds)
@@ -0,0 +1,330 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from hashlib import blake2b
+
+# Configuración de la caché desde variables de entorno
+CACHE_ENABLED = os.environ.get('CACHE_ENABLED', '1') == '1'
+CACHE_DIR = os.environ.get('CACHE_DIR', '/tmp/extradata_cache')
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '256'))
+# Nivel compartido: 'sqlite', 'fs' o vacío para desactivarlo
+CACHE_SHARED_BACKEND = os.environ.get('CACHE_SHARED_BACKEND', '')
+CACHE_SHARED_PATH = os.environ.get('CACHE_SHARED_PATH', '/tmp/extradata_shared_cache.db')
+CACHE_TTL_SECONDS = int(os.environ.get('CACHE_TTL_SECONDS', '0'))
+# Cada cuánto (segundos) una escritura en SQLite borra las filas vencidas
+CACHE_PURGE_INTERVAL_SECONDS = float(os.environ.get('CACHE_PURGE_INTERVAL_SECONDS', '300'))
+
+
+def content_hash(data):
+    """Calcula el hash blake2b (hex) de los bytes de un documento"""
+    return blake2b(data, digest_size=32).hexdigest()
+
+
+def version_tag(*parts):
+    """
+    Genera una etiqueta de versión corta a partir de textos (prompt, schema, etc.).
+
+    Sirve como versión por defecto cuando no se define PROMPT_VERSION o
+    SCHEMA_VERSION: cualquier cambio en el texto invalida la caché.
+    """
+    digest = blake2b(digest_size=6)
+    for part in parts:
+        if part is None:
+            part = ''
+        if not isinstance(part, str):
+            part = json.dumps(part, sort_keys=True, ensure_ascii=False)
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+def build_cache_key(doc_bytes, model_name, prompt_version, schema_version):
+    """
+    Construye la clave de caché de una extracción.
+
+    Args:
+        doc_bytes: Bytes del PDF recortado (lo que realmente se envía al modelo)
+        model_name: Nombre del modelo utilizado
+        prompt_version: Versión del prompt/instrucciones del sistema
+        schema_version: Versión del schema de respuesta
+
+    Returns:
+        str: Clave hexadecimal estable para el par documento/configuración
+    """
+    digest = blake2b(digest_size=32)
+    for part in (content_hash(doc_bytes), model_name, prompt_version, schema_version):
+        digest.update(str(part or '').encode('utf-8'))
+        digest.update(b'|')
+    return digest.hexdigest()
+
+
+class LocalLRUCache:
+    """
+    Nivel local acotado en /tmp para contenedores calientes.
+
+    Cada entrada es un archivo JSON; el orden LRU se mantiene en memoria y se
+    reconstruye desde la fecha de modificación si el contenedor se reinicia.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_entries=CACHE_MAX_ENTRIES):
+        self.directory = directory
+        self.max_entries = max(1, max_entries)
+        self._index = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load_index(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                path = os.path.join(self.directory, name)
+                try:
+                    entries.append((os.path.getmtime(path), name[:-5]))
+                except OSError:
+                    continue
+        for _, key in sorted(entries):
+            self._index[key] = True
+        self._evict()
+
+    def _evict(self):
+        while len(self._index) > self.max_entries:
+            old_key, _ = self._index.popitem(last=False)
+            try:
+                os.unlink(self._path(old_key))
+            except OSError:
+                pass
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._index:
+                return None
+            try:
+                with open(self._path(key), 'r', encoding='utf-8') as f:
+                    value = json.load(f)
+            except (OSError, ValueError):
+                self._index.pop(key, None)
+                return None
+            self._index.move_to_end(key)
+            try:
+                os.utime(self._path(key))
+            except OSError:
+                pass
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            path = self._path(key)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+            # Reemplazo atómico para no dejar entradas a medio escribir
+            os.replace(tmp_path, path)
+            self._index[key] = True
+            self._index.move_to_end(key)
+            self._evict()
+
+    def __len__(self):
+        return len(self._index)
+
+
+class SQLiteCacheStore:
+    """
+    Nivel compartido sobre SQLite (sustituto local de un almacén remoto).
+
+    Con ttl_seconds las filas vencidas se ignoran al leer y se borran al
+    escribir, como mucho una vez cada purge_interval_seconds.
+    """
+
+    def __init__(self, path=CACHE_SHARED_PATH, ttl_seconds=CACHE_TTL_SECONDS, table='extraction_cache',
+                 purge_interval_seconds=CACHE_PURGE_INTERVAL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.table = table
+        self.purge_interval_seconds = purge_interval_seconds
+        self._purged_at = None
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_created_at ON {self.table} (created_at)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, key):
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if not row:
+            return None
+        value, created_at = row
+        if self.ttl_seconds and time.time() - created_at > self.ttl_seconds:
+            return None
+        return json.loads(value)
+
+    def put(self, key, value):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now)
+            )
+            if self.ttl_seconds and (self._purged_at is None or now - self._purged_at >= self.purge_interval_seconds):
+                self._purged_at = now
+                self._purge(conn, now)
+
+    def _purge(self, conn, now):
+        return conn.execute(f"DELETE FROM {self.table} WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+
+    def purge(self):
+        """
+        Borra las filas vencidas.
+
+        Returns:
+            int: Filas borradas (0 sin ttl_seconds)
+        """
+        if not self.ttl_seconds:
+            return 0
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            self._purged_at = now
+            return self._purge(conn, now)
+
+
+class FileSystemCacheStore:
+    """Nivel compartido sobre un directorio (p. ej. un montaje EFS)"""
+
+    def __init__(self, directory, ttl_seconds=CACHE_TTL_SECONDS):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        # Repartir en subdirectorios para no saturar un único directorio
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if self.ttl_seconds and time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+def create_shared_store(backend=CACHE_SHARED_BACKEND, path=CACHE_SHARED_PATH, table='extraction_cache',
+                        ttl_seconds=CACHE_TTL_SECONDS):
+    """
+    Crea el nivel compartido configurado.
+
+    Args:
+        backend: 'sqlite', 'fs' o vacío
+        path: Archivo SQLite o directorio base según el backend
+        table: Tabla a utilizar con el backend SQLite
+        ttl_seconds: Vigencia de las entradas (0 sin vencimiento)
+
+    Returns:
+        Objeto con métodos get/put, o None si no hay nivel compartido
+    """
+    backend = (backend or '').strip().lower()
+    if not backend:
+        return None
+    if backend == 'sqlite':
+        return SQLiteCacheStore(path, ttl_seconds=ttl_seconds, table=table)
+    if backend == 'fs':
+        return FileSystemCacheStore(path, ttl_seconds=ttl_seconds)
+    raise ValueError(f"Backend de caché compartida no soportado: '{backend}'")
+
+
+class ExtractionCache:
+    """
+    Caché de dos niveles para resultados de extracción.
+
+    Consulta primero el nivel local (LRU en /tmp) y luego el compartido; los
+    aciertos del nivel compartido se promueven al local. Los fallos del nivel
+    compartido nunca interrumpen el procesamiento.
+    """
+
+    def __init__(self, local=None, shared=None, enabled=True):
+        self.local = local
+        self.shared = shared
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls):
+        if not CACHE_ENABLED:
+            return cls(enabled=False)
+        local = LocalLRUCache(CACHE_DIR, CACHE_MAX_ENTRIES)
+        try:
+            shared = create_shared_store()
+        except Exception as e:
+            print(f"⚠️ No se pudo inicializar la caché compartida: {e}")
+            shared = None
+        return cls(local=local, shared=shared)
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        if self.local is not None:
+            value = self.local.get(key)
+            if value is not None:
+                self.hits += 1
+                print(f"⚡ Caché local: acierto {key[:12]}")
+                return value
+        if self.shared is not None:
+            try:
+                value = self.shared.get(key)
+            except Exception as e:
+                print(f"⚠️ Error leyendo caché compartida: {e}")
+                value = None
+            if value is not None:
+                self.hits += 1
+                print(f"⚡ Caché compartida: acierto {key[:12]}")
+                if self.local is not None:
+                    # Sin espacio en /tmp el acierto sigue siendo válido; solo no se promueve
+                    try:
+                        self.local.put(key, value)
+                    except OSError as e:
+                        print(f"⚠️ Error escribiendo caché local: {e}")
+                return value
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        if not self.enabled or value is None:
+            return
+        if self.local is not None:
+            try:
+                self.local.put(key, value)
+            except OSError as e:
+                print(f"⚠️ Error escribiendo caché local: {e}")
+        if self.shared is not None:
+            try:
+                self.shared.put(key, value)
+            except Exception as e:
+                print(f"⚠️ Error escribiendo caché compartida: {e}")
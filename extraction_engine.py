@@ -0,0 +1,255 @@
+import json
+import re
+from datetime import datetime, timedelta
+
+from deadlines import MODEL_TIMEOUT_SECONDS, require, stage_timeout
+from extraction_schema import CONCILIACION_SCHEMA, normalize_response
+from hedging import HEDGE_REQUESTS
+from tracing import annotate, correlation_id, stage
+
+# Motor de extracción común a las lambdas y a la app: el proveedor (Gemini,
+# OpenAI o el backend determinista) se elige con LLM_BACKEND y se obtiene de
+# runtime.get_backend(); el schema compartido se adapta en cada backend.
+
+
+def extract_document(pdf_bytes, prompt=None, system_instruction=None, schema=CONCILIACION_SCHEMA, backend=None,
+                     display_name=None, usage_context=None, runtime=None, prompt_version=None):
+    """
+    Extrae información estructurada de un PDF con el backend configurado.
+
+    Args:
+        pdf_bytes: Contenido del PDF (ya recortado)
+        prompt: Prompt de extracción (por defecto el del runtime)
+        system_instruction: Instrucciones del sistema para el modelo
+        schema: Schema de la respuesta (None para respuesta JSON libre)
+        backend: ExtractionBackend (por defecto runtime.get_backend())
+        display_name: Nombre visible del archivo (subidas a la File API)
+        usage_context: Campos para el registro de consumo (bucket, document, pages, tenant)
+        runtime: Runtime del contenedor (por defecto get_runtime())
+        prompt_version: Versión del prompt para el registro (por defecto la del runtime)
+
+    Returns:
+        dict: Datos extraídos en formato JSON según el schema, con la forma de Gemini
+    """
+    if runtime is None:
+        from runtime import get_runtime
+        runtime = get_runtime()
+    backend = backend or runtime.get_backend()
+    final_prompt = prompt if prompt and prompt.strip() else runtime.prompt_text
+
+    context = dict(usage_context or {})
+    if 'pages' not in context:
+        from usage_ledger import count_pdf_pages
+        context['pages'] = count_pdf_pages(pdf_bytes)
+    context.update(prompt_version=prompt_version or runtime.prompt_version, correlation_id=correlation_id())
+
+    # Sin tiempo para la llamada el registro se abandona antes de pagarla; si no, se acota al restante
+    require('model')
+    timeout = stage_timeout(MODEL_TIMEOUT_SECONDS)
+    print(f"Generando contenido con {backend.name} ({backend.model_name})...")
+    if HEDGE_REQUESTS:
+        # Segunda llamada si la primera supera el percentil de latencia; gana la primera válida
+        with stage('generate'):
+            result, backend, role, fired = runtime.get_hedger().generate(
+                backend, pdf_bytes, final_prompt, system_instruction, schema, display_name=display_name,
+                usage_context=context, timeout=timeout
+            )
+        context['hedge'] = role
+        annotate(hedge=role, hedge_fired=fired)
+    else:
+        result = backend.generate(pdf_bytes, final_prompt, system_instruction, schema, display_name=display_name,
+                                  timeout=timeout)
+
+    # Registrar tokens y costo estimado de la llamada
+    usage = runtime.usage_ledger.record(
+        None, backend.model_name, usage=result['usage'], backend=backend.name,
+        upload_path=result['upload_path'], **context
+    )
+    annotate(backend=backend.name, prompt_tokens=usage['prompt_tokens'],
+             candidates_tokens=usage['candidates_tokens'], cost_usd=usage['cost_usd'])
+
+    if not result['text']:
+        raise Exception(f"Respuesta vacía de {backend.name}")
+    try:
+        with stage('json_parse'):
+            result_json = json.loads(result['text'])
+    except json.JSONDecodeError as e:
+        print(f"Error al procesar la respuesta JSON: {e}")
+        print(f"Respuesta recibida: {result['text']}")
+        raise Exception("La respuesta no es un JSON válido")
+    print("Datos extraídos exitosamente")
+    # Los campos opcionales sin valor se omiten igual con cualquier proveedor
+    return normalize_response(result_json)
+
+
+def postprocess_extraction(data):
+    """Valida la estructura y agrega fecha_inicio / fecha_fin a partir de fecha, hora y jornada"""
+    validate_response(data)
+    with stage('datetime'):
+        return process_datetime_fields(data)
+
+
+def convert_to_24_hour_format(hora_str, jornada):
+    """Convierte hora en formato 12h a 24h con validaciones mejoradas"""
+    try:
+        # Limpiar la string de hora
+        hora_clean = hora_str.strip().replace('.', ':')
+        
+        # Buscar patrones de hora (HH:MM o H:MM)
+        hora_match = re.search(r'(\d{1,2}):(\d{2})', hora_clean)
+        if not hora_match:
+            # Intentar solo horas (ej: "10", "2")
+            hora_match = re.search(r'(\d{1,2})', hora_clean)
+            if hora_match:
+                horas = int(hora_match.group(1))
+                minutos = 0
+            else:
+                print(f"No se pudo extraer hora de: '{hora_str}'")
+                return None
+        else:
+            horas = int(hora_match.group(1))
+            minutos = int(hora_match.group(2))
+        
+        # Detectar si ya está en formato 24 horas
+        if horas > 12:
+            print(f"Hora ya en formato 24h: {horas}:{minutos:02d}")
+            return f"{horas:02d}:{minutos:02d}"
+        
+        # Validar rangos para formato 12h
+        if horas < 1 or horas > 12 or minutos < 0 or minutos > 59:
+            print(f"Hora fuera de rango válido: {horas}:{minutos}")
+            # Intentar corrección automática si es formato 24h mal detectado
+            if horas >= 0 and horas <= 23 and minutos >= 0 and minutos <= 59:
+                print(f"Corrigiendo a formato 24h: {horas}:{minutos}")
+                return f"{horas:02d}:{minutos:02d}"
+            return None
+        
+        # Normalizar jornada
+        jornada_clean = jornada.strip().upper()
+        
+        # Convertir a formato 24 horas basándose en la jornada
+        if jornada_clean == 'PM':
+            if horas != 12:  # 1 PM = 13:00, 2 PM = 14:00, etc.
+                horas += 12
+            # 12 PM = 12:00 (mediodía, no se cambia)
+        elif jornada_clean == 'AM':
+            if horas == 12:  # 12 AM = 00:00 (medianoche)
+                horas = 0
+            # 1 AM = 01:00, 2 AM = 02:00, etc. (no se cambia)
+        else:
+            print(f"Jornada no reconocida: '{jornada}', asumiendo formato tal como está")
+            # Si no hay jornada clara, mantener la hora como está
+            if horas <= 12:
+                print(f"Sin jornada clara, manteniendo hora: {horas}:{minutos:02d}")
+            
+        # Validación final
+        if horas < 0 or horas > 23:
+            print(f"Hora final fuera de rango: {horas}:{minutos}")
+            return None
+            
+        resultado = f"{horas:02d}:{minutos:02d}"
+        print(f"Conversión exitosa: '{hora_str}' {jornada} → {resultado}")
+        return resultado
+        
+    except (ValueError, AttributeError) as e:
+        print(f"Error convirtiendo hora '{hora_str}' con jornada '{jornada}': {e}")
+        return None
+
+
+def process_datetime_fields(data):
+    """Procesa y valida los campos de fecha y hora, creando fecha_inicio y fecha_fin"""
+    try:
+        fecha_conciliacion = data.get('fecha_conciliacion')
+        hora_conciliacion = data.get('hora_conciliacion')
+        jornada = data.get('jornada', '').upper()
+        
+        # Log de datos recibidos
+        print(f"Procesando fecha/hora: fecha={fecha_conciliacion}, hora={hora_conciliacion}, jornada={jornada}")
+        
+        # Si no tenemos los datos básicos, intentar extraer de otros campos
+        if not fecha_conciliacion or not hora_conciliacion:
+            print("Faltan datos de fecha/hora, no se pueden generar fecha_inicio y fecha_fin")
+            return data
+        
+        # Validar que la jornada esté presente y sea válida
+        if not jornada or jornada not in ['AM', 'PM']:
+            print(f"Jornada inválida o faltante: '{jornada}'. Intentando inferir de la hora...")
+            
+            # Intentar inferir la jornada de la hora si está en formato 24h
+            try:
+                hora_num = int(hora_conciliacion.split(':')[0])
+                if hora_num >= 12:
+                    jornada = 'PM'
+                    print(f"Jornada inferida como PM basándose en hora {hora_num}")
+                else:
+                    jornada = 'AM'
+                    print(f"Jornada inferida como AM basándose en hora {hora_num}")
+            except:
+                print("No se pudo inferir la jornada, usando valor original")
+        
+        # Parsear la hora y convertir a formato 24 horas
+        hora_24 = convert_to_24_hour_format(hora_conciliacion, jornada)
+        
+        if hora_24:
+            # Crear fecha_inicio en formato ISO 8601
+            fecha_inicio_str = f"{fecha_conciliacion}T{hora_24}:00"
+            
+            # Validar que la fecha sea válida
+            try:
+                fecha_inicio_dt = datetime.fromisoformat(fecha_inicio_str)
+            except ValueError as e:
+                print(f"Fecha inválida: {fecha_inicio_str}, error: {e}")
+                return data
+            
+            # Crear fecha_fin (una hora después)
+            fecha_fin_dt = fecha_inicio_dt + timedelta(hours=1)
+            fecha_fin_str = fecha_fin_dt.strftime("%Y-%m-%dT%H:%M:%S")
+            
+            # Agregar los nuevos campos
+            data['fecha_inicio'] = fecha_inicio_str
+            data['fecha_fin'] = fecha_fin_str
+            
+            # Actualizar la jornada en caso de que haya sido inferida
+            data['jornada'] = jornada
+            
+            print(f"✅ Fechas procesadas exitosamente:")
+            print(f"   🕐 Inicio: {fecha_inicio_str}")
+            print(f"   🕑 Fin: {fecha_fin_str}")
+            print(f"   🌅 Jornada: {jornada}")
+        else:
+            print("No se pudo procesar la hora, formato no reconocido")
+            print(f"Datos recibidos: hora='{hora_conciliacion}', jornada='{jornada}'")
+            
+    except Exception as e:
+        print(f"Error procesando fechas: {e}")
+        
+    return data
+
+
+def validate_emails(data):
+    """Valida formato de emails en la respuesta"""
+    email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
+    
+    # Validar emails en convocantes
+    for convocante in data.get('convocantes', []):
+        email = convocante.get('email', '')
+        if email and not re.search(email_pattern, email):
+            print(f"Email posiblemente inválido en convocante: {email}")
+    
+    # Validar emails en convocados
+    for convocado in data.get('convocados', []):
+        email = convocado.get('mail', '')
+        if email and not re.search(email_pattern, email):
+            print(f"Email posiblemente inválido en convocado: {email}")
+
+
+def validate_response(data):
+    """Valida la estructura de la respuesta"""
+    if 'convocantes' not in data or not data['convocantes']:
+        print("⚠️ No se encontraron convocantes en la respuesta")
+    
+    if 'convocados' not in data or not data['convocados']:
+        print("⚠️ No se encontraron convocados en la respuesta")
+    
+    # Validar emails
+    validate_emails(data)
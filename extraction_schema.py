@@ -0,0 +1,195 @@
+import copy
+import os
+
+from extraction_cache import version_tag
+
+# Schema de respuesta para solicitudes de audiencia de conciliación
+CONCILIACION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "expediente": {
+            "type": "string",
+            "description": "Número de expediente del documento"
+        },
+        "ciudad": {
+            "type": "string",
+            "description": "Ciudad donde se presenta la solicitud (Bogotá, Cali, Medellín, Barranquilla)"
+        },
+        "hechos": {
+            "type": "string",
+            "description": "Descripción detallada de los hechos"
+        },
+        "peticiones": {
+            "type": "string",
+            "description": "Peticiones realizadas en la solicitud"
+        },
+        "cuantia": {
+            "type": "string",
+            "description": "Valor económico de la cuantía"
+        },
+        "convocantes": {
+            "type": "array",
+            "description": "Lista de personas que convocan",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "rol": {
+                        "type": "string",
+                        "description": "Rol de la persona (CONDUCTOR, PROPIETARIO, OTROS)"
+                    },
+                    "nombre": {
+                        "type": "string",
+                        "description": "Nombre completo de la persona"
+                    },
+                    "email": {
+                        "type": "string",
+                        "description": "Dirección(es) de correo electrónico separadas por comas"
+                    },
+                    "telefono": {
+                        "type": "string",
+                        "description": "Número(s) de teléfono"
+                    }
+                },
+                "required": ["nombre", "email"]
+            }
+        },
+        "convocados": {
+            "type": "array",
+            "description": "Lista de personas convocadas",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "rol": {
+                        "type": "string",
+                        "description": "Rol de la persona (CONDUCTOR, PROPIETARIO, OTROS)"
+                    },
+                    "nombre": {
+                        "type": "string",
+                        "description": "Nombre completo de la persona"
+                    },
+                    "mail": {
+                        "type": "string",
+                        "description": "Dirección(es) de correo electrónico separadas por comas"
+                    },
+                    "telefono": {
+                        "type": "string",
+                        "description": "Número(s) de teléfono"
+                    }
+                },
+                "required": ["nombre", "mail"]
+            }
+        },
+        "fecha_conciliacion": {
+            "type": "string",
+            "description": "Fecha de la audiencia en formato YYYY-MM-DD"
+        },
+        "hora_conciliacion": {
+            "type": "string",
+            "description": "Hora de la audiencia"
+        },
+        "jornada": {
+            "type": "string",
+            "description": "Jornada de la audiencia (AM/PM)"
+        },
+        "fecha_inicio": {
+            "type": "string",
+            "description": "Fecha y hora de inicio de la audiencia en formato ISO 8601 (YYYY-MM-DDTHH:mm:ss)"
+        },
+        "fecha_fin": {
+            "type": "string",
+            "description": "Fecha y hora de fin de la audiencia (una hora después del inicio) en formato ISO 8601 (YYYY-MM-DDTHH:mm:ss)"
+        }
+    },
+    "required": ["convocantes", "convocados"]
+}
+
+# Parámetros de generación optimizados para extracción
+GENERATION_CONFIG = {
+    "temperature": 0.1,
+    "top_p": 0.8,
+    "top_k": 20,
+    "max_output_tokens": 8192,
+    "response_mime_type": "application/json",
+}
+
+# Versión del schema para la caché; se deriva del contenido salvo que se fije SCHEMA_VERSION
+SCHEMA_VERSION = os.environ.get('SCHEMA_VERSION') or version_tag(CONCILIACION_SCHEMA)
+
+
+def build_generation_config(schema=CONCILIACION_SCHEMA):
+    """Devuelve una copia de GENERATION_CONFIG con el schema de respuesta indicado"""
+    generation_config = dict(GENERATION_CONFIG)
+    if schema:
+        generation_config["response_schema"] = schema
+    return generation_config
+
+# Claves de JSON Schema que acepta response_schema de Gemini (subconjunto de OpenAPI)
+_GEMINI_SCHEMA_KEYS = {'type', 'format', 'description', 'nullable', 'enum', 'items', 'properties', 'required'}
+
+
+def to_gemini_schema(schema):
+    """
+    Adapta un JSON Schema al subconjunto que acepta Gemini.
+
+    Quita las claves no soportadas (additionalProperties, $schema, title...) y
+    convierte los tipos ["string", "null"] en {"type": "string", "nullable": true}.
+    """
+    if not isinstance(schema, dict):
+        return schema
+    adapted = {}
+    for key, value in schema.items():
+        if key not in _GEMINI_SCHEMA_KEYS:
+            continue
+        if key == 'type' and isinstance(value, list):
+            types = [t for t in value if t != 'null']
+            adapted['type'] = types[0] if types else 'string'
+            if 'null' in value:
+                adapted['nullable'] = True
+        elif key == 'properties':
+            adapted[key] = {name: to_gemini_schema(prop) for name, prop in value.items()}
+        elif key == 'items':
+            adapted[key] = to_gemini_schema(value)
+        else:
+            adapted[key] = copy.deepcopy(value)
+    return adapted
+
+
+def to_openai_schema(schema):
+    """
+    Adapta un JSON Schema al modo estricto de Structured Outputs de OpenAI.
+
+    En modo estricto todo objeto debe listar todas sus propiedades en
+    required y declarar additionalProperties: false; las propiedades que
+    no eran obligatorias se vuelven anulables (["string", "null"]).
+    """
+    if not isinstance(schema, dict):
+        return schema
+    adapted = {k: copy.deepcopy(v) for k, v in schema.items() if k not in ('properties', 'items', 'required', 'nullable')}
+    if schema.get('nullable') and isinstance(adapted.get('type'), str):
+        adapted['type'] = [adapted['type'], 'null']
+    if 'items' in schema:
+        adapted['items'] = to_openai_schema(schema['items'])
+    if 'properties' in schema:
+        required = set(schema.get('required', []))
+        properties = {}
+        for name, prop in schema['properties'].items():
+            prop = to_openai_schema(prop)
+            if name not in required and isinstance(prop.get('type'), str):
+                prop['type'] = [prop['type'], 'null']
+            properties[name] = prop
+        adapted['properties'] = properties
+        adapted['required'] = list(properties)
+        adapted['additionalProperties'] = False
+    return adapted
+
+
+def normalize_response(data):
+    """
+    Normaliza la respuesta de cualquier backend a la forma de Gemini: los
+    campos opcionales sin valor (null en el modo estricto de OpenAI) se omiten.
+    """
+    if isinstance(data, dict):
+        return {k: normalize_response(v) for k, v in data.items() if v is not None}
+    if isinstance(data, list):
+        return [normalize_response(v) for v in data]
+    return data
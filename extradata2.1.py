@@ -1,39 +1,48 @@
 import json
 import os
-import boto3
 import tempfile
-import requests
-import google.generativeai as genai
-import urllib.parse
-import PyPDF2
-import io
-import re
-from urllib.parse import unquote_plus
-from datetime import datetime, timedelta
+from extraction_cache import build_cache_key, version_tag
+from s3_events import build_batch_response, iter_s3_records, process_batch
+from extraction_engine import extract_document
+from runtime import get_runtime
+from webhook_outbox import WEBHOOK_OUTBOX
 
-print('Loading functionn 2')
-
-# Configurar API key de Google Gemini desde variable de entorno
-GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY')
+# El backend (LLM_BACKEND) y su modelo (MODEL_NAME u OPENAI_MODEL_NAME) se
+# configuran en llm_backends; la API key se lee en el primer uso del cliente
 WEBHOOK_URL = os.environ.get('WEBHOOK_URL')
-MODEL_NAME = os.environ.get('MODEL_NAME')
 PROMPT_EXTRADATA = os.environ.get('PROMPT')
 SYS_INSTRUCTION = os.environ.get('SYS_INSTRUCTION')
 SCHEMA = os.environ.get('SCHEMA')
-# Inicializar el cliente de S3
-s3_client = boto3.client('s3')
-
-# Configurar Gemini API
-genai.configure(api_key=GOOGLE_API_KEY)
+# Versiones para la caché de extracción (por defecto derivadas del texto)
+PROMPT_VERSION = os.environ.get('PROMPT_VERSION') or version_tag(PROMPT_EXTRADATA, SYS_INSTRUCTION)
+SCHEMA_VERSION = os.environ.get('SCHEMA_VERSION') or version_tag(SCHEMA)
+# El cliente de S3, la sesión HTTP y la caché viven en runtime.get_runtime(): se crean
+# en el primer uso y se reutilizan entre invocaciones calientes
 ##
 def lambda_handler(event, context):
     print("Received event: " + json.dumps(event, indent=2))
 
-    # Get the object from the event and show its content type
-    bucket = event['Records'][0]['s3']['bucket']['name']
-    key = urllib.parse.unquote_plus(event['Records'][0]['s3']['object']['key'], encoding='utf-8')
+    # Procesar todos los registros del lote (S3 directo o reenviados por SQS)
+    records = list(iter_s3_records(event))
+    print(f"Registros en el evento: {len(records)}")
     webhook_url = event.get('webhook_url', WEBHOOK_URL)
+    outcomes = process_batch(
+        records,
+        lambda record: process_record(record['bucket'], record['key'], webhook_url)
+    )
+    return build_batch_response(outcomes)
+
+def process_record(bucket, key, webhook_url):
+    """
+    Procesa un único objeto S3: descarga, recorte, extracción y webhook.
+
+    Returns:
+        dict: Datos extraídos (pdf_data) y respuesta del webhook
+    """
+    response_data = None
+    webhook_response = None
     try:
+        s3_client = get_runtime().s3_client
         response = s3_client.get_object(Bucket=bucket, Key=key)     
         print("CONTENT TYPE: " + response['ContentType'])
         print(f"1.Procesando archivo: s3://{bucket}/{key}")
@@ -76,23 +85,26 @@ def lambda_handler(event, context):
             # Validar que el archivo es un PDF
             #if not file_path.endswith('pdf'):
             #    raise Exception(f"El archivo '{key}' no es un archivo PDF válido")            
-                    print(f"4.Gemini con Archivo Recortado:'{file_path}'")
-                    # Procesar el PDF con Gemini
-                    response_data = process_pdf_with_gemini(file_path, MODEL_NAME,PROMPT_EXTRADATA,SYS_INSTRUCTION)            
+                    print(f"4.Modelo con Archivo Recortado:'{file_path}'")
+                    # Procesar el PDF con el backend configurado
+                    # Consultar la caché por contenido antes de llamar al modelo
+                    with open(file_path, 'rb') as trimmed_file:
+                        cache_key = build_cache_key(trimmed_file.read(), get_runtime().get_backend().cache_label,
+                                                    PROMPT_VERSION, SCHEMA_VERSION)
+                    response_data = get_runtime().extraction_cache.get(cache_key)
+                    if response_data is None:
+                        response_data = process_pdf_with_model(file_path, PROMPT_EXTRADATA, SYS_INSTRUCTION, bucket=bucket, document=key)
+                        get_runtime().extraction_cache.put(cache_key, response_data)
                     # Enviar los resultados al webhook
                     webhook_response = send_to_webhook(webhook_url, response_data)
                      # Eliminar el archivo temporal
                     if webhook_response:
                        os.unlink(file_path) 
                        print(f"5.Archivo Temporal Eliminado:'{file_path}'")        
-             # Devolver respuesta
+            # Devolver resultado del registro
             return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'message': 'Procesamiento completado exitosamente',
-                    'pdf_data': response_data,
-                    'webhook_response': webhook_response
-                })
+                'pdf_data': response_data,
+                'webhook_response': webhook_response
             }
         #return response['ContentType']
     except Exception as e:
@@ -103,6 +115,8 @@ def lambda_handler(event, context):
 def trim_pdf(file_path, max_pages=2):
 
     """Recorta un PDF a un número máximo de páginas"""
+    import PyPDF2
+
     try:
         # Abrir el PDF descargado de S3
         with open(file_path, 'rb') as file:
@@ -132,15 +146,16 @@ def trim_pdf(file_path, max_pages=2):
         # En caso de error, devolvemos el archivo original
         return file_path
 
-def process_pdf_with_gemini(file_path, model_name, prompt, system_instruction):
+def process_pdf_with_model(file_path, prompt, system_instruction, bucket=None, document=None):
     """
-    Procesa un archivo PDF con el modelo Gemini y extrae información estructurada.
+    Procesa un archivo PDF con el backend configurado (LLM_BACKEND) y extrae información estructurada.
     
     Args:
         file_path: Ruta al archivo PDF temporal
-        model_name: Nombre del modelo de Gemini a utilizar
         prompt: Prompt personalizado para la extracción
         system_instruction: Instrucciones del sistema para el modelo
+        bucket: Bucket del documento (para el registro de consumo)
+        document: Clave S3 del documento (para el registro de consumo)
         
     Returns:
         dict: Datos extraídos en formato JSON según el SCHEMA definido
@@ -155,43 +170,17 @@ def process_pdf_with_gemini(file_path, model_name, prompt, system_instruction):
                 print("⚠️ SCHEMA inválido, usando SCHEMA por defecto")
                 SCHEMA_dict = None
         
-        # Configurar parámetros de generación optimizados
-        generation_config = {
-            "temperature": 0.1,
-            "top_p": 0.8,
-            "top_k": 20,
-            "max_output_tokens": 8192,
-            "response_mime_type": "application/json",
-        }
-        
-        # Solo agregar SCHEMA si es válido
-        if SCHEMA_dict:
-            generation_config["response_SCHEMA"] = SCHEMA_dict
-        
-        # Inicializar el modelo con instrucciones del sistema
-        model = genai.GenerativeModel(
-            model_name=model_name,
-            system_instruction=system_instruction,
-            generation_config=generation_config,
-        )
-        
-        # Subir el archivo a Gemini
-        files = genai.upload_file(file_path, mime_type="application/pdf")
-        print(f"Uploaded file '{files.display_name}' as: {files.uri}")
+        with open(file_path, 'rb') as pdf_file:
+            pdf_bytes = pdf_file.read()
         
         # Usar el prompt proporcionado o uno por defecto
         final_prompt = prompt if prompt and prompt.strip() else "Extrae toda la información relevante del documento en formato JSON"
         
-        # Generar contenido con Gemini
-        print("Generando contenido con Gemini...")
-        response = model.generate_content([files, final_prompt])
-        
-        if not response.text:
-            raise Exception("Respuesta vacía de Gemini")
-        
-        # Parsear la respuesta JSON
-        result_json = json.loads(response.text)
-        print("Datos extraídos exitosamente")
+        # Sin SCHEMA válido el modelo responde JSON libre
+        result_json = extract_document(
+            pdf_bytes, final_prompt, system_instruction, schema=SCHEMA_dict,
+            prompt_version=PROMPT_VERSION, usage_context={'bucket': bucket, 'document': document}
+        )
         print(f"JSON extraído: {json.dumps(result_json, indent=2)}")
         
         # Validación básica de la estructura
@@ -210,23 +199,9 @@ def process_pdf_with_gemini(file_path, model_name, prompt, system_instruction):
         
         return result_json
         
-    except json.JSONDecodeError as e:
-        print(f"❌ Error al procesar la respuesta JSON: {e}")
-        print(f"Respuesta recibida: {response.text if 'response' in locals() else 'No response'}")
-        raise Exception(f"La respuesta no es un JSON válido: {str(e)}")
-        
     except Exception as e:
-        print(f"❌ Error en procesamiento con Gemini: {e}")
-        raise Exception(f"Error al procesar PDF con Gemini: {str(e)}")
-    
-    finally:
-        # Limpiar el archivo subido de Gemini si es posible
-        try:
-            if 'files' in locals():
-                genai.delete_file(files.name)
-                print(f"🗑️ Archivo eliminado de Gemini: {files.name}")
-        except Exception as cleanup_error:
-            print(f"⚠️ No se pudo limpiar archivo de Gemini: {cleanup_error}")
+        print(f"❌ Error en procesamiento con el modelo: {e}")
+        raise Exception(f"Error al procesar PDF con el modelo: {str(e)}")
 
 def send_to_webhook(webhook_url, json_data):
     """
@@ -239,6 +214,8 @@ def send_to_webhook(webhook_url, json_data):
     Returns:
         dict: Información sobre la respuesta del webhook
     """
+    import requests
+
     try:
         # Configurar headers para la solicitud
         headers = {
@@ -247,9 +224,19 @@ def send_to_webhook(webhook_url, json_data):
         }
         
         print(f"Enviando datos al webhook: {webhook_url}")
+
+        if WEBHOOK_OUTBOX:
+            # Se guarda en el outbox y se entrega con reintentos; si los agota queda en el dead-letter
+            entry = get_runtime().get_webhook_outbox().send(webhook_url, json_data, headers=headers)
+            if entry['status'] != 'delivered':
+                raise Exception(f"Error en la solicitud al webhook: {entry['last_error']}")
+            return {
+                'statusCode': entry['status_code'],
+                'response': entry['response']
+            }
         
-        # Realizar la petición POST
-        response = requests.post(
+        # Realizar la petición POST con la sesión compartida (keep-alive)
+        response = get_runtime().post(
             webhook_url,
             data=json.dumps(json_data),
             headers=headers
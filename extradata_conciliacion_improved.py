@@ -1,489 +1,498 @@
 import json
 import os
-import boto3
-import tempfile
-import requests
-import google.generativeai as genai
-import urllib.parse
-import PyPDF2
-import io
-import re
-from urllib.parse import unquote_plus
-from datetime import datetime, timedelta
-
-print('Loading functionn 2')
-
-# Configurar API key de Google Gemini desde variable de entorno
-GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY')
+import time
+from extraction_cache import build_cache_key
+from extraction_engine import extract_document, postprocess_extraction
+from extraction_schema import SCHEMA_VERSION
+from s3_events import PermanentRecordError, build_batch_response, iter_s3_records, process_batch
+from pdf_utils import open_s3_document, trim_pdf
+from pdf_shrink import PDF_SHRINK, shrink_pdf
+from model_router import MODEL_ROUTER, document_features
+from image_ingest import (UnsupportedDocumentError, build_image_document, document_kind,
+                          is_submission_key, unsupported_message)
+from text_extractor import TEXT_FAST_PATH, extract_fields, merge_extractions, missing_fields
+from form_fields import ACROFORM_FAST_PATH, extract_form_fields
+from page_selection import PAGE_TOKEN_BUDGET, PAGE_TOKEN_CHECK, drop_lowest_scored, select_pages
+from runtime import HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, get_runtime
+from deadlines import DEADLINE_RESERVE_MS, Deadline, DeadlineExceeded, require, stage_timeout
+from checkpoints import CHECKPOINT_MAX_ARTIFACT_BYTES, DocumentCheckpoint, current_checkpoint
+from extraction_cache import content_hash
+from idempotency import IDEMPOTENCY_LEASE_SECONDS, DuplicateDocument, IdempotencyGuard
+from webhook_outbox import WEBHOOK_OUTBOX
+from tracing import annotate, correlation_id, stage, start_trace
+
+# Configuración desde variables de entorno. Los clientes (S3, HTTP), la caché
+# y los backends de extracción (LLM_BACKEND: gemini, openai o fake; modelo en
+# MODEL_NAME u OPENAI_MODEL_NAME) viven en runtime.get_runtime() y se reutilizan
+# entre invocaciones calientes. Las dependencias pesadas se importan solo en la
+# ruta que las necesita: un acierto de caché nunca carga el SDK del proveedor.
+# Con MODEL_ROUTER=1 el modelo se elige por complejidad (ROUTER_TIERS).
+# El tiempo restante de la invocación (deadlines) acota cada etapa: la llamada
+# al modelo y el webhook reciben su timeout y, si no queda tiempo para una
+# etapa, el registro se abandona y se reporta como fallido para reintentarlo.
+# Cada documento guarda sus etapas completadas (checkpoints, CHECKPOINT_BACKEND)
+# para que el reintento retome en la primera incompleta. Las notificaciones
+# duplicadas (mismo objeto o mismo contenido) se reconocen sin llamar al modelo
+# ni reenviar el webhook (idempotency, IDEMPOTENCY_WINDOW_SECONDS). Con
+# WEBHOOK_OUTBOX=1 el resultado se guarda en el outbox y un pool lo entrega con
+# reintentos, sin que la extracción espere a n8n; el registro se confirma solo
+# cuando su entrega se confirma al final de la invocación. Para backfills,
+# WEBHOOK_BATCH_SIZE y WEBHOOK_COMPRESSION agrupan las entregas en lotes comprimidos.
 WEBHOOK_URL = os.environ.get('WEBHOOK_URL')
-MODEL_NAME = os.environ.get('MODEL_NAME')
 PROMPT_EXTRADATA = os.environ.get('PROMPT')
 SYS_INSTRUCTION = os.environ.get('SYS_INSTRUCTION')
-# Inicializar el cliente de S3
-s3_client = boto3.client('s3')
 
-# Configurar Gemini API
-genai.configure(api_key=GOOGLE_API_KEY)
 ##
 def lambda_handler(event, context):
-    print("Received event: " + json.dumps(event, indent=2))
+    # Una traza por invocación (muestreada); el evento completo solo con TRACE_LOG_EVENT=1
+    trace = start_trace(event, context)
+    # Plazo de la invocación: context.get_remaining_time_in_millis() menos el margen para cerrar el lote
+    deadline = Deadline.from_context(context)
+    # Las reservas de idempotencia vencen con la invocación: tras un timeout el reintento no queda bloqueado
+    remaining_ms = deadline.remaining_ms()
+    lease_seconds = IDEMPOTENCY_LEASE_SECONDS if remaining_ms is None else (remaining_ms + DEADLINE_RESERVE_MS) / 1000
 
-    # Get the object from the event and show its content type
-    bucket = event['Records'][0]['s3']['bucket']['name']
-    key = urllib.parse.unquote_plus(event['Records'][0]['s3']['object']['key'], encoding='utf-8')
+    # Procesar todos los registros del lote (S3 directo o reenviados por SQS)
+    records = list(iter_s3_records(event))
+    print(f"[{trace.correlation_id}] Registros en el evento: {len(records)}")
     webhook_url = event.get('webhook_url', WEBHOOK_URL)
+    # Registros cuya entrega sigue en el outbox: id de la entrega -> (checkpoint, guard, traza)
+    awaiting = {}
+
+    def handle(record):
+        # Estado del documento de intentos anteriores (bucket/key/etag)
+        checkpoint = get_runtime().checkpoints.open(record['bucket'], record['key'], record.get('etag'))
+        guard = IdempotencyGuard(get_runtime().idempotency, record['bucket'], record['key'],
+                                 record.get('version_id'), record.get('etag'), lease_seconds=lease_seconds)
+        with trace.record(record['bucket'], record['key'], record.get('message_id')) as record_trace, \
+                deadline.activate(), checkpoint.activate():
+            # Los registros que esperan en el pool no empiezan si ya no alcanza el tiempo
+            require('record')
+            result = process_record(record['bucket'], record['key'], webhook_url, checkpoint, guard)
+        if awaiting_delivery(result):
+            awaiting[result['webhook_response']['outbox_id']] = (checkpoint, guard, record_trace)
+        return result
+
     try:
-        response = s3_client.get_object(Bucket=bucket, Key=key)     
-        print("CONTENT TYPE: " + response['ContentType'])
-        print(f"1.Procesando archivo: s3://{bucket}/{key}")
-         # Extraer parámetros del evento
-        #bucket = event.get('bucket')
-        #key = event.get('key')
-        #webhook_url = event.get('webhook_url', WEBHOOK_URL)
-        
-        # Validar que se recibieron los parámetros necesarios
-        #if not bucket or not key:
-        #    return {
-        #        'statusCode': 400,
-        #        'body': json.dumps({
-        #            'error': 'Se requieren los parámetros "bucket" y "key"'
-        #        })
-        #    }
-         # Validar que se recibieron los parámetros necesarios
-        
-        
-        # Si la clave viene codificada en URL, decodificarla
-        #key = unquote_plus(key)          
-        # Descargar el archivo de S3 a un archivo temporal
-        with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
-            try:
-                s3_client.download_file(bucket, key, tmp_file.name)
-            except s3_client.exceptions.NoSuchKey:
-                raise Exception(f"El archivo '{key}' no existe en el bucket '{bucket}'")
-            except s3_client.exceptions.ClientError as e:
-                raise Exception(f"Error al descargar el archivo de S3: {e}")
-            file_path = tmp_file.name
-            # Verificar si es un PDF y recortarlo
-            if key.lower().endswith('.pdf'):
-                print(f"2.Recortando PDF a las primeras 2 páginas:'{file_path}' // {key}")
-                trimmed_file_path = trim_pdf(file_path, max_pages=2)   
-                print(f"3.Ruta Tmp Recortado:'{trimmed_file_path}'")         
-                # Si el recorte fue exitoso, eliminar el archivo original
-                if trimmed_file_path != file_path:
-                    #os.unlink(file_path)
-                    file_path = trimmed_file_path   
-            # Validar que el archivo es un PDF
-            #if not file_path.endswith('pdf'):
-            #    raise Exception(f"El archivo '{key}' no es un archivo PDF válido")            
-                    print(f"4.Gemini con Archivo Recortado:'{file_path}'")
-                    # Procesar el PDF con Gemini
-                    response_data = process_pdf_with_gemini(file_path, MODEL_NAME,PROMPT_EXTRADATA,SYS_INSTRUCTION)            
-                    # Enviar los resultados al webhook
-                    webhook_response = send_to_webhook(webhook_url, response_data)
-                     # Eliminar el archivo temporal
-                    if webhook_response:
-                       os.unlink(file_path) 
-                       print(f"5.Archivo Temporal Eliminado:'{file_path}'")        
-             # Devolver respuesta
+        if WEBHOOK_OUTBOX:
+            # Entregas que quedaron pendientes en invocaciones anteriores (timeout, contenedor congelado)
+            outbox = get_runtime().get_webhook_outbox()
+            outbox.resume()
+        outcomes = process_batch(records, handle)
+        if WEBHOOK_OUTBOX:
+            settle_webhooks(outbox, outcomes, awaiting, deadline)
+        # Con idempotencia, los registros ya entregados que repita el reintento se reconocen como duplicados
+        return build_batch_response(outcomes, replay_safe=get_runtime().idempotency is not None)
+    finally:
+        trace.emit()
+
+def awaiting_delivery(result):
+    """True si el resultado del registro espera la confirmación de su entrega en el outbox"""
+    webhook_response = (result or {}).get('webhook_response') or {}
+    return bool(webhook_response.get('outbox_id')) and webhook_response.get('status') != 'delivered'
+
+def settle_webhooks(outbox, outcomes, awaiting, deadline):
+    """
+    Espera las entregas del lote con el tiempo que queda y confirma o falla cada registro.
+
+    Un registro entregado marca 'delivered' en su checkpoint y completa su
+    reserva de idempotencia. Uno cuya entrega quedó en el dead-letter o sigue
+    en curso pasa a 'error' (batchItemFailures o reintento de la invocación)
+    y libera su reserva: el reintento retoma desde el checkpoint 'extracted'
+    y reutiliza la entrega si sigue en el outbox.
+
+    Args:
+        outbox: WebhookOutbox del contenedor
+        outcomes: Resultados de process_batch (se actualizan en el lugar)
+        awaiting: id de la entrega -> (checkpoint, guard, traza) de su registro
+        deadline: Plazo de la invocación
+    """
+    remaining_ms = deadline.remaining_ms()
+    in_flight = outbox.drain(timeout=None if remaining_ms is None else remaining_ms / 1000)
+    if in_flight:
+        print(f"📬 {in_flight} entrega(s) siguen en curso; quedan en el outbox para la próxima invocación")
+    for outcome in outcomes:
+        webhook_response = (outcome.get('result') or {}).get('webhook_response') or {}
+        delivery_id = webhook_response.get('outbox_id')
+        if delivery_id not in awaiting:
+            continue
+        checkpoint, guard, record_trace = awaiting[delivery_id]
+        entry = outbox.status(delivery_id) or {'status': 'lost', 'attempts': 0, 'status_code': None,
+                                               'last_error': 'La entrega no está en el outbox'}
+        webhook_response.update(status=entry['status'], attempts=entry['attempts'],
+                                statusCode=entry['status_code'], error=entry['last_error'])
+        if entry['status'] == 'delivered':
+            checkpoint.mark('delivered', webhook_response=webhook_response)
+            guard.complete()
+            continue
+        # Sin entrega confirmada el registro no se reconoce: SQS (o Lambda) lo reintenta
+        guard.release()
+        outcome['status'] = 'error'
+        outcome['error'] = (f"Webhook no entregado ({entry['status']}): "
+                            f"{entry['last_error'] or 'sin confirmación antes del fin de la invocación'}")
+        record_trace.status, record_trace.error = 'error', outcome['error']
+        print(f"❌ s3://{outcome['bucket']}/{outcome['key']}: {outcome['error']}")
+
+def process_record(bucket, key, webhook_url, checkpoint=None, guard=None):
+    """
+    Procesa un único objeto S3: descarga, recorte, extracción y webhook.
+
+    Los documentos pequeños se leen con un único GET a memoria; los grandes se
+    leen por rangos (solo la tabla xref y las páginas elegidas), de modo que
+    la memoria queda acotada sin importar el número de páginas de anexos. No
+    se crean archivos temporales. Las fotos (jpg/png) se normalizan y se
+    envían como un PDF compacto; las de una solicitud con varias fotos se
+    agrupan a partir de su manifiesto.
+
+    Con un checkpoint de un intento anterior (bucket/key/etag) se retoma en la
+    primera etapa incompleta: un documento ya extraído solo repite el webhook
+    y uno ya entregado no se vuelve a procesar. Con un guard de idempotencia,
+    una notificación repetida del mismo objeto, o un objeto con el mismo
+    contenido que otro ya entregado o en curso, se reconoce como duplicado.
+
+    Returns:
+        dict: Datos extraídos (pdf_data) y respuesta del webhook
+    """
+    response_data = None
+    webhook_response = None
+    # La entrega quedó en el outbox: checkpoint y reserva se resuelven al asentarla (settle_webhooks)
+    deferred = False
+    checkpoint = checkpoint or DocumentCheckpoint(None, bucket, key)
+    guard = guard or IdempotencyGuard(None, bucket, key)
+    try:
+        print(f"[{correlation_id()}] Procesando archivo: s3://{bucket}/{key}")
+        runtime = get_runtime()
+        # Validar el formato antes de leer el archivo
+        kind = document_kind(key)
+        if kind == 'unsupported':
+            raise UnsupportedDocumentError(unsupported_message(key))
+        if kind == 'image' and is_submission_key(key):
+            # Las fotos de una solicitud se procesan juntas cuando llega su manifiesto
+            print(f"Imagen de una solicitud con manifiesto, se omite: {key}")
+            annotate(source='skipped')
+            return {'skipped': True, 'reason': 'La imagen se procesa con el manifiesto de la solicitud'}
+
+        # Entrega at-least-once de S3: la misma notificación puede llegar más de una vez
+        claim_or_raise(guard.claim_notification())
+        if checkpoint.reached('delivered'):
+            print(f"♻️ {key} ya se entregó en un intento anterior, no se reprocesa")
+            annotate(source='checkpoint', resumed='delivered')
             return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'message': 'Procesamiento completado exitosamente',
-                    'pdf_data': response_data,
-                    'webhook_response': webhook_response
-                })
+                'pdf_data': checkpoint.get('data'),
+                'webhook_response': checkpoint.get('webhook_response'),
+                'source': checkpoint.get('source')
             }
-        #return response['ContentType']
+        if checkpoint.get('content_hash'):
+            claim_or_raise(guard.claim_content(checkpoint.get('content_hash')))
+        if checkpoint.reached('extracted'):
+            response_data, source = checkpoint.get('data'), checkpoint.get('source')
+            print(f"♻️ Reanudando {key}: datos extraídos en un intento anterior ({source}), falta el webhook")
+            annotate(resumed='extracted')
+        else:
+            response_data, source = extract_record(runtime, bucket, key, kind, checkpoint, guard)
+            # El PDF recortado se descarta del checkpoint (STAGE_DROPS): ya no hace falta para reintentar
+            checkpoint.mark('extracted', data=response_data, source=source)
+        annotate(source=source)
+
+        # Enviar los resultados al webhook
+        with stage('webhook'):
+            webhook_response = send_to_webhook(webhook_url, response_data, document=key)
+        deferred = awaiting_delivery({'webhook_response': webhook_response})
+        if not deferred:
+            checkpoint.mark('delivered', webhook_response=webhook_response)
+            guard.complete()
+
+        # Devolver resultado del registro
+        return {
+            'pdf_data': response_data,
+            'webhook_response': webhook_response,
+            'source': source
+        }
+    except DuplicateDocument as e:
+        # Se reconoce (el mensaje no se reintenta) sin modelo ni webhook; sus
+        # repeticiones también quedan como duplicadas durante la ventana
+        print(f"🔁 {e}: s3://{bucket}/{key} se reconoce sin procesarlo")
+        annotate(source='duplicate', duplicate_of=e.reservation['document'])
+        guard.complete()
+        return {'duplicate': True, 'duplicate_of': e.reservation['document'], 'source': 'duplicate'}
+    except PermanentRecordError:
+        # El motivo ya queda en el resultado del lote; reintentar no lo resuelve
+        raise
+    except DeadlineExceeded as e:
+        # Salida limpia antes del timeout de Lambda: el checkpoint conserva las
+        # etapas completadas y el reintento retoma desde la primera incompleta
+        print(f"⏳ {e}. Se abandona s3://{bucket}/{key} en la etapa '{checkpoint.stage}' para reintentarlo")
+        annotate(deadline_stage=e.stage, remaining_ms=round(e.remaining_ms))
+        raise
     except Exception as e:
         print(e)
         print('Error getting object {} from bucket {}. Make sure they exist and your bucket is in the same region as this function.'.format(key, bucket))
         raise e
+    finally:
+        # Si no se completó, la reserva se libera para que el reintento la tome
+        if not deferred:
+            guard.release()
 
-def trim_pdf(file_path, max_pages=2):
+def claim_or_raise(reservation):
+    """Lanza DuplicateDocument si la reserva de idempotencia pertenece a otro procesamiento"""
+    if reservation is not None:
+        raise DuplicateDocument(reservation)
+
+def extract_record(runtime, bucket, key, kind, checkpoint, guard):
+    """
+    Obtiene los datos del documento: formulario o capa de texto, caché o modelo.
+
+    Si un intento anterior dejó el PDF listo para el modelo en el checkpoint
+    (etapa 'trimmed'), se retoma desde ahí sin volver a descargar ni recortar.
+
+    Returns:
+        tuple: (datos extraídos ya post-procesados, origen)
+    """
+    backend = runtime.get_router() if MODEL_ROUTER else runtime.get_backend()
+    pdf_bytes = checkpoint.get('pdf_bytes') if checkpoint.reached('trimmed') else None
+    if pdf_bytes is not None:
+        print(f"♻️ Reanudando {key}: PDF recortado en un intento anterior ({len(pdf_bytes)} bytes)")
+        annotate(resumed=checkpoint.stage)
+        prepared = checkpoint.get('prepared')
+        return extract_with_model(runtime, backend, bucket, key, pdf_bytes, **prepared)
 
-    """Recorta un PDF a un número máximo de páginas"""
+    buffer = None
     try:
-        # Abrir el PDF descargado de S3
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            pdf_writer = PyPDF2.PdfWriter()
-            
-            # Determinar cuántas páginas procesar
-            pages_to_process = min(len(pdf_reader.pages), max_pages)
-            print(f"Procesando {pages_to_process} páginas de un total de {len(pdf_reader.pages)}")
-            
-            # Agregar solo las primeras páginas
-            for page_num in range(pages_to_process):
-                pdf_writer.add_page(pdf_reader.pages[page_num])
-                
-            # Crear un nuevo archivo temporal en una ruta diferente
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_trimmed:
-                trimmed_file_path = tmp_trimmed.name
-            
-            # Guardar el PDF recortado en un archivo temporal nuevo
-            #trimmed_file_path = f"{file_path}_trimmed.pdf"
-            with open(trimmed_file_path, 'wb') as output_file:
-                pdf_writer.write(output_file)
-            
-            return trimmed_file_path
-    except Exception as e:
-        print(f"Error al recortar el PDF: {e}")
-        # En caso de error, devolvemos el archivo original
-        return file_path
+        form_extraction = None
+        selection = None
+        image_keys = None
+        if kind == 'pdf':
+            # PDFs grandes (anexos escaneados) se leen por rangos: solo xref y páginas necesarias
+            with stage('s3_fetch'):
+                buffer, metadata = open_s3_document(runtime.s3_client, bucket, key)
+            print(f"CONTENT TYPE: {metadata['content_type']} ({metadata['bytes_read']} de {metadata['size']} bytes leídos)")
+            # Los objetos leídos por rangos se identifican por su ETag (huella del contenido en S3)
+            document_hash = content_hash(buffer.getvalue()) if not metadata['ranged'] else f"etag-{metadata['etag']}"
+            checkpoint.mark('fetched', size=metadata['size'], content_hash=document_hash)
+            claim_or_raise(guard.claim_content(document_hash))
+
+            # Los campos AcroForm se leen del original: el PDF recortado no los conserva
+            if ACROFORM_FAST_PATH:
+                with stage('form_fields'):
+                    form_extraction = extract_form_fields(buffer)
+
+            with stage('page_select'):
+                selection = select_pages(buffer)
+            print(f"Páginas elegidas: {[i + 1 for i in selection['pages']]} "
+                  f"(~{selection['tokens']} tokens, puntajes {selection['scores']})")
+            with stage('trim'):
+                pdf_bytes = trim_pdf(buffer, pages=selection['pages'])
+            print(f"PDF recortado en memoria: {len(pdf_bytes)} bytes")
+            annotate(size=metadata['size'], pages=selection['total_pages'],
+                     selected_pages=selection['pages'], trimmed_bytes=len(pdf_bytes))
+            if metadata['ranged']:
+                annotate(ranged_bytes=buffer.bytes_fetched, ranged_requests=buffer.requests + 1)
+                print(f"Lectura por rangos: {buffer.bytes_fetched} de {metadata['size']} bytes en {buffer.requests + 1} peticiones")
+        else:
+            # Fotos (sueltas o de una solicitud): orientación, tamaño y gris, en un solo PDF
+            with stage('s3_fetch'):
+                pdf_bytes, image_keys = build_image_document(runtime.s3_client, bucket, key)
+            print(f"PDF armado con {len(image_keys)} imagen(es): {len(pdf_bytes)} bytes")
+            annotate(images=len(image_keys), trimmed_bytes=len(pdf_bytes))
+            document_hash = content_hash(pdf_bytes)
+            checkpoint.mark('fetched', size=len(pdf_bytes), content_hash=document_hash)
+            claim_or_raise(guard.claim_content(document_hash))
+
+        # Formularios rellenables o digitales: extraer sin llamar al modelo
+        with stage('fast_path'):
+            response_data, source = extract_without_model(pdf_bytes, form_extraction)
+        if response_data is not None:
+            return response_data, source
+
+        # Consultar la caché por contenido antes de llamar al modelo
+        with stage('cache_lookup'):
+            cache_key = build_cache_key(pdf_bytes, backend.cache_label, runtime.prompt_version, SCHEMA_VERSION)
+            response_data = runtime.extraction_cache.get(cache_key)
+        if response_data is not None:
+            return response_data, 'cache'
 
-def process_pdf_with_gemini(file_path, model_name, prompt,system_instruction):
+        if PAGE_TOKEN_CHECK and selection is not None:
+            with stage('token_check'):
+                pdf_bytes, selection = fit_token_budget(backend, buffer, pdf_bytes, selection)
+        if PDF_SHRINK and kind == 'pdf':
+            # Quitar recursos sin uso y recomprimir escaneos antes de enviarlo
+            with stage('shrink'):
+                pdf_bytes, _ = shrink_pdf(pdf_bytes)
+    finally:
+        # El buffer se libera siempre, incluso si falla la lectura o el recorte
+        if buffer is not None:
+            buffer.close()
+
+    pages_sent = len(selection['pages']) if selection is not None else len(image_keys)
+    prepared = {
+        'cache_key': cache_key,
+        'pages_sent': pages_sent,
+        'features': document_features(kind, selection, image_count=pages_sent, key=key),
+    }
+    # Lo que sigue solo depende del PDF recortado: un reintento retoma aquí
+    if len(pdf_bytes) <= CHECKPOINT_MAX_ARTIFACT_BYTES:
+        checkpoint.mark('trimmed', pdf_bytes=pdf_bytes, prepared=prepared)
+    return extract_with_model(runtime, backend, bucket, key, pdf_bytes, **prepared)
+
+def extract_with_model(runtime, backend, bucket, key, pdf_bytes, cache_key, pages_sent, features):
     """
-    Procesa un archivo PDF con el modelo Gemini y extrae información estructurada.
-    
-    Args:
-        file_path: Ruta al archivo PDF temporal
-        model_name: Nombre del modelo de Gemini a utilizar
-        prompt: Prompt personalizado para la extracción
-        
+    Llama al backend (o al router) con el PDF recortado y guarda el resultado en la caché.
+
     Returns:
-        dict: Datos extraídos en formato JSON según el schema definido
+        tuple: (datos extraídos ya post-procesados, 'model')
     """
-    # Definir el schema mejorado para la respuesta
-    schema = {
-        "type": "object",
-        "properties": {
-            "expediente": {
-                "type": "string",
-                "description": "Número de expediente del documento"
-            },
-            "ciudad": {
-                "type": "string",
-                "description": "Ciudad donde se presenta la solicitud (Bogotá, Cali, Medellín, Barranquilla)"
-            },
-            "hechos": {
-                "type": "string",
-                "description": "Descripción detallada de los hechos"
-            },
-            "peticiones": {
-                "type": "string",
-                "description": "Peticiones realizadas en la solicitud"
-            },
-            "cuantia": {
-                "type": "string",
-                "description": "Valor económico de la cuantía"
-            },
-            "convocantes": {
-                "type": "array",
-                "description": "Lista de personas que convocan",
-                "items": {
-                    "type": "object",
-                    "properties": {
-                        "rol": {
-                            "type": "string",
-                            "description": "Rol de la persona (CONDUCTOR, PROPIETARIO, OTROS)"
-                        },
-                        "nombre": {
-                            "type": "string",
-                            "description": "Nombre completo de la persona"
-                        },
-                        "email": {
-                            "type": "string",
-                            "description": "Dirección(es) de correo electrónico separadas por comas"
-                        },
-                        "telefono": {
-                            "type": "string",
-                            "description": "Número(s) de teléfono"
-                        }
-                    },
-                    "required": ["nombre", "email"]
-                }
-            },
-            "convocados": {
-                "type": "array",
-                "description": "Lista de personas convocadas",
-                "items": {
-                    "type": "object",
-                    "properties": {
-                        "rol": {
-                            "type": "string",
-                            "description": "Rol de la persona (CONDUCTOR, PROPIETARIO, OTROS)"
-                        },
-                        "nombre": {
-                            "type": "string",
-                            "description": "Nombre completo de la persona"
-                        },
-                        "mail": {
-                            "type": "string",
-                            "description": "Dirección(es) de correo electrónico separadas por comas"
-                        },
-                        "telefono": {
-                            "type": "string",
-                            "description": "Número(s) de teléfono"
-                        }
-                    },
-                    "required": ["nombre", "mail"]
-                }
-            },
-            "fecha_conciliacion": {
-                "type": "string",
-                "description": "Fecha de la audiencia en formato YYYY-MM-DD"
-            },
-            "hora_conciliacion": {
-                "type": "string",
-                "description": "Hora de la audiencia"
-            },
-            "jornada": {
-                "type": "string",
-                "description": "Jornada de la audiencia (AM/PM)"
-            },
-            "fecha_inicio": {
-                "type": "string",
-                "description": "Fecha y hora de inicio de la audiencia en formato ISO 8601 (YYYY-MM-DDTHH:mm:ss)"
-            },
-            "fecha_fin": {
-                "type": "string",
-                "description": "Fecha y hora de fin de la audiencia (una hora después del inicio) en formato ISO 8601 (YYYY-MM-DDTHH:mm:ss)"
-            }
-        },
-        "required": ["convocantes", "convocados"]
-    }
-    
-    # Configurar parámetros de generación optimizados
-    generation_config = {
-        "temperature": 0.1,
-        "top_p": 0.8,
-        "top_k": 20,
-        "max_output_tokens": 8192,
-        "response_mime_type": "application/json",
-        "response_schema": schema,
+    print(f"Modelo con archivo recortado: {key}")
+    extract_kwargs = {
+        'display_name': os.path.basename(key),
+        'usage_context': {'bucket': bucket, 'document': key, 'pages': pages_sent},
     }
-    
-    # Prompt mejorado para mejor detección
-    enhanced_prompt = PROMPT_EXTRADATA
-    
-    # Inicializar el modelo con instrucciones del sistema
-    model = genai.GenerativeModel(
-        model_name=model_name,
-        system_instruction=system_instruction,
-        generation_config=generation_config,
-    )
-    
-    # Subir el archivo a Gemini
-    files = genai.upload_file(file_path, mime_type="application/pdf")
-    print(f"Uploaded file '{files.display_name}' as: {files.uri}")
-    
-    # Usar el prompt mejorado si no se proporciona uno personalizado
-    final_prompt = prompt if prompt and prompt.strip() else enhanced_prompt
-    
-    try:
-        # Generar contenido con Gemini
-        print("Generando contenido con Gemini...")
-        response = model.generate_content([files, final_prompt])
-        
-        if not response.text:
-            raise Exception("Respuesta vacía de Gemini")
-        
-        result_json = json.loads(response.text)
-        print("Datos extraídos exitosamente")
-        
-        # Validar estructura básica
-        _validate_response(result_json)
-        
-        # Procesar y validar fechas
-        result_json = _process_datetime_fields(result_json)
-        
-        return result_json
-        
-    except json.JSONDecodeError as e:
-        print(f"Error al procesar la respuesta JSON: {e}")
-        print(f"Respuesta recibida: {response.text}")
-        raise Exception("La respuesta no es un JSON válido")
-    except Exception as e:
-        print(f"Error en procesamiento: {e}")
-        raise
+    if MODEL_ROUTER:
+        # Flash para formularios simples; escala si es complejo o la respuesta no sirve
+        response_data = backend.extract(pdf_bytes, PROMPT_EXTRADATA, SYS_INSTRUCTION,
+                                        features=features, **extract_kwargs)
+    else:
+        response_data = extract_document(pdf_bytes, PROMPT_EXTRADATA, SYS_INSTRUCTION, backend=backend,
+                                         runtime=runtime, **extract_kwargs)
+        annotate(model=backend.model_name)
+    response_data = postprocess_extraction(response_data)
+    runtime.extraction_cache.put(cache_key, response_data)
+    annotate(sent_bytes=len(pdf_bytes))
+    return response_data, 'model'
 
-def _convert_to_24_hour_format(hora_str, jornada):
-    """Convierte hora en formato 12h a 24h con validaciones mejoradas"""
-    try:
-        # Limpiar la string de hora
-        hora_clean = hora_str.strip().replace('.', ':')
-        
-        # Buscar patrones de hora (HH:MM o H:MM)
-        hora_match = re.search(r'(\d{1,2}):(\d{2})', hora_clean)
-        if not hora_match:
-            # Intentar solo horas (ej: "10", "2")
-            hora_match = re.search(r'(\d{1,2})', hora_clean)
-            if hora_match:
-                horas = int(hora_match.group(1))
-                minutos = 0
-            else:
-                print(f"No se pudo extraer hora de: '{hora_str}'")
-                return None
-        else:
-            horas = int(hora_match.group(1))
-            minutos = int(hora_match.group(2))
-        
-        # Detectar si ya está en formato 24 horas
-        if horas > 12:
-            print(f"Hora ya en formato 24h: {horas}:{minutos:02d}")
-            return f"{horas:02d}:{minutos:02d}"
-        
-        # Validar rangos para formato 12h
-        if horas < 1 or horas > 12 or minutos < 0 or minutos > 59:
-            print(f"Hora fuera de rango válido: {horas}:{minutos}")
-            # Intentar corrección automática si es formato 24h mal detectado
-            if horas >= 0 and horas <= 23 and minutos >= 0 and minutos <= 59:
-                print(f"Corrigiendo a formato 24h: {horas}:{minutos}")
-                return f"{horas:02d}:{minutos:02d}"
-            return None
-        
-        # Normalizar jornada
-        jornada_clean = jornada.strip().upper()
-        
-        # Convertir a formato 24 horas basándose en la jornada
-        if jornada_clean == 'PM':
-            if horas != 12:  # 1 PM = 13:00, 2 PM = 14:00, etc.
-                horas += 12
-            # 12 PM = 12:00 (mediodía, no se cambia)
-        elif jornada_clean == 'AM':
-            if horas == 12:  # 12 AM = 00:00 (medianoche)
-                horas = 0
-            # 1 AM = 01:00, 2 AM = 02:00, etc. (no se cambia)
-        else:
-            print(f"Jornada no reconocida: '{jornada}', asumiendo formato tal como está")
-            # Si no hay jornada clara, mantener la hora como está
-            if horas <= 12:
-                print(f"Sin jornada clara, manteniendo hora: {horas}:{minutos:02d}")
-            
-        # Validación final
-        if horas < 0 or horas > 23:
-            print(f"Hora final fuera de rango: {horas}:{minutos}")
-            return None
-            
-        resultado = f"{horas:02d}:{minutos:02d}"
-        print(f"Conversión exitosa: '{hora_str}' {jornada} → {resultado}")
-        return resultado
-        
-    except (ValueError, AttributeError) as e:
-        print(f"Error convirtiendo hora '{hora_str}' con jornada '{jornada}': {e}")
-        return None
+def extract_without_model(pdf_bytes, form_extraction=None):
+    """
+    Intenta llenar el schema con los campos del formulario PDF y la capa de texto.
+
+    Los campos AcroForm se usan primero; si no cubren todos los campos
+    requeridos se completan con la capa de texto del PDF recortado.
+
+    Args:
+        pdf_bytes: Contenido del PDF (ya recortado)
+        form_extraction: Resultado de extract_form_fields sobre el original (opcional)
+
+    Returns:
+        tuple: (datos extraídos, origen 'form_fields' | 'text_layer'), o (None, None)
+        si faltan campos requeridos o su confianza es baja (en ese caso se usa el modelo)
+    """
+    start = time.perf_counter()
+    extractions = []
+    source = None
+    if form_extraction and form_extraction['confidence']:
+        extractions.append(form_extraction)
+        source = 'form_fields'
+    if TEXT_FAST_PATH and (not extractions or missing_fields(form_extraction)):
+        text_extraction = extract_fields(pdf_bytes)
+        if text_extraction['confidence']:
+            extractions.append(text_extraction)
+            source = 'text_layer' if source is None else 'form_fields+text_layer'
+        elif not extractions:
+            print(f"Sin capa de texto útil ({text_extraction['text_chars']} caracteres), se usa el modelo")
+    if not extractions:
+        return None, None
 
-def _process_datetime_fields(data):
-    """Procesa y valida los campos de fecha y hora, creando fecha_inicio y fecha_fin"""
+    extraction = merge_extractions(*extractions)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    confidence = ", ".join(f"{field}={score:.2f}" for field, score in extraction['confidence'].items())
+    print(f"Confianza por campo ({source}): {confidence}")
+    missing = missing_fields(extraction)
+    if missing:
+        print(f"Campos faltantes o con baja confianza: {', '.join(missing)}. Se usa el modelo")
+        return None, None
+
+    print(f"⚡ Datos extraídos ({source}) en {elapsed_ms:.0f} ms, sin llamar al modelo")
+    return postprocess_extraction(extraction['data']), source
+
+def fit_token_budget(backend, buffer, pdf_bytes, selection, token_budget=PAGE_TOKEN_BUDGET):
+    """
+    Verifica con el conteo de tokens del backend que el PDF recortado quepa en el presupuesto.
+
+    Mientras lo supere, quita la página de menor puntaje y vuelve a recortar.
+    Si la verificación falla, o el backend no cuenta tokens, se envía el PDF tal como está.
+
+    Returns:
+        tuple: (PDF recortado dentro del presupuesto o con una sola página, selección final)
+    """
     try:
-        fecha_conciliacion = data.get('fecha_conciliacion')
-        hora_conciliacion = data.get('hora_conciliacion')
-        jornada = data.get('jornada', '').upper()
-        
-        # Log de datos recibidos
-        print(f"Procesando fecha/hora: fecha={fecha_conciliacion}, hora={hora_conciliacion}, jornada={jornada}")
-        
-        # Si no tenemos los datos básicos, intentar extraer de otros campos
-        if not fecha_conciliacion or not hora_conciliacion:
-            print("Faltan datos de fecha/hora, no se pueden generar fecha_inicio y fecha_fin")
-            return data
-        
-        # Validar que la jornada esté presente y sea válida
-        if not jornada or jornada not in ['AM', 'PM']:
-            print(f"Jornada inválida o faltante: '{jornada}'. Intentando inferir de la hora...")
-            
-            # Intentar inferir la jornada de la hora si está en formato 24h
-            try:
-                hora_num = int(hora_conciliacion.split(':')[0])
-                if hora_num >= 12:
-                    jornada = 'PM'
-                    print(f"Jornada inferida como PM basándose en hora {hora_num}")
-                else:
-                    jornada = 'AM'
-                    print(f"Jornada inferida como AM basándose en hora {hora_num}")
-            except:
-                print("No se pudo inferir la jornada, usando valor original")
-        
-        # Parsear la hora y convertir a formato 24 horas
-        hora_24 = _convert_to_24_hour_format(hora_conciliacion, jornada)
-        
-        if hora_24:
-            # Crear fecha_inicio en formato ISO 8601
-            fecha_inicio_str = f"{fecha_conciliacion}T{hora_24}:00"
-            
-            # Validar que la fecha sea válida
-            try:
-                fecha_inicio_dt = datetime.fromisoformat(fecha_inicio_str)
-            except ValueError as e:
-                print(f"Fecha inválida: {fecha_inicio_str}, error: {e}")
-                return data
-            
-            # Crear fecha_fin (una hora después)
-            fecha_fin_dt = fecha_inicio_dt + timedelta(hours=1)
-            fecha_fin_str = fecha_fin_dt.strftime("%Y-%m-%dT%H:%M:%S")
-            
-            # Agregar los nuevos campos
-            data['fecha_inicio'] = fecha_inicio_str
-            data['fecha_fin'] = fecha_fin_str
-            
-            # Actualizar la jornada en caso de que haya sido inferida
-            data['jornada'] = jornada
-            
-            print(f"✅ Fechas procesadas exitosamente:")
-            print(f"   🕐 Inicio: {fecha_inicio_str}")
-            print(f"   🕑 Fin: {fecha_fin_str}")
-            print(f"   🌅 Jornada: {jornada}")
-        else:
-            print("No se pudo procesar la hora, formato no reconocido")
-            print(f"Datos recibidos: hora='{hora_conciliacion}', jornada='{jornada}'")
-            
+        tokens = backend.count_tokens(pdf_bytes)
+        if tokens is None:
+            return pdf_bytes, selection
+        while tokens > token_budget and len(selection['pages']) > 1:
+            print(f"⚠️ {tokens} tokens superan el presupuesto de {token_budget}")
+            selection = drop_lowest_scored(selection)
+            pdf_bytes = trim_pdf(buffer, pages=selection['pages'])
+            tokens = backend.count_tokens(pdf_bytes)
+        print(f"count_tokens: {tokens} tokens en {len(selection['pages'])} páginas")
     except Exception as e:
-        print(f"Error procesando fechas: {e}")
-        
-    return data
+        print(f"⚠️ No se pudo verificar el presupuesto de tokens: {e}")
+    return pdf_bytes, selection
 
-def _validate_emails(data):
-    """Valida formato de emails en la respuesta"""
-    email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-    
-    # Validar emails en convocantes
-    for convocante in data.get('convocantes', []):
-        email = convocante.get('email', '')
-        if email and not re.search(email_pattern, email):
-            print(f"Email posiblemente inválido en convocante: {email}")
-    
-    # Validar emails en convocados
-    for convocado in data.get('convocados', []):
-        email = convocado.get('mail', '')
-        if email and not re.search(email_pattern, email):
-            print(f"Email posiblemente inválido en convocado: {email}")
-
-def _validate_response(data):
-    """Valida la estructura de la respuesta"""
-    if 'convocantes' not in data or not data['convocantes']:
-        print("⚠️ No se encontraron convocantes en la respuesta")
-    
-    if 'convocados' not in data or not data['convocados']:
-        print("⚠️ No se encontraron convocados en la respuesta")
-    
-    # Validar emails
-    _validate_emails(data)
+def enqueue_webhook(webhook_url, json_data, headers, document=None):
+    """
+    Guarda la entrega en el outbox; si un intento anterior del documento ya
+    dejó una (id en su checkpoint) que no está en el dead-letter, la reutiliza
+    en lugar de duplicarla.
 
-def send_to_webhook(webhook_url, json_data):
+    Returns:
+        dict: outbox_id y status de la entrega
+    """
+    outbox = get_runtime().get_webhook_outbox()
+    checkpoint = current_checkpoint()
+    previous_id = checkpoint.get('outbox_id') if checkpoint is not None else None
+    previous = outbox.status(previous_id) if previous_id else None
+    if previous is not None and previous['status'] != 'dead':
+        if previous['status'] != 'delivered':
+            outbox.schedule(previous_id)
+        print(f"Webhook de un intento anterior en el outbox ({previous_id}, {previous['status']})")
+        return {'outbox_id': previous_id, 'status': previous['status']}
+
+    # Guardar primero: si n8n está lento o caído el resultado no se pierde
+    delivery_id = outbox.enqueue(webhook_url, json_data, headers=headers, document=document)
+    if checkpoint is not None:
+        checkpoint.mark('extracted', outbox_id=delivery_id)
+    print(f"Webhook en el outbox ({delivery_id}): {webhook_url}")
+    return {'outbox_id': delivery_id, 'status': 'pending'}
+
+def send_to_webhook(webhook_url, json_data, document=None):
     """
     Envía los datos extraídos a un webhook.
+
+    Con WEBHOOK_OUTBOX solo se guardan en el outbox (la entrega corre en su
+    pool, con reintentos) y se devuelve el id de la entrega.
     
     Args:
         webhook_url: URL del webhook
         json_data: Datos en formato diccionario para enviar como JSON
+        document: Clave S3 del documento (para el estado de la entrega)
         
     Returns:
-        dict: Información sobre la respuesta del webhook
+        dict: Información sobre la respuesta del webhook, o outbox_id y status 'pending'
     """
+    import requests
+
     try:
         # Configurar headers para la solicitud
         headers = {
             'Content-Type': 'application/json',
             'User-Agent': 'Lambda-Legal-Workflow-Agent/1.0'
         }
+        # El id de correlación permite unir la traza con los registros del receptor
+        if correlation_id():
+            headers['X-Correlation-Id'] = correlation_id()
+
+        if WEBHOOK_OUTBOX:
+            return enqueue_webhook(webhook_url, json_data, headers, document)
         
+        # Sin tiempo para esperar la respuesta el envío queda para el reintento
+        require('webhook')
+        timeout = (stage_timeout(HTTP_CONNECT_TIMEOUT), stage_timeout(HTTP_READ_TIMEOUT))
         print(f"Enviando datos al webhook: {webhook_url}")
         
-        # Realizar la petición POST
-        response = requests.post(
+        # Realizar la petición POST con la sesión compartida (keep-alive), acotada por el plazo
+        response = get_runtime().post(
             webhook_url,
             data=json.dumps(json_data),
-            headers=headers
+            headers=headers,
+            timeout=timeout
         )
         
         # Verificar si la petición fue exitosa
@@ -0,0 +1,210 @@
+import json
+import os
+
+from text_extractor import CIUDADES, normalize_date, normalize_hour, strip_accents
+
+# Leer los campos AcroForm de solicitudes diligenciadas como PDF rellenable
+ACROFORM_FAST_PATH = os.environ.get('ACROFORM_FAST_PATH', '1') == '1'
+# Archivo JSON con el mapeo campo del formulario -> schema (por defecto DEFAULT_FIELD_MAPPING)
+FORM_FIELD_MAPPING_FILE = os.environ.get('FORM_FIELD_MAPPING_FILE')
+
+# Mapeo de los campos del formulario al schema de extracción.
+#   - lista de nombres: campo de texto o grupo de radio; se usa el primero con valor
+#   - dict nombre -> valor: casillas de chequeo; se usa el valor de la casilla marcada
+#   - lista de dicts (convocantes/convocados): un dict por persona con el nombre
+#     del campo del formulario para cada propiedad ('rol' es un valor fijo)
+# Los nombres se comparan sin mayúsculas ni tildes, contra el nombre completo
+# del campo o su último segmento ('form1.ciudad.cali' -> 'cali').
+DEFAULT_FIELD_MAPPING = {
+    'expediente': ['expediente', 'numero_expediente', 'no_expediente'],
+    'ciudad': {
+        'bogota': 'Bogotá',
+        'cali': 'Cali',
+        'medellin': 'Medellín',
+        'barranquilla': 'Barranquilla',
+    },
+    'cuantia': ['cuantia', 'valor_cuantia'],
+    'hechos': ['hechos'],
+    'peticiones': ['peticiones'],
+    'fecha_conciliacion': ['fecha_conciliacion', 'fecha_audiencia'],
+    'hora_conciliacion': ['hora_conciliacion', 'hora_audiencia'],
+    'jornada': {'am': 'AM', 'pm': 'PM'},
+    'convocantes': [
+        {
+            'rol': 'CONDUCTOR',
+            'nombre': 'convocante_conductor_nombre',
+            'email': 'convocante_conductor_email',
+            'telefono': 'convocante_conductor_telefono',
+        },
+        {
+            'rol': 'PROPIETARIO',
+            'nombre': 'convocante_propietario_nombre',
+            'email': 'convocante_propietario_email',
+            'telefono': 'convocante_propietario_telefono',
+        },
+    ],
+    'convocados': [
+        {
+            'rol': 'CONDUCTOR',
+            'nombre': 'convocado_conductor_nombre',
+            'mail': 'convocado_conductor_email',
+            'telefono': 'convocado_conductor_telefono',
+        },
+        {
+            'rol': 'PROPIETARIO',
+            'nombre': 'convocado_propietario_nombre',
+            'mail': 'convocado_propietario_email',
+            'telefono': 'convocado_propietario_telefono',
+        },
+    ],
+}
+
+# Valores de una casilla de chequeo desmarcada
+_UNCHECKED = {'', 'off', 'no', 'false', '0'}
+
+
+def load_field_mapping(path=FORM_FIELD_MAPPING_FILE):
+    """
+    Carga el mapeo de campos desde un archivo JSON.
+
+    Args:
+        path: Ruta del archivo; si no se indica se usa DEFAULT_FIELD_MAPPING
+
+    Returns:
+        dict: Mapeo campo del schema -> campos del formulario
+    """
+    if not path:
+        return DEFAULT_FIELD_MAPPING
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _normalize_name(name):
+    return strip_accents(str(name)).replace(' ', '_').replace('-', '_')
+
+
+def _clean_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        value = value[0] if value else ''
+    # Los valores de casillas y radios son nombres PDF ('/Yes', '/Cali')
+    return str(value).lstrip('/').strip()
+
+
+def read_acroform_values(stream):
+    """
+    Lee los valores de los campos AcroForm de un PDF.
+
+    Args:
+        stream: Objeto tipo archivo (con seek) con el PDF original; los campos
+            se leen antes del recorte porque el PDF recortado no conserva /AcroForm
+
+    Returns:
+        dict: Nombre normalizado del campo -> valor (vacío si no es un formulario)
+    """
+    import PyPDF2
+
+    stream.seek(0)
+    fields = PyPDF2.PdfReader(stream).get_fields() or {}
+    values = {}
+    for name, field in fields.items():
+        value = _clean_value(field.get('/V'))
+        normalized = _normalize_name(name)
+        # Nombre completo y último segmento ('form1.ciudad.cali' -> 'cali')
+        for alias in (normalized, normalized.rsplit('.', 1)[-1]):
+            if value or alias not in values:
+                values[alias] = value
+    return values
+
+
+def _first_value(values, names):
+    for name in names:
+        value = values.get(_normalize_name(name), '')
+        if value:
+            return value
+    return ''
+
+
+def _checked_choice(values, choices):
+    """Valor de la única casilla marcada; vacío si no hay ninguna o hay varias"""
+    checked = {
+        label for name, label in choices.items()
+        if values.get(_normalize_name(name), '').lower() not in _UNCHECKED
+    }
+    return checked.pop() if len(checked) == 1 else ''
+
+
+def _normalize_choice(field, value):
+    if field == 'ciudad':
+        return CIUDADES.get(strip_accents(value), value)
+    if field == 'jornada':
+        return value.replace('.', '').replace(' ', '').upper()
+    return value
+
+
+def map_form_values(values, mapping=None):
+    """
+    Llena el schema de extracción a partir de los valores del formulario.
+
+    Args:
+        values: Resultado de read_acroform_values
+        mapping: Mapeo de campos (por defecto load_field_mapping())
+
+    Returns:
+        dict: {'data': campos del schema, 'confidence': confianza 0-1 por campo, 'text_chars': 0}
+    """
+    mapping = load_field_mapping() if mapping is None else mapping
+    data = {}
+    confidence = {}
+    for field, spec in mapping.items():
+        if isinstance(spec, dict):
+            value = _normalize_choice(field, _checked_choice(values, spec))
+        elif spec and isinstance(spec[0], dict):
+            people = []
+            for person_spec in spec:
+                person = {
+                    prop: (name if prop == 'rol' else values.get(_normalize_name(name), ''))
+                    for prop, name in person_spec.items()
+                }
+                if person.get('nombre'):
+                    people.append(person)
+            data[field] = people
+            # Las personas sin correo suelen ser casillas omitidas; se deja decidir al modelo
+            complete = all(any(p.get(k) for k in ('email', 'mail')) for p in people)
+            confidence[field] = (1.0 if complete else 0.6) if people else 0.0
+            continue
+        else:
+            value = _normalize_choice(field, _first_value(values, spec))
+
+        if field == 'fecha_conciliacion':
+            value = normalize_date(value) or ''
+        elif field == 'hora_conciliacion':
+            value = normalize_hour(value)
+        data[field] = value
+        confidence[field] = 1.0 if value else 0.0
+    return {'data': data, 'confidence': confidence, 'text_chars': 0}
+
+
+def extract_form_fields(stream, mapping=None):
+    """
+    Extracción determinista desde los campos AcroForm del PDF.
+
+    Args:
+        stream: PDF original (objeto tipo archivo)
+        mapping: Mapeo de campos opcional
+
+    Returns:
+        dict: Resultado de map_form_values; confianza vacía si el PDF no tiene formulario
+    """
+    try:
+        values = read_acroform_values(stream)
+    except Exception as e:
+        print(f"⚠️ No se pudieron leer los campos del formulario: {e}")
+        values = {}
+    finally:
+        stream.seek(0)
+    if not any(values.values()):
+        return {'data': {}, 'confidence': {}, 'text_chars': 0}
+    print(f"Formulario PDF con {len(values)} campos")
+    return map_form_values(values, mapping)
@@ -0,0 +1,243 @@
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from deadlines import DeadlineExceeded, require, stage_timeout
+from extraction_cache import content_hash, create_shared_store
+from tracing import annotate, stage
+
+# Persistencia opcional del registro entre contenedores: 'sqlite', 'fs' o vacío (solo memoria)
+FILE_REGISTRY_BACKEND = os.environ.get('FILE_REGISTRY_BACKEND', '')
+FILE_REGISTRY_PATH = os.environ.get('FILE_REGISTRY_PATH', '/tmp/gemini_file_registry.db')
+# Margen de seguridad antes de la expiración (los archivos de Gemini duran 48 h)
+FILE_REUSE_MARGIN_SECONDS = int(os.environ.get('FILE_REUSE_MARGIN_SECONDS', '3600'))
+# Espera máxima para que un archivo pase de PROCESSING a ACTIVE
+FILE_READY_TIMEOUT_SECONDS = float(os.environ.get('FILE_READY_TIMEOUT_SECONDS', '60'))
+FILE_READY_POLL_SECONDS = float(os.environ.get('FILE_READY_POLL_SECONDS', '1'))
+# Modo de envío del documento: 'auto' (inline si es pequeño), 'inline' o 'file'
+GEMINI_UPLOAD_MODE = os.environ.get('GEMINI_UPLOAD_MODE', 'auto')
+# Tamaño máximo para enviar el documento inline (la petición completa admite ~20 MB)
+INLINE_MAX_BYTES = int(os.environ.get('INLINE_MAX_BYTES', str(8 * 1024 * 1024)))
+# Locks por franja de hash: memoria fija aunque el contenedor vea miles de documentos
+FILE_LOCK_STRIPES = int(os.environ.get('FILE_LOCK_STRIPES', '64'))
+# Entradas del registro en memoria (LRU); las demás se consultan en el almacén persistente
+FILE_REGISTRY_MAX_ENTRIES = int(os.environ.get('FILE_REGISTRY_MAX_ENTRIES', '256'))
+
+
+def _to_epoch(value):
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return float(value)
+
+
+def wait_until_active(file, timeout=FILE_READY_TIMEOUT_SECONDS, poll=FILE_READY_POLL_SECONDS):
+    """
+    Espera a que un archivo de Gemini quede en estado ACTIVE.
+
+    Dentro del handler la espera se acota al plazo de la invocación: si ya no
+    queda el mínimo para la llamada al modelo se lanza DeadlineExceeded y el
+    registro se reintenta en vez de agotar la invocación.
+
+    Args:
+        file: Archivo devuelto por genai.upload_file o genai.get_file
+        timeout: Segundos máximos de espera (acotados por el tiempo restante)
+        poll: Intervalo entre consultas
+
+    Returns:
+        El archivo actualizado en estado ACTIVE
+    """
+    import google.generativeai as genai
+
+    timeout = stage_timeout(timeout)
+    deadline = time.monotonic() + timeout
+    with stage('file_ready'):
+        while file.state.name == "PROCESSING":
+            # El archivo solo sirve si después queda tiempo para generar
+            require('model')
+            if time.monotonic() > deadline:
+                raise Exception(f"El archivo {file.name} sigue en PROCESSING tras {timeout:.1f}s")
+            time.sleep(poll)
+            file = genai.get_file(file.name)
+    if file.state.name != "ACTIVE":
+        raise Exception(f"File {file.name} failed to process")
+    return file
+
+
+class GeminiFileRegistry:
+    """
+    Registro de archivos subidos a la File API de Gemini por hash de contenido.
+
+    Guarda nombre, URI y expiración de cada subida. Antes de subir un documento
+    consulta el registro y, si existe un archivo vigente, verifica su estado con
+    genai.get_file y lo reutiliza cuando está ACTIVE. En memoria se conservan
+    las max_entries usadas más recientemente.
+    """
+
+    def __init__(self, store=None, margin_seconds=FILE_REUSE_MARGIN_SECONDS, max_entries=FILE_REGISTRY_MAX_ENTRIES):
+        self.store = store
+        self.margin_seconds = margin_seconds
+        self.max_entries = max(1, max_entries)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hash_locks = [threading.Lock() for _ in range(max(1, FILE_LOCK_STRIPES))]
+        self.reused = 0
+        self.uploaded = 0
+
+    @classmethod
+    def from_env(cls):
+        try:
+            store = create_shared_store(FILE_REGISTRY_BACKEND, FILE_REGISTRY_PATH, table='gemini_files')
+        except Exception as e:
+            print(f"⚠️ No se pudo inicializar el registro persistente de archivos: {e}")
+            store = None
+        return cls(store=store)
+
+    def _lock_for(self, doc_hash):
+        # Dos hashes de la misma franja se serializan entre sí; el mismo hash siempre cae en la misma
+        return self._hash_locks[int(doc_hash[:8], 16) % len(self._hash_locks)]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _cache(self, doc_hash, entry):
+        with self._lock:
+            self._entries[doc_hash] = entry
+            self._entries.move_to_end(doc_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _lookup(self, doc_hash):
+        with self._lock:
+            entry = self._entries.get(doc_hash)
+            if entry is not None:
+                self._entries.move_to_end(doc_hash)
+        if entry is None and self.store is not None:
+            try:
+                entry = self.store.get(doc_hash)
+            except Exception as e:
+                print(f"⚠️ Error leyendo el registro de archivos: {e}")
+                entry = None
+            if entry:
+                self._cache(doc_hash, entry)
+        return entry
+
+    def _remember(self, doc_hash, entry):
+        self._cache(doc_hash, entry)
+        if self.store is not None:
+            try:
+                self.store.put(doc_hash, entry)
+            except Exception as e:
+                print(f"⚠️ Error escribiendo el registro de archivos: {e}")
+
+    def _forget(self, doc_hash):
+        with self._lock:
+            self._entries.pop(doc_hash, None)
+        if self.store is not None:
+            try:
+                self.store.put(doc_hash, None)
+            except Exception:
+                pass
+
+    def _reuse(self, doc_hash):
+        import google.generativeai as genai
+
+        entry = self._lookup(doc_hash)
+        if not entry:
+            return None
+        expires_at = entry.get('expires_at')
+        if expires_at and expires_at - self.margin_seconds <= time.time():
+            self._forget(doc_hash)
+            return None
+        try:
+            file = genai.get_file(entry['name'])
+            file = wait_until_active(file)
+        except DeadlineExceeded:
+            # El archivo sigue siendo válido: el reintento lo vuelve a consultar
+            raise
+        except Exception as e:
+            print(f"Archivo registrado no reutilizable ({entry['name']}): {e}")
+            self._forget(doc_hash)
+            return None
+        return file
+
+    def get_or_upload(self, data, mime_type="application/pdf", display_name=None):
+        """
+        Devuelve un archivo ACTIVE de Gemini con el contenido indicado.
+
+        Args:
+            data: Bytes del documento
+            mime_type: Tipo MIME del documento
+            display_name: Nombre visible para nuevas subidas
+
+        Returns:
+            Archivo de Gemini listo para usarse en generate_content
+        """
+        import google.generativeai as genai
+
+        doc_hash = content_hash(data)
+        # El lock de la franja del hash evita subir dos veces el mismo documento dentro de un lote
+        with self._lock_for(doc_hash):
+            file = self._reuse(doc_hash)
+            if file is not None:
+                self.reused += 1
+                print(f"♻️ Reutilizando archivo de Gemini '{file.name}' ({file.uri})")
+                return file
+
+            with stage('upload'):
+                file = genai.upload_file(io.BytesIO(data), mime_type=mime_type, display_name=display_name)
+            print(f"Uploaded file '{file.display_name}' as: {file.uri}")
+            file = wait_until_active(file)
+            self.uploaded += 1
+            self._remember(doc_hash, {
+                'name': file.name,
+                'uri': file.uri,
+                'mime_type': mime_type,
+                'expires_at': _to_epoch(file.expiration_time),
+            })
+            return file
+
+
+def build_document_part(data, mime_type="application/pdf", registry=None, mode=None, display_name=None):
+    """
+    Prepara el documento como parte de la petición a generate_content.
+
+    En modo 'auto' los documentos de hasta INLINE_MAX_BYTES se envían como datos
+    inline en la misma petición (sin subida ni espera de procesamiento); los
+    mayores pasan por la File API, reutilizando subidas previas si se indica un
+    registro.
+
+    Args:
+        data: Bytes del documento
+        mime_type: Tipo MIME del documento
+        registry: GeminiFileRegistry opcional para la ruta File API
+        mode: 'auto', 'inline' o 'file' (por defecto GEMINI_UPLOAD_MODE)
+        display_name: Nombre visible para subidas nuevas
+
+    Returns:
+        tuple: (parte para generate_content, ruta utilizada: 'inline' o 'file')
+    """
+    mode = (mode or GEMINI_UPLOAD_MODE).strip().lower()
+    start = time.perf_counter()
+    if mode == 'inline' or (mode == 'auto' and len(data) <= INLINE_MAX_BYTES):
+        part, path = {'mime_type': mime_type, 'data': data}, 'inline'
+    elif registry is not None:
+        part, path = registry.get_or_upload(data, mime_type=mime_type, display_name=display_name), 'file'
+    else:
+        import google.generativeai as genai
+
+        with stage('upload'):
+            part = genai.upload_file(io.BytesIO(data), mime_type=mime_type, display_name=display_name)
+        print(f"Uploaded file '{part.display_name}' as: {part.uri}")
+        part, path = wait_until_active(part), 'file'
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    annotate(upload_path=path)
+    print(f"⏱️ Documento preparado vía {path} ({len(data)} bytes) en {elapsed_ms:.0f} ms")
+    return part, path
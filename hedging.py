@@ -0,0 +1,188 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import ExitStack
+
+from checkpoints import current_checkpoint
+from deadlines import current_deadline, stage_timeout
+from tracing import current_record
+
+# Cobertura (hedging) de llamadas al modelo: si la primera no responde a tiempo se lanza una segunda
+HEDGE_REQUESTS = os.environ.get('HEDGE_REQUESTS', '0') == '1'
+# Percentil de la latencia observada tras el cual se lanza la segunda llamada
+HEDGE_PERCENTILE = float(os.environ.get('HEDGE_PERCENTILE', '90'))
+# Plazo mientras no hay suficientes muestras, y límites del plazo calculado (ms)
+HEDGE_DEFAULT_MS = float(os.environ.get('HEDGE_DEFAULT_MS', '8000'))
+HEDGE_MIN_MS = float(os.environ.get('HEDGE_MIN_MS', '1000'))
+HEDGE_MAX_MS = float(os.environ.get('HEDGE_MAX_MS', '30000'))
+HEDGE_MIN_SAMPLES = int(os.environ.get('HEDGE_MIN_SAMPLES', '20'))
+HEDGE_WINDOW = int(os.environ.get('HEDGE_WINDOW', '200'))
+# Backend de la segunda llamada ("backend:modelo"); vacío repite el mismo backend
+HEDGE_BACKEND = os.environ.get('HEDGE_BACKEND', '')
+HEDGE_MAX_WORKERS = int(os.environ.get('HEDGE_MAX_WORKERS', '8'))
+
+
+def schema_valid(text, schema=None):
+    """La respuesta es un objeto JSON con los campos requeridos de primer nivel del schema"""
+    try:
+        data = json.loads(text) if text else None
+    except ValueError:
+        return False
+    if not isinstance(data, dict):
+        return False
+    return all(field in data for field in (schema or {}).get('required', []))
+
+
+class LatencyTracker:
+    """Ventana de latencias recientes (ms) de generate por backend y modelo"""
+
+    def __init__(self, window=HEDGE_WINDOW):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label, elapsed_ms):
+        with self._lock:
+            self._samples.setdefault(label, deque(maxlen=self.window)).append(elapsed_ms)
+
+    def percentile(self, label, pct, min_samples=HEDGE_MIN_SAMPLES):
+        """Percentil de la ventana, o None si aún no hay suficientes muestras"""
+        with self._lock:
+            samples = sorted(self._samples.get(label, ()))
+        if len(samples) < max(min_samples, 1):
+            return None
+        return samples[min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))]
+
+
+class Hedger:
+    """
+    Lanza una segunda llamada al modelo cuando la primera supera el percentil
+    HEDGE_PERCENTILE de la latencia observada, y se queda con la primera
+    respuesta que cumpla el schema.
+
+    La llamada perdedora no se puede interrumpir a mitad de la petición HTTP:
+    se descarta su resultado y, si llega a completarse, su consumo se registra
+    con hedge='loser' para ver el costo adicional. stats cuenta cuántas veces
+    se dispara la cobertura y cuántas gana.
+    """
+
+    def __init__(self, runtime, alternate=HEDGE_BACKEND, percentile=HEDGE_PERCENTILE, tracker=None,
+                 max_workers=HEDGE_MAX_WORKERS):
+        self.runtime = runtime
+        self.alternate_spec = alternate
+        self.percentile = percentile
+        self.tracker = tracker or LatencyTracker()
+        self.stats = {'calls': 0, 'fired': 0, 'won': 0, 'losers_billed': 0}
+        self._stats_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedge')
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def deadline_ms(self, backend):
+        """Plazo antes de cubrir: percentil observado acotado, o HEDGE_DEFAULT_MS sin muestras"""
+        observed = self.tracker.percentile(backend.cache_label, self.percentile)
+        if observed is None:
+            return HEDGE_DEFAULT_MS
+        return min(max(observed, HEDGE_MIN_MS), HEDGE_MAX_MS)
+
+    def alternate(self, backend):
+        if not self.alternate_spec:
+            return backend
+        name, _, model = self.alternate_spec.rpartition(':')
+        return self.runtime.get_backend(name or None, model)
+
+    def hedge_timeout(self, timeout, started):
+        """
+        Timeout de la cobertura al lanzarla: el de la primera llamada menos lo
+        ya esperado, acotado por el tiempo que queda de la invocación.
+
+        Args:
+            timeout: Timeout (segundos) de la primera llamada; None sin límite
+            started: time.monotonic() al lanzar la primera llamada
+        """
+        if timeout is None:
+            return None
+        return stage_timeout(max(0.1, timeout - (time.monotonic() - started)))
+
+    def _call(self, context, backend, pdf_bytes, prompt, system_instruction, schema, display_name, timeout):
+        # Traza, checkpoint y plazo del registro: sin ellos la subida no marca 'uploaded' ni mide sus etapas
+        with ExitStack() as stack:
+            for value in context:
+                stack.enter_context(value.activate())
+            start = time.perf_counter()
+            result = backend.generate(pdf_bytes, prompt, system_instruction, schema, display_name=display_name,
+                                      timeout=timeout)
+        self.tracker.observe(backend.cache_label, (time.perf_counter() - start) * 1000)
+        return result
+
+    def _bill_loser(self, backend, usage_context):
+        def callback(future):
+            if future.cancelled() or future.exception() is not None:
+                return
+            self._count('losers_billed')
+            self.runtime.usage_ledger.record(
+                None, backend.model_name, usage=future.result()['usage'], backend=backend.name,
+                hedge='loser', **usage_context
+            )
+        return callback
+
+    def generate(self, backend, pdf_bytes, prompt, system_instruction=None, schema=None, display_name=None,
+                 usage_context=None, timeout=None):
+        """
+        Llama a backend.generate con cobertura.
+
+        Las llamadas corren en los hilos del pool con la traza, el checkpoint
+        y el plazo del registro activos. La cobertura recibe lo que queda del
+        timeout de la primera llamada, acotado por el plazo de la invocación.
+
+        Returns:
+            tuple: (resultado de generate, backend que respondió, rol 'primary' o 'hedge',
+            True si se lanzó la cobertura)
+        """
+        self._count('calls')
+        started = time.monotonic()
+        context = [value for value in (current_record(), current_checkpoint(), current_deadline()) if value is not None]
+        args = (pdf_bytes, prompt, system_instruction, schema, display_name)
+        futures = {self._pool.submit(self._call, context, backend, *args, timeout): (backend, 'primary')}
+        deadline = self.deadline_ms(backend)
+        done, _ = wait(futures, timeout=deadline / 1000)
+        fired = not done
+        if fired:
+            alternate = self.alternate(backend)
+            hedge_timeout = self.hedge_timeout(timeout, started)
+            print(f"🏁 {backend.model_name} sin respuesta en {deadline:.0f} ms, se lanza una cobertura con {alternate.model_name}")
+            futures[self._pool.submit(self._call, context, alternate, *args, hedge_timeout)] = (alternate, 'hedge')
+            self._count('fired')
+
+        pending = set(futures)
+        invalid = None
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                winner, role = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"⚠️ Falló la llamada {role} a {winner.model_name}: {e}")
+                    error = error or e
+                    continue
+                if not schema_valid(result['text'], schema):
+                    invalid = invalid or (result, winner, role, fired)
+                    continue
+                # La otra llamada sigue en curso: se descarta, pero su consumo se registra
+                for other in pending:
+                    if not other.cancel():
+                        other.add_done_callback(self._bill_loser(futures[other][0], dict(usage_context or {})))
+                if role == 'hedge':
+                    self._count('won')
+                return result, winner, role, fired
+        # Ninguna respuesta cumple el schema: se devuelve la primera para que el motor reporte el error
+        if invalid is not None:
+            return invalid
+        raise error
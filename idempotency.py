@@ -0,0 +1,172 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# Deduplicación de notificaciones S3 (entrega at-least-once y re-cargas del mismo
+# archivo): 'sqlite' (sustituto local de un almacén con escrituras condicionales,
+# p. ej. DynamoDB) o vacío (desactivada)
+IDEMPOTENCY_BACKEND = os.environ.get('IDEMPOTENCY_BACKEND', 'sqlite')
+IDEMPOTENCY_PATH = os.environ.get('IDEMPOTENCY_PATH', '/tmp/idempotency.db')
+# Ventana en la que un documento ya entregado se considera duplicado
+IDEMPOTENCY_WINDOW_SECONDS = int(os.environ.get('IDEMPOTENCY_WINDOW_SECONDS', str(24 * 3600)))
+# Vigencia de la reserva de un documento en curso si no se conoce el tiempo de la invocación
+IDEMPOTENCY_LEASE_SECONDS = int(os.environ.get('IDEMPOTENCY_LEASE_SECONDS', '900'))
+
+
+def notification_key(bucket, key, version_id=None, etag=None):
+    """Identidad de la notificación: bucket, clave y versión (o etag) del objeto"""
+    return f"object:{bucket}/{key}@{version_id or etag or ''}"
+
+
+def content_key(bucket, document_hash):
+    """Identidad del contenido: el mismo archivo subido con otra clave es el mismo documento"""
+    return f"content:{bucket}/{document_hash}"
+
+
+class IdempotencyStore:
+    """
+    Reservas por documento en SQLite.
+
+    claim() es atómico (transacción IMMEDIATE): la primera invocación reserva
+    las claves 'in_progress' por la duración de su plazo; las demás ven la
+    reserva y se reconocen como duplicadas. Al entregar, las claves pasan a
+    'done' durante window_seconds; si el procesamiento falla, la reserva se
+    libera para que el reintento pueda tomarla.
+    """
+
+    def __init__(self, path=IDEMPOTENCY_PATH, window_seconds=IDEMPOTENCY_WINDOW_SECONDS):
+        self.path = path
+        self.window_seconds = window_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS idempotency ("
+                "key TEXT PRIMARY KEY, status TEXT NOT NULL, owner TEXT NOT NULL, "
+                "document TEXT, expires_at REAL NOT NULL)"
+            )
+
+    @classmethod
+    def from_env(cls):
+        backend = (IDEMPOTENCY_BACKEND or '').strip().lower()
+        if not backend:
+            return None
+        try:
+            if backend != 'sqlite':
+                raise ValueError(f"Backend de idempotencia no soportado: '{backend}'")
+            return cls()
+        except Exception as e:
+            print(f"⚠️ No se pudo inicializar el almacén de idempotencia: {e}")
+            return None
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def claim(self, keys, owner, document, lease_seconds):
+        """
+        Reserva las claves si ninguna está vigente para otro dueño.
+
+        Returns:
+            dict | None: La reserva vigente que la hace duplicada (status y
+            document), o None si las claves quedaron reservadas para owner
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for key in keys:
+                row = conn.execute(
+                    "SELECT status, owner, document FROM idempotency WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if row and row[1] != owner:
+                    conn.execute("ROLLBACK")
+                    return {'key': key, 'status': row[0], 'document': row[2]}
+            conn.executemany(
+                "INSERT OR REPLACE INTO idempotency (key, status, owner, document, expires_at) "
+                "VALUES (?, 'in_progress', ?, ?, ?)",
+                [(key, owner, document, now + lease_seconds) for key in keys]
+            )
+            conn.execute("COMMIT")
+            return None
+        finally:
+            conn.close()
+
+    def complete(self, keys, owner):
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE idempotency SET status = 'done', expires_at = ? WHERE key = ? AND owner = ?",
+                [(time.time() + self.window_seconds, key, owner) for key in keys]
+            )
+
+    def release(self, keys, owner):
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM idempotency WHERE key = ? AND owner = ?", [(key, owner) for key in keys])
+
+
+class IdempotencyGuard:
+    """
+    Reservas de un registro: primero su notificación y, cuando se conoce el
+    contenido, su hash. Sin almacén no deduplica (todo se procesa).
+    """
+
+    def __init__(self, store, bucket, key, version_id=None, etag=None, lease_seconds=IDEMPOTENCY_LEASE_SECONDS):
+        self.store = store
+        self.bucket = bucket
+        self.document = key
+        self.lease_seconds = lease_seconds
+        self.owner = uuid.uuid4().hex
+        self.notification = notification_key(bucket, key, version_id, etag) if (version_id or etag) else None
+        self.keys = []
+        self._lock = threading.Lock()
+
+    def _claim(self, keys):
+        if self.store is None or not keys:
+            return None
+        try:
+            duplicate = self.store.claim(keys, self.owner, self.document, self.lease_seconds)
+        except Exception as e:
+            # Sin almacén disponible es preferible procesar de más que perder el documento
+            print(f"⚠️ No se pudo verificar la idempotencia de {self.document}: {e}")
+            return None
+        if duplicate is None:
+            with self._lock:
+                self.keys.extend(keys)
+        return duplicate
+
+    def claim_notification(self):
+        """Reserva la notificación; devuelve la reserva vigente si es un duplicado"""
+        return self._claim([self.notification] if self.notification else [])
+
+    def claim_content(self, document_hash):
+        """Reserva el contenido; devuelve la reserva vigente si otro objeto ya lo procesa o lo entregó"""
+        return self._claim([content_key(self.bucket, document_hash)] if document_hash else [])
+
+    def complete(self):
+        """El documento se entregó: las claves quedan como duplicadas durante la ventana"""
+        self._finish(self.store.complete if self.store is not None else None)
+
+    def release(self):
+        """El procesamiento falló: se liberan las reservas para el reintento"""
+        self._finish(self.store.release if self.store is not None else None)
+
+    def _finish(self, action):
+        with self._lock:
+            keys, self.keys = self.keys, []
+        if action is None or not keys:
+            return
+        try:
+            action(keys, self.owner)
+        except Exception as e:
+            print(f"⚠️ No se pudo actualizar la idempotencia de {self.document}: {e}")
+
+
+class DuplicateDocument(Exception):
+    """El documento ya se procesó o está en curso en otra invocación; se reconoce sin reprocesar"""
+
+    def __init__(self, reservation):
+        self.reservation = reservation
+        state = 'entregado' if reservation['status'] == 'done' else 'en curso'
+        super().__init__(f"Duplicado de {reservation['document']} ({state})")
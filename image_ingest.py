@@ -0,0 +1,347 @@
+import io
+import json
+import os
+import posixpath
+import time
+import uuid
+from datetime import datetime
+
+from pdf_utils import fetch_s3_object
+from s3_events import PermanentRecordError
+
+# Lado mayor (px) de cada foto tras el preprocesamiento
+IMAGE_MAX_SIDE = int(os.environ.get('IMAGE_MAX_SIDE', '2000'))
+IMAGE_GRAYSCALE = os.environ.get('IMAGE_GRAYSCALE', '1') == '1'
+IMAGE_JPEG_QUALITY = int(os.environ.get('IMAGE_JPEG_QUALITY', '75'))
+# Resolución con la que se arma el PDF del lote (define el tamaño de página)
+IMAGE_BUNDLE_DPI = int(os.environ.get('IMAGE_BUNDLE_DPI', '200'))
+# Máximo de fotos por solicitud y tamaño máximo de cada foto original
+MAX_BUNDLE_IMAGES = int(os.environ.get('MAX_BUNDLE_IMAGES', '10'))
+MAX_IMAGE_BYTES = int(os.environ.get('MAX_IMAGE_BYTES', str(25 * 1024 * 1024)))
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+# Las fotos de una misma solicitud se suben a una carpeta 'sub-<id>/' con un manifiesto
+SUBMISSION_PREFIX = 'sub-'
+MANIFEST_NAME = 'manifest.json'
+
+
+class UnsupportedDocumentError(PermanentRecordError):
+    """El formato del archivo no se puede procesar"""
+
+
+def document_kind(key):
+    """
+    Clasifica un objeto según su clave.
+
+    Returns:
+        str: 'pdf', 'image', 'manifest' o 'unsupported'
+    """
+    name = posixpath.basename(key).lower()
+    if name.endswith('.pdf'):
+        return 'pdf'
+    if name.endswith(IMAGE_EXTENSIONS):
+        return 'image'
+    if name == MANIFEST_NAME and is_submission_key(key):
+        return 'manifest'
+    return 'unsupported'
+
+
+def is_submission_key(key):
+    """True si el objeto está en la carpeta de una solicitud con varias fotos"""
+    return posixpath.basename(posixpath.dirname(key)).startswith(SUBMISSION_PREFIX)
+
+
+def unsupported_message(key):
+    extension = posixpath.splitext(key)[1].lower() or 'sin extensión'
+    if extension in ('.doc', '.docx'):
+        return (f"El archivo '{key}' es un documento de Word ({extension}); "
+                "se debe cargar como PDF o como fotos (jpg/png) del formulario")
+    return f"El formato de '{key}' ({extension}) no es compatible: se aceptan PDF, JPG y PNG"
+
+
+def prepare_image(data, max_side=IMAGE_MAX_SIDE, grayscale=IMAGE_GRAYSCALE):
+    """
+    Normaliza una foto de formulario: orientación EXIF, tamaño y color.
+
+    Para JPEG se usa draft() para decodificar directamente a una escala
+    reducida, lo que evita descomprimir los 12+ megapíxeles de una foto de
+    celular.
+
+    Args:
+        data: Bytes de la imagen (jpg/png)
+        max_side: Lado mayor en píxeles
+        grayscale: Convertir a escala de grises
+
+    Returns:
+        PIL.Image: Imagen lista para comprimir (modo 'L' o 'RGB')
+    """
+    from PIL import Image, ImageOps
+
+    image = Image.open(io.BytesIO(data))
+    if image.format == 'JPEG':
+        image.draft('L' if grayscale else 'RGB', (max_side, max_side))
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # Transparencias sobre fondo blanco
+        image = image.convert('RGBA')
+        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    image = image.convert('L' if grayscale else 'RGB')
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    return image
+
+
+def compress_image_upload(data, name, quality=IMAGE_JPEG_QUALITY):
+    """
+    Prepara una foto antes de subirla a S3 (la carga se hace con la versión reducida).
+
+    Args:
+        data: Bytes de la imagen original
+        name: Nombre del archivo original
+
+    Returns:
+        tuple: (BytesIO con el JPEG, nombre de upload_name)
+    """
+    # Una foto que ya cumple (p. ej. recargada desde S3) no pasa por otra compresión con pérdida
+    if reusable_jpeg(data) is not None:
+        return io.BytesIO(data), upload_name(name)
+    output = io.BytesIO()
+    prepare_image(data).save(output, 'JPEG', quality=quality, optimize=True)
+    output.seek(0)
+    return output, upload_name(name)
+
+
+def upload_name(name):
+    """
+    Nombre en S3 de un archivo cargado. Las fotos se suben como JPEG; las que
+    no lo eran conservan su extensión en el nombre ('foto.png' -> 'foto-png.jpg')
+    para no pisar un 'foto.jpg' de la misma carga.
+    """
+    stem, ext = posixpath.splitext(name)
+    if ext.lower() in IMAGE_EXTENSIONS and ext.lower() not in ('.jpg', '.jpeg'):
+        return f"{stem}-{ext[1:].lower()}.jpg"
+    return name
+
+
+def unique_names(names):
+    """Desambigua los nombres repetidos de una carga: 'a.pdf', 'a-2.pdf', 'a-3.pdf'..."""
+    seen = set()
+    result = []
+    for name in names:
+        stem, ext = posixpath.splitext(name)
+        candidate, n = name, 1
+        while candidate.lower() in seen:
+            n += 1
+            candidate = f"{stem}-{n}{ext}"
+        seen.add(candidate.lower())
+        result.append(candidate)
+    return result
+
+
+def upload_files(s3_client, bucket, prefix, files, on_progress=None):
+    """
+    Sube los archivos de una carga a s3://bucket/prefix/AAAA-MM-DD/.
+
+    Las fotos se reducen antes de subirlas (las de celular pesan 5-12 MB). Si
+    la carga trae varias fotos son una sola solicitud: van a su carpeta
+    'sub-<id>/' y al final se sube el manifiesto, cuyo evento dispara el
+    procesamiento de todas. Los nombres repetidos se desambiguan.
+
+    Args:
+        s3_client: Cliente de boto3
+        bucket: Bucket de destino
+        prefix: Prefijo del cliente (p. ej. 'uploads')
+        files: Archivos cargados (name y getvalue(), como los de st.file_uploader)
+        on_progress: Función on_progress(subidos, total) (opcional)
+
+    Returns:
+        list: Por archivo, {'success', 'name', 'url', 'path'} o {'success': False, 'name', 'error'}
+    """
+    images = [f for f in files if f.name.lower().endswith(IMAGE_EXTENSIONS)]
+    folder = f"{SUBMISSION_PREFIX}{uuid.uuid4().hex[:12]}" if len(images) > 1 else None
+    base = f"{prefix}/{datetime.now().strftime('%Y-%m-%d')}"
+    names = unique_names([upload_name(f.name) for f in files])
+
+    results = []
+    for i, (file, name) in enumerate(zip(files, names)):
+        try:
+            body = file
+            if file in images:
+                body, _ = compress_image_upload(file.getvalue(), file.name)
+            s3_path = f"{base}/{folder}/{name}" if folder and file in images else f"{base}/{name}"
+            print(f"Subiendo archivo a S3: {s3_path}")
+            s3_client.upload_fileobj(body, bucket, s3_path)
+            results.append({
+                "success": True,
+                "name": name,
+                "url": f"https://{bucket}.s3.amazonaws.com/{s3_path}",
+                "path": s3_path
+            })
+        except Exception as e:
+            results.append({"success": False, "name": file.name, "error": str(e)})
+        if on_progress is not None:
+            on_progress(i + 1, len(files))
+
+    # El manifiesto se sube al final: su evento dispara el procesamiento de todas las fotos
+    image_paths = [r['path'] for r in results if folder and r['success'] and f"/{folder}/" in r['path']]
+    if image_paths:
+        try:
+            s3_client.put_object(
+                Bucket=bucket, Key=f"{base}/{folder}/{MANIFEST_NAME}", ContentType='application/json',
+                Body=build_manifest(posixpath.basename(p) for p in image_paths)
+            )
+        except Exception as e:
+            results.append({"success": False, "name": MANIFEST_NAME, "error": str(e)})
+    return results
+
+
+def build_manifest(image_names):
+    """Contenido del manifiesto de una solicitud con varias fotos"""
+    return json.dumps({'images': list(image_names)}, ensure_ascii=False).encode('utf-8')
+
+
+def reusable_jpeg(data, max_side=IMAGE_MAX_SIDE, grayscale=IMAGE_GRAYSCALE):
+    """
+    Reconoce una foto que ya se preparó al cargarla (compress_image_upload):
+    JPEG, dentro de max_side, en el modo de color final y sin rotación EXIF
+    pendiente. Esas fotos se incrustan tal cual en el PDF, sin una segunda
+    compresión con pérdida.
+
+    Returns:
+        tuple | None: (ancho, alto, modo) o None si hay que prepararla
+    """
+    from PIL import Image
+
+    try:
+        image = Image.open(io.BytesIO(data))
+    except Exception:
+        return None
+    if image.format != 'JPEG' or max(image.size) > max_side:
+        return None
+    if image.mode != ('L' if grayscale else 'RGB') or image.getexif().get(0x0112, 1) != 1:
+        return None
+    return image.width, image.height, image.mode
+
+
+def encode_jpeg(image, quality=IMAGE_JPEG_QUALITY):
+    """
+    Comprime una imagen preparada (prepare_image) como JPEG.
+
+    Returns:
+        tuple: (bytes del JPEG, ancho, alto, modo)
+    """
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=quality, optimize=True)
+    return output.getvalue(), image.width, image.height, image.mode
+
+
+def bundle_images(pages, dpi=IMAGE_BUNDLE_DPI):
+    """
+    Une varias fotos en un solo PDF (una página por foto). Los JPEG se
+    incrustan sin recomprimir (DCTDecode).
+
+    Args:
+        pages: Lista de (bytes JPEG, ancho, alto, modo 'L' o 'RGB')
+        dpi: Resolución declarada de las páginas
+
+    Returns:
+        bytes: Documento PDF
+    """
+    objects = [None, None]
+    page_ids = []
+    for jpeg, width, height, mode in pages:
+        objects.append(
+            f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+            f"/ColorSpace /{'DeviceGray' if mode == 'L' else 'DeviceRGB'} /BitsPerComponent 8 "
+            f"/Filter /DCTDecode /Length {len(jpeg)} >>\nstream\n".encode('latin-1') + jpeg + b"\nendstream"
+        )
+        image_id = len(objects)
+        page_width, page_height = width * 72 / dpi, height * 72 / dpi
+        content = f"q {page_width:.2f} 0 0 {page_height:.2f} 0 0 cm /Im0 Do Q".encode('latin-1')
+        objects.append(f"<< /Length {len(content)} >>\nstream\n".encode('latin-1') + content + b"\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width:.2f} {page_height:.2f}] "
+            f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {len(objects)} 0 R >>".encode('latin-1')
+        )
+        page_ids.append(len(objects))
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode('latin-1')
+
+    output = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n".encode('latin-1') + body + b"\nendobj\n"
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('latin-1')
+    for offset in offsets:
+        output += f"{offset:010d} 00000 n \n".encode('latin-1')
+    output += (f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+               f"startxref\n{xref_offset}\n%%EOF\n").encode('latin-1')
+    return bytes(output)
+
+
+def load_manifest(s3_client, bucket, key):
+    """
+    Lee el manifiesto de una solicitud con varias fotos.
+
+    Returns:
+        list: Claves S3 de las fotos, en el orden en que se cargaron
+    """
+    buffer, _ = fetch_s3_object(s3_client, bucket, key, max_bytes=1024 * 1024)
+    try:
+        manifest = json.loads(buffer.read().decode('utf-8'))
+    finally:
+        buffer.close()
+    folder = posixpath.dirname(key)
+    keys = [k if '/' in k else posixpath.join(folder, k) for k in manifest.get('images', [])]
+    if not keys:
+        raise PermanentRecordError(f"El manifiesto '{key}' no lista imágenes")
+    return keys
+
+
+def build_image_document(s3_client, bucket, key):
+    """
+    Convierte una foto, o todas las fotos de una solicitud, en un PDF compacto.
+
+    Args:
+        s3_client: Cliente boto3 de S3
+        bucket: Nombre del bucket
+        key: Clave de una imagen suelta o del manifiesto de la solicitud
+
+    Returns:
+        tuple: (bytes del PDF, lista de claves incluidas)
+    """
+    start = time.perf_counter()
+    keys = load_manifest(s3_client, bucket, key) if document_kind(key) == 'manifest' else [key]
+    if len(keys) > MAX_BUNDLE_IMAGES:
+        print(f"⚠️ La solicitud tiene {len(keys)} fotos, se usan las primeras {MAX_BUNDLE_IMAGES}")
+        keys = keys[:MAX_BUNDLE_IMAGES]
+
+    pages = []
+    original_bytes = 0
+    reused = 0
+    for image_key in keys:
+        if document_kind(image_key) != 'image':
+            raise UnsupportedDocumentError(unsupported_message(image_key))
+        buffer, metadata = fetch_s3_object(s3_client, bucket, image_key, max_bytes=MAX_IMAGE_BYTES)
+        try:
+            data = buffer.read()
+            # Las fotos cargadas desde la app ya vienen preparadas: se usan sin recomprimir
+            prepared = reusable_jpeg(data)
+            if prepared is not None:
+                pages.append((data,) + prepared)
+                reused += 1
+            else:
+                pages.append(encode_jpeg(prepare_image(data)))
+        except Exception as e:
+            raise UnsupportedDocumentError(f"No se pudo leer la imagen '{image_key}': {e}")
+        finally:
+            buffer.close()
+        original_bytes += metadata['bytes_read']
+
+    pdf_bytes = bundle_images(pages)
+    print(f"🖼️ {len(pages)} imagen(es) ({reused} sin recomprimir): {original_bytes} → {len(pdf_bytes)} bytes "
+          f"en PDF ({(time.perf_counter() - start) * 1000:.0f} ms)")
+    return pdf_bytes, keys
@@ -0,0 +1,225 @@
+import base64
+import os
+import time
+from abc import ABC, abstractmethod
+
+from checkpoints import mark
+from deadlines import stage_timeout
+from extraction_cache import content_hash, version_tag
+from extraction_schema import build_generation_config, to_gemini_schema, to_openai_schema
+from gemini_files import build_document_part
+from tracing import stage
+from usage_ledger import usage_from_response
+
+# Backend de extracción: 'gemini', 'openai' o 'fake'
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'gemini')
+OPENAI_MODEL_NAME = os.environ.get('OPENAI_MODEL_NAME', 'gpt-4.1-mini')
+OPENAI_TIMEOUT_SECONDS = float(os.environ.get('OPENAI_TIMEOUT_SECONDS', '120'))
+# Latencia simulada del backend 'fake' (para benchmarks)
+FAKE_BACKEND_LATENCY_MS = float(os.environ.get('FAKE_BACKEND_LATENCY_MS', '0'))
+
+
+class ExtractionBackend(ABC):
+    """
+    Interfaz común de los proveedores de extracción.
+
+    generate() recibe el PDF ya recortado, el prompt, las instrucciones del
+    sistema y el schema compartido (cada backend lo adapta a su API) y
+    devuelve el texto JSON de la respuesta junto con su consumo de tokens en
+    el formato de usage_ledger. timeout (segundos) acota la llamada al
+    proveedor; None usa el del cliente. Un backend sin generate() falla al
+    crearse, no a mitad de una extracción.
+    """
+
+    name = None
+    default_model = None
+
+    def __init__(self, model_name=None):
+        self.model_name = model_name or self.default_model
+
+    @property
+    def cache_label(self):
+        """Identifica backend y modelo en la clave de caché"""
+        return f"{self.name}:{self.model_name}"
+
+    @abstractmethod
+    def generate(self, pdf_bytes, prompt, system_instruction=None, schema=None, display_name=None, timeout=None):
+        """
+        Returns:
+            dict: {'text': JSON de la respuesta, 'usage': conteos de tokens, 'upload_path'}
+        """
+
+    def count_tokens(self, pdf_bytes, prompt=None):
+        """Tokens de entrada del documento, o None si el backend no puede contarlos"""
+        return None
+
+
+class GeminiBackend(ExtractionBackend):
+    """Gemini con schema de respuesta, modelos reutilizados y envío inline o File API"""
+
+    name = 'gemini'
+    default_model = os.environ.get('MODEL_NAME') or 'gemini-1.5-flash-002'
+
+    def __init__(self, model_name=None, runtime=None):
+        super().__init__(model_name)
+        self.runtime = runtime
+
+    @property
+    def cache_label(self):
+        # Sin prefijo, para conservar las entradas de caché creadas antes de los backends
+        return self.model_name
+
+    def _model(self, system_instruction, schema):
+        return self.runtime.get_model(self.model_name, system_instruction, to_gemini_schema(schema),
+                                      version_tag(schema))
+
+    def generate(self, pdf_bytes, prompt, system_instruction=None, schema=None, display_name=None, timeout=None):
+        model = self._model(system_instruction, schema)
+        # Adjuntar el PDF inline si es pequeño; si no, subirlo (o reutilizar una subida vigente)
+        part, upload_path = build_document_part(
+            pdf_bytes, mime_type="application/pdf", registry=self.runtime.file_registry, display_name=display_name
+        )
+        if upload_path == 'file':
+            # La subida se reutiliza por hash desde el registro de archivos (FILE_REGISTRY_BACKEND)
+            mark('uploaded', document_hash=content_hash(pdf_bytes))
+            # La espera de la subida consumió parte del plazo de la invocación
+            timeout = stage_timeout(timeout) if timeout else timeout
+        start = time.perf_counter()
+        with stage('generate'):
+            if timeout:
+                response = model.generate_content([part, prompt], request_options={'timeout': timeout})
+            else:
+                response = model.generate_content([part, prompt])
+        print(f"⏱️ generate_content ({upload_path}) en {(time.perf_counter() - start) * 1000:.0f} ms")
+        return {'text': response.text, 'usage': usage_from_response(response), 'upload_path': upload_path}
+
+    def count_tokens(self, pdf_bytes, prompt=None):
+        from page_selection import count_pdf_tokens
+
+        return count_pdf_tokens(self._model(None, None), pdf_bytes, prompt)
+
+
+class OpenAIBackend(ExtractionBackend):
+    """OpenAI Responses API con el PDF como input_file y Structured Outputs estricto"""
+
+    name = 'openai'
+    default_model = OPENAI_MODEL_NAME
+
+    def __init__(self, model_name=None, runtime=None):
+        super().__init__(model_name)
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            try:
+                from openai import OpenAI
+            except ImportError:
+                raise Exception("El backend 'openai' requiere el paquete openai (pip install openai)")
+            self._client = OpenAI(timeout=OPENAI_TIMEOUT_SECONDS)
+        return self._client
+
+    @staticmethod
+    def _usage(response):
+        usage = getattr(response, 'usage', None)
+        if usage is None:
+            return usage_from_response(None)
+        input_details = getattr(usage, 'input_tokens_details', None)
+        output_details = getattr(usage, 'output_tokens_details', None)
+        cached = getattr(input_details, 'cached_tokens', 0) or 0
+        reasoning = getattr(output_details, 'reasoning_tokens', 0) or 0
+        return {
+            'prompt_tokens': usage.input_tokens,
+            'cached_tokens': cached,
+            # output_tokens incluye el razonamiento; se separa como en Gemini
+            'candidates_tokens': usage.output_tokens - reasoning,
+            'thoughts_tokens': reasoning,
+            'total_tokens': usage.total_tokens,
+        }
+
+    def generate(self, pdf_bytes, prompt, system_instruction=None, schema=None, display_name=None, timeout=None):
+        content = [
+            {
+                'type': 'input_file',
+                'filename': display_name or 'documento.pdf',
+                'file_data': 'data:application/pdf;base64,' + base64.b64encode(pdf_bytes).decode('ascii'),
+            },
+            {'type': 'input_text', 'text': prompt},
+        ]
+        request = {
+            'model': self.model_name,
+            'input': [{'role': 'user', 'content': content}],
+            'temperature': build_generation_config(None)['temperature'],
+        }
+        if system_instruction:
+            request['instructions'] = system_instruction
+        if schema:
+            request['text'] = {'format': {'type': 'json_schema', 'name': 'extraccion',
+                                          'schema': to_openai_schema(schema), 'strict': True}}
+        start = time.perf_counter()
+        with stage('generate'):
+            if timeout:
+                response = self.client.responses.create(timeout=timeout, **request)
+            else:
+                response = self.client.responses.create(**request)
+        print(f"⏱️ responses.create (inline) en {(time.perf_counter() - start) * 1000:.0f} ms")
+        return {'text': response.output_text, 'usage': self._usage(response), 'upload_path': 'inline'}
+
+
+class FakeBackend(ExtractionBackend):
+    """
+    Backend determinista sin red: llena el schema con la capa de texto del
+    PDF (text_extractor). Sirve para benchmarks y pruebas de extremo a extremo.
+    """
+
+    name = 'fake'
+    default_model = 'fake-extractor'
+
+    def __init__(self, model_name=None, runtime=None, latency_ms=FAKE_BACKEND_LATENCY_MS):
+        super().__init__(model_name)
+        self.latency_ms = latency_ms
+
+    def generate(self, pdf_bytes, prompt, system_instruction=None, schema=None, display_name=None, timeout=None):
+        import json
+
+        from text_extractor import extract_fields
+
+        with stage('generate'):
+            if self.latency_ms:
+                if timeout and self.latency_ms / 1000 > timeout:
+                    time.sleep(timeout)
+                    raise TimeoutError(f"{self.model_name} sin respuesta en {timeout:.1f} s")
+                time.sleep(self.latency_ms / 1000)
+            data = dict({'convocantes': [], 'convocados': []}, **extract_fields(pdf_bytes)['data'])
+        text = json.dumps(data, ensure_ascii=False)
+        prompt_tokens = self.count_tokens(pdf_bytes, prompt)
+        usage = {'prompt_tokens': prompt_tokens, 'cached_tokens': 0, 'candidates_tokens': len(text) // 4,
+                 'thoughts_tokens': 0, 'total_tokens': prompt_tokens + len(text) // 4}
+        return {'text': text, 'usage': usage, 'upload_path': 'inline'}
+
+    def count_tokens(self, pdf_bytes, prompt=None):
+        from page_selection import PAGE_IMAGE_TOKENS
+        from usage_ledger import count_pdf_pages
+
+        return PAGE_IMAGE_TOKENS * (count_pdf_pages(pdf_bytes) or 1) + len(prompt or '') // 4
+
+
+BACKENDS = {backend.name: backend for backend in (GeminiBackend, OpenAIBackend, FakeBackend)}
+
+
+def create_backend(name=None, model_name=None, runtime=None):
+    """
+    Crea el backend configurado.
+
+    Args:
+        name: 'gemini', 'openai' o 'fake' (por defecto LLM_BACKEND)
+        model_name: Modelo del proveedor (por defecto el del backend)
+        runtime: Runtime del contenedor (modelos y registro de archivos de Gemini)
+
+    Returns:
+        ExtractionBackend
+    """
+    name = (name or LLM_BACKEND).strip().lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Backend de extracción no soportado: '{name}'")
+    return BACKENDS[name](model_name, runtime=runtime)
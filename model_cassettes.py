@@ -0,0 +1,136 @@
+import glob
+import json
+import os
+import time
+
+from extraction_cache import FileSystemCacheStore, content_hash, version_tag
+from extraction_schema import GENERATION_CONFIG
+from llm_backends import ExtractionBackend
+from s3_events import PermanentRecordError
+
+# Grabación de llamadas al modelo: '' (desactivado), 'record' (llama y graba),
+# 'replay' (solo casetes, sin red; un faltante es error) o 'auto' (reproduce
+# si existe el casete, si no llama y graba)
+LLM_CASSETTE_MODE = os.environ.get('LLM_CASSETTE_MODE', '')
+LLM_CASSETTE_DIR = os.environ.get('LLM_CASSETTE_DIR', '/tmp/llm_cassettes')
+
+CASSETTE_MODES = ('record', 'replay', 'auto')
+
+
+class CassetteMissError(PermanentRecordError):
+    """No hay casete grabado para la petición en modo replay (reintentar no lo resuelve)"""
+
+
+def request_fingerprint(pdf_bytes, prompt, system_instruction, schema, backend_name, model_name,
+                        config=GENERATION_CONFIG):
+    """
+    Huella de una petición al modelo.
+
+    Combina el hash del documento enviado con todo lo que determina la
+    respuesta: prompt, instrucciones del sistema, schema, backend, modelo y
+    parámetros de generación. Cualquier cambio produce una huella distinta.
+
+    Returns:
+        tuple: (huella, hash del documento)
+    """
+    document_hash = content_hash(pdf_bytes)
+    fingerprint = version_tag(document_hash, prompt, system_instruction, schema, backend_name, model_name, config)
+    return f"{document_hash[:16]}-{fingerprint}", document_hash
+
+
+class CassetteStore(FileSystemCacheStore):
+    """Casetes en un directorio: un JSON por huella, repartidos en subdirectorios"""
+
+    def __init__(self, directory=LLM_CASSETTE_DIR):
+        super().__init__(directory, ttl_seconds=0)
+
+    def entries(self):
+        """Casetes grabados, en orden de huella"""
+        for path in sorted(glob.glob(os.path.join(self.directory, '*', '*.json'))):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    yield json.load(f)
+            except (OSError, ValueError):
+                continue
+
+
+class CassetteBackend(ExtractionBackend):
+    """
+    Envuelve un backend para grabar sus respuestas crudas o reproducirlas.
+
+    En reproducción no hay red ni costo: la respuesta se sirve del casete y
+    el consumo se registra en cero (upload_path 'cassette'), de modo que el
+    post-proceso (fechas, validaciones) se puede iterar sobre documentos
+    históricos sin volver a pagar al proveedor.
+    """
+
+    def __init__(self, inner, store=None, mode=LLM_CASSETTE_MODE):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Modo de casetes no soportado: '{mode}'")
+        self.inner = inner
+        self.store = store or CassetteStore()
+        self.mode = mode
+        self.name = inner.name
+        self.model_name = inner.model_name
+        self.recorded = 0
+        self.replayed = 0
+
+    @property
+    def cache_label(self):
+        return self.inner.cache_label
+
+    def generate(self, pdf_bytes, prompt, system_instruction=None, schema=None, display_name=None, timeout=None):
+        fingerprint, document_hash = request_fingerprint(
+            pdf_bytes, prompt, system_instruction, schema, self.name, self.model_name
+        )
+        if self.mode in ('replay', 'auto'):
+            cassette = self.store.get(fingerprint)
+            if cassette is not None:
+                self.replayed += 1
+                print(f"📼 Casete reproducido {fingerprint} ({cassette.get('display_name')})")
+                usage = {field: 0 for field in cassette['usage']}
+                return {'text': cassette['text'], 'usage': usage, 'upload_path': 'cassette'}
+            if self.mode == 'replay':
+                raise CassetteMissError(f"Sin casete para {display_name or document_hash[:16]} ({fingerprint})")
+
+        result = self.inner.generate(pdf_bytes, prompt, system_instruction, schema, display_name=display_name,
+                                     timeout=timeout)
+        cassette = {
+            'fingerprint': fingerprint,
+            'recorded_at': time.time(),
+            'backend': self.name,
+            'model': self.model_name,
+            'document_hash': document_hash,
+            'display_name': display_name,
+            'prompt_version': version_tag(prompt, system_instruction),
+            'schema_version': version_tag(schema),
+            'text': result['text'],
+            'usage': result['usage'],
+            'upload_path': result['upload_path'],
+        }
+        try:
+            self.store.put(fingerprint, cassette)
+            self.recorded += 1
+            print(f"📼 Casete grabado {fingerprint}")
+        except OSError as e:
+            print(f"⚠️ No se pudo grabar el casete: {e}")
+        return result
+
+    def count_tokens(self, pdf_bytes, prompt=None):
+        # En reproducción no se llama al proveedor
+        if self.mode == 'replay':
+            return None
+        return self.inner.count_tokens(pdf_bytes, prompt)
+
+
+def wrap_backend(backend, mode=LLM_CASSETTE_MODE, directory=LLM_CASSETTE_DIR):
+    """
+    Envuelve el backend con la grabación de casetes si LLM_CASSETTE_MODE está activo.
+
+    Returns:
+        ExtractionBackend: CassetteBackend, o el mismo backend si el modo está vacío
+    """
+    mode = (mode or '').strip().lower()
+    if not mode:
+        return backend
+    return CassetteBackend(backend, CassetteStore(directory), mode=mode)
@@ -0,0 +1,282 @@
+import os
+import re
+import threading
+import time
+
+from deadlines import DeadlineExceeded
+from extraction_cache import create_shared_store
+from extraction_engine import extract_document
+from s3_events import PermanentRecordError
+from tracing import annotate
+from usage_ledger import tenant_prefix
+
+# Enrutar cada documento al modelo más barato que lo resuelva
+MODEL_ROUTER = os.environ.get('MODEL_ROUTER', '0') == '1'
+# Cascada de modelos, del más rápido al más capaz: "backend:modelo" o solo "modelo" (backend LLM_BACKEND)
+ROUTER_TIERS = os.environ.get('ROUTER_TIERS', 'gemini:gemini-1.5-flash-002,gemini:gemini-1.5-pro-002')
+# Puntaje de complejidad a partir del cual se empieza en el segundo nivel
+ROUTER_COMPLEXITY_THRESHOLD = int(os.environ.get('ROUTER_COMPLEXITY_THRESHOLD', '2'))
+# Páginas enviadas que se consideran un formulario simple
+ROUTER_SIMPLE_PAGES = int(os.environ.get('ROUTER_SIMPLE_PAGES', '2'))
+# Fallas previas de una plantilla para tratarla como compleja
+ROUTER_TEMPLATE_FAILURES = int(os.environ.get('ROUTER_TEMPLATE_FAILURES', '2'))
+# Vigencia de esa memoria: pasado este tiempo la plantilla vuelve a probar el modelo rápido
+ROUTER_MEMORY_TTL_SECONDS = int(os.environ.get('ROUTER_MEMORY_TTL_SECONDS', str(7 * 24 * 3600)))
+# Campos que la respuesta del modelo rápido debe traer; si faltan se escala
+ROUTER_REQUIRED_FIELDS = [
+    f.strip() for f in os.environ.get(
+        'ROUTER_REQUIRED_FIELDS', 'convocantes,convocados,fecha_conciliacion,hora_conciliacion'
+    ).split(',') if f.strip()
+]
+# Memoria de fallas por plantilla compartida entre contenedores: 'sqlite', 'fs' o vacío (solo local)
+ROUTER_MEMORY_BACKEND = os.environ.get('ROUTER_MEMORY_BACKEND', '')
+ROUTER_MEMORY_PATH = os.environ.get('ROUTER_MEMORY_PATH', '/tmp/model_router.db')
+
+_FECHA_ISO = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+_EMAIL = re.compile(r'^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}$')
+# Números, fechas y códigos en el nombre del archivo no distinguen la plantilla
+_VARIABLE = re.compile(r'[0-9a-f]{8,}|\d+', re.I)
+
+
+def parse_tiers(spec=ROUTER_TIERS):
+    """
+    Lee la cascada de modelos.
+
+    Returns:
+        list: [(backend o None, modelo)] en orden de escalamiento
+    """
+    tiers = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        backend, _, model = item.rpartition(':')
+        tiers.append((backend or None, model))
+    if not tiers:
+        raise ValueError("ROUTER_TIERS no define ningún modelo")
+    return tiers
+
+
+def template_key(key):
+    """
+    Plantilla aproximada de un documento: prefijo de carga y nombre sin partes variables.
+
+    'uploads/2025-06-01/solicitud_3021.pdf' y 'uploads/2025-06-02/solicitud_3188.pdf'
+    comparten plantilla ('uploads/solicitud_#.pdf').
+    """
+    if not key:
+        return None
+    name = _VARIABLE.sub('#', os.path.basename(key).lower())
+    return f"{tenant_prefix(key) or ''}{name}"
+
+
+def document_features(kind='pdf', selection=None, image_count=None, pdf_bytes=None, key=None):
+    """
+    Señales de complejidad de un documento.
+
+    Args:
+        kind: 'pdf' o 'image' (fotos armadas en un PDF)
+        selection: Resultado de select_pages (páginas enviadas y páginas sin texto)
+        image_count: Número de fotos del documento (kind 'image')
+        pdf_bytes: PDF a enviar, si no hay selección (se cuentan páginas y capa de texto)
+        key: Clave S3 o nombre del documento (plantilla)
+
+    Returns:
+        dict: pages, scan, photos y template
+    """
+    if selection is not None:
+        pages = len(selection['pages'])
+        scan = any(i in selection['image_only'] for i in selection['pages'])
+    elif kind == 'image':
+        pages = image_count or 1
+        scan = True
+    else:
+        from text_extractor import MIN_TEXT_CHARS, extract_text_layer
+        from usage_ledger import count_pdf_pages
+
+        pages = count_pdf_pages(pdf_bytes) or 1
+        try:
+            scan = len(extract_text_layer(pdf_bytes).strip()) < MIN_TEXT_CHARS
+        except Exception:
+            scan = True
+    return {'pages': pages, 'scan': scan, 'photos': kind == 'image', 'template': template_key(key)}
+
+
+def output_problems(data, required_fields=None):
+    """
+    Revisa una respuesta del modelo antes de aceptarla.
+
+    Returns:
+        list: Problemas encontrados (campos requeridos vacíos, fecha no ISO,
+        personas sin nombre o correos inválidos); vacía si la respuesta sirve
+    """
+    required_fields = ROUTER_REQUIRED_FIELDS if required_fields is None else required_fields
+    problems = [f"falta {field}" for field in required_fields if not data.get(field)]
+    fecha = data.get('fecha_conciliacion')
+    if fecha and not _FECHA_ISO.match(fecha):
+        problems.append(f"fecha no ISO '{fecha}'")
+    for group, email_field in (('convocantes', 'email'), ('convocados', 'mail')):
+        for person in data.get(group) or []:
+            if not person.get('nombre'):
+                problems.append(f"{group} sin nombre")
+            email = person.get(email_field)
+            if email and not _EMAIL.match(email.strip()):
+                problems.append(f"correo inválido en {group}")
+    return problems
+
+
+class TemplateMemory:
+    """
+    Resultados del modelo rápido por plantilla: intentos y escalamientos.
+
+    Se guarda en memoria del contenedor y, opcionalmente, en un almacén
+    compartido (mismo formato que la caché) para que los demás contenedores
+    aprendan qué plantillas conviene enviar directo al modelo capaz.
+    """
+
+    def __init__(self, shared=None, ttl_seconds=ROUTER_MEMORY_TTL_SECONDS):
+        self.shared = shared
+        self.ttl_seconds = ttl_seconds
+        self._local = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        try:
+            shared = create_shared_store(ROUTER_MEMORY_BACKEND, ROUTER_MEMORY_PATH, table='router_memory')
+        except Exception as e:
+            print(f"⚠️ No se pudo inicializar la memoria del router: {e}")
+            shared = None
+        return cls(shared=shared)
+
+    def get(self, template):
+        if not template:
+            return {'attempts': 0, 'failures': 0}
+        with self._lock:
+            stats = self._local.get(template)
+        if stats is None and self.shared is not None:
+            try:
+                stats = self.shared.get(template)
+            except Exception as e:
+                print(f"⚠️ Error leyendo la memoria del router: {e}")
+        if not stats or (self.ttl_seconds and time.time() - stats.get('ts', 0) > self.ttl_seconds):
+            return {'attempts': 0, 'failures': 0}
+        return stats
+
+    def record(self, template, failed):
+        if not template:
+            return
+        stats = dict(self.get(template))
+        stats['attempts'] += 1
+        stats['failures'] += int(failed)
+        stats['ts'] = time.time()
+        with self._lock:
+            self._local[template] = stats
+        if self.shared is not None:
+            try:
+                self.shared.put(template, stats)
+            except Exception as e:
+                print(f"⚠️ Error escribiendo la memoria del router: {e}")
+
+
+class ModelRouter:
+    """
+    Elige el modelo por complejidad del documento y escala en cascada.
+
+    Los documentos simples empiezan en el primer nivel (flash); los complejos
+    (muchas páginas, escaneos o fotos, plantillas que ya fallaron) empiezan en
+    el segundo. Si la respuesta de un nivel no es JSON válido o no pasa
+    output_problems, se repite con el siguiente nivel.
+    """
+
+    def __init__(self, runtime, tiers=None, memory=None, threshold=ROUTER_COMPLEXITY_THRESHOLD):
+        self.runtime = runtime
+        self.tiers = tiers or parse_tiers()
+        self.memory = memory or TemplateMemory.from_env()
+        self.threshold = threshold
+
+    @property
+    def backends(self):
+        return [self.runtime.get_backend(name, model) for name, model in self.tiers]
+
+    @property
+    def cache_label(self):
+        """La caché no depende del nivel que respondió: todos cumplen el mismo schema"""
+        return 'router:' + ','.join(backend.cache_label for backend in self.backends)
+
+    def count_tokens(self, pdf_bytes, prompt=None):
+        return self.backends[0].count_tokens(pdf_bytes, prompt)
+
+    def complexity(self, features):
+        """
+        Returns:
+            tuple: (puntaje, motivos)
+        """
+        score = 0
+        reasons = []
+        extra_pages = features['pages'] - ROUTER_SIMPLE_PAGES
+        if extra_pages > 0:
+            score += extra_pages
+            reasons.append(f"{features['pages']} páginas")
+        if features['scan']:
+            score += 1
+            reasons.append('escaneo')
+        if features['photos']:
+            score += 1
+            reasons.append('fotos')
+        stats = self.memory.get(features.get('template'))
+        if stats['failures'] >= ROUTER_TEMPLATE_FAILURES and stats['failures'] * 2 >= stats['attempts']:
+            score += self.threshold
+            reasons.append(f"plantilla con {stats['failures']}/{stats['attempts']} escalamientos")
+        return score, reasons
+
+    def start_tier(self, features):
+        score, reasons = self.complexity(features)
+        tier = 1 if score >= self.threshold and len(self.tiers) > 1 else 0
+        return tier, score, reasons
+
+    def extract(self, pdf_bytes, prompt=None, system_instruction=None, features=None, **kwargs):
+        """
+        Extrae con el nivel que corresponde al documento, escalando si la respuesta no sirve.
+
+        Args:
+            pdf_bytes: PDF a enviar
+            prompt, system_instruction: Igual que extract_document
+            features: Resultado de document_features (por defecto se calculan del PDF)
+            **kwargs: Argumentos adicionales de extract_document (schema, display_name, usage_context...)
+
+        Returns:
+            dict: Datos extraídos por el primer nivel cuya respuesta pasa las revisiones
+            (o la del último nivel, aunque tenga problemas)
+        """
+        if features is None:
+            features = document_features(pdf_bytes=pdf_bytes)
+        tier, score, reasons = self.start_tier(features)
+        backends = self.backends
+        print(f"🧭 Router: complejidad {score} ({', '.join(reasons) or 'simple'}) → {backends[tier].model_name}")
+        escalations = []
+        while True:
+            backend = backends[tier]
+            last = tier == len(backends) - 1
+            try:
+                data = extract_document(pdf_bytes, prompt, system_instruction, backend=backend,
+                                        runtime=self.runtime, **kwargs)
+                problems = output_problems(data)
+            except (PermanentRecordError, DeadlineExceeded):
+                # Sin tiempo de la invocación no tiene sentido escalar
+                raise
+            except Exception as e:
+                if last:
+                    raise
+                data, problems = None, [str(e)]
+            if tier == 0:
+                self.memory.record(features.get('template'), failed=bool(problems))
+            if not problems or last:
+                if problems:
+                    print(f"⚠️ Router: {backend.model_name} respondió con problemas: {'; '.join(problems)}")
+                annotate(model=backend.model_name, router_tier=tier, router_score=score,
+                         router_escalations=escalations)
+                return data
+            print(f"⬆️ Router: {backend.model_name} no sirve ({'; '.join(problems)}), se escala")
+            escalations.append(backend.model_name)
+            tier += 1
@@ -0,0 +1,183 @@
+import os
+import re
+
+from pdf_utils import get_page, page_count
+from text_extractor import strip_accents
+
+# 'score' elige las páginas del formulario por señales baratas; 'first' conserva las primeras
+PAGE_SELECTION_MODE = os.environ.get('PAGE_SELECTION_MODE', 'score')
+# Páginas iniciales que se analizan (los anexos largos no se recorren completos)
+PAGE_SCAN_LIMIT = int(os.environ.get('PAGE_SCAN_LIMIT', '10'))
+# Máximo de páginas enviadas al modelo y presupuesto estimado de tokens de entrada
+MAX_FORM_PAGES = int(os.environ.get('MAX_FORM_PAGES', '3'))
+# Páginas iniciales que se conservan si no hay señales (recorte fijo anterior)
+FALLBACK_PAGES = int(os.environ.get('FALLBACK_PAGES', '2'))
+PAGE_TOKEN_BUDGET = int(os.environ.get('PAGE_TOKEN_BUDGET', '3000'))
+# Gemini cobra cada página de un PDF como una imagen (258 tokens) más su texto
+PAGE_IMAGE_TOKENS = int(os.environ.get('PAGE_IMAGE_TOKENS', '258'))
+# Puntaje mínimo para considerar una página como parte del formulario
+MIN_PAGE_SCORE = float(os.environ.get('MIN_PAGE_SCORE', '2'))
+# Verificar con count_tokens antes de llamar al modelo
+PAGE_TOKEN_CHECK = os.environ.get('PAGE_TOKEN_CHECK', '0') == '1'
+
+# Palabras clave del formulario de solicitud y su peso
+KEYWORDS = {
+    'convocante': 3,
+    'convocado': 3,
+    'cuantia': 2,
+    'solicitud': 2,
+    'hechos': 2,
+    'peticiones': 2,
+    'conciliacion': 1,
+    'expediente': 1,
+    'audiencia': 1,
+}
+_KEYWORD_PATTERNS = {word: re.compile(r'\b' + word, re.I) for word in KEYWORDS}
+_EMAIL = re.compile(r'[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}')
+# Tamaños de página de un formulario (A4 y carta, en puntos)
+FORM_PAGE_AREAS = (595 * 842, 612 * 792)
+
+
+def _has_images(page):
+    try:
+        xobjects = page['/Resources'].get_object().get('/XObject')
+        if not xobjects:
+            return False
+        xobjects = xobjects.get_object()
+        return any(xobjects[name].get_object().get('/Subtype') == '/Image' for name in xobjects)
+    except Exception:
+        return False
+
+
+def score_page(page):
+    """
+    Puntúa una página según lo probable que sea parte del formulario.
+
+    Señales: palabras clave en la capa de texto, correos, tamaño de página
+    y si la página es solo una imagen (escaneo sin texto).
+
+    Args:
+        page: Página de PyPDF2
+
+    Returns:
+        dict: {'score', 'tokens' estimados, 'chars', 'image_only'}
+    """
+    try:
+        text = page.extract_text() or ''
+    except Exception:
+        text = ''
+    plain = strip_accents(text)
+    score = sum(weight for word, weight in KEYWORDS.items() if _KEYWORD_PATTERNS[word].search(plain))
+    score += min(len(_EMAIL.findall(text)), 4) * 0.5
+
+    width, height = float(page.mediabox.width), float(page.mediabox.height)
+    area = width * height
+    # Recibos, fotos o planos con tamaño distinto al del formulario pesan menos
+    if not any(0.75 <= area / form_area <= 1.25 for form_area in FORM_PAGE_AREAS):
+        score *= 0.5
+
+    chars = len(text.strip())
+    return {
+        'score': score,
+        'tokens': PAGE_IMAGE_TOKENS + chars // 4,
+        'chars': chars,
+        'image_only': chars < 20 and _has_images(page),
+    }
+
+
+def select_pages(stream, max_pages=MAX_FORM_PAGES, token_budget=PAGE_TOKEN_BUDGET, mode=None):
+    """
+    Elige el conjunto mínimo de páginas del formulario dentro del presupuesto de tokens.
+
+    Las páginas con puntaje suficiente se toman de mayor a menor puntaje hasta
+    agotar max_pages o el presupuesto, y se devuelven en el orden del documento.
+    Si ninguna página tiene señales (formulario escaneado) se conservan las
+    primeras, como el recorte fijo anterior.
+
+    Args:
+        stream: Objeto tipo archivo (con seek) con el PDF original
+        max_pages: Máximo de páginas a conservar
+        token_budget: Presupuesto estimado de tokens de entrada
+        mode: 'score' o 'first' (por defecto PAGE_SELECTION_MODE)
+
+    Returns:
+        dict: {'pages': índices elegidos, 'scores': {índice: puntaje}, 'tokens': estimado,
+        'image_only': páginas analizadas sin capa de texto, 'total_pages'}
+    """
+    import PyPDF2
+
+    mode = (mode or PAGE_SELECTION_MODE).strip().lower()
+    try:
+        stream.seek(0)
+        reader = PyPDF2.PdfReader(stream)
+        total_pages = page_count(reader)
+    except Exception as e:
+        # trim_pdf devolverá el original si tampoco puede leerlo
+        print(f"Error al analizar las páginas del PDF: {e}")
+        stream.seek(0)
+        return {'pages': list(range(FALLBACK_PAGES)), 'scores': {}, 'tokens': FALLBACK_PAGES * PAGE_IMAGE_TOKENS,
+                'image_only': [], 'total_pages': None}
+    fallback = list(range(min(total_pages, max_pages, FALLBACK_PAGES)))
+    if mode != 'score':
+        return {'pages': fallback, 'scores': {}, 'tokens': len(fallback) * PAGE_IMAGE_TOKENS,
+                'image_only': [], 'total_pages': total_pages}
+
+    info = {}
+    for index in range(min(total_pages, PAGE_SCAN_LIMIT)):
+        info[index] = score_page(get_page(reader, index))
+
+    candidates = sorted(
+        (i for i, page in info.items() if page['score'] >= MIN_PAGE_SCORE),
+        key=lambda i: (-info[i]['score'], i)
+    )
+    selected = []
+    tokens = 0
+    for index in candidates:
+        if len(selected) >= max_pages:
+            break
+        if selected and tokens + info[index]['tokens'] > token_budget:
+            continue
+        selected.append(index)
+        tokens += info[index]['tokens']
+
+    if not selected:
+        # Sin señales de texto (formulario escaneado): recorte fijo como antes
+        selected = fallback
+        tokens = sum(info[i]['tokens'] if i in info else PAGE_IMAGE_TOKENS for i in selected)
+    selected.sort()
+    stream.seek(0)
+    return {
+        'pages': selected,
+        'scores': {i: round(page['score'], 2) for i, page in info.items()},
+        'tokens': tokens,
+        'image_only': [i for i, page in info.items() if page['image_only']],
+        'total_pages': total_pages,
+    }
+
+
+def count_pdf_tokens(model, pdf_bytes, prompt=None):
+    """
+    Cuenta con la API los tokens de entrada del PDF (y el prompt, si se indica).
+
+    Args:
+        model: GenerativeModel de Gemini
+        pdf_bytes: PDF recortado
+        prompt: Texto del prompt opcional
+
+    Returns:
+        int: Tokens de entrada según count_tokens
+    """
+    contents = [{'mime_type': 'application/pdf', 'data': pdf_bytes}]
+    if prompt:
+        contents.append(prompt)
+    return model.count_tokens(contents).total_tokens
+
+
+def drop_lowest_scored(selection):
+    """Quita de la selección la página con menor puntaje (nunca la deja vacía)"""
+    pages = selection['pages']
+    if len(pages) <= 1:
+        return selection
+    scores = selection['scores']
+    lowest = min(pages, key=lambda i: (scores.get(i, 0), -i))
+    return dict(selection, pages=[i for i in pages if i != lowest])
@@ -0,0 +1,262 @@
+import hashlib
+import io
+import os
+import re
+import time
+
+# Optimizar el PDF recortado antes de enviarlo al modelo
+PDF_SHRINK = os.environ.get('PDF_SHRINK', '1') == '1'
+# Resolución objetivo de las imágenes escaneadas (Gemini rasteriza cada página a baja resolución)
+SHRINK_TARGET_DPI = int(os.environ.get('SHRINK_TARGET_DPI', '150'))
+SHRINK_JPEG_QUALITY = int(os.environ.get('SHRINK_JPEG_QUALITY', '70'))
+# Convertir los escaneos a escala de grises (los formularios no dependen del color)
+SHRINK_GRAYSCALE = os.environ.get('SHRINK_GRAYSCALE', '1') == '1'
+# Imágenes menores que esto no se recomprimen
+SHRINK_MIN_IMAGE_BYTES = int(os.environ.get('SHRINK_MIN_IMAGE_BYTES', str(32 * 1024)))
+
+# Categorías de /Resources que se referencian por nombre desde el contenido de la página
+RESOURCE_CATEGORIES = ('/XObject', '/Font', '/ExtGState', '/Pattern', '/Shading', '/ColorSpace')
+_NAME = re.compile(rb'/([^\s/\[\]<>(){}%]+)')
+_IMAGE_MODES = {'/DeviceGray': 'L', '/DeviceRGB': 'RGB', '/DeviceCMYK': 'CMYK'}
+_ICC_MODES = {1: 'L', 3: 'RGB', 4: 'CMYK'}
+# Filtros que ya son compresiones específicas (binarias o JPEG 2000): no se tocan
+_SKIP_FILTERS = {'/JBIG2Decode', '/CCITTFaxDecode', '/JPXDecode'}
+_FONT_FILES = ('/FontFile', '/FontFile2', '/FontFile3')
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    value = value.get_object()
+    return list(value) if isinstance(value, list) else [value]
+
+
+def _used_names(page):
+    """Nombres de recursos que aparecen en el contenido de la página"""
+    contents = page.get_contents()
+    if contents is None:
+        return set()
+    return {name.decode('latin-1') for name in _NAME.findall(contents.get_data())}
+
+
+def _stream_digest(obj):
+    """Hash del contenido y del diccionario de un stream (sin /Length)"""
+    digest = hashlib.blake2b(digest_size=16)
+    for key in sorted(k for k in obj.keys() if k != '/Length'):
+        digest.update(f"{key}={obj.raw_get(key)!r};".encode('utf-8'))
+    digest.update(obj._data)
+    return digest.hexdigest()
+
+
+def _image_mode(obj):
+    color_space = obj.get('/ColorSpace')
+    if color_space is None:
+        return None
+    color_space = color_space.get_object()
+    if isinstance(color_space, list):
+        if color_space and color_space[0] == '/ICCBased':
+            return _ICC_MODES.get(int(color_space[1].get_object().get('/N', 0)))
+        return None
+    return _IMAGE_MODES.get(color_space)
+
+
+def recompress_image(obj, page_width_pt, page_height_pt, target_dpi=SHRINK_TARGET_DPI,
+                     quality=SHRINK_JPEG_QUALITY, grayscale=SHRINK_GRAYSCALE):
+    """
+    Reduce la resolución de una imagen escaneada y la recomprime como JPEG.
+
+    La resolución efectiva se estima suponiendo que la imagen ocupa la página
+    completa, que es como se ven los escaneos de anexos y formularios.
+
+    Args:
+        obj: Stream de imagen (se modifica en su lugar)
+        page_width_pt: Ancho de la página en puntos
+        page_height_pt: Alto de la página en puntos
+        target_dpi: Resolución objetivo
+        quality: Calidad JPEG
+        grayscale: Convertir a escala de grises
+
+    Returns:
+        int: Bytes ahorrados (0 si la imagen no se modificó)
+    """
+    from PIL import Image
+    from PyPDF2.generic import NameObject, NumberObject
+
+    if obj.get('/ImageMask') or '/SMask' in obj or '/Mask' in obj or '/Decode' in obj:
+        return 0
+    if int(obj.get('/BitsPerComponent', 8)) != 8:
+        return 0
+    filters = [str(f) for f in _as_list(obj.get('/Filter'))]
+    mode = _image_mode(obj)
+    original_size = len(obj._data)
+    if mode is None or _SKIP_FILTERS.intersection(filters) or original_size < SHRINK_MIN_IMAGE_BYTES:
+        return 0
+
+    width, height = int(obj['/Width']), int(obj['/Height'])
+    if filters == ['/DCTDecode']:
+        image = Image.open(io.BytesIO(obj._data))
+    else:
+        image = Image.frombytes(mode, (width, height), obj.get_data())
+
+    dpi = max(width / (page_width_pt / 72), height / (page_height_pt / 72))
+    scale = min(1.0, target_dpi / dpi)
+    if scale < 1.0:
+        image = image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+    if grayscale and image.mode != 'L':
+        image = image.convert('L')
+    elif image.mode not in ('L', 'RGB'):
+        image = image.convert('RGB')
+
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=quality, optimize=True)
+    data = output.getvalue()
+    if len(data) >= original_size * 0.9:
+        return 0
+
+    obj._data = data
+    obj.decoded_self = None
+    obj[NameObject('/Filter')] = NameObject('/DCTDecode')
+    obj[NameObject('/Width')] = NumberObject(image.width)
+    obj[NameObject('/Height')] = NumberObject(image.height)
+    obj[NameObject('/ColorSpace')] = NameObject('/DeviceGray' if image.mode == 'L' else '/DeviceRGB')
+    obj[NameObject('/BitsPerComponent')] = NumberObject(8)
+    if '/DecodeParms' in obj:
+        del obj['/DecodeParms']
+    return original_size - len(data)
+
+
+def _page_signature(reader):
+    """
+    Lo que la optimización no debe cambiar en cada página: su capa de texto y
+    las imágenes que dibuja. Un escaneo no tiene texto,
+    así que sin las imágenes la comparación no detectaría una página vacía.
+    """
+    signature = []
+    for page in reader.pages:
+        text = " ".join((page.extract_text() or '').split())
+        images = []
+        resources = page.get('/Resources')
+        xobjects = resources.get_object().get('/XObject') if resources is not None else None
+        used = _used_names(page)
+        for name, ref in (xobjects.get_object().items() if xobjects is not None else ()):
+            obj = ref.get_object()
+            if name[1:] in used and obj.get('/Subtype') == '/Image':
+                images.append(name)
+        signature.append((text, sorted(images)))
+    return signature
+
+
+def shrink_pdf(pdf_bytes, target_dpi=SHRINK_TARGET_DPI, quality=SHRINK_JPEG_QUALITY,
+               grayscale=SHRINK_GRAYSCALE, verify=True):
+    """
+    Optimiza un PDF ya recortado antes de enviarlo al modelo.
+
+    1. Quita de /Resources de cada página los recursos que su contenido no usa
+       (los escaneos suelen heredar todas las imágenes del documento).
+    2. Unifica imágenes y archivos de fuente idénticos en un solo objeto.
+    3. Reduce las imágenes escaneadas a target_dpi y las recomprime como JPEG.
+
+    Si el resultado no es menor, o la verificación detecta que cambió el número
+    de páginas, su capa de texto o las imágenes que dibuja, se devuelve el PDF
+    original.
+
+    Args:
+        pdf_bytes: PDF recortado
+        target_dpi: Resolución objetivo de las imágenes
+        quality: Calidad JPEG
+        grayscale: Convertir imágenes a escala de grises
+        verify: Comparar páginas, capa de texto e imágenes con el original
+
+    Returns:
+        tuple: (bytes del PDF optimizado u original, dict con estadísticas)
+    """
+    import PyPDF2
+    from PyPDF2.generic import DictionaryObject, NameObject
+
+    start = time.perf_counter()
+    stats = {'original_bytes': len(pdf_bytes), 'pruned': 0, 'deduplicated': 0,
+             'images_recompressed': 0, 'image_bytes_saved': 0}
+    try:
+        reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+        writer = PyPDF2.PdfWriter()
+        canonical = {}
+        recompressed = set()
+
+        def dedupe(ref):
+            obj = ref.get_object()
+            if not hasattr(obj, '_data'):
+                return ref
+            digest = _stream_digest(obj)
+            if digest in canonical and canonical[digest] != ref:
+                stats['deduplicated'] += 1
+                return canonical[digest]
+            canonical[digest] = ref
+            return ref
+
+        for page in reader.pages:
+            resources = page.get('/Resources')
+            if resources is not None:
+                resources = resources.get_object()
+                used = _used_names(page)
+                # Diccionario nuevo por página: el original puede estar compartido entre páginas
+                pruned = DictionaryObject()
+                for category, entries in resources.items():
+                    if category not in RESOURCE_CATEGORIES:
+                        pruned[NameObject(category)] = entries
+                        continue
+                    entries = entries.get_object()
+                    kept = DictionaryObject()
+                    for name in entries:
+                        if name[1:] not in used:
+                            stats['pruned'] += 1
+                            continue
+                        value = entries.raw_get(name)
+                        if category == '/XObject' and hasattr(value, 'idnum'):
+                            value = dedupe(value)
+                        kept[NameObject(name)] = value
+                    pruned[NameObject(category)] = kept
+                page[NameObject('/Resources')] = pruned
+
+                width, height = float(page.mediabox.width), float(page.mediabox.height)
+                for name, ref in pruned.get('/XObject', {}).items():
+                    obj = ref.get_object()
+                    key = getattr(ref, 'idnum', id(obj))
+                    if obj.get('/Subtype') == '/Image' and key not in recompressed:
+                        recompressed.add(key)
+                        saved = recompress_image(obj, width, height, target_dpi, quality, grayscale)
+                        if saved:
+                            stats['images_recompressed'] += 1
+                            stats['image_bytes_saved'] += saved
+
+                for ref in pruned.get('/Font', {}).values():
+                    descriptor = ref.get_object().get('/FontDescriptor')
+                    if descriptor is None:
+                        continue
+                    descriptor = descriptor.get_object()
+                    for font_file in _FONT_FILES:
+                        value = descriptor.raw_get(font_file) if font_file in descriptor else None
+                        if hasattr(value, 'idnum'):
+                            descriptor[NameObject(font_file)] = dedupe(value)
+            writer.add_page(page)
+
+        output = io.BytesIO()
+        writer.write(output)
+        shrunk = output.getvalue()
+
+        if verify:
+            original_reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+            shrunk_reader = PyPDF2.PdfReader(io.BytesIO(shrunk))
+            if _page_signature(original_reader) != _page_signature(shrunk_reader):
+                print("⚠️ La optimización cambió el texto o las imágenes de una página, se usa el PDF original")
+                return pdf_bytes, dict(stats, shrunk_bytes=len(pdf_bytes), verified=False)
+    except Exception as e:
+        print(f"⚠️ No se pudo optimizar el PDF: {e}")
+        return pdf_bytes, dict(stats, shrunk_bytes=len(pdf_bytes), verified=False)
+
+    if len(shrunk) >= len(pdf_bytes):
+        return pdf_bytes, dict(stats, shrunk_bytes=len(pdf_bytes), verified=verify)
+    stats.update(shrunk_bytes=len(shrunk), verified=verify)
+    print(f"🗜️ PDF optimizado: {len(pdf_bytes)} → {len(shrunk)} bytes "
+          f"({stats['pruned']} recursos sin uso, {stats['deduplicated']} duplicados, "
+          f"{stats['images_recompressed']} imágenes) en {(time.perf_counter() - start) * 1000:.0f} ms")
+    return shrunk, stats
@@ -0,0 +1,359 @@
+import io
+import os
+import re
+import tempfile
+from collections import OrderedDict
+
+from s3_events import PermanentRecordError
+
+# Tamaño máximo aceptado para un objeto de S3 (bytes)
+MAX_DOWNLOAD_BYTES = int(os.environ.get('MAX_DOWNLOAD_BYTES', str(100 * 1024 * 1024)))
+# Bytes que se mantienen en memoria antes de volcar el buffer a un archivo anónimo
+SPOOL_MAX_MEMORY = int(os.environ.get('SPOOL_MAX_MEMORY', str(8 * 1024 * 1024)))
+# Tamaño de bloque para la lectura en streaming
+READ_CHUNK_SIZE = 1024 * 1024
+# Los PDF mayores se leen por rangos: solo la tabla xref y las páginas necesarias
+RANGED_READ_MIN_BYTES = int(os.environ.get('RANGED_READ_MIN_BYTES', str(8 * 1024 * 1024)))
+RANGE_BLOCK_SIZE = int(os.environ.get('RANGE_BLOCK_SIZE', str(256 * 1024)))
+# Bloques en memoria por documento (RANGE_BLOCK_SIZE * RANGE_CACHE_BLOCKS como máximo)
+RANGE_CACHE_BLOCKS = int(os.environ.get('RANGE_CACHE_BLOCKS', '32'))
+# Tamaño máximo aceptado para un PDF leído por rangos y bytes máximos a leer de él
+MAX_PDF_BYTES = int(os.environ.get('MAX_PDF_BYTES', str(1024 * 1024 * 1024)))
+MAX_RANGED_FETCH_BYTES = int(os.environ.get('MAX_RANGED_FETCH_BYTES', str(64 * 1024 * 1024)))
+
+_CONTENT_RANGE = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+|\*)')
+
+
+class DocumentTooLargeError(PermanentRecordError):
+    """El documento supera el tamaño máximo permitido"""
+
+
+def fetch_s3_object(s3_client, bucket, key, max_bytes=MAX_DOWNLOAD_BYTES):
+    """
+    Descarga un objeto de S3 con un único GET en streaming hacia un buffer acotado.
+
+    El buffer es un SpooledTemporaryFile: se mantiene en memoria hasta
+    SPOOL_MAX_MEMORY y después se vuelca a un archivo anónimo que el sistema
+    elimina al cerrarlo, por lo que nunca quedan archivos en /tmp.
+
+    Args:
+        s3_client: Cliente boto3 de S3
+        bucket: Nombre del bucket
+        key: Clave del objeto (ya decodificada)
+        max_bytes: Tamaño máximo permitido
+
+    Returns:
+        tuple: (buffer posicionado al inicio, dict con content_type, bytes_read, etag, version_id)
+    """
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+    except s3_client.exceptions.NoSuchKey:
+        raise Exception(f"El archivo '{key}' no existe en el bucket '{bucket}'")
+    except s3_client.exceptions.ClientError as e:
+        raise Exception(f"Error al descargar el archivo de S3: {e}")
+
+    body = response['Body']
+    content_length = response.get('ContentLength')
+    if content_length is not None and content_length > max_bytes:
+        body.close()
+        raise DocumentTooLargeError(
+            f"El archivo '{key}' ocupa {content_length} bytes y supera el máximo de {max_bytes}"
+        )
+
+    buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    bytes_read = 0
+    try:
+        for chunk in body.iter_chunks(chunk_size=READ_CHUNK_SIZE):
+            bytes_read += len(chunk)
+            if bytes_read > max_bytes:
+                raise DocumentTooLargeError(
+                    f"El archivo '{key}' supera el máximo de {max_bytes} bytes"
+                )
+            buffer.write(chunk)
+    except Exception:
+        buffer.close()
+        raise
+    finally:
+        body.close()
+
+    buffer.seek(0)
+    metadata = {
+        'content_type': response.get('ContentType'),
+        'bytes_read': bytes_read,
+        'etag': response.get('ETag'),
+        'version_id': response.get('VersionId'),
+    }
+    return buffer, metadata
+
+
+class S3RangeReader(io.RawIOBase):
+    """
+    Archivo de solo lectura sobre un objeto de S3 que se descarga por rangos.
+
+    PyPDF2 solo lee la tabla xref y los objetos que necesita, así que un PDF
+    de cientos de páginas de anexos se recorta leyendo una fracción del
+    objeto. Los bloques se guardan en un LRU acotado (RANGE_CACHE_BLOCKS) y el
+    prefijo ya descargado por open_s3_document se reutiliza sin otra petición.
+    """
+
+    def __init__(self, s3_client, bucket, key, size, prefix=b'', etag=None,
+                 block_size=RANGE_BLOCK_SIZE, cache_blocks=RANGE_CACHE_BLOCKS,
+                 max_fetch_bytes=MAX_RANGED_FETCH_BYTES):
+        super().__init__()
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.etag = etag
+        self.block_size = block_size
+        self.cache_blocks = cache_blocks
+        self.max_fetch_bytes = max_fetch_bytes
+        self._prefix = prefix
+        self._blocks = OrderedDict()
+        self._pos = 0
+        self.requests = 0
+        self.bytes_fetched = len(prefix)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            self._pos = self.size + offset
+        self._pos = max(0, self._pos)
+        return self._pos
+
+    def _fetch(self, start, end):
+        if self.bytes_fetched + (end - start) > self.max_fetch_bytes:
+            raise DocumentTooLargeError(
+                f"El archivo '{self.key}' requiere leer más de {self.max_fetch_bytes} bytes"
+            )
+        kwargs = {'IfMatch': self.etag} if self.etag else {}
+        response = self.s3_client.get_object(
+            Bucket=self.bucket, Key=self.key, Range=f"bytes={start}-{end - 1}", **kwargs
+        )
+        body = response['Body']
+        try:
+            data = body.read()
+        finally:
+            body.close()
+        self.requests += 1
+        self.bytes_fetched += len(data)
+        return data
+
+    def _block(self, index):
+        block = self._blocks.get(index)
+        if block is not None:
+            self._blocks.move_to_end(index)
+            return block
+        start = index * self.block_size
+        end = min(start + self.block_size, self.size)
+        if end <= len(self._prefix):
+            return self._prefix[start:end]
+        block = self._fetch(start, end)
+        self._blocks[index] = block
+        if len(self._blocks) > self.cache_blocks:
+            self._blocks.popitem(last=False)
+        return block
+
+    def read(self, size=-1):
+        end = self.size if size is None or size < 0 else min(self.size, self._pos + size)
+        if self._pos >= end:
+            return b''
+        if end <= len(self._prefix):
+            data = self._prefix[self._pos:end]
+        else:
+            chunks = []
+            pos = self._pos
+            while pos < end:
+                index = pos // self.block_size
+                block = self._block(index)
+                offset = pos - index * self.block_size
+                chunk = block[offset:offset + (end - pos)]
+                chunks.append(chunk)
+                pos += len(chunk)
+            data = b''.join(chunks)
+        self._pos = end
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self._blocks.clear()
+        self._prefix = b''
+        super().close()
+
+
+def open_s3_document(s3_client, bucket, key, max_bytes=MAX_PDF_BYTES):
+    """
+    Abre un PDF de S3 leyendo solo lo necesario.
+
+    Un único GET por rango trae los primeros RANGED_READ_MIN_BYTES. Si el
+    objeto cabe ahí (el caso habitual) se devuelve completo en memoria; si es
+    mayor se devuelve un S3RangeReader que reutiliza ese prefijo y lee el
+    resto bajo demanda. Los objetos que superan max_bytes se rechazan antes de
+    leer el cuerpo.
+
+    Args:
+        s3_client: Cliente boto3 de S3
+        bucket: Nombre del bucket
+        key: Clave del objeto (ya decodificada)
+        max_bytes: Tamaño máximo permitido
+
+    Returns:
+        tuple: (objeto tipo archivo posicionado al inicio, dict con content_type,
+        bytes_read, size, ranged, etag, version_id)
+    """
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes=0-{RANGED_READ_MIN_BYTES - 1}")
+    except s3_client.exceptions.NoSuchKey:
+        raise Exception(f"El archivo '{key}' no existe en el bucket '{bucket}'")
+    except s3_client.exceptions.ClientError as e:
+        raise Exception(f"Error al descargar el archivo de S3: {e}")
+
+    body = response['Body']
+    match = _CONTENT_RANGE.match(response.get('ContentRange') or '')
+    size = int(match.group(3)) if match and match.group(3) != '*' else response.get('ContentLength')
+    if size is not None and size > max_bytes:
+        body.close()
+        raise DocumentTooLargeError(f"El archivo '{key}' ocupa {size} bytes y supera el máximo de {max_bytes}")
+
+    chunks = []
+    bytes_read = 0
+    try:
+        for chunk in body.iter_chunks(chunk_size=READ_CHUNK_SIZE):
+            chunks.append(chunk)
+            bytes_read += len(chunk)
+            # Servidores que ignoran Range: no leer más allá del prefijo
+            if bytes_read >= RANGED_READ_MIN_BYTES:
+                break
+    finally:
+        body.close()
+    prefix = b''.join(chunks)
+    size = size or bytes_read
+
+    metadata = {
+        'content_type': response.get('ContentType'),
+        'bytes_read': bytes_read,
+        'size': size,
+        'ranged': size > len(prefix),
+        'etag': response.get('ETag'),
+        'version_id': response.get('VersionId'),
+    }
+    if not metadata['ranged']:
+        return io.BytesIO(prefix), metadata
+    print(f"Lectura por rangos: {size} bytes en S3, {len(prefix)} leídos al abrir")
+    reader = S3RangeReader(s3_client, bucket, key, size, prefix=prefix,
+                           etag=response.get('ETag'))
+    return reader, metadata
+
+
+def page_count(reader):
+    """Número de páginas según /Count del árbol, sin cargar cada página"""
+    try:
+        return int(reader.trailer['/Root'].get_object()['/Pages'].get_object()['/Count'])
+    except Exception:
+        return len(reader.pages)
+
+
+def get_page(reader, index):
+    """
+    Devuelve una página descendiendo por el árbol de páginas con /Count.
+
+    reader.pages[i] de PyPDF2 aplana el árbol completo y lee cada objeto de
+    página; aquí solo se resuelven los nodos hasta la página pedida, lo que
+    evita leer los anexos por rangos.
+
+    Args:
+        reader: PdfReader
+        index: Índice (base 0) de la página
+
+    Returns:
+        PageObject con los atributos heredados (/Resources, /MediaBox, ...)
+    """
+    from PyPDF2 import PageObject
+    from PyPDF2.generic import NameObject
+
+    node = reader.trailer['/Root'].get_object()['/Pages'].get_object()
+    inherited = {}
+    while True:
+        for attr in ('/Resources', '/MediaBox', '/CropBox', '/Rotate'):
+            if attr in node:
+                inherited[attr] = node[attr]
+        for kid_ref in node['/Kids']:
+            kid = kid_ref.get_object()
+            if '/Kids' in kid:
+                count = int(kid.get('/Count', 0))
+                if index < count:
+                    node = kid
+                    break
+                index -= count
+            elif index == 0:
+                page = PageObject(reader, kid_ref)
+                page.update(kid)
+                for attr, value in inherited.items():
+                    if attr not in page:
+                        page[NameObject(attr)] = value
+                return page
+            else:
+                index -= 1
+        else:
+            raise IndexError("Índice de página fuera del árbol de páginas")
+
+
+def trim_pdf(stream, max_pages=2, pages=None):
+    """
+    Recorta un PDF a un número máximo de páginas sin escribir en disco.
+
+    Args:
+        stream: Objeto tipo archivo (con seek) con el PDF original
+        max_pages: Número máximo de páginas a conservar
+        pages: Índices (base 0) de las páginas a conservar; si se indican
+            reemplazan a max_pages
+
+    Returns:
+        bytes: PDF recortado, o el contenido original si no se pudo recortar
+    """
+    import PyPDF2
+
+    try:
+        stream.seek(0)
+        pdf_reader = PyPDF2.PdfReader(stream)
+        pdf_writer = PyPDF2.PdfWriter()
+
+        # Determinar qué páginas procesar
+        total_pages = page_count(pdf_reader)
+        if pages is None:
+            pages = range(min(total_pages, max_pages))
+        pages = [page_num for page_num in pages if page_num < total_pages]
+        print(f"Procesando páginas {[page_num + 1 for page_num in pages]} de un total de {total_pages}")
+
+        for page_num in pages:
+            pdf_writer.add_page(get_page(pdf_reader, page_num))
+
+        output = io.BytesIO()
+        pdf_writer.write(output)
+        return output.getvalue()
+    except DocumentTooLargeError:
+        raise
+    except Exception as e:
+        print(f"Error al recortar el PDF: {e}")
+        # Un documento leído por rangos no se descarga completo para enviarlo sin recortar
+        if isinstance(stream, S3RangeReader):
+            raise
+        # En caso de error, devolvemos el archivo original
+        stream.seek(0)
+        return stream.read()
@@ -1,24 +1,17 @@
 import json
 import os
-import boto3
 import tempfile
-import requests
-import google.generativeai as genai
 import urllib.parse
-from urllib.parse import unquote_plus
+from extraction_engine import extract_document
+from runtime import get_runtime
+from webhook_outbox import WEBHOOK_OUTBOX
 
-print('Loading functionn 2')
-
-# Configurar API key de Google Gemini desde variable de entorno
-GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY')
+# El backend (LLM_BACKEND) y su modelo (MODEL_NAME u OPENAI_MODEL_NAME) se
+# configuran en llm_backends; la API key se lee en el primer uso del cliente
 WEBHOOK_URL = os.environ.get('WEBHOOK_URL')
-MODEL_NAME = os.environ.get('MODEL_NAME')
-
-# Inicializar el cliente de S3
-s3_client = boto3.client('s3')
 
-# Configurar Gemini API
-genai.configure(api_key=GOOGLE_API_KEY)
+# El cliente de S3 y la sesión HTTP viven en runtime.get_runtime(): se crean en el
+# primer uso y se reutilizan entre invocaciones calientes
 
 ##
 ##
@@ -30,6 +23,7 @@ def lambda_handler(event, context):
     key = urllib.parse.unquote_plus(event['Records'][0]['s3']['object']['key'], encoding='utf-8')
     webhook_url = event.get('webhook_url', WEBHOOK_URL)
     try:
+        s3_client = get_runtime().s3_client
         response = s3_client.get_object(Bucket=bucket, Key=key)     
         print("CONTENT TYPE: " + response['ContentType'])
         print(f"1.Procesando archivo: s3://{bucket}/{key}")
@@ -68,8 +62,8 @@ def lambda_handler(event, context):
             #if not file_path.endswith('pdf'):
             #    raise Exception(f"El archivo '{key}' no es un archivo PDF válido")
             
-            # Procesar el PDF con Gemini
-            response_data = process_pdf_with_gemini(file_path, MODEL_NAME)
+            # Procesar el PDF con el backend configurado
+            response_data = process_pdf_with_model(file_path, bucket=bucket, document=key)
             
             # Enviar los resultados al webhook
             webhook_response = send_to_webhook(webhook_url, response_data)
@@ -92,13 +86,14 @@ def lambda_handler(event, context):
         print('Error getting object {} from bucket {}. Make sure they exist and your bucket is in the same region as this function.'.format(key, bucket))
         raise e
 
-def process_pdf_with_gemini(file_path, model_name):
+def process_pdf_with_model(file_path, bucket=None, document=None):
     """
-    Procesa un archivo PDF con el modelo Gemini y extrae información estructurada.
+    Procesa un archivo PDF con el backend configurado (LLM_BACKEND) y extrae información estructurada.
     
     Args:
         file_path: Ruta al archivo PDF temporal
-        model_name: Nombre del modelo de Gemini a utilizar
+        bucket: Bucket del documento (para el registro de consumo)
+        document: Clave S3 del documento (para el registro de consumo)
         
     Returns:
         dict: Datos extraídos en formato JSON según el schema definido
@@ -140,44 +135,15 @@ def process_pdf_with_gemini(file_path, model_name):
         "required": ["convocantes", "convocados"]
     }
     
-    # Inicializar el modelo
-    model = genai.GenerativeModel(
-    model_name=model_name,
-    generation_config=generation_config,
-    )
-    
-    # Subir el archivo a Gemini
-    files = genai.upload_file(file_path, mime_type="application/pdf")
-    print(f"Uploaded file '{files.display_name}' as: {files.uri}")
-    
     # Crear el prompt
     prompt = "identifica los datos de ciudad(Cali o Bogota o Medellin o Barranquilla),hechos,peticiones,cuantia,convocantes, convocados, fecha de audicencia, jornada am o pm del archivo adjunto"
-
-    
-    # Crear la historia del chat
-    history = [{
-        "role": "user",
-        "parts": [
-            files,
-            prompt,
-        ],
-    }]
-    
-    # Iniciar la sesión de chat
-    chat_session = model.start_chat(history=history)
     
-    # Enviar mensaje y obtener respuesta
-    response = chat_session.send_message("Analiza el documento según las instrucciones proporcionadas")
-    
-    # Procesar la respuesta
-    try:
-        result_json = json.loads(response.text)
-        print("Datos extraídos exitosamente")
-        return result_json
-    except json.JSONDecodeError as e:
-        print(f"Error al procesar la respuesta JSON: {e}")
-        print(f"Respuesta recibida: {response.text}")
-        raise Exception("La respuesta no es un JSON válido")
+    # El backend configurado (LLM_BACKEND) adapta el schema a su proveedor
+    with open(file_path, 'rb') as pdf_file:
+        pdf_bytes = pdf_file.read()
+    return extract_document(
+        pdf_bytes, prompt, schema=schema, usage_context={'bucket': bucket, 'document': document}
+    )
 
 def send_to_webhook(webhook_url, json_data):
     """
@@ -190,6 +156,8 @@ def send_to_webhook(webhook_url, json_data):
     Returns:
         dict: Información sobre la respuesta del webhook
     """
+    import requests
+
     try:
         # Configurar headers para la solicitud
         headers = {
@@ -198,9 +166,19 @@ def send_to_webhook(webhook_url, json_data):
         }
         
         print(f"Enviando datos al webhook: {webhook_url}")
+
+        if WEBHOOK_OUTBOX:
+            # Se guarda en el outbox y se entrega con reintentos; si los agota queda en el dead-letter
+            entry = get_runtime().get_webhook_outbox().send(webhook_url, json_data, headers=headers)
+            if entry['status'] != 'delivered':
+                raise Exception(f"Error en la solicitud al webhook: {entry['last_error']}")
+            return {
+                'statusCode': entry['status_code'],
+                'response': entry['response']
+            }
         
-        # Realizar la petición POST
-        response = requests.post(
+        # Realizar la petición POST con la sesión compartida (keep-alive)
+        response = get_runtime().post(
             webhook_url,
             data=json.dumps(json_data),
             headers=headers
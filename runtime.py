@@ -0,0 +1,196 @@
+import os
+import threading
+
+from checkpoints import CheckpointStore
+from extraction_cache import ExtractionCache, version_tag
+from extraction_schema import build_generation_config
+from gemini_files import GeminiFileRegistry
+from idempotency import IdempotencyStore
+from usage_ledger import UsageLedger
+
+# Prompt por defecto si no se define la variable PROMPT
+PROMPT_FILE = os.environ.get(
+    'PROMPT_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prompt', 'prompt_extradata.txt')
+)
+# Timeouts (segundos) y tamaño del pool de conexiones HTTP
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '5'))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', '30'))
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', '10'))
+# Timeout de lectura (segundos) de las peticiones a S3; boto3 espera 60 s por defecto
+S3_READ_TIMEOUT = float(os.environ.get('S3_READ_TIMEOUT', '20'))
+
+
+class Runtime:
+    """
+    Recursos que se construyen una vez por contenedor y se reutilizan en
+    las invocaciones calientes: clientes, caché, registro de archivos, registro
+    de consumo, checkpoints e idempotencia por documento, modelos de Gemini por configuración,
+    backends de extracción, texto del prompt, sesión HTTP con pool y outbox de webhooks.
+    """
+
+    def __init__(self):
+        self.extraction_cache = ExtractionCache.from_env()
+        self.file_registry = GeminiFileRegistry.from_env()
+        self.usage_ledger = UsageLedger.from_env()
+        self.checkpoints = CheckpointStore.from_env()
+        self.idempotency = IdempotencyStore.from_env()
+        self.prompt_text = os.environ.get('PROMPT') or self._read_prompt_file(PROMPT_FILE)
+        # Versión del prompt para la caché (por defecto derivada del texto)
+        self.prompt_version = os.environ.get('PROMPT_VERSION') or version_tag(
+            self.prompt_text, os.environ.get('SYS_INSTRUCTION')
+        )
+        # Los clientes pesados (boto3, Gemini, requests) se importan y crean en el primer uso
+        self._s3_client = None
+        self._http_session = None
+        self._genai = None
+        self._lock = threading.Lock()
+        self._models = {}
+        self._models_lock = threading.Lock()
+        self._backends = {}
+        self._router = None
+        self._hedger = None
+        self._webhook_outbox = None
+
+    @staticmethod
+    def _read_prompt_file(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            print(f"⚠️ No se encontró el archivo de prompt: {path}")
+            return None
+
+    @property
+    def s3_client(self):
+        if self._s3_client is None:
+            with self._lock:
+                if self._s3_client is None:
+                    import boto3
+                    from botocore.config import Config
+                    self._s3_client = boto3.client('s3', config=Config(
+                        connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=S3_READ_TIMEOUT
+                    ))
+        return self._s3_client
+
+    @s3_client.setter
+    def s3_client(self, client):
+        self._s3_client = client
+
+    @property
+    def genai(self):
+        """Módulo google.generativeai configurado con la API key (solo si hace falta llamar al modelo)"""
+        if self._genai is None:
+            with self._lock:
+                if self._genai is None:
+                    import google.generativeai as genai
+                    genai.configure(api_key=os.environ.get('GOOGLE_API_KEY'))
+                    self._genai = genai
+        return self._genai
+
+    @property
+    def http_session(self):
+        if self._http_session is None:
+            with self._lock:
+                if self._http_session is None:
+                    self._http_session = self._build_session()
+        return self._http_session
+
+    @http_session.setter
+    def http_session(self, session):
+        self._http_session = session
+
+    @staticmethod
+    def _build_session():
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({'User-Agent': 'Lambda-Legal-Workflow-Agent/1.0'})
+        return session
+
+    def get_model(self, model_name, system_instruction, schema, schema_version):
+        """
+        Devuelve el GenerativeModel para la combinación (modelo, instrucciones, versión de schema).
+
+        El modelo se crea la primera vez y se reutiliza en las siguientes llamadas.
+        """
+        key = (model_name, system_instruction, schema_version)
+        with self._models_lock:
+            model = self._models.get(key)
+            if model is None:
+                model = self.genai.GenerativeModel(
+                    model_name=model_name,
+                    system_instruction=system_instruction,
+                    generation_config=build_generation_config(schema),
+                )
+                self._models[key] = model
+            return model
+
+    def get_backend(self, name=None, model_name=None):
+        """
+        Devuelve el backend de extracción (LLM_BACKEND por defecto) para el modelo indicado.
+
+        Igual que los modelos, cada backend se crea una vez por contenedor. Con
+        LLM_CASSETTE_MODE el backend graba o reproduce sus respuestas (model_cassettes).
+        """
+        from llm_backends import LLM_BACKEND, create_backend
+        from model_cassettes import wrap_backend
+
+        key = ((name or LLM_BACKEND).strip().lower(), model_name)
+        with self._models_lock:
+            backend = self._backends.get(key)
+            if backend is None:
+                backend = wrap_backend(create_backend(key[0], model_name, runtime=self))
+                self._backends[key] = backend
+            return backend
+
+    def get_router(self):
+        """Devuelve el ModelRouter (cascada ROUTER_TIERS), creado en el primer uso"""
+        if self._router is None:
+            with self._lock:
+                if self._router is None:
+                    from model_router import ModelRouter
+                    self._router = ModelRouter(self)
+        return self._router
+
+    def get_hedger(self):
+        """Devuelve el Hedger (latencias observadas y pool de llamadas), creado en el primer uso"""
+        if self._hedger is None:
+            with self._lock:
+                if self._hedger is None:
+                    from hedging import Hedger
+                    self._hedger = Hedger(self)
+        return self._hedger
+
+    def get_webhook_outbox(self):
+        """Devuelve el WebhookOutbox (almacén y pool de entregas sobre la sesión compartida), creado en el primer uso"""
+        if self._webhook_outbox is None:
+            with self._lock:
+                if self._webhook_outbox is None:
+                    from webhook_outbox import WebhookOutbox
+                    self._webhook_outbox = WebhookOutbox.from_env(self.post)
+        return self._webhook_outbox
+
+    def post(self, url, timeout=None, **kwargs):
+        """POST con la sesión compartida (keep-alive) y timeouts por defecto"""
+        return self.http_session.post(
+            url, timeout=timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT), **kwargs
+        )
+
+
+_runtime = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime():
+    """Devuelve el Runtime del contenedor, creándolo en la primera invocación"""
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                _runtime = Runtime()
+    return _runtime
@@ -0,0 +1,170 @@
+import json
+import os
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+# Número máximo de registros procesados en paralelo por invocación
+MAX_WORKERS = int(os.environ.get('MAX_WORKERS', '4'))
+# Si es '1', una falla en un registro S3 directo relanza la excepción para que Lambda
+# reintente. El reintento repite la invocación completa, incluidos los registros que
+# ya se procesaron bien: solo es seguro con deduplicación (idempotency.py) o si los
+# receptores toleran repeticiones. Las notificaciones S3 directas suelen traer un solo
+# registro; los lotes de varios llegan por SQS, que reintenta solo los fallidos.
+FAIL_ON_RECORD_ERROR = os.environ.get('FAIL_ON_RECORD_ERROR', '1') == '1'
+
+
+class PermanentRecordError(Exception):
+    """Error que no se resuelve reintentando (formato no soportado, documento demasiado grande)"""
+
+
+class BatchProcessingError(Exception):
+    """Uno o más registros del lote fallaron; conserva el resultado de cada uno"""
+
+    def __init__(self, outcomes):
+        self.outcomes = outcomes
+        failed = [o for o in outcomes if o['status'] == 'error']
+        super().__init__(
+            f"{len(failed)} de {len(outcomes)} registros fallaron: "
+            + json.dumps([{'key': o['key'], 'error': o['error']} for o in failed], ensure_ascii=False)
+        )
+
+
+def _parse_s3_record(record, message_id=None):
+    s3 = record['s3']
+    obj = s3['object']
+    return {
+        'bucket': s3['bucket']['name'],
+        'key': urllib.parse.unquote_plus(obj['key'], encoding='utf-8'),
+        'version_id': obj.get('versionId'),
+        'etag': obj.get('eTag'),
+        'size': obj.get('size'),
+        'message_id': message_id,
+    }
+
+
+def iter_s3_records(event):
+    """
+    Recorre todos los registros S3 de un evento.
+
+    Soporta notificaciones S3 directas y lotes reenviados por SQS (con o sin
+    sobre SNS). Los eventos de prueba de S3 (s3:TestEvent) se ignoran.
+
+    Yields:
+        dict: bucket, key (decodificada), version_id, etag, size y message_id; un
+        mensaje SQS ilegible produce un registro con 'error' y sin bucket ni key
+    """
+    for record in event.get('Records', []):
+        if 's3' in record:
+            yield _parse_s3_record(record)
+        elif 'body' in record:
+            message_id = record.get('messageId')
+            try:
+                body = json.loads(record['body'])
+                # Notificación S3 → SNS → SQS
+                if isinstance(body, dict) and 'Message' in body:
+                    body = json.loads(body['Message'])
+                if not isinstance(body, dict):
+                    raise ValueError(f"se esperaba un objeto, llegó {type(body).__name__}")
+            except (TypeError, ValueError) as e:
+                # Se reporta como fallido (batchItemFailures) para que termine en la DLQ
+                print(f"⚠️ Mensaje SQS sin JSON válido: {message_id}: {e}")
+                yield {'bucket': None, 'key': None, 'message_id': message_id,
+                       'error': f"Mensaje SQS sin JSON válido: {e}"}
+                continue
+            for inner in body.get('Records', []):
+                if 's3' in inner:
+                    yield _parse_s3_record(inner, message_id=message_id)
+
+
+def process_batch(records, handler, max_workers=MAX_WORKERS):
+    """
+    Procesa los registros con un pool de hilos acotado.
+
+    Args:
+        records: Lista de registros producidos por iter_s3_records
+        handler: Función handler(record) que devuelve el resultado del registro
+        max_workers: Tamaño máximo del pool
+
+    Returns:
+        list: Un resultado por registro, en el mismo orden, con status 'ok', 'error'
+        o 'rejected' (PermanentRecordError: no se reintenta)
+    """
+    def run(record):
+        outcome = {
+            'bucket': record['bucket'],
+            'key': record['key'],
+            'message_id': record.get('message_id'),
+        }
+        if record.get('error'):
+            outcome.update(result=None, status='error', error=record['error'])
+            return outcome
+        try:
+            outcome['result'] = handler(record)
+            outcome['status'] = 'ok'
+            outcome['error'] = None
+        except PermanentRecordError as e:
+            print(f"⛔ Registro rechazado s3://{record['bucket']}/{record['key']}: {e}")
+            outcome['result'] = None
+            outcome['status'] = 'rejected'
+            outcome['error'] = str(e)
+        except Exception as e:
+            print(f"❌ Error procesando s3://{record['bucket']}/{record['key']}: {e}")
+            outcome['result'] = None
+            outcome['status'] = 'error'
+            outcome['error'] = str(e)
+        return outcome
+
+    if not records:
+        return []
+    if len(records) == 1 or max_workers <= 1:
+        return [run(record) for record in records]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(records))) as executor:
+        return list(executor.map(run, records))
+
+
+def build_batch_response(outcomes, fail_on_error=FAIL_ON_RECORD_ERROR, replay_safe=False):
+    """
+    Construye la respuesta de Lambda a partir de los resultados por registro.
+
+    Los registros que llegaron por SQS se reportan en batchItemFailures para que
+    SQS reintente solo esos mensajes. Si falla un registro S3 directo y
+    fail_on_error está activo, se lanza BatchProcessingError para conservar el
+    reintento de la invocación asíncrona; ese reintento repite también los
+    registros directos que terminaron bien, salvo que replay_safe indique que
+    se reconocen como duplicados. Los registros rechazados
+    (PermanentRecordError) se reportan pero nunca se reintentan.
+    """
+    failed = [o for o in outcomes if o['status'] == 'error']
+    rejected = [o for o in outcomes if o['status'] == 'rejected']
+    direct_failures = [o for o in failed if not o.get('message_id')]
+    if direct_failures and fail_on_error:
+        replayed = [o for o in outcomes if o['status'] == 'ok' and not o.get('message_id')]
+        if replayed and not replay_safe:
+            print(f"⚠️ El reintento de la invocación repetirá {len(replayed)} registro(s) ya procesados "
+                  f"(sin deduplicación): {', '.join(o['key'] for o in replayed)}")
+        raise BatchProcessingError(outcomes)
+    not_ok = len(failed) + len(rejected)
+    if not not_ok:
+        status_code = 200
+    elif not_ok < len(outcomes):
+        status_code = 207
+    else:
+        status_code = 500 if failed else 400
+    body = {
+        'message': 'Procesamiento completado exitosamente' if not not_ok else 'Procesamiento completado con errores',
+        'processed': len(outcomes) - not_ok,
+        'failed': len(failed),
+        'rejected': len(rejected),
+        'records': outcomes,
+    }
+    # Compatibilidad con la respuesta anterior de un solo documento
+    if len(outcomes) == 1 and isinstance(outcomes[0]['result'], dict):
+        body.update(outcomes[0]['result'])
+    response = {
+        'statusCode': status_code,
+        'body': json.dumps(body),
+    }
+    sqs_failures = sorted({o['message_id'] for o in failed if o.get('message_id')})
+    if sqs_failures:
+        response['batchItemFailures'] = [{'itemIdentifier': m} for m in sqs_failures]
+    return response
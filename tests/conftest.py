@@ -0,0 +1,85 @@
+"""
+Configuración común de las pruebas.
+
+Pone en el path los módulos del repositorio y los sustitutos de benchmarks/
+(S3 local, receptor de webhooks, contexto de Lambda) y fija un entorno sin
+red: backend 'fake' y almacenes (caché, checkpoints, idempotencia, outbox)
+en un directorio temporal. Debe ejecutarse antes de importar los módulos,
+que leen su configuración del entorno al cargarse.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'benchmarks')]
+
+_TMP = tempfile.mkdtemp(prefix='extradata-tests-')
+for name, value in {
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'LLM_BACKEND': 'fake',
+    'FAKE_BACKEND_LATENCY_MS': '0',
+    'TEXT_FAST_PATH': '0',
+    'ACROFORM_FAST_PATH': '0',
+    'CACHE_ENABLED': '0',
+    'CACHE_DIR': os.path.join(_TMP, 'cache'),
+    'USAGE_LEDGER_PATH': os.path.join(_TMP, 'usage.jsonl'),
+    'FILE_REGISTRY_PATH': os.path.join(_TMP, 'files.db'),
+    'CHECKPOINT_PATH': os.path.join(_TMP, 'checkpoints.db'),
+    'IDEMPOTENCY_PATH': os.path.join(_TMP, 'idempotency.db'),
+    'WEBHOOK_OUTBOX_PATH': os.path.join(_TMP, 'webhook_outbox.db'),
+    'WEBHOOK_BACKOFF_INITIAL_SECONDS': '0.01',
+    'WEBHOOK_BACKOFF_MAX_SECONDS': '0.02',
+}.items():
+    os.environ.setdefault(name, value)
+
+
+@pytest.fixture
+def lambda_runtime(tmp_path):
+    """
+    Runtime nuevo para la prueba: S3 en memoria y checkpoints e idempotencia
+    en tmp_path. Se descarta al terminar.
+    """
+    import runtime
+    from checkpoints import CheckpointStore
+    from extraction_cache import SQLiteCacheStore
+    from fakes import LocalS3Client
+    from idempotency import IdempotencyStore
+
+    previous = runtime._runtime
+    runtime._runtime = None
+    current = runtime.get_runtime()
+    current.s3_client = LocalS3Client()
+    current.checkpoints = CheckpointStore(SQLiteCacheStore(str(tmp_path / 'checkpoints.db'), ttl_seconds=0,
+                                                           table='document_checkpoints'))
+    current.idempotency = IdempotencyStore(str(tmp_path / 'idempotency.db'))
+    yield current
+    runtime._runtime = previous
+
+
+@pytest.fixture
+def webhook_sink():
+    """Receptor de webhooks local; error_rate se puede cambiar durante la prueba"""
+    from fakes import WebhookSink
+
+    sink = WebhookSink(seed=1).start()
+    yield sink
+    sink.stop()
+
+
+@pytest.fixture
+def backend_calls(monkeypatch):
+    """Registra las llamadas al FakeBackend: el modelo que recibió cada documento"""
+    from llm_backends import FakeBackend
+
+    calls = []
+    generate = FakeBackend.generate
+
+    def counting(self, pdf_bytes, *args, **kwargs):
+        calls.append(self.model_name)
+        return generate(self, pdf_bytes, *args, **kwargs)
+
+    monkeypatch.setattr(FakeBackend, 'generate', counting)
+    return calls
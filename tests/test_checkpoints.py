@@ -0,0 +1,123 @@
+import json
+
+import pytest
+
+import extradata_conciliacion_improved as handler
+from checkpoints import CheckpointStore
+from extraction_cache import SQLiteCacheStore
+from fakes import FakeLambdaContext
+from synthetic_pdfs import build_pdf
+
+
+def sqs_event(message_id, key, etag, webhook_url, bucket='docs'):
+    record = {'s3': {'bucket': {'name': bucket}, 'object': {'key': key, 'eTag': etag}}}
+    return {'webhook_url': webhook_url,
+            'Records': [{'messageId': message_id, 'body': json.dumps({'Records': [record]})}]}
+
+
+def test_checkpoint_survives_reopen(tmp_path):
+    store = CheckpointStore(SQLiteCacheStore(str(tmp_path / 'c.db'), ttl_seconds=0, table='document_checkpoints'))
+    checkpoint = store.open('docs', 'a.pdf', 'e1')
+    checkpoint.mark('fetched', content_hash='h1')
+    checkpoint.mark('trimmed', pdf_bytes=b'%PDF-recortado', prepared={'pages_sent': 2})
+
+    reopened = store.open('docs', 'a.pdf', 'e1')
+    assert reopened.stage == 'trimmed'
+    assert reopened.reached('fetched') and not reopened.reached('extracted')
+    assert reopened.get('pdf_bytes') == b'%PDF-recortado'
+    assert reopened.get('prepared') == {'pages_sent': 2}
+
+    # Una etapa anterior no hace retroceder el estado; drop descarta artefactos
+    reopened.mark('extracted', drop=('pdf_bytes',), data={'ciudad': 'Cali'})
+    reopened.mark('fetched', size=10)
+    again = store.open('docs', 'a.pdf', 'e1')
+    assert again.stage == 'extracted'
+    assert again.get('pdf_bytes') is None
+    assert again.get('content_hash') == 'h1'
+
+
+def test_trimmed_pdf_is_dropped_once_extracted_or_delivered(tmp_path):
+    store = CheckpointStore(SQLiteCacheStore(str(tmp_path / 'c.db'), ttl_seconds=0, table='document_checkpoints'))
+    extracted = store.open('docs', 'a.pdf', 'e1')
+    extracted.mark('trimmed', pdf_bytes=b'%PDF-recortado')
+    extracted.mark('extracted', outbox_id='d1')
+    # El almacén deja de guardar el PDF, aunque la etapa no lo pida
+    assert store.open('docs', 'a.pdf', 'e1').get('pdf_bytes') is None
+    assert store.open('docs', 'a.pdf', 'e1').get('outbox_id') == 'd1'
+
+    delivered = store.open('docs', 'b.pdf', 'e1')
+    delivered.mark('trimmed', pdf_bytes=b'%PDF-recortado')
+    delivered.mark('delivered', webhook_response={'statusCode': 200})
+    assert store.open('docs', 'b.pdf', 'e1').get('pdf_bytes') is None
+
+
+def test_new_object_version_starts_from_scratch(tmp_path):
+    store = CheckpointStore(SQLiteCacheStore(str(tmp_path / 'c.db'), ttl_seconds=0, table='document_checkpoints'))
+    store.open('docs', 'a.pdf', 'e1').mark('extracted', data={})
+
+    assert store.open('docs', 'a.pdf', 'e2').stage is None
+    # Sin etag no hay forma de saber si es el mismo objeto: el estado vive solo en memoria
+    store.open('docs', 'a.pdf').mark('extracted', data={})
+    assert store.open('docs', 'a.pdf').stage is None
+
+
+def test_failed_webhook_resumes_without_calling_the_model(lambda_runtime, webhook_sink, backend_calls):
+    lambda_runtime.s3_client.put_object(Bucket='docs', Key='a.pdf', Body=build_pdf(4, form_pages=1))
+    webhook_sink.error_rate = 1.0
+
+    response = handler.lambda_handler(sqs_event('m1', 'a.pdf', 'e1', webhook_sink.url), FakeLambdaContext())
+    assert response['batchItemFailures'] == [{'itemIdentifier': 'm1'}]
+    assert lambda_runtime.checkpoints.open('docs', 'a.pdf', 'e1').stage == 'extracted'
+    assert len(backend_calls) == 1
+
+    # SQS reintenta el mensaje: solo se repite el webhook
+    webhook_sink.error_rate = 0.0
+    s3_requests = lambda_runtime.s3_client.requests
+    response = handler.lambda_handler(sqs_event('m1', 'a.pdf', 'e1', webhook_sink.url), FakeLambdaContext())
+    body = json.loads(response['body'])
+
+    assert 'batchItemFailures' not in response
+    assert body['webhook_response']['statusCode'] == 200
+    assert len(backend_calls) == 1
+    assert lambda_runtime.s3_client.requests == s3_requests
+    assert lambda_runtime.checkpoints.open('docs', 'a.pdf', 'e1').stage == 'delivered'
+    assert webhook_sink.received == 2
+
+
+def test_model_failure_resumes_from_trimmed_pdf(lambda_runtime, webhook_sink, backend_calls, monkeypatch):
+    lambda_runtime.s3_client.put_object(Bucket='docs', Key='a.pdf', Body=build_pdf(4, form_pages=1))
+    backend = lambda_runtime.get_backend()
+    generate = type(backend).generate
+
+    def unavailable(self, *args, **kwargs):
+        raise RuntimeError('503 modelo no disponible')
+
+    monkeypatch.setattr(type(backend), 'generate', unavailable)
+    response = handler.lambda_handler(sqs_event('m1', 'a.pdf', 'e1', webhook_sink.url), FakeLambdaContext())
+    assert response['batchItemFailures'] == [{'itemIdentifier': 'm1'}]
+    checkpoint = lambda_runtime.checkpoints.open('docs', 'a.pdf', 'e1')
+    assert checkpoint.stage == 'trimmed'
+
+    # El reintento parte del PDF recortado: no vuelve a leer S3
+    monkeypatch.setattr(type(backend), 'generate', generate)
+    s3_requests = lambda_runtime.s3_client.requests
+    response = handler.lambda_handler(sqs_event('m1', 'a.pdf', 'e1', webhook_sink.url), FakeLambdaContext())
+
+    assert 'batchItemFailures' not in response
+    assert len(backend_calls) == 1
+    assert lambda_runtime.s3_client.requests == s3_requests
+    assert webhook_sink.received == 1
+
+
+@pytest.mark.parametrize('stage', ['extracted', 'delivered'])
+def test_resume_stage_is_reported(lambda_runtime, webhook_sink, backend_calls, stage):
+    lambda_runtime.checkpoints.open('docs', 'a.pdf', 'e1').mark(
+        stage, data={'ciudad': 'Cali'}, source='model', webhook_response={'statusCode': 200})
+
+    response = handler.lambda_handler(sqs_event('m1', 'a.pdf', 'e1', webhook_sink.url), FakeLambdaContext())
+    body = json.loads(response['body'])
+
+    assert body['pdf_data'] == {'ciudad': 'Cali'}
+    assert backend_calls == []
+    # Un documento ya entregado no repite el webhook
+    assert webhook_sink.received == (1 if stage == 'extracted' else 0)
@@ -0,0 +1,102 @@
+import json
+from types import SimpleNamespace
+
+import google.generativeai as genai
+import pytest
+
+import extradata_conciliacion_improved as handler
+from deadlines import (DEADLINE_MODEL_MS, DEADLINE_RECORD_MS, DEADLINE_RESERVE_MS, Deadline, DeadlineExceeded,
+                       require, stage_timeout)
+from fakes import FakeLambdaContext
+from gemini_files import wait_until_active
+from synthetic_pdfs import build_pdf
+
+
+def sqs_event(message_id, key, etag, webhook_url, bucket='docs'):
+    record = {'s3': {'bucket': {'name': bucket}, 'object': {'key': key, 'eTag': etag}}}
+    return {'webhook_url': webhook_url,
+            'Records': [{'messageId': message_id, 'body': json.dumps({'Records': [record]})}]}
+
+
+def processing_file(name='files/a'):
+    return SimpleNamespace(name=name, state=SimpleNamespace(name='PROCESSING'))
+
+
+def test_without_context_there_is_no_limit():
+    deadline = Deadline.from_context(None)
+
+    assert deadline.remaining_ms() is None
+    assert deadline.timeout(120) == 120
+    deadline.require('model')
+
+
+def test_remaining_time_excludes_the_reserve():
+    deadline = Deadline.from_context(FakeLambdaContext(timeout_ms=DEADLINE_RESERVE_MS + 2000))
+
+    assert 1900 < deadline.remaining_ms() <= 2000
+    assert 1.9 < deadline.timeout(120) <= 2
+    # Un tope menor que el tiempo restante se respeta
+    assert deadline.timeout(1) == 1
+
+
+def test_exhausted_deadline_clamps_timeouts_to_the_minimum():
+    deadline = Deadline(DEADLINE_RESERVE_MS - 500)
+
+    assert deadline.remaining_ms() == 0
+    assert deadline.timeout(120) == 0.1
+
+
+def test_require_checks_the_stage_minimum():
+    deadline = Deadline(DEADLINE_RESERVE_MS + DEADLINE_RECORD_MS + 1000)
+
+    deadline.require('record')
+    deadline.require('desconocida')
+    with pytest.raises(DeadlineExceeded) as error:
+        deadline.require('model')
+    assert error.value.stage == 'model'
+    assert error.value.remaining_ms < DEADLINE_MODEL_MS
+    with pytest.raises(DeadlineExceeded):
+        deadline.require('record', min_ms=DEADLINE_RECORD_MS + 2000)
+
+
+def test_module_helpers_use_the_active_deadline():
+    assert stage_timeout(30) == 30
+    require('model')
+
+    with Deadline(DEADLINE_RESERVE_MS + 1000).activate():
+        assert 0.9 < stage_timeout(30) <= 1
+        with pytest.raises(DeadlineExceeded):
+            require('model')
+    # Fuera del bloque el plazo deja de aplicar
+    assert stage_timeout(30) == 30
+
+
+def test_file_wait_gives_up_when_the_model_would_not_fit(monkeypatch):
+    polls = []
+    monkeypatch.setattr(genai, 'get_file', lambda name: polls.append(name) or processing_file(name))
+
+    with Deadline(DEADLINE_RESERVE_MS + DEADLINE_MODEL_MS + 200).activate():
+        with pytest.raises(DeadlineExceeded) as error:
+            wait_until_active(processing_file(), timeout=60, poll=0.05)
+    assert error.value.stage == 'model'
+    assert 1 <= len(polls) <= 6
+
+
+def test_file_wait_without_deadline_uses_its_own_timeout(monkeypatch):
+    monkeypatch.setattr(genai, 'get_file', lambda name: processing_file(name))
+
+    with pytest.raises(Exception, match='sigue en PROCESSING'):
+        wait_until_active(processing_file(), timeout=0.1, poll=0.05)
+
+
+def test_record_without_time_for_the_model_is_reported_for_retry(lambda_runtime, webhook_sink, backend_calls):
+    lambda_runtime.s3_client.put_object(Bucket='docs', Key='a.pdf', Body=build_pdf(3, form_pages=1))
+    context = FakeLambdaContext(timeout_ms=DEADLINE_RESERVE_MS + DEADLINE_RECORD_MS + 1000)
+
+    response = handler.lambda_handler(sqs_event('m1', 'a.pdf', 'e1', webhook_sink.url), context)
+
+    assert response['batchItemFailures'] == [{'itemIdentifier': 'm1'}]
+    assert backend_calls == []
+    assert webhook_sink.received == 0
+    # El reintento retoma con el PDF ya recortado
+    assert lambda_runtime.checkpoints.open('docs', 'a.pdf', 'e1').stage == 'trimmed'
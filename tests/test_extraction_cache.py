@@ -0,0 +1,90 @@
+from extraction_cache import ExtractionCache, LocalLRUCache, SQLiteCacheStore, build_cache_key
+
+
+def test_lru_evicts_least_recently_used(tmp_path):
+    cache = LocalLRUCache(str(tmp_path), max_entries=2)
+    cache.put('a', {'v': 1})
+    cache.put('b', {'v': 2})
+    # Leer 'a' la vuelve la más reciente: la siguiente escritura desaloja 'b'
+    assert cache.get('a') == {'v': 1}
+    cache.put('c', {'v': 3})
+
+    assert len(cache) == 2
+    assert cache.get('b') is None
+    assert cache.get('a') == {'v': 1}
+    assert cache.get('c') == {'v': 3}
+    assert not (tmp_path / 'b.json').exists()
+
+
+def test_lru_index_is_rebuilt_and_bounded_on_restart(tmp_path):
+    cache = LocalLRUCache(str(tmp_path), max_entries=3)
+    for key in ('a', 'b', 'c'):
+        cache.put(key, {'key': key})
+
+    # Un contenedor nuevo con un límite menor conserva las más recientes
+    restarted = LocalLRUCache(str(tmp_path), max_entries=2)
+    assert len(restarted) == 2
+    assert restarted.get('c') == {'key': 'c'}
+    assert len(list(tmp_path.glob('*.json'))) == 2
+
+
+def test_shared_hits_are_promoted_to_local(tmp_path):
+    shared = SQLiteCacheStore(str(tmp_path / 'shared.db'))
+    shared.put('k', {'v': 1})
+    cache = ExtractionCache(local=LocalLRUCache(str(tmp_path / 'local'), max_entries=4), shared=shared)
+
+    assert cache.get('k') == {'v': 1}
+    assert cache.local.get('k') == {'v': 1}
+    assert cache.get('missing') is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_key_depends_on_document_and_configuration():
+    key = build_cache_key(b'%PDF-1', 'gemini-1.5-flash', 'p1', 's1')
+    assert key == build_cache_key(b'%PDF-1', 'gemini-1.5-flash', 'p1', 's1')
+    assert key != build_cache_key(b'%PDF-2', 'gemini-1.5-flash', 'p1', 's1')
+    assert key != build_cache_key(b'%PDF-1', 'gemini-1.5-pro', 'p1', 's1')
+    assert key != build_cache_key(b'%PDF-1', 'gemini-1.5-flash', 'p2', 's1')
+    assert key != build_cache_key(b'%PDF-1', 'gemini-1.5-flash', 'p1', 's2')
+
+
+def test_shared_hit_survives_a_full_local_disk(tmp_path, monkeypatch):
+    shared = SQLiteCacheStore(str(tmp_path / 'shared.db'))
+    shared.put('k', {'v': 1})
+    local = LocalLRUCache(str(tmp_path / 'local'), max_entries=4)
+
+    def disk_full(key, value):
+        raise OSError(28, 'No space left on device')
+
+    monkeypatch.setattr(local, 'put', disk_full)
+    cache = ExtractionCache(local=local, shared=shared)
+
+    assert cache.get('k') == {'v': 1}
+    assert cache.hits == 1
+
+
+def test_sqlite_store_purges_expired_rows_on_write(tmp_path, monkeypatch):
+    import sqlite3
+
+    import extraction_cache
+
+    now = [1000.0]
+    monkeypatch.setattr(extraction_cache.time, 'time', lambda: now[0])
+    store = SQLiteCacheStore(str(tmp_path / 'shared.db'), ttl_seconds=60, purge_interval_seconds=30)
+
+    def rows():
+        with sqlite3.connect(store.path) as conn:
+            return sorted(key for key, in conn.execute("SELECT key FROM extraction_cache"))
+
+    store.put('viejo', {'v': 1})
+    now[0] += 61
+    assert store.get('viejo') is None
+    # Una escritura pasado el intervalo borra las filas vencidas
+    store.put('nuevo', {'v': 2})
+    assert rows() == ['nuevo']
+    now[0] += 61
+    store.put('otro', {'v': 3})
+    assert rows() == ['otro']
+    now[0] += 61
+    assert store.purge() == 1
+    assert rows() == []
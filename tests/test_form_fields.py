@@ -0,0 +1,67 @@
+import io
+
+from form_fields import extract_form_fields, map_form_values, read_acroform_values
+from synthetic_pdfs import build_pdf
+from text_extractor import missing_fields
+
+FIELDS = {
+    'expediente': 'CA-3020',
+    'bogota': False,
+    'cali': True,
+    'medellin': False,
+    'barranquilla': False,
+    'fecha_audiencia': '01/06/2025',
+    'hora_audiencia': '9.30',
+    'am': False,
+    'pm': True,
+    'convocante_conductor_nombre': 'FELIPE PARDO',
+    'convocante_conductor_email': 'felipe.pardo@example.com',
+    'convocado_conductor_nombre': 'CARLOS SAENZ',
+    'convocado_conductor_email': 'carlos.saenz@example.com',
+}
+
+
+def test_fillable_form_fills_the_schema():
+    extraction = extract_form_fields(io.BytesIO(build_pdf(2, form_pages=1, form_fields=FIELDS)))
+    data = extraction['data']
+
+    assert (data['ciudad'], data['jornada']) == ('Cali', 'PM')
+    assert (data['fecha_conciliacion'], data['hora_conciliacion']) == ('2025-06-01', '9:30')
+    assert data['convocantes'] == [{'rol': 'CONDUCTOR', 'nombre': 'FELIPE PARDO',
+                                    'email': 'felipe.pardo@example.com', 'telefono': ''}]
+    assert missing_fields(extraction) == []
+
+
+def test_unchecked_boxes_read_as_off():
+    values = read_acroform_values(io.BytesIO(build_pdf(1, form_pages=1, form_fields=FIELDS)))
+    assert values['cali'] == 'Yes'
+    assert values['bogota'] == 'Off'
+
+
+def test_checkbox_mapping_needs_exactly_one_mark():
+    none_checked = map_form_values({'cali': 'Off', 'bogota': 'Off'})
+    assert (none_checked['data']['ciudad'], none_checked['confidence']['ciudad']) == ('', 0.0)
+    two_checked = map_form_values({'cali': 'Yes', 'bogota': 'On'})
+    assert two_checked['data']['ciudad'] == ''
+    one_checked = map_form_values({'medellin': 'Yes', 'cali': 'off', 'bogota': ''})
+    assert (one_checked['data']['ciudad'], one_checked['confidence']['ciudad']) == ('Medellín', 1.0)
+
+
+def test_radio_group_maps_its_selected_option():
+    # Un grupo de radio guarda la opción elegida ('/Medellin', leída sin la barra)
+    mapping = {'ciudad': ['ciudad'], 'jornada': ['jornada']}
+    extraction = map_form_values({'ciudad': 'Medellin', 'jornada': 'p.m.'}, mapping)
+    assert extraction['data'] == {'ciudad': 'Medellín', 'jornada': 'PM'}
+    assert map_form_values({'ciudad': ''}, mapping)['confidence']['ciudad'] == 0.0
+
+
+def test_people_without_email_are_left_to_the_model():
+    extraction = map_form_values({'convocado_conductor_nombre': 'CARLOS SAENZ'})
+    assert extraction['confidence']['convocados'] == 0.6
+    assert extraction['confidence']['convocantes'] == 0.0
+
+
+def test_pdf_without_form_has_no_confidence():
+    stream = io.BytesIO(build_pdf(2, form_pages=1))
+    assert extract_form_fields(stream)['confidence'] == {}
+    assert stream.tell() == 0
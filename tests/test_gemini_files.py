@@ -0,0 +1,31 @@
+from extraction_cache import SQLiteCacheStore
+from gemini_files import GeminiFileRegistry
+
+
+def entry(name):
+    return {'name': f'files/{name}', 'uri': f'https://files/{name}', 'mime_type': 'application/pdf',
+            'expires_at': None}
+
+
+def test_registry_keeps_only_recent_entries_in_memory():
+    registry = GeminiFileRegistry(max_entries=2)
+    for doc_hash in ('aa', 'bb'):
+        registry._remember(doc_hash, entry(doc_hash))
+    # Consultar 'aa' la vuelve la más reciente: la siguiente subida desaloja 'bb'
+    assert registry._lookup('aa') == entry('aa')
+    registry._remember('cc', entry('cc'))
+
+    assert len(registry) == 2
+    assert registry._lookup('bb') is None
+    assert registry._lookup('aa') == entry('aa')
+
+
+def test_evicted_entries_are_read_back_from_the_store(tmp_path):
+    store = SQLiteCacheStore(str(tmp_path / 'files.db'), table='gemini_files')
+    registry = GeminiFileRegistry(store=store, max_entries=1)
+    registry._remember('aa', entry('aa'))
+    registry._remember('bb', entry('bb'))
+
+    assert len(registry) == 1
+    assert registry._lookup('aa') == entry('aa')
+    assert len(registry) == 1
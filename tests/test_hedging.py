@@ -0,0 +1,96 @@
+import pytest
+
+import hedging
+from checkpoints import DocumentCheckpoint, current_checkpoint
+from deadlines import DEADLINE_RESERVE_MS, Deadline, current_deadline
+from hedging import Hedger
+from llm_backends import FakeBackend
+from synthetic_pdfs import build_pdf
+from tracing import InvocationTrace, current_record
+
+
+@pytest.fixture
+def hedger(lambda_runtime, monkeypatch):
+    """Cobertura a los 50 ms con el modelo 'veloz'; el modelo 'lento' tarda 300 ms"""
+    monkeypatch.setattr(hedging, 'HEDGE_DEFAULT_MS', 50)
+    lambda_runtime.get_backend('fake', 'lento').latency_ms = 300
+    lambda_runtime.get_backend('fake', 'veloz').latency_ms = 0
+    hedger = Hedger(lambda_runtime, alternate='fake:veloz', max_workers=2)
+    yield hedger
+    hedger._pool.shutdown(wait=True)
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Modelo, timeout y contexto de hilo con que se llamó a cada backend"""
+    calls = []
+    generate = FakeBackend.generate
+
+    def recording(self, pdf_bytes, prompt, system_instruction=None, schema=None, display_name=None, timeout=None):
+        calls.append({'model': self.model_name, 'timeout': timeout, 'record': current_record(),
+                      'checkpoint': current_checkpoint(), 'deadline': current_deadline()})
+        return generate(self, pdf_bytes, prompt, system_instruction, schema, display_name, timeout)
+
+    monkeypatch.setattr(FakeBackend, 'generate', recording)
+    return calls
+
+
+def test_hedge_wins_and_the_loser_is_billed(lambda_runtime, hedger, calls, monkeypatch):
+    billed = []
+    record = lambda_runtime.usage_ledger.record
+    monkeypatch.setattr(lambda_runtime.usage_ledger, 'record',
+                        lambda *args, **kwargs: billed.append(kwargs) or record(*args, **kwargs))
+
+    result, backend, role, fired = hedger.generate(
+        lambda_runtime.get_backend('fake', 'lento'), build_pdf(2), 'prompt', timeout=5,
+        usage_context={'document': 'uploads/a.pdf'}
+    )
+
+    assert (backend.model_name, role, fired) == ('veloz', 'hedge', True)
+    assert result['text']
+    # La primera llamada sigue hasta terminar y su consumo se registra como perdedora
+    hedger._pool.shutdown(wait=True)
+    assert [entry['hedge'] for entry in billed] == ['loser']
+    assert billed[0]['document'] == 'uploads/a.pdf'
+    assert hedger.stats == {'calls': 1, 'fired': 1, 'won': 1, 'losers_billed': 1}
+
+
+def test_fast_primary_does_not_fire_the_hedge(lambda_runtime, hedger, calls):
+    lambda_runtime.get_backend('fake', 'lento').latency_ms = 0
+
+    _, backend, role, fired = hedger.generate(lambda_runtime.get_backend('fake', 'lento'), build_pdf(2), 'prompt',
+                                              timeout=5)
+
+    assert (backend.model_name, role, fired) == ('lento', 'primary', False)
+    assert [call['model'] for call in calls] == ['lento']
+
+
+def test_hedge_gets_the_time_left_of_the_primary_timeout(lambda_runtime, hedger, calls):
+    hedger.generate(lambda_runtime.get_backend('fake', 'lento'), build_pdf(2), 'prompt', timeout=2)
+
+    primary, hedge = calls
+    assert primary['timeout'] == 2
+    assert 1.8 < hedge['timeout'] < 1.96
+
+
+def test_hedge_timeout_is_clamped_to_the_invocation_deadline(lambda_runtime, hedger, calls):
+    with Deadline(DEADLINE_RESERVE_MS + 1000).activate():
+        hedger.generate(lambda_runtime.get_backend('fake', 'lento'), build_pdf(2), 'prompt', timeout=30)
+
+    assert calls[0]['timeout'] == 30
+    assert 0.8 < calls[1]['timeout'] < 0.96
+
+
+def test_pool_threads_see_the_record_context(lambda_runtime, hedger, calls):
+    trace = InvocationTrace('corr')
+    checkpoint = DocumentCheckpoint(None, 'bucket', 'uploads/a.pdf')
+    deadline = Deadline(DEADLINE_RESERVE_MS + 60000)
+
+    with trace.record('bucket', 'uploads/a.pdf') as record, checkpoint.activate(), deadline.activate():
+        hedger.generate(lambda_runtime.get_backend('fake', 'lento'), build_pdf(2), 'prompt', timeout=5)
+
+    for call in calls:
+        assert (call['record'], call['checkpoint'], call['deadline']) == (record, checkpoint, deadline)
+    assert record.stages['generate'] > 0
+    # Los hilos del pool no conservan el contexto después de la llamada
+    assert hedger._pool.submit(current_record).result() is None
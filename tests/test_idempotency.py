@@ -0,0 +1,99 @@
+import json
+
+import extradata_conciliacion_improved as handler
+from fakes import FakeLambdaContext
+from idempotency import DuplicateDocument, IdempotencyGuard, IdempotencyStore
+from synthetic_pdfs import build_pdf
+
+
+def sqs_event(webhook_url, *notifications, bucket='docs'):
+    """notifications: (message_id, key, etag)"""
+    return {'webhook_url': webhook_url, 'Records': [
+        {'messageId': message_id, 'body': json.dumps({'Records': [
+            {'s3': {'bucket': {'name': bucket}, 'object': {'key': key, 'eTag': etag}}}]})}
+        for message_id, key, etag in notifications]}
+
+
+def test_claim_is_exclusive_until_released(tmp_path):
+    store = IdempotencyStore(str(tmp_path / 'i.db'), window_seconds=60)
+    first = IdempotencyGuard(store, 'docs', 'a.pdf', etag='e1', lease_seconds=60)
+    second = IdempotencyGuard(store, 'docs', 'a.pdf', etag='e1', lease_seconds=60)
+
+    assert first.claim_notification() is None
+    assert second.claim_notification()['status'] == 'in_progress'
+
+    # Si el procesamiento falla la reserva se libera para el reintento
+    first.release()
+    assert second.claim_notification() is None
+    second.complete()
+    duplicate = IdempotencyGuard(store, 'docs', 'a.pdf', etag='e1').claim_notification()
+    assert duplicate == {'key': 'object:docs/a.pdf@e1', 'status': 'done', 'document': 'a.pdf'}
+    assert str(DuplicateDocument(duplicate)) == 'Duplicado de a.pdf (entregado)'
+
+
+def test_expired_lease_and_window_allow_reprocessing(tmp_path):
+    store = IdempotencyStore(str(tmp_path / 'i.db'), window_seconds=0)
+    abandoned = IdempotencyGuard(store, 'docs', 'a.pdf', etag='e1', lease_seconds=0)
+    assert abandoned.claim_notification() is None
+    # Reserva vencida (la invocación murió sin liberarla): otra invocación la toma
+    retry = IdempotencyGuard(store, 'docs', 'a.pdf', etag='e1', lease_seconds=60)
+    assert retry.claim_notification() is None
+    retry.complete()
+    assert IdempotencyGuard(store, 'docs', 'a.pdf', etag='e1').claim_notification() is None
+
+
+def test_same_content_under_another_key_is_a_duplicate(tmp_path):
+    store = IdempotencyStore(str(tmp_path / 'i.db'))
+    original = IdempotencyGuard(store, 'docs', 'a.pdf', etag='e1')
+    assert original.claim_notification() is None
+    assert original.claim_content('h1') is None
+    original.complete()
+
+    copy = IdempotencyGuard(store, 'docs', 'copia.pdf', etag='e9')
+    assert copy.claim_notification() is None
+    assert copy.claim_content('h1')['document'] == 'a.pdf'
+    assert IdempotencyGuard(store, 'otro-bucket', 'copia.pdf', etag='e9').claim_content('h1') is None
+
+
+def test_duplicate_notifications_are_acknowledged_once(lambda_runtime, webhook_sink, backend_calls):
+    lambda_runtime.s3_client.put_object(Bucket='docs', Key='a.pdf', Body=build_pdf(3, form_pages=1))
+
+    # S3 entrega la misma notificación dos veces en el mismo lote y una tercera después
+    event = sqs_event(webhook_sink.url, ('m1', 'a.pdf', 'e1'), ('m2', 'a.pdf', 'e1'))
+    response = handler.lambda_handler(event, FakeLambdaContext())
+    records = json.loads(response['body'])['records']
+
+    assert 'batchItemFailures' not in response
+    assert sorted(bool(r['result'].get('duplicate')) for r in records) == [False, True]
+    response = handler.lambda_handler(sqs_event(webhook_sink.url, ('m3', 'a.pdf', 'e1')), FakeLambdaContext())
+    assert json.loads(response['body'])['duplicate'] is True
+
+    assert len(backend_calls) == 1
+    assert webhook_sink.received == 1
+
+
+def test_reupload_with_new_key_is_not_sent_twice(lambda_runtime, webhook_sink, backend_calls):
+    pdf = build_pdf(3, form_pages=1)
+    lambda_runtime.s3_client.put_object(Bucket='docs', Key='a.pdf', Body=pdf)
+    lambda_runtime.s3_client.put_object(Bucket='docs', Key='a (1).pdf', Body=pdf)
+
+    handler.lambda_handler(sqs_event(webhook_sink.url, ('m1', 'a.pdf', 'e1')), FakeLambdaContext())
+    response = handler.lambda_handler(sqs_event(webhook_sink.url, ('m2', 'a (1).pdf', 'e2')), FakeLambdaContext())
+    body = json.loads(response['body'])
+
+    assert body['duplicate_of'] == 'a.pdf'
+    assert len(backend_calls) == 1
+    assert webhook_sink.received == 1
+
+
+def test_failed_delivery_is_not_remembered_as_duplicate(lambda_runtime, webhook_sink, backend_calls):
+    lambda_runtime.s3_client.put_object(Bucket='docs', Key='a.pdf', Body=build_pdf(3, form_pages=1))
+    webhook_sink.error_rate = 1.0
+    response = handler.lambda_handler(sqs_event(webhook_sink.url, ('m1', 'a.pdf', 'e1')), FakeLambdaContext())
+    assert response['batchItemFailures'] == [{'itemIdentifier': 'm1'}]
+
+    webhook_sink.error_rate = 0.0
+    response = handler.lambda_handler(sqs_event(webhook_sink.url, ('m1', 'a.pdf', 'e1')), FakeLambdaContext())
+    body = json.loads(response['body'])
+    assert 'duplicate' not in body
+    assert body['webhook_response']['statusCode'] == 200
@@ -0,0 +1,122 @@
+import io
+
+import PyPDF2
+import pytest
+from PIL import Image
+
+from fakes import LocalS3Client
+from image_ingest import (build_image_document, compress_image_upload, document_kind, load_manifest,
+                          reusable_jpeg, unique_names, upload_files, upload_name)
+from s3_events import PermanentRecordError
+
+
+class UploadedFile(io.BytesIO):
+    """Archivo cargado como los de st.file_uploader (name y getvalue)"""
+
+    def __init__(self, name, data):
+        super().__init__(data)
+        self.name = name
+
+
+def photo(fmt='PNG', size=(1200, 900), mode='RGB', **save):
+    output = io.BytesIO()
+    Image.new(mode, size, 'white').save(output, fmt, **save)
+    return output.getvalue()
+
+
+def test_upload_names_keep_the_original_extension():
+    assert upload_name('foto.png') == 'foto-png.jpg'
+    assert upload_name('foto.JPEG') == 'foto.JPEG'
+    assert upload_name('solicitud.pdf') == 'solicitud.pdf'
+    # 'foto.png' y 'foto.jpg' de la misma carga no se pisan
+    assert unique_names([upload_name('foto.png'), upload_name('foto.jpg')]) == ['foto-png.jpg', 'foto.jpg']
+    assert unique_names(['a.pdf', 'A.pdf', 'a.pdf', 'a-2.pdf']) == ['a.pdf', 'A-2.pdf', 'a-3.pdf', 'a-2-2.pdf']
+
+
+def test_several_photos_become_one_submission():
+    s3 = LocalS3Client()
+    files = [UploadedFile('foto.png', photo()), UploadedFile('foto.jpg', photo('JPEG')),
+             UploadedFile('foto.png', photo(size=(900, 1200))), UploadedFile('anexo.pdf', b'%PDF-1.4')]
+    progress = []
+    results = upload_files(s3, 'docs', 'uploads', files, on_progress=lambda done, total: progress.append(done))
+
+    assert all(r['success'] for r in results)
+    assert progress == [1, 2, 3, 4]
+    paths = [r['path'] for r in results]
+    folder = paths[0].rsplit('/', 1)[0]
+    assert document_kind(f"{folder}/manifest.json") == 'manifest'
+    assert paths[:3] == [f"{folder}/foto-png.jpg", f"{folder}/foto.jpg", f"{folder}/foto-png-2.jpg"]
+    # El PDF no es parte de la solicitud de fotos
+    assert paths[3] == f"{folder.rsplit('/', 1)[0]}/anexo.pdf"
+    assert s3.objects[('docs', paths[3])][0] == b'%PDF-1.4'
+
+    keys = load_manifest(s3, 'docs', f"{folder}/manifest.json")
+    assert keys == paths[:3]
+    pdf_bytes, bundled = build_image_document(s3, 'docs', f"{folder}/manifest.json")
+    assert bundled == keys
+    assert len(PyPDF2.PdfReader(io.BytesIO(pdf_bytes)).pages) == 3
+
+
+def test_single_photo_has_no_manifest():
+    s3 = LocalS3Client()
+    results = upload_files(s3, 'docs', 'uploads', [UploadedFile('foto.png', photo())])
+
+    assert [key for _, key in s3.objects] == [results[0]['path']]
+    assert '/sub-' not in results[0]['path']
+
+
+def test_failed_uploads_are_left_out_of_the_manifest():
+    class FlakyS3(LocalS3Client):
+        def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None):
+            if Key.endswith('b.jpg'):
+                raise OSError('conexión reiniciada')
+            super().upload_fileobj(Fileobj, Bucket, Key, ExtraArgs)
+
+    s3 = FlakyS3()
+    files = [UploadedFile(name, photo('JPEG')) for name in ('a.jpg', 'b.jpg', 'c.jpg')]
+    results = upload_files(s3, 'docs', 'uploads', files)
+
+    assert [r['success'] for r in results] == [True, False, True]
+    assert results[1] == {'success': False, 'name': 'b.jpg', 'error': 'conexión reiniciada'}
+    manifest = next(key for _, key in s3.objects if key.endswith('manifest.json'))
+    assert [k.rsplit('/', 1)[1] for k in load_manifest(s3, 'docs', manifest)] == ['a.jpg', 'c.jpg']
+
+
+def test_empty_manifest_is_rejected():
+    s3 = LocalS3Client()
+    s3.put_object(Bucket='docs', Key='uploads/sub-1/manifest.json', Body=b'{"images": []}')
+    with pytest.raises(PermanentRecordError):
+        load_manifest(s3, 'docs', 'uploads/sub-1/manifest.json')
+
+
+def test_prepared_jpeg_is_not_recompressed():
+    prepared, _ = compress_image_upload(photo(size=(3000, 4000)), 'foto.png')
+    data = prepared.getvalue()
+    assert reusable_jpeg(data) == (1500, 2000, 'L')
+
+    # Ni al volver a cargarla ni al armar el PDF en la lambda
+    assert compress_image_upload(data, 'foto.jpg')[0].getvalue() == data
+    s3 = LocalS3Client()
+    s3.put_object(Bucket='docs', Key='uploads/foto.jpg', Body=data, ContentType='image/jpeg')
+    pdf_bytes, _ = build_image_document(s3, 'docs', 'uploads/foto.jpg')
+    page = PyPDF2.PdfReader(io.BytesIO(pdf_bytes)).pages[0]
+    image = page['/Resources']['/XObject']['/Im0'].get_object()
+    assert image._data == data
+    assert (float(page.mediabox.width), float(page.mediabox.height)) == (540.0, 720.0)
+
+
+@pytest.mark.parametrize('data', [
+    photo('JPEG'),                                   # en color
+    photo('JPEG', size=(2400, 1000), mode='L'),      # más grande que IMAGE_MAX_SIDE
+    photo('PNG', mode='L'),                          # no es JPEG
+    photo('JPEG', mode='L', exif=b'Exif\x00\x00MM\x00*\x00\x00\x00\x08\x00\x01\x01\x12\x00\x03'
+                                 b'\x00\x00\x00\x01\x00\x06\x00\x00\x00\x00\x00\x00'),  # rotada
+])
+def test_photos_that_need_preparing_are_recompressed(data):
+    assert reusable_jpeg(data) is None
+    s3 = LocalS3Client()
+    s3.put_object(Bucket='docs', Key='uploads/foto.jpg', Body=data)
+    pdf_bytes, _ = build_image_document(s3, 'docs', 'uploads/foto.jpg')
+    image = PyPDF2.PdfReader(io.BytesIO(pdf_bytes)).pages[0]['/Resources']['/XObject']['/Im0'].get_object()
+    assert image._data != data
+    assert image['/ColorSpace'] == '/DeviceGray'
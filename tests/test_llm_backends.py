@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+from llm_backends import BACKENDS, ExtractionBackend, FakeBackend, create_backend
+from model_cassettes import CassetteBackend, CassetteStore
+from synthetic_pdfs import build_pdf
+
+
+def test_backend_without_generate_fails_when_created():
+    class Incomplete(ExtractionBackend):
+        name = 'incompleto'
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_every_backend_can_be_created():
+    for name in BACKENDS:
+        assert create_backend(name).name == name
+    with pytest.raises(ValueError):
+        create_backend('otro')
+
+
+def test_cassette_replays_without_calling_the_backend(tmp_path, backend_calls):
+    pdf = build_pdf(2, form_pages=2, image_size=None)
+    store = CassetteStore(str(tmp_path))
+    recorded = CassetteBackend(FakeBackend(), store=store, mode='record').generate(pdf, 'prompt', schema={})
+    replayed = CassetteBackend(FakeBackend(), store=store, mode='replay').generate(pdf, 'prompt', schema={})
+
+    assert len(backend_calls) == 1
+    assert replayed['text'] == recorded['text']
+    assert json.loads(replayed['text'])['ciudad'] == 'Cali'
+    assert replayed['upload_path'] == 'cassette'
+    assert set(replayed['usage'].values()) == {0}
@@ -0,0 +1,118 @@
+import json
+
+import pytest
+
+import model_router
+from deadlines import DeadlineExceeded
+from llm_backends import FakeBackend
+from model_router import ModelRouter, TemplateMemory, output_problems, template_key
+from synthetic_pdfs import build_pdf
+
+TIERS = [('fake', 'rapido'), ('fake', 'capaz')]
+SIMPLE = {'pages': 1, 'scan': False, 'photos': False, 'template': 'uploads/solicitud_#.pdf'}
+
+
+@pytest.fixture
+def weak_fast_tier(monkeypatch, backend_calls):
+    """El nivel 'rapido' responde según `reply`: 'vacio' (sin campos requeridos) o una excepción"""
+    generate = FakeBackend.generate
+    reply = {'value': 'vacio'}
+
+    def answer(self, pdf_bytes, *args, **kwargs):
+        result = generate(self, pdf_bytes, *args, **kwargs)
+        if self.model_name != 'rapido':
+            return result
+        if isinstance(reply['value'], Exception):
+            raise reply['value']
+        return dict(result, text=json.dumps({'convocantes': [], 'convocados': []}))
+
+    monkeypatch.setattr(FakeBackend, 'generate', answer)
+    return reply
+
+
+def make_router(lambda_runtime, memory=None):
+    return ModelRouter(lambda_runtime, tiers=TIERS, memory=memory or TemplateMemory())
+
+
+def test_template_key_ignores_dates_and_numbers():
+    assert template_key('uploads/2025-06-01/solicitud_3021.pdf') == 'uploads/solicitud_#.pdf'
+    assert template_key('uploads/2025-06-02/solicitud_3188.pdf') == 'uploads/solicitud_#.pdf'
+    assert template_key(None) is None
+
+
+def test_output_problems_flags_missing_fields_and_bad_values():
+    data = {'convocantes': [{'nombre': '', 'email': 'no-es-correo'}], 'convocados': [{'nombre': 'ANA'}],
+            'fecha_conciliacion': '01/06/2025', 'hora_conciliacion': '9:00'}
+
+    assert output_problems(data) == ["fecha no ISO '01/06/2025'", 'convocantes sin nombre',
+                                     'correo inválido en convocantes']
+    assert output_problems({}, required_fields=['expediente']) == ['falta expediente']
+
+
+def test_simple_document_stays_on_the_fast_tier(lambda_runtime, backend_calls):
+    data = make_router(lambda_runtime).extract(build_pdf(2), features=SIMPLE)
+
+    assert data['fecha_conciliacion'] == '2025-06-01'
+    assert backend_calls == ['rapido']
+
+
+def test_incomplete_answer_escalates_to_the_next_tier(lambda_runtime, backend_calls, weak_fast_tier):
+    memory = TemplateMemory()
+    data = make_router(lambda_runtime, memory).extract(build_pdf(2), features=SIMPLE)
+
+    assert data['convocantes']
+    assert backend_calls == ['rapido', 'capaz']
+    assert memory.get(SIMPLE['template'])['failures'] == 1
+
+
+def test_error_on_the_fast_tier_escalates(lambda_runtime, backend_calls, weak_fast_tier):
+    weak_fast_tier['value'] = TimeoutError('rapido sin respuesta')
+
+    data = make_router(lambda_runtime).extract(build_pdf(2), features=SIMPLE)
+
+    assert data['convocantes']
+    assert backend_calls == ['rapido', 'capaz']
+
+
+def test_last_tier_answer_is_returned_even_with_problems(lambda_runtime, backend_calls):
+    # Sin capa de texto el FakeBackend no encuentra campos en ningún nivel
+    data = make_router(lambda_runtime).extract(build_pdf(2, form_pages=0), features=SIMPLE)
+
+    assert output_problems(data)
+    assert backend_calls == ['rapido', 'capaz']
+
+
+def test_deadline_exceeded_is_not_escalated(lambda_runtime, backend_calls, weak_fast_tier):
+    weak_fast_tier['value'] = DeadlineExceeded('model', 800)
+
+    with pytest.raises(DeadlineExceeded):
+        make_router(lambda_runtime).extract(build_pdf(2), features=SIMPLE)
+    assert backend_calls == ['rapido']
+
+
+def test_failing_template_starts_on_the_capable_tier(lambda_runtime, backend_calls, weak_fast_tier):
+    router = make_router(lambda_runtime)
+    for _ in range(model_router.ROUTER_TEMPLATE_FAILURES):
+        router.extract(build_pdf(2), features=SIMPLE)
+    del backend_calls[:]
+
+    router.extract(build_pdf(2), features=SIMPLE)
+
+    assert backend_calls == ['capaz']
+    assert router.start_tier(dict(SIMPLE, template='uploads/otra_#.pdf'))[0] == 0
+
+
+def test_template_memory_expires(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(model_router.time, 'time', lambda: now[0])
+    memory = TemplateMemory(ttl_seconds=60)
+    memory.record('uploads/solicitud_#.pdf', failed=True)
+    memory.record('uploads/solicitud_#.pdf', failed=True)
+
+    now[0] += 59
+    assert memory.get('uploads/solicitud_#.pdf')['failures'] == 2
+    now[0] += 2
+    assert memory.get('uploads/solicitud_#.pdf') == {'attempts': 0, 'failures': 0}
+    # Vencida, la plantilla vuelve a contar desde cero
+    memory.record('uploads/solicitud_#.pdf', failed=False)
+    assert memory.get('uploads/solicitud_#.pdf')['attempts'] == 1
@@ -0,0 +1,105 @@
+import io
+
+import PyPDF2
+
+from llm_backends import FakeBackend
+from page_selection import PAGE_IMAGE_TOKENS, drop_lowest_scored, select_pages
+from pdf_utils import get_page, page_count, trim_pdf
+from synthetic_pdfs import build_pdf
+
+
+def reorder(pdf_bytes, order):
+    """PDF con las páginas de pdf_bytes en el orden indicado"""
+    reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+    writer = PyPDF2.PdfWriter()
+    for index in order:
+        writer.add_page(reader.pages[index])
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def page_texts(pdf_bytes):
+    return [page.extract_text() for page in PyPDF2.PdfReader(io.BytesIO(pdf_bytes)).pages]
+
+
+# Páginas 0 y 1: formulario (convocantes; hechos y peticiones); 2 a 5: anexos sin señales
+FORM_FIRST = build_pdf(6, form_pages=2, image_size=None)
+# Formulario al final, detrás de los anexos: índices 3 (convocantes) y 5 (hechos)
+FORM_LAST = reorder(FORM_FIRST, [2, 3, 4, 0, 5, 1])
+
+
+def test_form_pages_are_found_anywhere_and_kept_in_document_order():
+    selection = select_pages(io.BytesIO(FORM_LAST), max_pages=3, token_budget=10000)
+
+    assert selection['pages'] == [3, 5]
+    assert selection['scores'][3] > selection['scores'][5] > 0
+    assert selection['scores'][0] == 0
+    assert selection['total_pages'] == 6
+    assert selection['tokens'] == 2 * PAGE_IMAGE_TOKENS + sum(
+        len(text.strip()) // 4 for text in (page_texts(FORM_LAST)[3], page_texts(FORM_LAST)[5]))
+
+
+def test_highest_scores_win_within_max_pages_and_budget():
+    assert select_pages(io.BytesIO(FORM_LAST), max_pages=1, token_budget=10000)['pages'] == [3]
+    # La primera página siempre entra; las siguientes solo si caben en el presupuesto
+    assert select_pages(io.BytesIO(FORM_LAST), max_pages=3, token_budget=PAGE_IMAGE_TOKENS)['pages'] == [3]
+
+
+def test_without_signals_the_first_pages_are_kept():
+    scanned = build_pdf(5, form_pages=0, image_size=(20, 20))
+    selection = select_pages(io.BytesIO(scanned), max_pages=3)
+    assert selection['pages'] == [0, 1]
+    assert selection['image_only'] == [0, 1, 2, 3, 4]
+    assert select_pages(io.BytesIO(FORM_LAST), mode='first')['pages'] == [0, 1]
+
+
+def test_drop_lowest_scored_order():
+    selection = {'pages': [0, 2, 4], 'scores': {0: 5.0, 2: 1.0, 4: 1.0}}
+    # Con empate se quita la página posterior
+    selection = drop_lowest_scored(selection)
+    assert selection['pages'] == [0, 2]
+    selection = drop_lowest_scored(selection)
+    assert selection['pages'] == [0]
+    assert drop_lowest_scored(selection)['pages'] == [0]
+
+
+def test_trim_keeps_the_selected_pages():
+    selection = select_pages(io.BytesIO(FORM_LAST), max_pages=3, token_budget=10000)
+    trimmed = trim_pdf(io.BytesIO(FORM_LAST), pages=selection['pages'] + [99])
+    texts = page_texts(trimmed)
+
+    assert texts == [page_texts(FORM_LAST)[3], page_texts(FORM_LAST)[5]]
+    assert 'CONVOCANTE' in texts[0] and 'HECHOS' in texts[1]
+
+
+def test_trim_without_pages_keeps_the_first_ones_and_falls_back_on_errors():
+    assert page_texts(trim_pdf(io.BytesIO(FORM_FIRST), max_pages=2)) == page_texts(FORM_FIRST)[:2]
+    assert trim_pdf(io.BytesIO(b'no es un pdf'), pages=[0]) == b'no es un pdf'
+
+
+def test_get_page_resolves_inherited_resources():
+    pdf = build_pdf(4, form_pages=1, image_size=(10, 10), shared_resources=True)
+    reader = PyPDF2.PdfReader(io.BytesIO(pdf))
+
+    assert page_count(reader) == 4
+    for index in range(4):
+        page = get_page(reader, index)
+        assert page['/Contents'].get_object().get_data() == reader.pages[index]['/Contents'].get_object().get_data()
+        assert '/MediaBox' in page
+        if index:
+            assert f'/Im{index}' in page['/Resources']['/XObject']
+
+
+def test_token_budget_drops_the_lowest_scored_page_first():
+    from extradata_conciliacion_improved import fit_token_budget
+
+    buffer = io.BytesIO(FORM_LAST)
+    selection = select_pages(buffer, max_pages=3, token_budget=10000)
+    pdf_bytes = trim_pdf(buffer, pages=selection['pages'])
+    # FakeBackend cuenta PAGE_IMAGE_TOKENS por página: solo cabe una
+    pdf_bytes, selection = fit_token_budget(FakeBackend(), buffer, pdf_bytes, selection,
+                                            token_budget=PAGE_IMAGE_TOKENS + 10)
+
+    assert selection['pages'] == [3]
+    assert page_texts(pdf_bytes) == [page_texts(FORM_LAST)[3]]
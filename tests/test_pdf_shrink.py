@@ -0,0 +1,67 @@
+import io
+
+import PyPDF2
+
+import pdf_shrink
+from pdf_shrink import shrink_pdf
+from synthetic_pdfs import build_pdf
+
+
+def page_texts(pdf_bytes):
+    return [page.extract_text() for page in PyPDF2.PdfReader(io.BytesIO(pdf_bytes)).pages]
+
+
+def test_digital_pdf_keeps_its_text_layer():
+    pdf = build_pdf(3, form_pages=2, image_size=(850, 1100))
+    shrunk, stats = shrink_pdf(pdf)
+
+    assert stats['verified'] is True
+    assert len(shrunk) < len(pdf)
+    assert page_texts(shrunk) == page_texts(pdf)
+    assert 'CONVOCANTE' in page_texts(shrunk)[0]
+
+
+def test_scanned_pdf_is_shrunk_and_keeps_its_images():
+    pdf = build_pdf(2, form_pages=2, scanned_form_dpi=200)
+    shrunk, stats = shrink_pdf(pdf)
+
+    assert stats['images_recompressed'] == 2
+    assert stats['shrunk_bytes'] == len(shrunk) < len(pdf) / 2
+    reader = PyPDF2.PdfReader(io.BytesIO(shrunk))
+    for page in reader.pages:
+        (image,) = page['/Resources']['/XObject'].values()
+        image = image.get_object()
+        assert image['/Filter'] == '/DCTDecode'
+        assert image['/Width'] < 1654
+
+
+def test_unused_and_duplicated_resources_are_removed():
+    pdf = build_pdf(4, form_pages=1, image_size=(400, 500), shared_resources=True)
+    shrunk, stats = shrink_pdf(pdf)
+
+    # Cada página de anexo heredaba las tres imágenes y dibuja solo la suya
+    assert stats['pruned'] == 6
+    for page in PyPDF2.PdfReader(io.BytesIO(shrunk)).pages[1:]:
+        assert len(page['/Resources']['/XObject']) == 1
+
+
+def test_falls_back_to_the_original_when_a_page_loses_its_image(monkeypatch):
+    from PyPDF2.generic import NameObject
+
+    def broken_recompress(obj, *args, **kwargs):
+        # Una recompresión defectuosa que deja la página de escaneo sin imagen
+        obj[NameObject('/Subtype')] = NameObject('/Form')
+        return 1
+
+    monkeypatch.setattr(pdf_shrink, 'recompress_image', broken_recompress)
+    pdf = build_pdf(2, form_pages=2, scanned_form_dpi=100)
+    shrunk, stats = shrink_pdf(pdf)
+
+    assert shrunk == pdf
+    assert stats['verified'] is False
+
+
+def test_unreadable_pdf_is_returned_unchanged():
+    shrunk, stats = shrink_pdf(b'%PDF-1.4 roto')
+    assert shrunk == b'%PDF-1.4 roto'
+    assert stats['verified'] is False
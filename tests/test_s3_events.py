@@ -0,0 +1,111 @@
+import json
+
+import pytest
+
+from s3_events import (BatchProcessingError, PermanentRecordError, build_batch_response,
+                       iter_s3_records, process_batch)
+
+
+def s3_record(key, bucket='docs', etag='e1'):
+    return {'s3': {'bucket': {'name': bucket}, 'object': {'key': key, 'eTag': etag, 'size': 10}}}
+
+
+def sqs_record(message_id, *keys, body=None):
+    if body is None:
+        body = json.dumps({'Records': [s3_record(key) for key in keys]})
+    return {'messageId': message_id, 'body': body}
+
+
+def outcome(key, status, message_id=None, result=None):
+    return {'bucket': 'docs', 'key': key, 'message_id': message_id, 'result': result,
+            'status': status, 'error': None if status == 'ok' else 'falla'}
+
+
+def test_iter_s3_records_direct_sqs_and_sns():
+    sns = json.dumps({'Message': json.dumps({'Records': [s3_record('c.pdf')]})})
+    event = {'Records': [
+        s3_record('carpeta/a+b%C3%B1.pdf'),
+        sqs_record('m1', 'b.pdf'),
+        sqs_record('m2', body=sns),
+        sqs_record('m3', body=json.dumps({'Event': 's3:TestEvent'})),
+    ]}
+    records = list(iter_s3_records(event))
+
+    assert [(r['key'], r['message_id']) for r in records] == [
+        ('carpeta/a bñ.pdf', None), ('b.pdf', 'm1'), ('c.pdf', 'm2')]
+
+
+def test_unreadable_sqs_message_is_reported_without_calling_handler():
+    records = list(iter_s3_records({'Records': [sqs_record('bad', body='{no es json'), sqs_record('m1', 'a.pdf')]}))
+    calls = []
+    outcomes = process_batch(records, lambda r: calls.append(r['key']) or {'ok': True})
+    response = build_batch_response(outcomes)
+
+    assert calls == ['a.pdf']
+    assert [o['status'] for o in outcomes] == ['error', 'ok']
+    assert response['batchItemFailures'] == [{'itemIdentifier': 'bad'}]
+
+
+@pytest.mark.parametrize('body', ['[]', '1', '"x"', 'null', json.dumps({'Message': '[1]'})])
+def test_sqs_message_that_is_not_an_object_is_reported(body):
+    records = list(iter_s3_records({'Records': [sqs_record('bad', body=body), sqs_record('m1', 'a.pdf')]}))
+    outcomes = process_batch(records, lambda r: {'ok': True})
+
+    assert [o['status'] for o in outcomes] == ['error', 'ok']
+    assert 'se esperaba un objeto' in outcomes[0]['error']
+    assert build_batch_response(outcomes)['batchItemFailures'] == [{'itemIdentifier': 'bad'}]
+
+
+def test_process_batch_classifies_errors_and_keeps_order():
+    def handler(record):
+        if record['key'] == 'grande.pdf':
+            raise PermanentRecordError('demasiado grande')
+        if record['key'] == 'falla.pdf':
+            raise RuntimeError('timeout')
+        return {'key': record['key']}
+
+    records = [{'bucket': 'docs', 'key': k} for k in ('a.pdf', 'grande.pdf', 'falla.pdf', 'b.pdf')]
+    outcomes = process_batch(records, handler, max_workers=4)
+
+    assert [o['key'] for o in outcomes] == ['a.pdf', 'grande.pdf', 'falla.pdf', 'b.pdf']
+    assert [o['status'] for o in outcomes] == ['ok', 'rejected', 'error', 'ok']
+    assert outcomes[2]['error'] == 'timeout'
+
+
+def test_batch_response_reports_only_failed_sqs_messages():
+    outcomes = [outcome('a.pdf', 'ok', 'm1'), outcome('b.pdf', 'error', 'm2'),
+                outcome('c.pdf', 'error', 'm2'), outcome('d.pdf', 'rejected', 'm3')]
+    response = build_batch_response(outcomes, fail_on_error=True)
+    body = json.loads(response['body'])
+
+    # Los rechazados no se reintentan; un mensaje con varios registros fallidos se reporta una vez
+    assert response['batchItemFailures'] == [{'itemIdentifier': 'm2'}]
+    assert response['statusCode'] == 207
+    assert (body['processed'], body['failed'], body['rejected']) == (1, 2, 1)
+
+
+def test_batch_response_status_codes():
+    assert build_batch_response([outcome('a.pdf', 'ok')])['statusCode'] == 200
+    assert build_batch_response([outcome('a.pdf', 'rejected')])['statusCode'] == 400
+    assert build_batch_response([outcome('a.pdf', 'error')], fail_on_error=False)['statusCode'] == 500
+    assert 'batchItemFailures' not in build_batch_response([outcome('a.pdf', 'ok', 'm1')])
+
+
+def test_single_record_keeps_legacy_body():
+    response = build_batch_response([outcome('a.pdf', 'ok', result={'pdf_data': {'ciudad': 'Cali'}})])
+    assert json.loads(response['body'])['pdf_data'] == {'ciudad': 'Cali'}
+
+
+def test_direct_failure_raises_for_async_retry(capsys):
+    outcomes = [outcome('a.pdf', 'ok'), outcome('b.pdf', 'error')]
+    with pytest.raises(BatchProcessingError) as error:
+        build_batch_response(outcomes, fail_on_error=True)
+    assert error.value.outcomes == outcomes
+    # Sin deduplicación se avisa que el reintento repetirá a.pdf
+    assert 'a.pdf' in capsys.readouterr().out
+
+    with pytest.raises(BatchProcessingError):
+        build_batch_response(outcomes, fail_on_error=True, replay_safe=True)
+    assert 'repetirá' not in capsys.readouterr().out
+
+    assert build_batch_response(outcomes, fail_on_error=False)['statusCode'] == 207
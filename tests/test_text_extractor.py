@@ -0,0 +1,90 @@
+import pytest
+
+from synthetic_pdfs import FORM_PAGE_LINES, build_pdf
+from text_extractor import (FAST_PATH_MIN_CONFIDENCE, _label_penalty, _score_matches, _HORA,
+                            extract_fields, extract_fields_from_text, missing_fields)
+
+FORM_TEXT = "\n".join(FORM_PAGE_LINES[0] + FORM_PAGE_LINES[1])
+
+
+def with_line(old, new):
+    assert old in FORM_TEXT
+    return FORM_TEXT.replace(old, new)
+
+
+def test_clean_form_skips_the_model():
+    extraction = extract_fields_from_text(FORM_TEXT)
+
+    assert extraction['data']['ciudad'] == 'Cali'
+    assert extraction['data']['fecha_conciliacion'] == '2025-06-01'
+    assert extraction['data']['hora_conciliacion'] == '9:00'
+    assert extraction['data']['jornada'] == 'AM'
+    assert [p['nombre'] for p in extraction['data']['convocados']] == ['CARLOS SAENZ', 'CHECO PEREZ']
+    assert missing_fields(extraction) == []
+
+
+def test_conflicting_matches_score_low():
+    text = FORM_TEXT + "\nFecha de audiencia: 2025-07-15"
+    extraction = extract_fields_from_text(text)
+
+    # Se conserva la primera, pero el modelo decide
+    assert extraction['data']['fecha_conciliacion'] == '2025-06-01'
+    assert extraction['confidence']['fecha_conciliacion'] == 0.3
+    assert missing_fields(extraction) == ['fecha_conciliacion']
+
+
+def test_repeated_equal_matches_are_not_a_conflict():
+    extraction = extract_fields_from_text(FORM_TEXT + "\nFecha de audiencia: 01/06/2025")
+    assert extraction['confidence']['fecha_conciliacion'] == 1.0
+
+
+@pytest.mark.parametrize('old, new, field', [
+    ('2025-06-01', '1999-06-01', 'fecha_conciliacion'),
+    ('Hora: 9:00', 'Hora: 27:00', 'hora_conciliacion'),
+    ('$ 5.450.000', '$ 5.45.0', 'cuantia'),
+])
+def test_format_validation_failures_score_low(old, new, field):
+    extraction = extract_fields_from_text(with_line(old, new))
+    assert extraction['confidence'][field] == 0.3
+
+
+def test_marked_choices_that_conflict_are_left_to_the_model():
+    extraction = extract_fields_from_text(with_line('Bogota [ ]', 'Bogota [X]'))
+    assert (extraction['data']['ciudad'], extraction['confidence']['ciudad']) == ('', 0.0)
+    assert 'ciudad' in missing_fields(extraction)
+    extraction = extract_fields_from_text(with_line('PM [ ]', 'PM [X]'))
+    assert extraction['data']['jornada'] == ''
+    assert 'jornada' in missing_fields(extraction)
+
+
+def test_value_far_from_its_label_is_penalised():
+    near = next(_HORA.finditer("Hora: 9:00"))
+    other_line = next(_HORA.finditer("Hora\n9:00"))
+    assert _label_penalty(near) == 0.0
+    # Otra línea (0.25) y sin separador (0.05)
+    assert _label_penalty(other_line) == pytest.approx(0.3)
+
+    extraction = extract_fields_from_text(with_line('Hora: 9:00', 'Hora\n9:00'))
+    assert extraction['confidence']['hora_conciliacion'] == 0.7
+    assert extraction['confidence']['hora_conciliacion'] < FAST_PATH_MIN_CONFIDENCE
+    assert missing_fields(extraction) == ['hora_conciliacion']
+
+
+def test_score_matches_ignores_unrecognised_values():
+    matches = list(_HORA.finditer("Hora: 7\nHora: 10:30"))
+    assert _score_matches(matches, lambda m: None) == ('', 0.0)
+    # Una coincidencia que no se reconoce no cuenta como contradicción
+    assert _score_matches(matches, lambda m: m.group(1) if ':' in m.group(1) else '') == ('10:30', 1.0)
+
+
+def test_missing_fields_respects_the_threshold():
+    extraction = {'confidence': {'ciudad': 0.79, 'jornada': 0.8}}
+    assert missing_fields(extraction, ['ciudad', 'jornada', 'convocados'], min_confidence=0.8) == [
+        'ciudad', 'convocados']
+
+
+def test_pdf_text_layer_and_scanned_pdf():
+    assert missing_fields(extract_fields(build_pdf(2, form_pages=2, image_size=None))) == []
+    # Sin capa de texto no hay confianza: decide el modelo
+    scanned = extract_fields(build_pdf(1, form_pages=1, scanned_form_dpi=50))
+    assert scanned['confidence'] == {}
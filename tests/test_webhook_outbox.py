@@ -0,0 +1,249 @@
+import gzip
+import json
+import time
+
+import pytest
+import requests
+
+import extradata_conciliacion_improved as handler
+from fakes import FakeLambdaContext
+from synthetic_pdfs import build_pdf
+from webhook_outbox import OutboxStore, WebhookOutbox, batch_acks, compress
+
+
+class ScriptedPost:
+    """post() que responde en orden con los códigos (o excepciones) indicados"""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.calls = []
+
+    def __call__(self, url, data=None, headers=None, timeout=None):
+        self.calls.append({'url': url, 'data': data, 'headers': headers, 'at': time.monotonic()})
+        reply = self.replies.pop(0) if len(self.replies) > 1 else self.replies[0]
+        if isinstance(reply, Exception):
+            raise reply
+        status, body = reply if isinstance(reply, tuple) else (reply, 'ok')
+        response = requests.Response()
+        response.status_code = status
+        response._content = (body if isinstance(body, str) else json.dumps(body)).encode('utf-8')
+        return response
+
+
+def make_outbox(tmp_path, post, **kwargs):
+    kwargs = dict({'max_attempts': 3, 'workers': 2, 'backoff_initial': 0.001, 'backoff_max': 0.002}, **kwargs)
+    return WebhookOutbox(OutboxStore(str(tmp_path / 'outbox.db')), post, **kwargs)
+
+
+def test_outbox_requires_a_durable_path():
+    with pytest.raises(ValueError):
+        OutboxStore('')
+
+
+def test_retryable_errors_are_retried_until_delivered(tmp_path):
+    post = ScriptedPost(503, requests.exceptions.ConnectionError('reset'), 200)
+    outbox = make_outbox(tmp_path, post)
+
+    entry = outbox.send('http://n8n/webhook', {'ciudad': 'Cali'}, document='a.pdf')
+
+    assert entry['status'] == 'delivered'
+    assert (entry['attempts'], entry['status_code'], entry['last_error']) == (3, 200, None)
+    assert json.loads(post.calls[-1]['data']) == {'ciudad': 'Cali'}
+    assert outbox.stats['retried'] == 2
+
+
+def test_exhausted_attempts_go_to_dead_letter_and_redrive(tmp_path):
+    post = ScriptedPost(500)
+    outbox = make_outbox(tmp_path, post)
+
+    entry = outbox.send('http://n8n/webhook', {'ciudad': 'Cali'}, document='a.pdf')
+    assert entry['status'] == 'dead'
+    assert entry['attempts'] == 3
+    assert 'HTTP 500' in entry['last_error']
+    assert [e['id'] for e in outbox.dead_letters()] == [entry['id']]
+
+    # Con el receptor recuperado, el dead-letter se reenvía
+    post.replies = [200]
+    outbox.redrive(entry['id'])
+    outbox.drain()
+    assert outbox.status(entry['id'])['status'] == 'delivered'
+    assert outbox.store.counts() == {'delivered': 1}
+
+
+def test_client_errors_are_not_retried(tmp_path):
+    post = ScriptedPost((400, 'payload inválido'))
+    entry = make_outbox(tmp_path, post).send('http://n8n/webhook', {}, document='a.pdf')
+
+    assert (entry['status'], entry['attempts'], entry['status_code']) == ('dead', 1, 400)
+    assert len(post.calls) == 1
+
+
+def test_pending_entries_are_resumed_after_restart(tmp_path):
+    store = OutboxStore(str(tmp_path / 'outbox.db'))
+    # Guardada por un contenedor que se congeló antes de entregarla
+    delivery_id = store.add('http://n8n/webhook', json.dumps({'ciudad': 'Cali'}), {}, 'a.pdf')
+
+    post = ScriptedPost(200)
+    outbox = make_outbox(tmp_path, post)
+    assert outbox.resume() == 1
+    assert outbox.drain(timeout=5) == 0
+    assert outbox.status(delivery_id)['status'] == 'delivered'
+    assert outbox.resume() == 0
+
+
+def test_batch_partial_acks_requeue_only_retryable_items(tmp_path):
+    # El receptor acepta el primero, pide reintentar el segundo y rechaza el tercero (por posición)
+    post = ScriptedPost((200, [{'status': 200}, {'status': 503}, {'status': 422}]), (200, [{'status': 200}]))
+    outbox = make_outbox(tmp_path, post, batch_size=3, batch_window_ms=20, compression='gzip')
+    ids = [outbox.enqueue('http://n8n/webhook', {'n': n}, document=f'{n}.pdf') for n in range(3)]
+
+    assert outbox.drain(timeout=5) == 0
+    assert [outbox.status(i)['status'] for i in ids] == ['delivered', 'delivered', 'dead']
+    assert outbox.status(ids[1])['attempts'] == 2
+    assert outbox.status(ids[2])['status_code'] == 422
+    first, second = post.calls
+    assert first['headers']['Content-Encoding'] == 'gzip'
+    assert first['headers']['X-Webhook-Batch'] == '3'
+    assert [item['data'] for item in json.loads(gzip.decompress(first['data']))] == [{'n': 0}, {'n': 1}, {'n': 2}]
+    assert [item['id'] for item in json.loads(gzip.decompress(second['data']))] == [ids[1]]
+
+
+def test_requeued_batch_items_wait_for_their_backoff(tmp_path):
+    post = ScriptedPost((200, [{'status': 503}]), (200, [{'status': 200}]))
+    outbox = make_outbox(tmp_path, post, batch_size=2, batch_window_ms=10, backoff_initial=0.2, backoff_max=1)
+    delivery_id = outbox.enqueue('http://n8n/webhook', {'n': 0}, document='0.pdf')
+
+    assert outbox.drain(timeout=5) == 0
+    assert outbox.status(delivery_id)['status'] == 'delivered'
+    first, second = post.calls
+    assert second['at'] - first['at'] >= 0.2
+
+
+def sink_outbox(tmp_path, **kwargs):
+    return make_outbox(tmp_path, requests.Session().post, **kwargs)
+
+
+def test_full_batch_is_sent_without_waiting_for_the_window(tmp_path, webhook_sink):
+    outbox = sink_outbox(tmp_path, batch_size=3, batch_window_ms=60000)
+    ids = [outbox.enqueue(webhook_sink.url, {'n': n}, document=f'{n}.pdf',
+                          headers={'Content-Type': 'application/json', 'X-Correlation-Id': f'corr:{n}'})
+           for n in range(3)]
+
+    assert [entry['status'] for entry in outbox.wait(ids, timeout=5)] == ['delivered'] * 3
+    assert webhook_sink.requests == 1
+    items = webhook_sink.batches[0]['items']
+    assert [item['correlation_id'] for item in items] == ['corr:0', 'corr:1', 'corr:2']
+    # Las cabeceras de cada entrega viajan en su elemento (Content-Type es del lote)
+    assert items[0]['headers'] == {'X-Correlation-Id': 'corr:0'}
+
+
+def test_partial_batch_is_sent_when_the_window_expires(tmp_path, webhook_sink):
+    outbox = sink_outbox(tmp_path, batch_size=10, batch_window_ms=50)
+    ids = [outbox.enqueue(webhook_sink.url, {'n': n}, document=f'{n}.pdf') for n in range(2)]
+
+    assert [entry['status'] for entry in outbox.wait(ids, timeout=5)] == ['delivered'] * 2
+    assert webhook_sink.requests == 1
+    assert [item['id'] for item in webhook_sink.batches[0]['items']] == ids
+
+
+def test_items_rejected_by_the_sink_are_requeued_until_dead(tmp_path, webhook_sink):
+    webhook_sink.error_rate = 1.0
+    outbox = sink_outbox(tmp_path, max_attempts=2, batch_size=2, batch_window_ms=10)
+    ids = [outbox.enqueue(webhook_sink.url, {'n': n}, document=f'{n}.pdf') for n in range(2)]
+
+    assert outbox.drain(timeout=5) == 0
+    entries = [outbox.status(i) for i in ids]
+    assert [(e['status'], e['attempts'], e['status_code']) for e in entries] == [('dead', 2, 500)] * 2
+    # Cada intento es un lote con los dos elementos
+    assert webhook_sink.requests == 2
+    assert webhook_sink.failed == 4
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'zstd'])
+def test_compressed_batches_round_trip_through_the_sink(tmp_path, webhook_sink, compression):
+    outbox = sink_outbox(tmp_path, batch_size=2, batch_window_ms=60000, compression=compression)
+    payloads = [{'hechos': 'choque en la calle 5 ' * 50, 'n': n} for n in range(2)]
+    ids = [outbox.enqueue(webhook_sink.url, payload, document=f'{n}.pdf') for n, payload in enumerate(payloads)]
+
+    assert [entry['status'] for entry in outbox.wait(ids, timeout=5)] == ['delivered'] * 2
+    batch, = webhook_sink.batches
+    assert batch['encoding'] == compression
+    assert [item['data'] for item in batch['items']] == payloads
+    assert outbox.stats['bytes_sent'] < outbox.stats['bytes_raw']
+    assert webhook_sink.bytes_received == outbox.stats['bytes_sent']
+
+
+def test_batch_acks_by_position_and_ok_flag():
+    response = requests.Response()
+    response.status_code = 200
+    response._content = json.dumps({'results': [{'ok': True}, {'ok': False, 'error': 'sin convocantes'}]}).encode()
+
+    assert batch_acks(response, ['a', 'b']) == {'a': (200, None), 'b': (422, 'sin convocantes')}
+    assert compress(b'datos', '') == b'datos'
+    assert gzip.decompress(compress(b'datos', 'gzip')) == b'datos'
+
+
+@pytest.fixture
+def outbox_runtime(lambda_runtime, tmp_path, monkeypatch):
+    """El handler con WEBHOOK_OUTBOX=1 sobre un outbox en tmp_path"""
+    monkeypatch.setattr(handler, 'WEBHOOK_OUTBOX', True)
+    lambda_runtime._webhook_outbox = make_outbox(tmp_path, lambda_runtime.post, max_attempts=2)
+    return lambda_runtime
+
+
+def sqs_event(message_id, webhook_url, key='a.pdf', etag='e1'):
+    record = {'s3': {'bucket': {'name': 'docs'}, 'object': {'key': key, 'eTag': etag}}}
+    return {'webhook_url': webhook_url,
+            'Records': [{'messageId': message_id, 'body': json.dumps({'Records': [record]})}]}
+
+
+def test_record_is_acknowledged_only_after_delivery(outbox_runtime, webhook_sink, backend_calls):
+    outbox_runtime.s3_client.put_object(Bucket='docs', Key='a.pdf', Body=build_pdf(3, form_pages=1))
+    webhook_sink.error_rate = 1.0
+
+    response = handler.lambda_handler(sqs_event('m1', webhook_sink.url), FakeLambdaContext())
+    assert response['batchItemFailures'] == [{'itemIdentifier': 'm1'}]
+    record = json.loads(response['body'])['records'][0]
+    assert record['error'].startswith('Webhook no entregado (dead)')
+    checkpoint = outbox_runtime.checkpoints.open('docs', 'a.pdf', 'e1')
+    assert checkpoint.stage == 'extracted'
+    assert webhook_sink.received == 2
+
+    # El reintento no es un duplicado: la reserva se liberó y se entrega sin llamar al modelo
+    webhook_sink.error_rate = 0.0
+    response = handler.lambda_handler(sqs_event('m1', webhook_sink.url), FakeLambdaContext())
+    body = json.loads(response['body'])
+    assert 'batchItemFailures' not in response
+    assert body['webhook_response']['status'] == 'delivered'
+    assert len(backend_calls) == 1
+    assert outbox_runtime.checkpoints.open('docs', 'a.pdf', 'e1').stage == 'delivered'
+
+    # Ya entregado: una notificación repetida se reconoce sin reenviar
+    response = handler.lambda_handler(sqs_event('m2', webhook_sink.url), FakeLambdaContext())
+    assert json.loads(response['body'])['duplicate'] is True
+    assert webhook_sink.received == 3
+
+
+def test_pending_delivery_is_reused_by_the_retry(outbox_runtime, webhook_sink, monkeypatch):
+    import deadlines
+
+    outbox_runtime.s3_client.put_object(Bucket='docs', Key='a.pdf', Body=build_pdf(3, form_pages=1))
+    webhook_sink.latency_ms = 1000
+    for name in ('record', 'model', 'webhook'):
+        monkeypatch.setitem(deadlines.STAGE_MIN_MS, name, 0)
+
+    # Sin tiempo para esperar la entrega: el registro falla y la entrega sigue en el outbox
+    context = FakeLambdaContext(timeout_ms=deadlines.DEADLINE_RESERVE_MS + 200)
+    response = handler.lambda_handler(sqs_event('m1', webhook_sink.url), context)
+    assert response['batchItemFailures'] == [{'itemIdentifier': 'm1'}]
+    outbox_id = outbox_runtime.checkpoints.open('docs', 'a.pdf', 'e1').get('outbox_id')
+    assert outbox_id
+
+    # El reintento reutiliza la misma entrega en lugar de duplicar el POST
+    response = handler.lambda_handler(sqs_event('m1', webhook_sink.url), FakeLambdaContext())
+    body = json.loads(response['body'])
+    assert 'batchItemFailures' not in response
+    assert body['webhook_response']['outbox_id'] == outbox_id
+    assert body['webhook_response']['status'] == 'delivered'
+    assert outbox_runtime.get_webhook_outbox().store.counts() == {'delivered': 1}
+    assert webhook_sink.received == 1
@@ -0,0 +1,317 @@
+import datetime
+import io
+import os
+import re
+
+# Activar la extracción determinista por capa de texto antes de llamar al modelo
+TEXT_FAST_PATH = os.environ.get('TEXT_FAST_PATH', '1') == '1'
+# Campos que deben extraerse con confianza suficiente para omitir el modelo
+FAST_PATH_REQUIRED_FIELDS = [
+    f.strip() for f in os.environ.get(
+        'FAST_PATH_REQUIRED_FIELDS',
+        'ciudad,convocantes,convocados,fecha_conciliacion,hora_conciliacion,jornada'
+    ).split(',') if f.strip()
+]
+# Confianza mínima por campo: se calcula con la distancia a la etiqueta, la
+# validación del formato y si el formulario trae valores contradictorios
+FAST_PATH_MIN_CONFIDENCE = float(os.environ.get('FAST_PATH_MIN_CONFIDENCE', '0.8'))
+# Por debajo de este número de caracteres se asume un escaneo sin capa de texto
+MIN_TEXT_CHARS = int(os.environ.get('MIN_TEXT_CHARS', '200'))
+
+MESES = {
+    'enero': 1, 'febrero': 2, 'marzo': 3, 'abril': 4, 'mayo': 5, 'junio': 6, 'julio': 7,
+    'agosto': 8, 'septiembre': 9, 'setiembre': 9, 'octubre': 10, 'noviembre': 11, 'diciembre': 12,
+}
+CIUDADES = {'bogota': 'Bogotá', 'cali': 'Cali', 'medellin': 'Medellín', 'barranquilla': 'Barranquilla'}
+
+# Patrones precompilados sobre las etiquetas del formulario
+_MARK = r'[\[\(]\s*[xX✓✔☑/]\s*[\]\)]'
+_EXPEDIENTE = re.compile(r'expediente\s*(?:n[o°º]\.?|n[uú]mero)?\s*[:#\-]?\s*([A-Z]{0,5}[\-\s]?\d[\w\-/]*)', re.I)
+_CIUDAD_MARCADA = re.compile(r'(Bogot[aá]|Cali|Medell[ií]n|Barranquilla)\s*' + _MARK, re.I)
+_CUANTIA = re.compile(r'cuant[ií]a\s*[:\-]?\s*(\$?\s*\d[\d\.,]*)', re.I)
+_EMAIL = re.compile(r'[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}')
+_TELEFONO = re.compile(r'(?:tel[eé]fono|celular|tel\.?)\s*[:\-]?\s*(\+?\d[\d\s\-]{4,}\d)', re.I)
+_FECHA_ETIQUETA = re.compile(r'fecha\s+(?:de\s+(?:la\s+)?)?(?:audiencia|conciliaci[oó]n)\s*[:\-]?\s*([^\n]{0,60})', re.I)
+_FECHA_ISO = re.compile(r'\b(\d{4})-(\d{1,2})-(\d{1,2})\b')
+_FECHA_DMY = re.compile(r'\b(\d{1,2})[/\-.](\d{1,2})[/\-.](\d{4})\b')
+_FECHA_TEXTO = re.compile(r'\b(\d{1,2})\s+de\s+(' + '|'.join(MESES) + r')\s+(?:de|del)\s+(\d{4})', re.I)
+_HORA = re.compile(r'\bhora\s*[:\-]?\s*(\d{1,2}(?:[:.]\d{2})?)', re.I)
+_JORNADA_MARCADA = re.compile(r'\b(A\.?\s?M\.?|P\.?\s?M\.?)\s*' + _MARK, re.I)
+_SECCION = re.compile(r'^\s*(CONVOCANTES?|CONVOCADOS?|CONVOCANDO)\b[:\s]*', re.I | re.M)
+_FIN_SECCION = re.compile(r'^\s*(?:cuant[ií]a|fecha|hechos|peticiones|pruebas|anexos)\b', re.I | re.M)
+_ROL = re.compile(r'^\s*(conductor|propietario|otros?)\s*[:\-]\s*(.+)$', re.I | re.M)
+_CORTE_NOMBRE = re.compile(r'\s+(?:e-?mail|correo|tel[eé]fono|celular|tel\.?|c\.?c\.?)\b.*$', re.I)
+_HECHOS = re.compile(r'\bHECHOS\s*[:\-]?\s*(.+?)(?=^\s*PETICIONES\b|\Z)', re.I | re.S | re.M)
+_PETICIONES = re.compile(r'\bPETICIONES\s*[:\-]?\s*(.+?)(?=^\s*(?:PRUEBAS|ANEXOS|FIRMA|NOTIFICACIONES|RADICADO)\b|\Z)', re.I | re.S | re.M)
+
+
+def extract_text_layer(pdf_bytes, max_pages=None):
+    """
+    Extrae la capa de texto de un PDF con PyPDF2.
+
+    Args:
+        pdf_bytes: Contenido del PDF
+        max_pages: Número máximo de páginas a leer
+
+    Returns:
+        str: Texto concatenado de las páginas (vacío si no hay capa de texto)
+    """
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+    pages = reader.pages if max_pages is None else reader.pages[:max_pages]
+    texts = []
+    for page in pages:
+        try:
+            texts.append(page.extract_text() or '')
+        except Exception as e:
+            print(f"⚠️ No se pudo extraer texto de una página: {e}")
+    return "\n".join(texts)
+
+
+def normalize_date(raw):
+    """Normaliza una fecha (ISO, dd/mm/aaaa o '10 de mayo de 2025') a YYYY-MM-DD"""
+    match = _FECHA_ISO.search(raw)
+    if match:
+        year, month, day = (int(g) for g in match.groups())
+    else:
+        match = _FECHA_DMY.search(raw)
+        if match:
+            day, month, year = (int(g) for g in match.groups())
+        else:
+            match = _FECHA_TEXTO.search(raw)
+            if not match:
+                return None
+            day, month, year = int(match.group(1)), MESES[match.group(2).lower()], int(match.group(3))
+    if not (1 <= month <= 12 and 1 <= day <= 31):
+        return None
+    return f"{year:04d}-{month:02d}-{day:02d}"
+
+
+def normalize_hour(raw):
+    """Normaliza una hora ('9', '9.30', '09:30') a H:MM"""
+    match = re.search(r'(\d{1,2})(?:[:.](\d{2}))?', raw or '')
+    if not match:
+        return ''
+    return f"{int(match.group(1))}:{match.group(2) or '00'}"
+
+
+def strip_accents(text):
+    return (text.lower().replace('á', 'a').replace('é', 'e').replace('í', 'i')
+            .replace('ó', 'o').replace('ú', 'u'))
+
+
+def _parse_people(block, email_field):
+    people = []
+    seen = set()
+    for match in _ROL.finditer(block):
+        rol, rest = match.group(1).upper(), match.group(2)
+        nombre = _CORTE_NOMBRE.sub('', rest).strip(' :-,')
+        emails = _EMAIL.findall(rest)
+        telefono = _TELEFONO.search(rest)
+        if (not nombre and not emails) or (rol, nombre) in seen:
+            continue
+        seen.add((rol, nombre))
+        people.append({
+            'rol': 'OTROS' if rol.startswith('OTRO') else rol,
+            'nombre': nombre,
+            email_field: ",".join(emails),
+            'telefono': re.sub(r'[\s\-]', '', telefono.group(1)) if telefono else '',
+        })
+    return people
+
+
+def _people_confidence(people, email_field):
+    """Confianza de un bloque de personas: proporción con nombre plausible y correo válido"""
+    if not people:
+        return 0.0
+    complete = sum(1 for p in people if _plausible_name(p['nombre']) and p[email_field])
+    return round(0.4 + 0.55 * complete / len(people), 2)
+
+
+def _plausible_name(nombre):
+    # Un nombre con dígitos o de una sola letra suele ser texto de otra etiqueta
+    return len(nombre) >= 3 and not re.search(r'\d', nombre)
+
+
+def _label_penalty(match, group=1):
+    """
+    Penalización por la distancia entre la etiqueta y el valor: un valor en
+    otra línea o sin separador (':', '-', '#') puede pertenecer a otra etiqueta.
+    """
+    between = match.string[match.start(0):match.start(group)]
+    penalty = 0.0
+    if '\n' in between:
+        penalty += 0.25
+    if not re.search(r'[:\-#]', between):
+        penalty += 0.05
+    if len(between) > 40:
+        penalty += 0.1
+    return penalty
+
+
+def _score_matches(matches, value_of, valid=None):
+    """
+    Valor y confianza de un campo a partir de todas las coincidencias de su etiqueta.
+
+    La confianza parte de 1 y baja por la distancia a la etiqueta; un valor
+    con formato inválido (valid) queda en 0.3 y coincidencias con valores
+    distintos en 0.3 (el formulario se contradice y decide el modelo).
+
+    Args:
+        matches: Coincidencias de la etiqueta (el valor en el grupo 1)
+        value_of: Función match -> valor normalizado ('' o None si no se reconoce)
+        valid: Función valor -> bool con la validación de formato (opcional)
+
+    Returns:
+        tuple: (valor de la primera coincidencia reconocida, confianza 0-1)
+    """
+    candidates = [(value_of(m), m) for m in matches]
+    candidates = [(value, m) for value, m in candidates if value]
+    if not candidates:
+        return '', 0.0
+    value, match = candidates[0]
+    if len({v for v, _ in candidates}) > 1:
+        return value, 0.3
+    if valid is not None and not valid(value):
+        return value, 0.3
+    return value, round(max(0.0, 1.0 - _label_penalty(match)), 2)
+
+
+def _valid_date(value):
+    try:
+        date = datetime.date.fromisoformat(value)
+    except ValueError:
+        return False
+    return 2000 <= date.year <= 2100
+
+
+def _valid_hour(value):
+    hour, minute = (int(part) for part in value.split(':'))
+    return hour <= 23 and minute < 60
+
+
+def _valid_amount(value):
+    return bool(re.fullmatch(r'\$?\d{1,3}(?:[.,]?\d{3})*(?:[.,]\d{1,2})?', value))
+
+
+def _text_confidence(text):
+    # Un bloque muy corto suele ser un corte de la capa de texto
+    if not text:
+        return 0.0
+    return 0.8 if len(text) >= 40 else 0.5
+
+
+def _sections(text):
+    """Divide el texto en bloques CONVOCANTE / CONVOCADO"""
+    blocks = {'convocantes': '', 'convocados': ''}
+    matches = list(_SECCION.finditer(text))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        block = text[match.end():end]
+        stop = _FIN_SECCION.search(block)
+        if stop:
+            block = block[:stop.start()]
+        field = 'convocantes' if match.group(1).upper().startswith('CONVOCANTE') else 'convocados'
+        blocks[field] += block + "\n"
+    return blocks
+
+
+def extract_fields_from_text(text):
+    """
+    Llena el schema de extracción a partir del texto del formulario.
+
+    Returns:
+        dict: {'data': campos del schema, 'confidence': confianza 0-1 por campo, 'text_chars': int}
+    """
+    data = {}
+    confidence = {}
+
+    def put(field, value, score):
+        data[field] = value
+        confidence[field] = score if value else 0.0
+
+    put('expediente', *_score_matches(
+        _EXPEDIENTE.finditer(text), lambda m: m.group(1).strip(),
+        valid=lambda value: 3 <= len(value) <= 40 and bool(re.search(r'\d', value))
+    ))
+
+    # Una sola casilla marcada es inequívoca; varias se dejan al modelo
+    value, score = _score_matches(_CIUDAD_MARCADA.finditer(text), lambda m: CIUDADES[strip_accents(m.group(1))])
+    put('ciudad', value if score > 0.3 else '', score)
+
+    put('cuantia', *_score_matches(_CUANTIA.finditer(text), lambda m: m.group(1).replace(' ', ''),
+                                   valid=_valid_amount))
+
+    match = _HECHOS.search(text)
+    hechos = " ".join(match.group(1).split()) if match else ''
+    put('hechos', hechos, _text_confidence(hechos))
+    match = _PETICIONES.search(text)
+    peticiones = " ".join(match.group(1).split()) if match else ''
+    put('peticiones', peticiones, _text_confidence(peticiones))
+
+    blocks = _sections(text)
+    convocantes = _parse_people(blocks['convocantes'], 'email')
+    convocados = _parse_people(blocks['convocados'], 'mail')
+    put('convocantes', convocantes, _people_confidence(convocantes, 'email'))
+    put('convocados', convocados, _people_confidence(convocados, 'mail'))
+
+    put('fecha_conciliacion', *_score_matches(_FECHA_ETIQUETA.finditer(text),
+                                              lambda m: normalize_date(m.group(1)), valid=_valid_date))
+
+    put('hora_conciliacion', *_score_matches(_HORA.finditer(text), lambda m: normalize_hour(m.group(1)),
+                                             valid=_valid_hour))
+
+    value, score = _score_matches(_JORNADA_MARCADA.finditer(text),
+                                  lambda m: m.group(1).replace('.', '').replace(' ', '').upper())
+    put('jornada', value if score > 0.3 else '', score)
+
+    return {'data': data, 'confidence': confidence, 'text_chars': len(text.strip())}
+
+
+def extract_fields(pdf_bytes, max_pages=None):
+    """
+    Extracción determinista desde la capa de texto del PDF.
+
+    Args:
+        pdf_bytes: PDF (normalmente ya recortado a las páginas del formulario)
+        max_pages: Número máximo de páginas a leer
+
+    Returns:
+        dict: Resultado de extract_fields_from_text; confianza 0 si no hay capa de texto
+    """
+    try:
+        text = extract_text_layer(pdf_bytes, max_pages=max_pages)
+    except Exception as e:
+        print(f"⚠️ No se pudo leer la capa de texto: {e}")
+        text = ''
+    if len(text.strip()) < MIN_TEXT_CHARS:
+        return {'data': {}, 'confidence': {}, 'text_chars': len(text.strip())}
+    return extract_fields_from_text(text)
+
+
+def merge_extractions(*extractions):
+    """
+    Combina varias extracciones quedándose, por campo, con la de mayor confianza.
+
+    Returns:
+        dict: Extracción combinada con el mismo formato
+    """
+    data = {}
+    confidence = {}
+    for extraction in extractions:
+        for field, score in extraction.get('confidence', {}).items():
+            if score > confidence.get(field, -1.0):
+                data[field] = extraction['data'][field]
+                confidence[field] = score
+        for field, value in extraction.get('data', {}).items():
+            data.setdefault(field, value)
+    text_chars = max((e.get('text_chars', 0) for e in extractions), default=0)
+    return {'data': data, 'confidence': confidence, 'text_chars': text_chars}
+
+
+def missing_fields(extraction, required_fields=None, min_confidence=FAST_PATH_MIN_CONFIDENCE):
+    """Devuelve los campos requeridos ausentes o con confianza insuficiente"""
+    required_fields = FAST_PATH_REQUIRED_FIELDS if required_fields is None else required_fields
+    confidence = extraction.get('confidence', {})
+    return [f for f in required_fields if confidence.get(f, 0.0) < min_confidence]
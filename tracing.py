@@ -0,0 +1,200 @@
+import json
+import os
+import random
+import resource
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from s3_events import PermanentRecordError
+
+# Fracción de invocaciones cuya traza se emite (0 a 1)
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '1'))
+# Las invocaciones más lentas que esto (ms) se emiten siempre, aunque no estén muestreadas
+TRACE_SLOW_MS = float(os.environ.get('TRACE_SLOW_MS', '10000'))
+# Imprimir el evento completo de entrada (solo para depuración: incluye claves y URLs)
+TRACE_LOG_EVENT = os.environ.get('TRACE_LOG_EVENT', '0') == '1'
+
+_current = threading.local()
+_invocations = 0
+_invocations_lock = threading.Lock()
+
+
+class RecordTrace:
+    """Tiempos por etapa y atributos de un registro (un documento) de la invocación"""
+
+    def __init__(self, correlation_id, bucket, key, message_id=None):
+        self.correlation_id = correlation_id
+        self.bucket = bucket
+        self.key = key
+        self.message_id = message_id
+        self.status = 'ok'
+        self.error = None
+        self.stages = {}
+        self.attrs = {}
+        self._start = time.perf_counter()
+        self.duration_ms = None
+
+    def add_stage(self, name, elapsed_ms):
+        # Una etapa que se repite (p. ej. trim al ajustar el presupuesto) acumula su tiempo
+        self.stages[name] = round(self.stages.get(name, 0.0) + elapsed_ms, 2)
+
+    @contextmanager
+    def activate(self):
+        """Hace visible la traza en el hilo actual (p. ej. en los hilos de la cobertura)"""
+        previous = getattr(_current, 'record', None)
+        _current.record = self
+        try:
+            yield self
+        finally:
+            _current.record = previous
+
+    def to_dict(self):
+        return {
+            'correlation_id': self.correlation_id,
+            'bucket': self.bucket,
+            'key': self.key,
+            'message_id': self.message_id,
+            'status': self.status,
+            'error': self.error,
+            'duration_ms': self.duration_ms,
+            'stages': self.stages,
+            'attrs': self.attrs,
+        }
+
+
+class InvocationTrace:
+    """
+    Traza de una invocación de Lambda: un registro JSON con el id de
+    correlación, la duración total y las etapas de cada documento del lote.
+    """
+
+    def __init__(self, correlation_id, request_id=None, sampled=True, cold_start=False):
+        self.correlation_id = correlation_id
+        self.request_id = request_id
+        self.sampled = sampled
+        self.cold_start = cold_start
+        self.records = []
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def record(self, bucket, key, message_id=None):
+        """
+        Activa la traza de un registro en el hilo actual mientras se procesa.
+
+        El estado queda en 'error' o 'rejected' si el bloque lanza una excepción,
+        que se propaga sin cambios.
+        """
+        with self._lock:
+            index = len(self.records)
+            trace = RecordTrace(f"{self.correlation_id}:{index}", bucket, key, message_id)
+            self.records.append(trace)
+        previous = getattr(_current, 'record', None)
+        _current.record = trace
+        try:
+            yield trace
+        except PermanentRecordError as e:
+            trace.status, trace.error = 'rejected', str(e)
+            raise
+        except Exception as e:
+            trace.status, trace.error = 'error', str(e)
+            raise
+        finally:
+            trace.duration_ms = round((time.perf_counter() - trace._start) * 1000, 2)
+            _current.record = previous
+
+    def to_dict(self):
+        return {
+            'type': 'trace',
+            'correlation_id': self.correlation_id,
+            'request_id': self.request_id,
+            'cold_start': self.cold_start,
+            'sampled': self.sampled,
+            'duration_ms': round((time.perf_counter() - self._start) * 1000, 2),
+            'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            'records': [r.to_dict() for r in self.records],
+        }
+
+    def emit(self, slow_ms=TRACE_SLOW_MS):
+        """
+        Imprime la traza como una sola línea JSON (consultable con CloudWatch Logs Insights).
+
+        Se emite si la invocación fue muestreada, si algún registro falló o si
+        superó slow_ms, para no perder la cola de latencia al muestrear.
+
+        Returns:
+            dict | None: La traza emitida, o None si se descartó
+        """
+        data = self.to_dict()
+        failed = any(r['status'] != 'ok' for r in data['records'])
+        slow = bool(slow_ms) and data['duration_ms'] >= slow_ms
+        if not (self.sampled or failed or slow):
+            return None
+        data['emitted_by'] = 'sample' if self.sampled else ('error' if failed else 'slow')
+        print(json.dumps(data, ensure_ascii=False, default=str))
+        return data
+
+
+def start_trace(event, context=None, sample_rate=TRACE_SAMPLE_RATE):
+    """
+    Crea la traza de una invocación.
+
+    El id de correlación se toma del evento ('correlation_id') si viene,
+    si no del aws_request_id de Lambda; cada registro del lote usa
+    '<id>:<índice>'.
+
+    Args:
+        event: Evento de Lambda
+        context: Contexto de Lambda (opcional)
+        sample_rate: Fracción de invocaciones muestreadas
+
+    Returns:
+        InvocationTrace
+    """
+    global _invocations
+    with _invocations_lock:
+        _invocations += 1
+        cold_start = _invocations == 1
+    request_id = getattr(context, 'aws_request_id', None)
+    correlation_id = event.get('correlation_id') or request_id or uuid.uuid4().hex
+    if TRACE_LOG_EVENT:
+        print("Received event: " + json.dumps(event, indent=2))
+    return InvocationTrace(correlation_id, request_id=request_id,
+                           sampled=random.random() < sample_rate, cold_start=cold_start)
+
+
+def current_record():
+    """Traza del registro que se procesa en este hilo (None fuera de un registro)"""
+    return getattr(_current, 'record', None)
+
+
+def correlation_id():
+    """Id de correlación del registro actual, para propagarlo (p. ej. al webhook)"""
+    trace = current_record()
+    return trace.correlation_id if trace is not None else None
+
+
+@contextmanager
+def stage(name):
+    """
+    Mide una etapa del registro actual. Sin traza activa no hace nada,
+    así que las funciones instrumentadas se pueden usar fuera del handler.
+    """
+    trace = current_record()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_stage(name, (time.perf_counter() - start) * 1000)
+
+
+def annotate(**attrs):
+    """Agrega atributos (origen, páginas, bytes...) a la traza del registro actual"""
+    trace = current_record()
+    if trace is not None:
+        trace.attrs.update(attrs)
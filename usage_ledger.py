@@ -0,0 +1,292 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+# Registro de consumo: 'jsonl', 'sqlite' o vacío para desactivarlo
+USAGE_LEDGER_BACKEND = os.environ.get('USAGE_LEDGER_BACKEND', 'jsonl')
+USAGE_LEDGER_PATH = os.environ.get('USAGE_LEDGER_PATH', '/tmp/gemini_usage.jsonl')
+# JSON opcional con precios propios: {"modelo": {"input": x, "cached": y, "output": z}} en USD por 1M tokens
+MODEL_PRICES_FILE = os.environ.get('MODEL_PRICES_FILE', '')
+
+# Precios de lista en USD por millón de tokens (prompts cortos). Se buscan por
+# prefijo más largo, de modo que 'gemini-1.5-flash-002' usa 'gemini-1.5-flash'.
+DEFAULT_MODEL_PRICES = {
+    'gemini-1.5-flash': {'input': 0.075, 'cached': 0.01875, 'output': 0.30},
+    'gemini-1.5-flash-8b': {'input': 0.0375, 'cached': 0.01, 'output': 0.15},
+    'gemini-1.5-pro': {'input': 1.25, 'cached': 0.3125, 'output': 5.00},
+    'gemini-2.0-flash': {'input': 0.10, 'cached': 0.025, 'output': 0.40},
+    'gemini-2.0-flash-lite': {'input': 0.075, 'cached': 0.01875, 'output': 0.30},
+    'gemini-2.5-flash': {'input': 0.30, 'cached': 0.075, 'output': 2.50},
+    'gemini-2.5-pro': {'input': 1.25, 'cached': 0.31, 'output': 10.00},
+    'gpt-4.1-mini': {'input': 0.40, 'cached': 0.10, 'output': 1.60},
+    # Backend determinista de llm_backends (benchmarks)
+    'fake-extractor': {'input': 0.0, 'cached': 0.0, 'output': 0.0},
+}
+# Campos que suma el resumen
+TOTAL_FIELDS = ('prompt_tokens', 'cached_tokens', 'candidates_tokens', 'thoughts_tokens', 'total_tokens', 'cost_usd')
+
+
+def usage_from_response(response):
+    """
+    Extrae el consumo de tokens de una respuesta de generate_content / send_message.
+
+    Returns:
+        dict: prompt_tokens (incluye los de caché), cached_tokens, candidates_tokens,
+        thoughts_tokens y total_tokens (0 si la respuesta no trae usage_metadata)
+    """
+    metadata = getattr(response, 'usage_metadata', None)
+
+    def count(name):
+        return int(getattr(metadata, name, 0) or 0) if metadata is not None else 0
+
+    return {
+        'prompt_tokens': count('prompt_token_count'),
+        'cached_tokens': count('cached_content_token_count'),
+        'candidates_tokens': count('candidates_token_count'),
+        'thoughts_tokens': count('thoughts_token_count'),
+        'total_tokens': count('total_token_count'),
+    }
+
+
+def count_pdf_pages(data):
+    """Número de páginas de un PDF en memoria (None si no se puede leer)"""
+    import io
+
+    import PyPDF2
+
+    try:
+        return len(PyPDF2.PdfReader(io.BytesIO(data)).pages)
+    except Exception:
+        return None
+
+
+def tenant_prefix(key):
+    """Prefijo de primer nivel de la clave S3 ('uploads/', 'cncvirtual5/'), o None"""
+    if not key or '/' not in key:
+        return None
+    return key.split('/', 1)[0] + '/'
+
+
+def load_prices(path=MODEL_PRICES_FILE):
+    """Tabla de precios por defecto, actualizada con MODEL_PRICES_FILE si existe"""
+    prices = dict(DEFAULT_MODEL_PRICES)
+    if path:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                prices.update(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"⚠️ No se pudo leer la tabla de precios {path}: {e}")
+    return prices
+
+
+def price_for(model_name, prices):
+    """Precio del modelo por prefijo más largo (None si no se conoce)"""
+    name = (model_name or '').split('/')[-1]
+    matches = [prefix for prefix in prices if name.startswith(prefix)]
+    return prices[max(matches, key=len)] if matches else None
+
+
+def estimate_cost(model_name, usage, prices):
+    """
+    Costo estimado en USD de una llamada.
+
+    Los tokens servidos desde la caché de contexto se cobran a la tarifa
+    'cached'; los de razonamiento (thoughts) se cobran como salida.
+
+    Returns:
+        float | None: Costo, o None si el modelo no está en la tabla
+    """
+    price = price_for(model_name, prices)
+    if price is None:
+        return None
+    uncached = max(usage['prompt_tokens'] - usage['cached_tokens'], 0)
+    output = usage['candidates_tokens'] + usage['thoughts_tokens']
+    cost = (uncached * price['input'] + usage['cached_tokens'] * price.get('cached', price['input'])
+            + output * price['output']) / 1_000_000
+    return round(cost, 8)
+
+
+class JsonlLedgerStore:
+    """Registro en un archivo JSONL de solo anexado (una línea por llamada)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def append(self, entry):
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line)
+
+    def entries(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # Línea truncada por un contenedor que terminó a mitad de escritura
+                        continue
+        except FileNotFoundError:
+            return
+
+
+class SQLiteLedgerStore:
+    """Registro sobre SQLite (sustituto local de una tabla de consumo compartida)"""
+
+    def __init__(self, path, table='usage_ledger'):
+        self.path = path
+        self.table = table
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, ts REAL NOT NULL, model TEXT, "
+                "tenant TEXT, document TEXT, entry TEXT NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def append(self, entry):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                f"INSERT INTO {self.table} (ts, model, tenant, document, entry) VALUES (?, ?, ?, ?, ?)",
+                (entry['ts'], entry.get('model'), entry.get('tenant'), entry.get('document'),
+                 json.dumps(entry, ensure_ascii=False))
+            )
+
+    def entries(self):
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(f"SELECT entry FROM {self.table} ORDER BY id").fetchall()
+        for (entry,) in rows:
+            yield json.loads(entry)
+
+
+def create_ledger_store(backend=USAGE_LEDGER_BACKEND, path=USAGE_LEDGER_PATH):
+    """
+    Crea el almacén del registro configurado.
+
+    Args:
+        backend: 'jsonl', 'sqlite' o vacío
+        path: Archivo JSONL o SQLite
+
+    Returns:
+        Objeto con append/entries, o None si el registro está desactivado
+    """
+    backend = (backend or '').strip().lower()
+    if not backend:
+        return None
+    if backend == 'jsonl':
+        return JsonlLedgerStore(path)
+    if backend == 'sqlite':
+        return SQLiteLedgerStore(path)
+    raise ValueError(f"Backend de registro de consumo no soportado: '{backend}'")
+
+
+class UsageLedger:
+    """
+    Registro de consumo de tokens y costo estimado por llamada al modelo.
+
+    Cada entrada guarda modelo, versión del prompt, documento, prefijo
+    (tenant), páginas enviadas y los conteos de usage_metadata. Una falla al
+    escribir nunca interrumpe el procesamiento del documento.
+    """
+
+    def __init__(self, store=None, prices=None):
+        self.store = store
+        self.prices = prices if prices is not None else load_prices()
+
+    @classmethod
+    def from_env(cls):
+        try:
+            store = create_ledger_store()
+        except Exception as e:
+            print(f"⚠️ No se pudo inicializar el registro de consumo: {e}")
+            store = None
+        return cls(store=store)
+
+    def record(self, response, model_name, document=None, bucket=None, prompt_version=None,
+               pages=None, usage=None, **extra):
+        """
+        Registra el consumo de una respuesta del modelo.
+
+        Args:
+            response: Respuesta de generate_content o send_message (None si se pasa usage)
+            model_name: Modelo utilizado
+            document: Clave S3 o nombre del documento
+            bucket: Bucket del documento (opcional)
+            prompt_version: Versión del prompt
+            pages: Páginas enviadas al modelo
+            usage: Conteos ya calculados por el backend (otros proveedores)
+            **extra: Campos adicionales (p. ej. correlation_id, upload_path)
+
+        Returns:
+            dict: Entrada registrada
+        """
+        if usage is None:
+            usage = usage_from_response(response)
+        entry = {
+            'ts': time.time(),
+            'model': model_name,
+            'prompt_version': prompt_version,
+            'bucket': bucket,
+            'document': document,
+            'tenant': tenant_prefix(document),
+            'pages': pages,
+            **usage,
+            'cost_usd': estimate_cost(model_name, usage, self.prices),
+            **extra,
+        }
+        cost = '¿?' if entry['cost_usd'] is None else f"${entry['cost_usd']:.6f}"
+        print(f"💰 Tokens: {usage['prompt_tokens']} entrada ({usage['cached_tokens']} en caché), "
+              f"{usage['candidates_tokens']} salida, {cost} ({model_name})")
+        if self.store is not None:
+            try:
+                self.store.append(entry)
+            except Exception as e:
+                print(f"⚠️ Error escribiendo el registro de consumo: {e}")
+        return entry
+
+    def entries(self):
+        return self.store.entries() if self.store is not None else iter(())
+
+
+def summarize(entries, by='document'):
+    """
+    Agrupa el consumo por documento, tenant o modelo.
+
+    Args:
+        entries: Entradas del registro
+        by: Campo por el que se agrupa ('document', 'tenant', 'model', 'backend', 'prompt_version');
+            None devuelve un único grupo 'total'
+
+    Returns:
+        dict: valor -> {'calls', 'pages', totales de TOTAL_FIELDS, 'unpriced'}; el costo
+        excluye las llamadas de modelos sin precio, que se cuentan en 'unpriced'
+    """
+    groups = defaultdict(lambda: dict({field: 0 for field in TOTAL_FIELDS}, calls=0, pages=0, unpriced=0))
+    for entry in entries:
+        group = groups[(entry.get(by) or '(sin valor)') if by else 'total']
+        group['calls'] += 1
+        group['pages'] += entry.get('pages') or 0
+        for field in TOTAL_FIELDS:
+            value = entry.get(field)
+            if value is None:
+                if field == 'cost_usd':
+                    group['unpriced'] += 1
+                continue
+            group[field] += value
+    return dict(groups)
@@ -0,0 +1,566 @@
+import gzip
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# Con '1' los resultados se guardan en el outbox antes de enviarlos y un pool los
+# entrega con reintentos; por defecto el webhook se envía en línea
+WEBHOOK_OUTBOX = os.environ.get('WEBHOOK_OUTBOX', '0') == '1'
+# Archivo SQLite del outbox, obligatorio con WEBHOOK_OUTBOX=1. Debe estar en un
+# almacenamiento durable (p. ej. EFS): en /tmp las entregas pendientes se pierden
+# al reciclar el contenedor
+WEBHOOK_OUTBOX_PATH = os.environ.get('WEBHOOK_OUTBOX_PATH', '')
+# Intentos por entrega y backoff exponencial con jitter entre intentos (segundos)
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', '5'))
+WEBHOOK_BACKOFF_INITIAL_SECONDS = float(os.environ.get('WEBHOOK_BACKOFF_INITIAL_SECONDS', '0.5'))
+WEBHOOK_BACKOFF_MAX_SECONDS = float(os.environ.get('WEBHOOK_BACKOFF_MAX_SECONDS', '10'))
+# Entregas simultáneas como máximo (no saturar n8n)
+WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', '4'))
+# Una entrega 'sending' sin cambios por más de esto quedó huérfana (contenedor caído) y se retoma
+WEBHOOK_STALE_SECONDS = int(os.environ.get('WEBHOOK_STALE_SECONDS', '300'))
+# Modo lote (backfills): con WEBHOOK_BATCH_SIZE > 1 las entregas se acumulan hasta
+# ese número o WEBHOOK_BATCH_WINDOW_MS y se envían como un solo arreglo JSON
+WEBHOOK_BATCH_SIZE = int(os.environ.get('WEBHOOK_BATCH_SIZE', '1'))
+WEBHOOK_BATCH_WINDOW_MS = float(os.environ.get('WEBHOOK_BATCH_WINDOW_MS', '250'))
+# Compresión de los lotes: '' (ninguna), 'gzip' o 'zstd'
+WEBHOOK_COMPRESSION = os.environ.get('WEBHOOK_COMPRESSION', '')
+
+# Respuestas que vale la pena reintentar además de los 5xx; el resto de 4xx va directo al dead-letter
+RETRYABLE_STATUS = {408, 425, 429}
+
+_COLUMNS = ('id', 'url', 'body', 'headers', 'document', 'status', 'attempts', 'status_code', 'response',
+            'last_error', 'created_at', 'updated_at')
+
+
+class WebhookHTTPError(Exception):
+    """El receptor respondió con un código de error"""
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.retryable = status_code in RETRYABLE_STATUS or status_code >= 500
+        super().__init__(f"HTTP {status_code}: {text}")
+
+
+def _retryable(error):
+    import requests
+
+    if isinstance(error, WebhookHTTPError):
+        return error.retryable
+    return isinstance(error, requests.exceptions.RequestException)
+
+
+def compress(data, encoding):
+    """
+    Comprime el cuerpo de un lote.
+
+    Args:
+        data: Bytes a enviar
+        encoding: '', 'gzip' o 'zstd' (valor de Content-Encoding)
+
+    Returns:
+        bytes: El cuerpo comprimido (o el original sin compresión)
+    """
+    if not encoding:
+        return data
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=6)
+    if encoding == 'zstd':
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    raise ValueError(f"Compresión de webhook no soportada: '{encoding}'")
+
+
+def batch_acks(response, delivery_ids):
+    """
+    Confirmaciones por entrega de la respuesta a un lote.
+
+    El receptor puede responder un arreglo JSON (o {'results': [...]}) con un
+    elemento por entrega: {'id', 'status'} o {'id', 'ok', 'error'}; sin 'id'
+    se asocian por posición. Las entregas que no aparecen quedan confirmadas
+    por el código HTTP del lote.
+
+    Returns:
+        dict: id de entrega -> (código de estado, error o None)
+    """
+    try:
+        body = response.json()
+    except Exception:
+        return {}
+    results = body.get('results') if isinstance(body, dict) else body
+    if not isinstance(results, list):
+        return {}
+    acks = {}
+    for position, item in enumerate(results):
+        if not isinstance(item, dict):
+            continue
+        delivery_id = item.get('id') or (delivery_ids[position] if position < len(delivery_ids) else None)
+        if delivery_id not in delivery_ids:
+            continue
+        status = item.get('status')
+        if not isinstance(status, int):
+            status = response.status_code if item.get('ok', True) else 422
+        acks[delivery_id] = (status, item.get('error'))
+    return acks
+
+
+class OutboxStore:
+    """
+    Entregas pendientes, entregadas y en dead-letter en SQLite.
+
+    status: 'pending' (guardada, sin enviar), 'sending' (un trabajador la
+    tomó), 'delivered' o 'dead' (agotó los intentos o el receptor la rechazó).
+    """
+
+    def __init__(self, path=WEBHOOK_OUTBOX_PATH):
+        if not path:
+            raise ValueError("WEBHOOK_OUTBOX_PATH es obligatorio con el outbox de webhooks "
+                             "(un archivo en almacenamiento durable, p. ej. EFS)")
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS webhook_outbox ("
+                "id TEXT PRIMARY KEY, url TEXT NOT NULL, body TEXT NOT NULL, headers TEXT, document TEXT, "
+                "status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, status_code INTEGER, response TEXT, "
+                "last_error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS webhook_outbox_status ON webhook_outbox (status, updated_at)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    @staticmethod
+    def _row(row):
+        if row is None:
+            return None
+        entry = dict(zip(_COLUMNS, row))
+        entry['headers'] = json.loads(entry['headers'] or '{}')
+        return entry
+
+    def add(self, url, body, headers, document):
+        delivery_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO webhook_outbox (id, url, body, headers, document, status, attempts, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, 'pending', 0, ?, ?)",
+                (delivery_id, url, body, json.dumps(headers or {}), document, now, now)
+            )
+        return delivery_id
+
+    def claim(self, delivery_id, stale_seconds=WEBHOOK_STALE_SECONDS):
+        """Pasa la entrega a 'sending' si está pendiente o huérfana; False si otro la tiene o ya terminó"""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE webhook_outbox SET status = 'sending', updated_at = ? WHERE id = ? AND "
+                "(status = 'pending' OR (status = 'sending' AND updated_at < ?))",
+                (now, delivery_id, now - stale_seconds)
+            )
+            return cursor.rowcount == 1
+
+    def update(self, delivery_id, **fields):
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE webhook_outbox SET {assignments} WHERE id = ?", (*fields.values(), delivery_id))
+
+    def count_attempt(self, delivery_ids):
+        with self._connect() as conn:
+            conn.executemany("UPDATE webhook_outbox SET attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                             [(time.time(), delivery_id) for delivery_id in delivery_ids])
+
+    def update_many(self, delivery_ids, **fields):
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.executemany(f"UPDATE webhook_outbox SET {assignments} WHERE id = ?",
+                             [(*fields.values(), delivery_id) for delivery_id in delivery_ids])
+
+    def get(self, delivery_id):
+        with self._connect() as conn:
+            return self._row(conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM webhook_outbox WHERE id = ?", (delivery_id,)
+            ).fetchone())
+
+    def list(self, status, limit=100, older_than=None):
+        query = f"SELECT {', '.join(_COLUMNS)} FROM webhook_outbox WHERE status = ?"
+        params = [status]
+        if older_than is not None:
+            query += " AND updated_at < ?"
+            params.append(older_than)
+        query += " ORDER BY created_at LIMIT ?"
+        params.append(limit)
+        with self._connect() as conn:
+            return [self._row(row) for row in conn.execute(query, params).fetchall()]
+
+    def counts(self):
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM webhook_outbox GROUP BY status").fetchall())
+
+
+class WebhookOutbox:
+    """
+    Outbox de webhooks: el resultado se guarda primero y un pool acotado lo
+    entrega en segundo plano con la sesión HTTP compartida (keep-alive).
+
+    Cada entrega se reintenta con backoff exponencial (tenacity) ante errores
+    de red, 5xx y 408/425/429; al agotar WEBHOOK_MAX_ATTEMPTS, o ante otro
+    4xx, queda en el dead-letter con el último error. La extracción no espera
+    a n8n: el handler solo encola y, al final de la invocación, espera las
+    entregas en curso con el tiempo que le queda (drain).
+
+    Con batch_size > 1 las entregas a una misma URL se acumulan y se envían
+    como un arreglo [{'id', 'document', 'correlation_id', 'headers', 'data'}, ...],
+    opcionalmente comprimido (Content-Encoding). Las cabeceras de cada entrega
+    (X-Correlation-Id...) viajan en su elemento, no en la petición del lote.
+    Cada entrega conserva su estado: el receptor puede confirmar o rechazar
+    elementos sueltos (ver batch_acks) y solo los rechazados con un código
+    reintentable vuelven a un lote, tras el mismo backoff que las entregas
+    sueltas.
+    """
+
+    def __init__(self, store, post, max_attempts=WEBHOOK_MAX_ATTEMPTS, workers=WEBHOOK_WORKERS,
+                 backoff_initial=WEBHOOK_BACKOFF_INITIAL_SECONDS, backoff_max=WEBHOOK_BACKOFF_MAX_SECONDS,
+                 stale_seconds=WEBHOOK_STALE_SECONDS, batch_size=WEBHOOK_BATCH_SIZE,
+                 batch_window_ms=WEBHOOK_BATCH_WINDOW_MS, compression=WEBHOOK_COMPRESSION):
+        self.store = store
+        self.post = post
+        self.max_attempts = max_attempts
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.stale_seconds = stale_seconds
+        self.batch_size = max(1, batch_size)
+        self.batch_window_ms = batch_window_ms
+        self.compression = (compression or '').strip().lower()
+        if self.compression not in ('', 'gzip', 'zstd'):
+            raise ValueError(f"Compresión de webhook no soportada: '{compression}'")
+        self.stats = {'enqueued': 0, 'delivered': 0, 'retried': 0, 'dead': 0,
+                      'batches': 0, 'bytes_raw': 0, 'bytes_sent': 0}
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='webhook')
+        self._futures = {}
+        # Lotes en formación por URL: {'ids': [...], 'timer': Timer}
+        self._batches = {}
+        # Reentrante: add_done_callback ejecuta _forget en el acto si la entrega ya terminó
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_env(cls, post):
+        return cls(OutboxStore(), post)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def enqueue(self, url, payload, headers=None, document=None):
+        """
+        Guarda la entrega y la programa en el pool (o en el lote de su URL).
+
+        Returns:
+            str: Id de la entrega en el outbox
+        """
+        delivery_id = self.store.add(url, json.dumps(payload), headers, document)
+        self._count('enqueued')
+        self.schedule(delivery_id, url)
+        return delivery_id
+
+    def schedule(self, delivery_id, url=None):
+        """Programa una entrega ya guardada (p. ej. la de un intento anterior del mismo documento)"""
+        if self.batch_size > 1:
+            url = url or self.store.get(delivery_id)['url']
+            return self._buffer(url, delivery_id)
+        return self.submit(delivery_id)
+
+    def submit(self, delivery_id):
+        with self._lock:
+            future = self._futures.get(delivery_id)
+            if future is None or future.done():
+                future = self._pool.submit(self.deliver, delivery_id)
+                self._track(delivery_id, future)
+            return future
+
+    def _track(self, delivery_id, future):
+        self._futures[delivery_id] = future
+        future.add_done_callback(lambda _, delivery_id=delivery_id: self._forget(delivery_id, future))
+
+    def _forget(self, delivery_id, future):
+        with self._lock:
+            if self._futures.get(delivery_id) is future:
+                del self._futures[delivery_id]
+
+    def send(self, url, payload, headers=None, document=None, timeout=None):
+        """Encola y espera el resultado (para quien necesita la respuesta del receptor)"""
+        delivery_id = self.enqueue(url, payload, headers=headers, document=document)
+        return self.wait([delivery_id], timeout=timeout)[0]
+
+    def _attempt(self, entry, attempt_number):
+        self.store.count_attempt([entry['id']])
+        if attempt_number > 1:
+            self._count('retried')
+        response = self.post(entry['url'], data=entry['body'], headers=entry['headers'])
+        if response.status_code >= 400:
+            raise WebhookHTTPError(response.status_code, (response.text or '')[:500])
+        return response
+
+    def _retrying(self, label):
+        from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+
+        return Retrying(
+            stop=stop_after_attempt(self.max_attempts),
+            wait=wait_exponential_jitter(multiplier=self.backoff_initial, max=self.backoff_max),
+            retry=retry_if_exception(_retryable),
+            before_sleep=lambda state: print(
+                f"🔁 Webhook de {label}: intento {state.attempt_number} falló "
+                f"({state.outcome.exception()}), reintento en {state.next_action.sleep:.1f} s"
+            ),
+            reraise=True,
+        )
+
+    def deliver(self, delivery_id):
+        """
+        Entrega una entrada del outbox con reintentos (se ejecuta en el pool).
+
+        Returns:
+            dict: La entrada con su estado final
+        """
+        if not self.store.claim(delivery_id, self.stale_seconds):
+            # Otro trabajador la tiene o ya terminó
+            return self.store.get(delivery_id)
+        entry = self.store.get(delivery_id)
+        try:
+            for attempt in self._retrying(entry['document']):
+                with attempt:
+                    response = self._attempt(entry, attempt.retry_state.attempt_number)
+        except Exception as e:
+            self.store.update(delivery_id, status='dead', last_error=str(e)[:1000],
+                              status_code=getattr(e, 'status_code', None))
+            self._count('dead')
+            print(f"💀 Webhook de {entry['document']} al dead-letter ({delivery_id}): {e}")
+        else:
+            self.store.update(delivery_id, status='delivered', status_code=response.status_code,
+                              response=(response.text or '')[:1000], last_error=None)
+            self._count('delivered')
+            print(f"Webhook enviado con éxito ({entry['document']}). Código de estado: {response.status_code}")
+        return self.store.get(delivery_id)
+
+    def _backoff(self, attempts):
+        """Espera (segundos) antes del siguiente intento: exponencial con jitter, como _retrying"""
+        delay = self.backoff_initial * 2 ** max(0, attempts - 1)
+        return min(self.backoff_max, delay + random.uniform(0, self.backoff_initial))
+
+    def _buffer(self, url, delivery_id, next_attempt_at=None):
+        """
+        Agrega la entrega al lote de su URL; el lote sale al llenarse o al vencer la ventana.
+
+        Args:
+            url: URL del receptor
+            delivery_id: Id de la entrega en el outbox
+            next_attempt_at: time.monotonic() antes del cual la entrega no vuelve a un lote (backoff)
+        """
+        from concurrent.futures import Future
+
+        with self._lock:
+            future = self._futures.get(delivery_id)
+            if future is None or future.done():
+                # Se resuelve cuando el lote que la lleva termina (ver _run_batch)
+                future = Future()
+                self._track(delivery_id, future)
+            delay = 0 if next_attempt_at is None else next_attempt_at - time.monotonic()
+            if delay > 0:
+                # Sigue en curso para drain mientras espera su backoff
+                timer = threading.Timer(delay, self._buffer, args=(url, delivery_id))
+                timer.daemon = True
+                timer.start()
+                return future
+            batch = self._batches.get(url)
+            if batch is None:
+                batch = {'ids': [], 'timer': None}
+                batch['timer'] = threading.Timer(self.batch_window_ms / 1000, self._flush_batch, args=(url, batch))
+                batch['timer'].daemon = True
+                self._batches[url] = batch
+                batch['timer'].start()
+            if delivery_id not in batch['ids']:
+                batch['ids'].append(delivery_id)
+            full = len(batch['ids']) >= self.batch_size
+        if full:
+            self._flush_batch(url, batch)
+        return future
+
+    def _flush_batch(self, url, batch):
+        with self._lock:
+            if self._batches.get(url) is not batch:
+                # Ya salió (lleno, por la ventana o por flush)
+                return
+            del self._batches[url]
+        batch['timer'].cancel()
+        self._pool.submit(self._run_batch, url, batch['ids'])
+
+    def flush(self):
+        """Envía los lotes en formación sin esperar su ventana"""
+        with self._lock:
+            batches = list(self._batches.items())
+        for url, batch in batches:
+            self._flush_batch(url, batch)
+
+    def _run_batch(self, url, delivery_ids):
+        requeued = set()
+        try:
+            requeued = self.deliver_batch(url, delivery_ids)
+        except Exception as e:
+            # Las entregas tomadas quedan en 'sending' y se retoman al quedar huérfanas
+            print(f"⚠️ Error entregando el lote de webhooks a {url}: {e}")
+        finally:
+            for delivery_id in delivery_ids:
+                if delivery_id in requeued:
+                    continue
+                with self._lock:
+                    future = self._futures.get(delivery_id)
+                if future is not None and not future.done():
+                    future.set_result(self.store.get(delivery_id))
+
+    def _post_batch(self, delivery_ids, url, body, headers, attempt_number):
+        self.store.count_attempt(delivery_ids)
+        if attempt_number > 1:
+            self._count('retried', len(delivery_ids))
+        response = self.post(url, data=body, headers=headers)
+        if response.status_code >= 400:
+            raise WebhookHTTPError(response.status_code, (response.text or '')[:500])
+        return response
+
+    def deliver_batch(self, url, delivery_ids):
+        """
+        Entrega un lote de entradas del outbox en una sola petición, con reintentos.
+
+        Returns:
+            set: Entregas rechazadas con un código reintentable, devueltas a un lote tras su backoff
+        """
+        claimed = [delivery_id for delivery_id in delivery_ids if self.store.claim(delivery_id, self.stale_seconds)]
+        if not claimed:
+            return set()
+        entries = [self.store.get(delivery_id) for delivery_id in claimed]
+        # Content-Type es del lote; las demás cabeceras de cada entrega viajan en su elemento
+        items = [{'id': entry['id'], 'document': entry['document'],
+                  'correlation_id': entry['headers'].get('X-Correlation-Id'),
+                  'headers': {name: value for name, value in entry['headers'].items()
+                              if name.lower() != 'content-type'},
+                  'data': json.loads(entry['body'])}
+                 for entry in entries]
+        raw = json.dumps(items).encode('utf-8')
+        body = compress(raw, self.compression)
+        headers = {'Content-Type': 'application/json', 'X-Webhook-Batch': str(len(entries))}
+        if self.compression:
+            headers['Content-Encoding'] = self.compression
+
+        label = f"lote de {len(entries)}"
+        attempts = 0
+        try:
+            for attempt in self._retrying(label):
+                with attempt:
+                    attempts = attempt.retry_state.attempt_number
+                    response = self._post_batch(claimed, url, body, headers, attempts)
+        except Exception as e:
+            self.store.update_many(claimed, status='dead', last_error=str(e)[:1000],
+                                   status_code=getattr(e, 'status_code', None))
+            self._count('dead', len(claimed))
+            print(f"💀 Webhooks del {label} al dead-letter: {e}")
+            return set()
+        self._count('batches')
+        self._count('bytes_raw', len(raw))
+        self._count('bytes_sent', len(body))
+
+        acks = batch_acks(response, claimed)
+        delivered, requeued = [], {}
+        for entry in entries:
+            status_code, error = acks.get(entry['id'], (response.status_code, None))
+            if status_code < 400:
+                delivered.append(entry['id'])
+                continue
+            failure = WebhookHTTPError(status_code, error or 'rechazada en el lote')
+            if failure.retryable and entry['attempts'] + attempts < self.max_attempts:
+                self.store.update(entry['id'], status='pending', status_code=status_code, last_error=str(failure))
+                self._count('retried')
+                requeued[entry['id']] = time.monotonic() + self._backoff(entry['attempts'] + attempts)
+            else:
+                self.store.update(entry['id'], status='dead', status_code=status_code, last_error=str(failure))
+                self._count('dead')
+                print(f"💀 Webhook de {entry['document']} al dead-letter ({entry['id']}): {failure}")
+        if delivered:
+            self.store.update_many(delivered, status='delivered', status_code=response.status_code,
+                                   response=(response.text or '')[:1000], last_error=None)
+            self._count('delivered', len(delivered))
+        print(f"Lote de {len(entries)} webhooks enviado ({len(raw)} → {len(body)} bytes). "
+              f"Código de estado: {response.status_code}, entregados: {len(delivered)}, "
+              f"reintento: {len(requeued)}")
+        for delivery_id, next_attempt_at in requeued.items():
+            self._buffer(url, delivery_id, next_attempt_at)
+        return set(requeued)
+
+    def wait(self, delivery_ids, timeout=None):
+        """Espera esas entregas hasta timeout segundos y devuelve su estado actual"""
+        with self._lock:
+            futures = [self._futures[i] for i in delivery_ids if i in self._futures]
+        if futures:
+            wait(futures, timeout=timeout)
+        return [self.store.get(i) for i in delivery_ids]
+
+    def drain(self, timeout=None):
+        """
+        Envía los lotes en formación y espera las entregas en curso (p. ej.
+        antes de que Lambda congele el contenedor).
+
+        Returns:
+            int: Entregas que siguen en curso al vencer el timeout (quedan en el outbox)
+        """
+        self.flush()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            # Las rechazadas en un lote vuelven a un lote nuevo: se esperan también
+            with self._lock:
+                futures = [future for future in self._futures.values() if not future.done()]
+            if not futures:
+                return 0
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            _, pending = wait(futures, timeout=remaining)
+            if pending:
+                return len(pending)
+
+    def resume(self, limit=100):
+        """
+        Reprograma las entregas pendientes o huérfanas de invocaciones anteriores.
+
+        Returns:
+            int: Entregas reprogramadas
+        """
+        entries = self.store.list('pending', limit)
+        entries += self.store.list('sending', limit, older_than=time.time() - self.stale_seconds)
+        with self._lock:
+            entries = [e for e in entries if e['id'] not in self._futures]
+        for entry in entries:
+            self.schedule(entry['id'], entry['url'])
+        if entries:
+            print(f"📬 Outbox: {len(entries)} entrega(s) pendiente(s) reprogramada(s)")
+        return len(entries)
+
+    def status(self, delivery_id):
+        """Estado de una entrega: status, attempts, status_code, last_error..."""
+        entry = self.store.get(delivery_id)
+        if entry is not None:
+            entry.pop('body', None)
+        return entry
+
+    def dead_letters(self, limit=100):
+        """Entregas que agotaron los intentos o fueron rechazadas, con su cuerpo para reenviarlas"""
+        return self.store.list('dead', limit)
+
+    def redrive(self, delivery_id):
+        """Devuelve una entrega del dead-letter a la cola y la programa de nuevo"""
+        self.store.update(delivery_id, status='pending', last_error=None)
+        return self.schedule(delivery_id)